@@ -21,8 +21,25 @@ import base64
 # Concurrencia para el hito 6
 import _thread
 
+# Varios procesos atendiendo el mismo puerto en el hito 6
+import multiprocessing
+
+# Clasificar las conexiones del hito 6 sin bloquear el bucle que las acepta
+import select
+import queue
+import time
+
 # Para obtener los rfc
 import urllib.request
+import urllib.error
+
+# Compresión de los rfc para los clientes que la aceptan
+import zlib
+
+# Fichero de estado con los enunciados de los hitos completados, y --resume para continuar desde él
+import json
+import tempfile
+import sys
 
 # Muestra de mensajes
 import logging
@@ -31,27 +48,78 @@ import logging
 # Función dada por los profesores para calcular el campo checksum del hito 5, YAP
 from inet_checksum import cksum
 
+# Analizador de los enunciados, compartido con yinkana_2324; en el servidor se envía junto a este fichero (make send_depend)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "yinkana_2324"))
+import prompt_parser
+
 
 # Definir algunas "constantes"
 
 DEFAULT_PACKET_SIZE : int = 1024
 MAGIC_WORD : bytes = b"identifier"
+# segundos que esperamos al proveedor de los rfc antes de devolver un error
+PROVIDER_TIMEOUT : float = 10.0
+# tamaño del buffer con el que se reenvían los ficheros del proveedor
+RELAY_BUFFER_SIZE : int = 256 * 1024
+# nivel de compresión gzip, 6 es el equilibrio habitual entre tamaño y tiempo
+GZIP_LEVEL : int = 6
+# tamaño máximo del enunciado, lo que llegue después se descarta
+MAX_PROMPT_SIZE : int = 64 * 1024
+# segundos que tiene una conexión nueva del hito 6 para enviar su petición antes de pasar a su propio hilo
+CLASSIFY_TIMEOUT : float = 0.01
+# segundos entre comprobaciones de si otro proceso ya ha recibido el mensaje final del hito 6
+POLL_INTERVAL : float = 0.1
+# segundos que tienen los procesos del hito 6 para empezar a escuchar
+WORKER_START_TIMEOUT : float = 30.0
+# segundos que el hito 6 con varios procesos espera al mensaje final
+HTTP_CHAMBER_TIMEOUT : float = 600.0
+# procesos que atienden el servidor HTTP del hito 6, $YINCANA_HTTP_PROCESSES; con más de uno
+# se lanzan trabajadores que comparten el puerto con SO_REUSEPORT
+HTTP_PROCESSES : int = int(os.environ.get("YINCANA_HTTP_PROCESSES") or 1)
+# fichero con el enunciado de cada hito completado, para continuar desde el último si algo falla
+STATE_FILE : str = os.environ.get("YINCANA_STATE", f".yincana-{os.environ.get('USER', 'yincana')}.json")
+# segundos tras los que no se continúa desde el fichero de estado, sus identificadores ya habrán caducado
+STATE_MAX_AGE : float = 3600.0
+# veces que se repite un hito que falla antes de rendirse, solo en los que se pueden repetir sin peligro:
+# el Hito0 no parte de nada, los demás gastan el identificador del anterior
+STAGE_RETRIES : int = 2
+# segundos antes del primer reintento de un hito, se duplican en cada uno
+STAGE_BACKOFF : float = 1.0
+# segundos durante los que se reutiliza la dirección resuelta de un host
+RESOLVE_TTL : float = 300.0
+
+# dirección IP y caducidad de cada host ya resuelto
+resolved_hosts : dict[str, tuple[str, float]] = {}
 
 
 def ObtainIdentifier(msg : bytes) -> bytes:
 	"""
-	Si no se encuentra la palabra mágica al principio del mensaje, no se puede obtener el identificador
-	Función que devuelve el identificador encontrado en el mensaje
+	Función que devuelve el identificador encontrado en el mensaje, con prompt_parser
+	Si no se encuentra la palabra mágica en el mensaje, no se puede obtener el identificador
 
 	Parameters:
-		msg: Bytes que deben ser del estilo: b"MAGIC_WORD:.*\\n.*" La primera instancia del patrón contiene el identificador
+		msg: Bytes que contienen el patrón b"MAGIC_WORD:.*\\n", la primera instancia del patrón contiene el identificador
 
 	Returns:
 		El identificador (en bytes), se encuentra entre b":" y b"\\n" del patrón encontrado quitando los espacios
 	"""
-	if msg[:len(MAGIC_WORD)] != MAGIC_WORD:
-		raise Exception(f"msg does not start with {MAGIC_WORD = }")
-	return msg.split(b"\n")[0].split(b":")[1].strip()
+	identifier : bytes = prompt_parser.parse_prompt(msg).identifier
+	if identifier is None:
+		raise Exception(f"msg does not contain {MAGIC_WORD = }")
+	return identifier.strip()
+
+def NextChamber(msg : bytes, default : tuple[str, int]) -> tuple[str, int]:
+	"""
+	Devuelve la dirección resuelta del siguiente hito, la que dice el enunciado del anterior
+
+	Parameters:
+		msg: El enunciado del hito anterior
+		default: La tupla con el host y el puerto si el enunciado no los da, o el host si solo da el puerto
+
+	Returns:
+		La tupla con la dirección IP y el puerto
+	"""
+	return ResolveEndpoint(prompt_parser.parse_prompt(msg).target(default))
 
 def Hito0(connection_tuple : tuple[str, int], username : str) -> bytes:
 	"""
@@ -156,35 +224,70 @@ def ObtainWordsLen(TCPsocket : socket.socket, maximum : int) -> bytes:
 
 	return count
 
-def ObtainAllMessages(socket : socket.socket) -> [bytes]:
+def ObtainPrompt(TCPsocket : socket.socket, terminator : bytes = None, quiet : float = None, max_size : int = MAX_PROMPT_SIZE) -> bytes:
 	"""
-	Recibe todos los mensajes hasta que se encuentra uno vacío, cuando el otro socket se ha cerrado, y devuelve todos los leídos.
+	Lee del socket hasta encontrar el enunciado, el mensaje en el que aparece MAGIC_WORD seguida de b":"
+	Lo anterior se descarta, solo se guarda el último mensaje por si la marca llega partida entre los dos; en ese caso el enunciado empieza en él
+	Una vez encontrado, el enunciado se acumula hasta el terminador o, si no se conoce, hasta el cierre de la conexión, como siempre; en ambos casos como mucho hasta max_size
+	Un silencio del servidor no corta el enunciado salvo que se pida con quiet y sin terminador: un servidor lento que se para a mitad lo dejaría incompleto
 
 	Parameters:
-		socket: Socket previamente abierto que enviará los mensajes.
+		TCPsocket: Socket previamente abierto que enviará el enunciado
+		terminator: Bytes con los que acaba el enunciado, incluidos en él; None si no se conocen
+		quiet: Solo sin terminador, segundos sin datos tras los que el enunciado se da por completo; None para leer hasta el cierre
+		max_size: Tamaño máximo del enunciado
 
 	Returns:
-		Array conteniendo todos los mensajes.
+		El enunciado entero, desde el principio del mensaje con la marca, como antes el último mensaje o los dos últimos. Vacío si la conexión se cierra sin enviarlo
 	"""
 
-	msg_list : [bytes] = []
-	msg = socket.recv(DEFAULT_PACKET_SIZE)
+	marker : bytes = MAGIC_WORD + b":"
+	previous : bytes = b""
+	prompt : bytearray = None
+	timeout = TCPsocket.gettimeout()
 
-	while msg:
-		logging.debug(f"ObtainAllMessages: new message:\n{msg = }")
+	try:
+		while True:
+			msg : bytes = TCPsocket.recv(DEFAULT_PACKET_SIZE)
+			logging.debug(f"ObtainPrompt: new message:\n{msg = }")
 
-		msg_list.append(msg)
+			if not msg:
+				break
 
-		msg = socket.recv(DEFAULT_PACKET_SIZE)
+			if prompt is None:
+				carry : bytes = previous[-(len(marker) - 1):]
+				start : int = (carry + msg).find(marker)
+				if start == -1:
+					previous = msg
+					continue
+				# el identificador se obtiene después con ObtainIdentifier, aquí se guarda el mensaje entero
+				prompt = bytearray((previous if start < len(carry) else b"") + msg)
+				if terminator is None and quiet is not None:
+					# a partir de aquí, un silencio del servidor también termina el enunciado
+					TCPsocket.settimeout(quiet)
+			else:
+				prompt += msg
+
+			if terminator is not None and terminator in prompt:
+				del prompt[prompt.find(terminator) + len(terminator):]
+				break
+			if len(prompt) >= max_size:
+				del prompt[max_size:]
+				break
+	except socket.timeout:
+		# solo puede pasar con el enunciado ya empezado
+		logging.debug(f"ObtainPrompt: no more data after {quiet} s")
+	finally:
+		TCPsocket.settimeout(timeout)
 
-	return msg_list
+	return bytes(prompt or b"")
 
 def Hito2(connection_tuple : tuple[str, int], identifier : bytes, maximum : int) -> bytes:
 	"""
 	Abre la conexión con la tupla dada
 	Obtiene la longitud de las palabas que la conexión ofrece hasta el máximo especificado
 	Envía un mensaje con el identificador y todas las longitudes leídas
-	Obtiene el último mensaje de la conexión y lo devuelve
+	Obtiene el enunciado del siguiente hito y lo devuelve
 
 	Parameters:
 		connection_tuple: Una tupla con la dirección y el puerto al que nos conectaremos
@@ -192,7 +295,7 @@ def Hito2(connection_tuple : tuple[str, int], identifier : bytes, maximum : int)
 		maximum: Suma máxima de longitudes de palabras
 
 	Returns:
-		El último mensaje recibido por el socket. Contiene el identificador y las instrucciones para el siguiente Hito
+		El enunciado recibido por el socket. Contiene el identificador y las instrucciones para el siguiente Hito
 	"""
 
 	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as clienteTCPHito2:
@@ -204,7 +307,7 @@ def Hito2(connection_tuple : tuple[str, int], identifier : bytes, maximum : int)
 
 		clienteTCPHito2.sendall(mensaje)
 
-		msg = ObtainAllMessages(clienteTCPHito2)[-1]
+		msg = ObtainPrompt(clienteTCPHito2)
 
 	return msg
 
@@ -260,7 +363,7 @@ def Hito3(connection_tuple : tuple[str, int], identifier : bytes, maximum : int)
 	Abre la conexión con la tupla dada
 	Obtiene la primera palabra leída tras alcanzar el máximo
 	Envía un mensaje con el identificador y la palabra
-	Obtiene el último mensaje de la conexión y lo devuelve
+	Obtiene el enunciado del siguiente hito y lo devuelve
 
 	Parameters:
 		connection_tuple: Una tupla con la dirección y el puerto al que nos conectaremos
@@ -268,7 +371,7 @@ def Hito3(connection_tuple : tuple[str, int], identifier : bytes, maximum : int)
 		maximum: Suma máxima del valor de los números y las palabras a leer
 
 	Returns:
-		El último mensaje recibido por el socket. Contiene el identificador y las instrucciones para el siguiente Hito
+		El enunciado recibido por el socket. Contiene el identificador y las instrucciones para el siguiente Hito
 	"""
 
 	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as clienteTCPHito3:
@@ -280,7 +383,7 @@ def Hito3(connection_tuple : tuple[str, int], identifier : bytes, maximum : int)
 
 		clienteTCPHito3.sendall(mensaje)
 
-		msg = ObtainAllMessages(clienteTCPHito3)[-1]
+		msg = ObtainPrompt(clienteTCPHito3)
 
 	return msg
 
@@ -329,14 +432,14 @@ def Hito4(connection_tuple : tuple[str, int], identifier : bytes) -> bytes:
 	Manda el identificador
 	Obtiene el fichero provisto por la conexión
 	Calcula el MD5 del fichero
-	Obtiene los últimos mensajes de la conexión y los devuelve como uno
+	Obtiene el enunciado del siguiente hito y lo devuelve
 
 	Parameters:
 		connection_tuple: Una tupla con la dirección y el puerto al que nos conectaremos
 		identifier: Bytes que representan el identificador obtenido de las instrucciones del hito
 
 	Returns:
-		Los últimos mensajes recibidos por el socket. Contiene el identificador y las instrucciones para el siguiente Hito
+		El enunciado recibido por el socket. Contiene el identificador y las instrucciones para el siguiente Hito
 	"""
 
 	with socket.socket() as clienteRAWHito4:
@@ -356,9 +459,9 @@ def Hito4(connection_tuple : tuple[str, int], identifier : bytes) -> bytes:
 
 		clienteRAWHito4.sendall(digest)
 
-		msg_list = ObtainAllMessages(clienteRAWHito4)
+		msg = ObtainPrompt(clienteRAWHito4)
 
-	return msg_list[-2] + msg_list[-1]
+	return msg
 
 def Hito5(connection_tuple : tuple[str, int], identifier : bytes) -> bytes:
 	"""
@@ -415,12 +518,51 @@ def Hito5(connection_tuple : tuple[str, int], identifier : bytes) -> bytes:
 
 	return base64.b64decode(payload)
 
+def GetHeader(msg : bytes, header : bytes) -> bytes:
+	"""
+	Obtiene el valor de una cabecera de la petición
+
+	Parameters:
+		msg: Mensaje HTTP con la petición
+		header: Nombre de la cabecera, sin distinguir mayúsculas
+
+	Returns: El valor de la cabecera, vacío si no está
+	"""
+	for line in msg.split(b"\r\n\r\n")[0].split(b"\r\n")[1:]:
+		name, _, value = line.partition(b":")
+		if name.strip().lower() == header.lower():
+			return value.strip()
+	return b""
+
+def AcceptsGzip(msg : bytes) -> bool:
+	"""
+	Comprueba si la petición acepta respuestas comprimidas con gzip
+
+	Parameters:
+		msg: Mensaje HTTP con la petición
+
+	Returns: True si la cabecera Accept-Encoding incluye gzip (o *) con calidad distinta de 0
+	"""
+	for coding in GetHeader(msg, b"Accept-Encoding").split(b","):
+		coding, _, params = coding.partition(b";")
+		quality = params.replace(b" ", b"").lower().removeprefix(b"q=") or b"1"
+		try:
+			if coding.strip().lower() in (b"gzip", b"*") and float(quality) > 0:
+				return True
+		except ValueError:
+			pass
+	return False
+
 def GET(request_socket : socket.socket, msg : bytes, provider : tuple[str, int]) -> None:
 	"""
 	Obtiene el fichero a enviar
 	Se lo pide al proveedor
 	Devuelve el fichero si se ha encontrado o una línea con el error
-	Cierra el socket
+	Si el proveedor no responde a tiempo, devuelve 502
+	El fichero se reenvía según llega, sin guardarlo entero en memoria
+	Si el cliente lo acepta, se comprime con gzip también según llega
+	Las cabeceras Range e If-Range se reenvían al proveedor, que puede contestar 206 o 416
+	Cierra el socket siempre
 
 	Parameters:
 		request_socket: Socket que pide el fichero
@@ -430,36 +572,104 @@ def GET(request_socket : socket.socket, msg : bytes, provider : tuple[str, int])
 
 	file = msg.split(b" ")[1]
 
-	with urllib.request.urlopen(f"http://{provider[0]}:{provider[1]}/rfc{file.decode()}") as response:
-		if response.status == 200:
-			logging.debug(f"GET: sending {file = }")
-			request_socket.sendall(b"HTTP/1.1 200 OK\r\n\r\n" + response.read())
-		else:
-			logging.debug(f"GET: {file = } not sent")
-			request_socket.sendall(b"HTTP/1.1 404 Not Found\r\n\r\n")
-
-	request_socket.close()
-
-def HTTP(HTTPserver_socket : socket.socket, provider : tuple[str, int]) -> bytes:
+	# rangos de bytes: los resuelve el proveedor, https://www.rfc-editor.org/rfc/rfc9110#section-14
+	headers = {}
+	if byte_range := GetHeader(msg, b"Range"):
+		headers["Range"] = byte_range.decode("latin-1")
+		if if_range := GetHeader(msg, b"If-Range"):
+			headers["If-Range"] = if_range.decode("latin-1")
+	provider_request = urllib.request.Request(f"http://{provider[0]}:{provider[1]}/rfc{file.decode()}", headers=headers)
+
+	# el socket se cierra aunque el proveedor falle, así el cliente no se queda esperando
+	with request_socket:
+		try:
+			with urllib.request.urlopen(provider_request, timeout=PROVIDER_TIMEOUT) as response:
+				logging.debug(f"GET: sending {file = }, {response.status = }")
+				if response.status == 206:
+					# los rangos son del cuerpo sin comprimir, se envían tal cual
+					compressor = None
+					partial = f"Content-Range: {response.headers.get('Content-Range', '')}\r\n"
+					if content_type := response.headers.get("Content-Type"):
+						# multipart/byteranges si se han pedido varios rangos
+						partial += f"Content-Type: {content_type}\r\n"
+					request_socket.sendall(b"HTTP/1.1 206 Partial Content\r\n" + partial.encode("latin-1") + b"\r\n")
+				else:
+					# wbits 31: formato gzip, la respuesta no tiene Content-Length así que se
+					# puede comprimir por partes sin conocer el tamaño final
+					compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if AcceptsGzip(msg) else None
+					encoding = b"Content-Encoding: gzip\r\n" if compressor else b""
+					request_socket.sendall(b"HTTP/1.1 200 OK\r\n" + encoding + b"Vary: Accept-Encoding\r\n\r\n")
+				# un único buffer reutilizado, urllib ya tiene sus propios datos en buffer
+				# así que no se puede usar splice sobre su socket
+				buffer = memoryview(bytearray(RELAY_BUFFER_SIZE))
+				relayed = 0
+				sent = 0
+				while received := response.readinto(buffer):
+					data = compressor.compress(buffer[:received]) if compressor else buffer[:received]
+					request_socket.sendall(data)
+					relayed += received
+					sent += len(data)
+				if compressor:
+					data = compressor.flush()
+					request_socket.sendall(data)
+					sent += len(data)
+				logging.debug(f"GET: {file = } sent, {relayed = }, {sent = }")
+		except urllib.error.HTTPError as e:
+			# urlopen lanza una excepción para cualquier respuesta que no sea 2xx
+			logging.debug(f"GET: {file = } not sent, {e.code = }")
+			if e.code == 416:
+				content_range = e.headers.get("Content-Range", "").encode("latin-1")
+				request_socket.sendall(b"HTTP/1.1 416 Range Not Satisfiable\r\nContent-Range: " + content_range + b"\r\n\r\n")
+			else:
+				request_socket.sendall(b"HTTP/1.1 404 Not Found\r\n\r\n")
+		except OSError as e:
+			# proveedor caído o sin responder a tiempo: fallo rápido
+			logging.warning(f"GET: {file = } not sent, {e = }")
+			request_socket.sendall(b"HTTP/1.1 502 Bad Gateway\r\n\r\n")
+
+def HTTP(HTTPserver_socket : socket.socket, provider : tuple[str, int], stop = None) -> bytes:
 	"""
 	Siempre:
 		Acepta una nueva conexión
-		Recibe un mensaje de esta
+		Recibe un mensaje de esta, si llega enseguida; si no, la conexión se clasifica en su propio hilo
 		Comprueba si es una petición GET
 			Dedica un hilo a tratar esta
 		En caso contrario
 			Devuelve el mensaje
+	Así ni los GET ni los clientes lentos retrasan el mensaje final
 
 	Parameters:
 		HTTPserver_socket: Socket del servidor HTTP que está a la escucha de nuevas conexiones
 		provider: Tupla dirección puerto que identifica al proveedor de los ficheros a devolver
+		stop: multiprocessing.Event que se activa cuando otro proceso ha recibido el mensaje final
 
 	Returns:
 		El primer mensaje que no sea una petición GET. Este contiene una cabecera HTTP y en el payload, el identificador y las instrucciones para el siguiente Hito
+		Vacío si se ha parado antes de recibirlo
 	"""
 
-	while True:
-		request_socket, peer = HTTPserver_socket.accept()
+	# mensajes finales recibidos por los hilos de las conexiones lentas
+	late_messages = queue.Queue()
+
+	# el accept se despierta de vez en cuando para comprobar si hay que parar o si ha llegado el mensaje final
+	HTTPserver_socket.settimeout(POLL_INTERVAL)
+
+	while late_messages.empty():
+		try:
+			request_socket, peer = HTTPserver_socket.accept()
+		except socket.timeout:
+			if stop is not None and stop.is_set():
+				return b""
+			continue
+		accepted_at = time.monotonic()
+
+		# los sockets aceptados no heredan el timeout
+		request_socket.settimeout(None)
+
+		ready, _, _ = select.select([request_socket], [], [], CLASSIFY_TIMEOUT)
+		if not ready:
+			_thread.start_new_thread(Classify, (request_socket, provider, late_messages, accepted_at))
+			continue
 
 		msg = request_socket.recv(DEFAULT_PACKET_SIZE)
 		logging.debug(f"HTTP: {msg = }")
@@ -467,8 +677,64 @@ def HTTP(HTTPserver_socket : socket.socket, provider : tuple[str, int]) -> bytes
 		if msg[:3] == b"GET":
 			_thread.start_new_thread(GET, (request_socket, msg, provider))
 		else:
+			logging.info(f"HTTP: mensaje final detectado {(time.monotonic() - accepted_at) * 1000:.1f} ms después de aceptar su conexión")
 			return msg
 
+	return late_messages.get()
+
+def Classify(request_socket : socket.socket, provider : tuple[str, int], messages : queue.Queue, accepted_at : float) -> None:
+	"""
+	Hilo de una conexión del hito 6 que no envió su petición a tiempo
+	Espera a recibirla y la trata como lo haría HTTP: si es un GET la atiende y si no, deja el mensaje final en la cola
+
+	Parameters:
+		request_socket: Socket de la conexión aceptada
+		provider: Tupla dirección puerto que identifica al proveedor de los ficheros a devolver
+		messages: queue.Queue en la que se deja el mensaje final
+		accepted_at: time.monotonic() al aceptar la conexión
+	"""
+
+	msg = request_socket.recv(DEFAULT_PACKET_SIZE)
+	logging.debug(f"Classify: {msg = }")
+
+	if msg[:3] == b"GET":
+		GET(request_socket, msg, provider)
+	elif msg:
+		logging.info(f"Classify: mensaje final detectado {(time.monotonic() - accepted_at) * 1000:.1f} ms después de aceptar su conexión")
+		messages.put(msg)
+	else:
+		request_socket.close()
+
+def HTTPWorker(port : int, max_connections : int, provider : tuple[str, int], ready, messages, stop) -> None:
+	"""
+	Proceso del servidor HTTP del hito 6 cuando se usan varios
+	Abre su propio socket en el puerto compartido, con SO_REUSEPORT el núcleo reparte las conexiones entre los procesos
+	Avisa de que está escuchando
+	Atiende a las peticiones HTTP hasta recibir el mensaje final o hasta que otro proceso lo reciba
+	Si lo ha recibido él, lo pasa al proceso principal
+
+	Parameters:
+		port: Puerto por el que escuchan todos los procesos
+		max_connections: Numero máximo de conexiones a atender a la vez en este proceso
+		provider: Tupla dirección puerto que identifica al proveedor de los ficheros a devolver
+		ready: multiprocessing.Semaphore que se libera al empezar a escuchar
+		messages: multiprocessing.Queue en la que se deja el mensaje final
+		stop: multiprocessing.Event que se activa cuando el hito ha terminado
+	"""
+
+	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as servidorHTTP:
+
+		servidorHTTP.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		servidorHTTP.bind(("", port))
+		servidorHTTP.listen(max_connections)
+
+		ready.release()
+
+		msg = HTTP(servidorHTTP, provider, stop)
+
+	if msg:
+		messages.put(msg)
+
 def ErrorListening(connection_tuple : tuple[str, int], identifier : bytes, port : int) -> None:
 	"""
 	Crea el mensaje a enviar con el identificador y el puerto
@@ -497,12 +763,14 @@ def ErrorListening(connection_tuple : tuple[str, int], identifier : bytes, port
 
 			logging.warning(f"ErrorListening: {msg = }")
 
-def Hito6(connection_tuple : tuple[str, int], identifier : bytes, port : int, max_connections : int, provider : tuple[str, int]) -> bytes:
+def Hito6(connection_tuple : tuple[str, int], identifier : bytes, port : int, max_connections : int, provider : tuple[str, int], processes : int = 1) -> bytes:
 	"""
 	Abre el servidor HTTP conectandose al puerto dado y escucha la cantidad de conexiones dadas
 	Crea un hilo para la escucha de errores
 	Atiende a las peticiones HTTP
 	Busca y devuelve el payload del último mensaje HTTP
+	Con varios procesos, cada uno atiende su parte de las conexiones con su propio intérprete (HTTPWorker)
+	y este espera al mensaje final de cualquiera de ellos
 
 	Parameters:
 		connection_tuple: Una tupla con la dirección y el puerto al que nos conectaremos
@@ -510,19 +778,65 @@ def Hito6(connection_tuple : tuple[str, int], identifier : bytes, port : int, ma
 		port: Puerto por el que escuchará el servidor
 		max_connections: Numero máximo de conexiones a atender a la vez
 		provider: Tupla dirección puerto que identifica al proveedor de los ficheros a devolver
+		processes: Número de procesos que atienden al servidor HTTP
 
 	Returns:
 		El payload del último mensaje HTTP, el identificador y las instrucciones para el siguiente Hito
 	"""
 
-	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as servidorHTTP:
-
-		servidorHTTP.bind(("", port))
-		servidorHTTP.listen(max_connections)
-
-		_thread.start_new_thread(ErrorListening, (connection_tuple, identifier, port))
-
-		msg = HTTP(servidorHTTP, provider)
+	if processes > 1:
+		# spawn: los procesos no heredan los hilos de este
+		context = multiprocessing.get_context("spawn")
+		ready = context.Semaphore(0)
+		messages = context.Queue()
+		stop = context.Event()
+
+		workers = [context.Process(target=HTTPWorker, args=(port, max_connections, provider, ready, messages, stop), daemon=True) for _ in range(processes)]
+		for worker in workers:
+			worker.start()
+
+		try:
+			# no se anuncia el puerto hasta que todos escuchan; un proceso que falla al abrir el puerto termina sin avisar
+			deadline = time.monotonic() + WORKER_START_TIMEOUT
+			listening = 0
+			while listening < processes:
+				if ready.acquire(timeout=POLL_INTERVAL):
+					listening += 1
+				elif not all(worker.is_alive() for worker in workers):
+					raise ChildProcessError("Hito6: un proceso del servidor HTTP terminó sin llegar a escuchar")
+				elif time.monotonic() > deadline:
+					raise TimeoutError("Hito6: los procesos del servidor HTTP no llegaron a escuchar")
+
+			_thread.start_new_thread(ErrorListening, (connection_tuple, identifier, port))
+
+			deadline = time.monotonic() + HTTP_CHAMBER_TIMEOUT
+			msg = b""
+			while not msg:
+				try:
+					msg = messages.get(timeout=POLL_INTERVAL)
+				except queue.Empty:
+					if not any(worker.is_alive() for worker in workers):
+						raise ChildProcessError("Hito6: todos los procesos del servidor HTTP terminaron sin el mensaje final")
+					if time.monotonic() > deadline:
+						raise TimeoutError("Hito6: no llegó el mensaje final")
+			logging.info(f"Hito6: final message received, stopping {processes} processes")
+
+		finally:
+			stop.set()
+			for worker in workers:
+				worker.join(PROVIDER_TIMEOUT)
+				if worker.is_alive():
+					worker.terminate()
+
+	else:
+		with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as servidorHTTP:
+
+			servidorHTTP.bind(("", port))
+			servidorHTTP.listen(max_connections)
+
+			_thread.start_new_thread(ErrorListening, (connection_tuple, identifier, port))
+
+			msg = HTTP(servidorHTTP, provider)
 
 	http_header_end = msg.find(b"\r\n\r\n")
 
@@ -551,44 +865,152 @@ def Hito7(connection_tuple : tuple[str, int], identifier : bytes) -> bytes:
 
 	return msg
 
-# función main: llama a todos los hitos en orden con los parámetros necesarios
-if __name__ == "__main__":
-	try:
-		#logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
+def ResolveEndpoint(connection_tuple : tuple[str, int]) -> tuple[str, int]:
+	"""
+	Resuelve el host de la tupla una sola vez cada RESOLVE_TTL segundos, así los hitos no repiten la búsqueda del nombre al conectarse
 
-		print(f"main: Starting {__file__} as {os.environ['USER']}.")
+	Parameters:
+		connection_tuple: Una tupla con el host y el puerto
+
+	Returns:
+		La tupla con la dirección IP y el puerto, o la original si no se puede resolver
+	"""
 
-		msg = Hito0(("yinkana", 2000), os.environ["USER"])
+	host, port = connection_tuple
+	now : float = time.monotonic()
 
-		print(f"main: Hito1:\n{msg.decode()}")
+	if host not in resolved_hosts or resolved_hosts[host][1] <= now:
+		try:
+			resolved_hosts[host] = (socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0][4][0], now + RESOLVE_TTL)
+		except OSError as e:
+			logging.warning(f"ResolveEndpoint: {host}: {e}")
+			return connection_tuple
 
-		msg = Hito1(("yinkana", 4000), ObtainIdentifier(msg), 25565)
+	return resolved_hosts[host][0], port
 
-		print(f"main: Hito2:\n{msg.decode()}")
+def LoadState(state_file : str) -> dict[str, bytes]:
+	"""
+	Lee los enunciados guardados de los hitos completados
 
-		msg = Hito2(("yinkana", 3010), ObtainIdentifier(msg), 1000)
+	Parameters:
+		state_file: Ruta del fichero de estado
 
-		print(f"main: Hito3:\n{msg.decode()}")
+	Returns:
+		El enunciado devuelto por cada hito completado, por nombre. Vacío si no hay fichero, no se puede leer o tiene más de STATE_MAX_AGE segundos
+	"""
 
-		msg = Hito3(("yinkana", 5501), ObtainIdentifier(msg), 1200)
+	try:
+		if time.time() - os.path.getmtime(state_file) > STATE_MAX_AGE:
+			logging.warning(f"LoadState: ignoring {state_file}: older than {STATE_MAX_AGE} s")
+			return {}
+		with open(state_file, "r", encoding="utf-8") as state:
+			# latin-1 convierte cada byte en un carácter y vuelta
+			return {name : output.encode("latin-1") for name, output in json.load(state).items()}
+	except FileNotFoundError:
+		return {}
+	except (OSError, ValueError, AttributeError) as e:
+		logging.warning(f"LoadState: ignoring {state_file}: {e}")
+		return {}
+
+def SaveState(state_file : str, outputs : dict[str, bytes]) -> None:
+	"""
+	Guarda los enunciados de los hitos completados en un fichero temporal y lo renombra, así nunca queda a medias
 
-		print(f"main: Hito4:\n{msg.decode()}")
+	Parameters:
+		state_file: Ruta del fichero de estado
+		outputs: El enunciado devuelto por cada hito completado, por nombre
+	"""
 
-		msg = Hito4(("yinkana", 9000), ObtainIdentifier(msg))
+	descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(state_file)), prefix=".state-")
+	try:
+		with os.fdopen(descriptor, "w", encoding="utf-8") as state:
+			json.dump({name : output.decode("latin-1") for name, output in outputs.items()}, state, indent=1)
+		os.replace(temporary, state_file)
+	except BaseException:
+		os.unlink(temporary)
+		raise
 
-		print(f"main: Hito5:\n{msg.decode()}")
+def RunStages(stages : list[tuple], state_file : str = STATE_FILE, retries : int = 0, backoff : float = STAGE_BACKOFF, resume : bool = False) -> bytes:
+	"""
+	Ejecuta los hitos en orden, cada uno con los enunciados devueltos por los hitos de los que depende
+	Tras cada hito guarda su enunciado en el fichero de estado; si la ejecución falla, la siguiente con resume continúa desde el hito que falló
+	Sin resume se empieza desde el principio: los identificadores guardados son de una sesión anterior del servidor
+	Un hito que falla solo se repite si se puede hacer sin peligro y lo pide, tras esperar backoff segundos, el doble en cada reintento
+	Al final muestra lo que ha tardado cada hito y borra el fichero de estado
 
-		msg = Hito5(("yinkana", 6001), ObtainIdentifier(msg))
+	Parameters:
+		stages: Nombre, función, nombres de los hitos anteriores cuyos enunciados recibe la función y, opcionalmente, veces que se repite si falla, en orden
+		state_file: Ruta del fichero de estado
+		retries: Veces que se repite un hito que falla y no dice las suyas
+		backoff: Segundos antes del primer reintento
+		resume: Si se continúa desde los hitos guardados por la ejecución anterior
 
-		print(f"main: Hito6:\n{msg.decode()}")
+	Returns:
+		El enunciado devuelto por el último hito
+	"""
 
-		msg = Hito6(("yinkana", 8002), ObtainIdentifier(msg), 25565, 5, ("rick", 81))
+	outputs : dict[str, bytes] = LoadState(state_file) if resume else {}
+	times : dict[str, float] = {}
+	msg : bytes = b""
 
-		print(f"main: Hito6:\n{msg.decode()}")
+	if outputs:
+		print(f"RunStages: resuming from {state_file}")
 
-		msg = Hito7(("yinkana", 33333), ObtainIdentifier(msg))
+	try:
+		for name, function, inputs, *options in stages:
+			if name in outputs:
+				msg = outputs[name]
+				continue
+
+			start : float = time.monotonic()
+			stage_retries : int = options[0] if options else retries
+			for attempt in range(stage_retries + 1):
+				try:
+					msg = function(*(outputs[stage] for stage in inputs))
+					break
+				except Exception as e:
+					if attempt == stage_retries:
+						raise
+					logging.warning(f"RunStages: {name} failed: {e}, retrying in {backoff * 2 ** attempt} s")
+					time.sleep(backoff * 2 ** attempt)
+			times[name] = time.monotonic() - start
+
+			print(f"RunStages: {name}:\n{msg.decode()}")
+
+			outputs[name] = msg
+			SaveState(state_file, outputs)
+	finally:
+		for name, *_ in stages:
+			print(f"RunStages: {name}: " + (f"{times[name]:.3f} s" if name in times else "restored" if name in outputs else "not run"))
+
+	# no existe si ningún hito llegó a guardarse, p. ej. si todos se restauraron
+	try:
+		os.remove(state_file)
+	except FileNotFoundError:
+		pass
+
+	return msg
+
+# función main: llama a todos los hitos en orden con los parámetros necesarios
+if __name__ == "__main__":
+	try:
+		#logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
+
+		print(f"main: Starting {__file__} as {os.environ['USER']}.")
 
-		print(f"main: Hito7:\n{msg.decode()}")
+		# cada hito recibe el enunciado del anterior y se resuelve donde este diga, con la dirección
+		# configurada si no la da; los hosts se resuelven una sola vez
+		# con --resume se continúa desde el hito que falló en la ejecución anterior; solo el Hito0 se repite si falla
+		msg = RunStages([
+			("Hito0", lambda: Hito0(ResolveEndpoint(("yinkana", 2000)), os.environ["USER"]), (), STAGE_RETRIES),
+			("Hito1", lambda msg: Hito1(NextChamber(msg, ("yinkana", 4000)), ObtainIdentifier(msg), 25565), ("Hito0",)),
+			("Hito2", lambda msg: Hito2(NextChamber(msg, ("yinkana", 3010)), ObtainIdentifier(msg), prompt_parser.parse_prompt(msg).number("maximum", 1000)), ("Hito1",)),
+			("Hito3", lambda msg: Hito3(NextChamber(msg, ("yinkana", 5501)), ObtainIdentifier(msg), prompt_parser.parse_prompt(msg).number("maximum", 1200)), ("Hito2",)),
+			("Hito4", lambda msg: Hito4(NextChamber(msg, ("yinkana", 9000)), ObtainIdentifier(msg)), ("Hito3",)),
+			("Hito5", lambda msg: Hito5(NextChamber(msg, ("yinkana", 6001)), ObtainIdentifier(msg)), ("Hito4",)),
+			("Hito6", lambda msg: Hito6(NextChamber(msg, ("yinkana", 8002)), ObtainIdentifier(msg), 25565, 5, prompt_parser.parse_prompt(msg).provider(("rick", 81)), HTTP_PROCESSES), ("Hito5",)),
+			("Hito7", lambda msg: Hito7(NextChamber(msg, ("yinkana", 33333)), ObtainIdentifier(msg)), ("Hito6",)),
+		], resume="--resume" in sys.argv[1:])
 
 	except Exception as e:
 		logging.error(f"main: Exception: {e}")
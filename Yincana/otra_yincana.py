@@ -6,6 +6,8 @@ import struct
 import base64
 import sys
 import array
+import os
+import time
 
 def cksum(pkt):
     # type: (bytes) -> int
@@ -76,13 +78,34 @@ def longitudHito2(cliente):
 
     return longitud
 
+MARCA = b"identifier:"
+# lo que pase de aquí se descarta
+MAXIMO_ENUNCIADO = 64 * 1024
+
 def siguienteEnunciado(cliente):
+    # solo se guarda el final de lo anterior, por si la marca llega partida en dos mensajes
+    resto = b""
     mensaje = cliente.recv(1024)
 
-    while mensaje and not mensaje.decode().startswith("identifier:"):
+    while mensaje:
+        datos = resto + mensaje
+        inicio = datos.find(MARCA)
+        if inicio != -1:
+            return restoEnunciado(cliente, datos[inicio:])
+        resto = datos[-(len(MARCA) - 1):]
         mensaje = cliente.recv(1024)
 
-    return mensaje
+    return b""
+
+def restoEnunciado(cliente, enunciado):
+    # el enunciado no tiene terminador, acaba cuando el servidor cierra la conexión;
+    # un silencio no basta, un servidor lento puede pararse a mitad
+    mensaje = cliente.recv(1024)
+    while mensaje and len(enunciado) < MAXIMO_ENUNCIADO:
+        enunciado += mensaje
+        mensaje = cliente.recv(1024)
+
+    return enunciado[:MAXIMO_ENUNCIADO]
 
 def Hito2(mensaje):
     cliente = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -177,7 +200,7 @@ def Hito4(mensaje):
     digest = sha1.digest()
 
     cliente.sendall(digest)
-    mensaje = siguienteEnunciado(cliente) + cliente.recv(1024)
+    mensaje = siguienteEnunciado(cliente)
 
     cliente.close()
 
@@ -202,19 +225,54 @@ def Hito5(mensaje):
 
     return base64.b64decode(mensaje)
 
+# aquí se guarda el enunciado de cada hito completado, si algo falla con --resume se sigue
+# desde ahí; si tiene más de ESTADO_MAX segundos sus identificadores ya han caducado
+ESTADO = "otra_yincana.estado"
+ESTADO_MAX = 3600
+REINTENTOS = 2
+
+def cargarEstado():
+    try:
+        if time.time() - os.path.getmtime(ESTADO) > ESTADO_MAX:
+            return []
+        with open(ESTADO) as fichero:
+            return [base64.b64decode(linea) for linea in fichero.read().split()]
+    except FileNotFoundError:
+        return []
+
+def guardarEstado(mensajes):
+    with open(ESTADO + ".tmp", "w") as fichero:
+        fichero.write("\n".join(base64.b64encode(mensaje).decode() for mensaje in mensajes))
+    os.replace(ESTADO + ".tmp", ESTADO)
+
 def main():
-    mensaje = Hito0("heuristic_cray")
-    print(mensaje.decode())
-    mensaje = Hito1(mensaje)
-    print(mensaje.decode())
-    mensaje = Hito2(mensaje)
-    print(mensaje.decode())
-    mensaje = Hito3(mensaje)
-    print(mensaje.decode())
-    mensaje = Hito4(mensaje)
-    print(mensaje.decode())
-    mensaje = Hito5(mensaje)
-    print(mensaje.decode())
+    hitos = [lambda _: Hito0("heuristic_cray"), Hito1, Hito2, Hito3, Hito4, Hito5]
+    mensajes = cargarEstado() if "--resume" in sys.argv[1:] else []
+    mensaje = mensajes[-1] if mensajes else b""
+
+    for i in range(len(mensajes), len(hitos)):
+        inicio = time.time()
+
+        for intento in range(REINTENTOS + 1):
+            try:
+                mensaje = hitos[i](mensaje)
+                break
+            except Exception:
+                if intento == REINTENTOS:
+                    raise
+                time.sleep(2 ** intento)
+
+        print(mensaje.decode())
+        print("Hito", i, "en", round(time.time() - inicio, 3), "s")
+
+        mensajes.append(mensaje)
+        guardarEstado(mensajes)
+
+    # no existe si ningún hito llegó a guardarse
+    try:
+        os.remove(ESTADO)
+    except FileNotFoundError:
+        pass
 
 main()
 
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""Asyncio implementation of the whole chamber sequence.
+
+Every chamber is a coroutine with the signature of its counterpart in yinkana.py, using
+streams from asyncio.open_connection or a datagram endpoint, and the HTTP chamber is
+async_proxy.chamber_6_async, so its server, error channel and relays are tasks of the same
+loop. Each chamber runs under a timeout and closes its transport when it is cancelled, so a
+session can be abandoned at any point, and several sessions can share one loop.
+"""
+
+import re
+import sys
+import json
+import time
+import array
+import base64
+import struct
+import asyncio
+import logging
+import contextlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import async_proxy
+import json_stream
+import prompt_parser
+
+
+RECV_SIZE: int = 64 * 1024
+# seconds each chamber has to return the next prompt
+CHAMBER_TIMEOUT: float = 60.0
+# seconds the HTTP chamber has, it waits for the clients of the chamber
+HTTP_CHAMBER_TIMEOUT: float = 600.0
+PROMPT_MARKER: bytes = b"identifier:"
+LOWERCASE: bytes = b"abcdefghijklmnopqrstuvwxyz"
+ASCII_UPPERCASE: re.Pattern[str] = re.compile(r"[A-Z]")
+# a number followed by a space, what ends the words of chamber 3
+WORD_COUNT: re.Pattern[bytes] = re.compile(rb"(\d+) ")
+
+
+def cksum(pkt: bytes) -> int:
+    # pylint: disable=invalid-name disable=missing-function-docstring
+    if len(pkt) % 2 == 1:
+        pkt += b"\0"
+    s = sum(array.array("H", pkt))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    s = ~s
+
+    if sys.byteorder == "little":
+        s = ((s >> 8) & 0xFF) | s << 8
+
+    return s & 0xFFFF
+
+
+@contextlib.asynccontextmanager
+async def connection(
+    target_ip: str, target_port: int
+) -> AsyncIterator[tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+    """Opens a TCP connection and closes it on exit, also when the chamber is cancelled.
+
+    Args:
+        target_ip (str): The IP address to connect to.
+        target_port (int): The port to connect to.
+
+    Yields:
+        tuple[asyncio.StreamReader, asyncio.StreamWriter]: The streams of the connection.
+    """
+    reader, writer = await asyncio.open_connection(target_ip, target_port, limit=RECV_SIZE)
+    try:
+        yield reader, writer
+    finally:
+        writer.close()
+
+
+async def read_prompt(reader: asyncio.StreamReader) -> bytes:
+    """Reads until the prompt of the next chamber, even if the marker is split between reads.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of the chamber.
+
+    Returns:
+        bytes: The prompt, from the marker to the end of the read that completes it.
+
+    Raises:
+        ConnectionError: If the chamber closes the connection without sending it.
+    """
+    carry: bytes = b""
+    while data := await reader.read(RECV_SIZE):
+        data = carry + data
+        start: int = data.find(PROMPT_MARKER)
+        if start != -1:
+            return data[start:]
+        carry = data[-(len(PROMPT_MARKER) - 1) :]
+    raise ConnectionError("the chamber closed the connection without the prompt")
+
+
+class DatagramQueue(asyncio.DatagramProtocol):
+    """Keeps the received datagrams in a queue, with their senders, and the errors, e.g. the
+    port unreachable of a connected endpoint, so the chamber fails instead of waiting.
+    """
+
+    def __init__(self) -> None:
+        self.datagrams: "asyncio.Queue[tuple[bytes, Any] | Exception]" = asyncio.Queue()
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        self.datagrams.put_nowait((data, addr))
+
+    def error_received(self, exc: Exception) -> None:
+        self.datagrams.put_nowait(exc)
+
+    async def receive(self) -> tuple[bytes, Any]:
+        """Waits for the next datagram.
+
+        Returns:
+            tuple[bytes, Any]: The datagram and its sender.
+
+        Raises:
+            OSError: The error received instead, if any.
+        """
+        datagram: tuple[bytes, Any] | Exception = await self.datagrams.get()
+        if isinstance(datagram, Exception):
+            raise datagram
+        return datagram
+
+
+async def chamber_0(target_ip: str, target_port: int, username: bytes) -> bytes:
+    """Sends the username to the specified IP address and port.
+    Returns the next chamber prompt.
+
+    Args:
+        target_ip (str): The IP address to send the username to.
+        target_port (int): The port to send the username to.
+        username (bytes): The username to send.
+
+    Returns:
+        bytes: The next chamber prompt.
+    """
+    async with connection(target_ip, target_port) as (reader, writer):
+        logging.info((await reader.read(1024)).decode())
+        writer.write(username)
+        await writer.drain()
+        return await reader.read(1024)
+
+
+async def chamber_1(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
+    """Sends the chamber_id and the port of a UDP endpoint, answers its upper-code request.
+    Returns the next chamber prompt.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+
+    Returns:
+        bytes: The next chamber prompt.
+    """
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        DatagramQueue, local_addr=("0.0.0.0", 0)
+    )
+    try:
+        unused_port: int = transport.get_extra_info("sockname")[1]
+        transport.sendto(str(unused_port).encode() + b" " + chamber_id, (target_ip, target_port))
+
+        received_data, sender = await protocol.receive()
+        if received_data == b"upper-code?":
+            logging.debug("upper-code request received from %s", str(sender))
+            transport.sendto(chamber_id.upper(), sender)
+            received_data, _ = await protocol.receive()
+        return received_data
+    finally:
+        transport.close()
+
+
+async def count_words_before(reader: asyncio.StreamReader, flag: bytes) -> int:
+    """Counts the spaces and newlines received before a flag, split between reads or not.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of the words.
+        flag (bytes): The flag that ends the words.
+
+    Returns:
+        int: The number of words before the flag.
+
+    Raises:
+        ConnectionError: If the stream ends before the flag.
+    """
+    count: int = 0
+    pending: bytes = b""
+    while data := await reader.read(RECV_SIZE):
+        pending += data
+        index: int = pending.find(flag)
+        if index != -1:
+            return count + pending.count(b" ", 0, index) + pending.count(b"\n", 0, index)
+        # the end may be the start of the flag
+        scanned: int = max(0, len(pending) - len(flag) + 1)
+        count += pending.count(b" ", 0, scanned) + pending.count(b"\n", 0, scanned)
+        pending = pending[scanned:]
+    raise ConnectionError("the chamber closed the connection before the flag")
+
+
+async def chamber_2(
+    target_ip: str, target_port: int, chamber_id: bytes, flag: bytes
+) -> bytes:
+    """Sends the chamber_id and the number of words before a flag.
+    Returns the next chamber prompt.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+        flag (bytes): The flag to search for in the received data.
+
+    Returns:
+        bytes: The next chamber prompt.
+    """
+    async with connection(target_ip, target_port) as (reader, writer):
+        words: int = await count_words_before(reader, flag)
+        writer.write(chamber_id + b" " + str(words).encode())
+        await writer.drain()
+        return await read_prompt(reader)
+
+
+async def read_last_words(reader: asyncio.StreamReader) -> bytes:
+    """Reads words until a number X and returns the last X words before it.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of the words.
+
+    Returns:
+        bytes: The last X words, separated by spaces.
+
+    Raises:
+        ConnectionError: If the stream ends before the number.
+    """
+    received_data: bytes = b""
+    while data := await reader.read(RECV_SIZE):
+        received_data += data
+        number: Optional[re.Match[bytes]] = WORD_COUNT.search(received_data)
+        if number is not None:
+            # the words end with the space before the number
+            words: list[bytes] = received_data[: max(0, number.start() - 1)].rsplit(
+                b" ", int(number[1])
+            )
+            return b" ".join(words[max(0, len(words) - int(number[1])) :])
+    raise ConnectionError("the chamber closed the connection before the number of words")
+
+
+async def chamber_3(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
+    """Sends the chamber_id, then encrypts the last X words with the received alphabet.
+    Returns the next chamber prompt.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+
+    Returns:
+        bytes: The next chamber prompt.
+    """
+    async with connection(target_ip, target_port) as (reader, writer):
+        writer.write(chamber_id)
+        await writer.drain()
+
+        alphabet: bytes = await reader.readexactly(26)
+        table: bytes = bytes.maketrans(LOWERCASE + LOWERCASE.upper(), alphabet + alphabet)
+        words: bytes = await read_last_words(reader)
+
+        writer.write(words.translate(table) + b" --")
+        await writer.drain()
+        return await read_prompt(reader)
+
+
+def sentence_answer(username: str, sentence: str) -> bytes:
+    """Returns the answer of chamber 4 to a sentence.
+
+    Args:
+        username (str): The player.
+        sentence (str): The sentence.
+
+    Returns:
+        bytes: The serialized answer.
+    """
+    letters: list[str] = (
+        ASCII_UPPERCASE.findall(sentence)
+        if sentence.isascii()
+        else [letter for letter in sentence if letter.isupper()]
+    )
+    return json.dumps(
+        {"player": username, "upperletters": letters, "timestamp": int(time.time())}
+    ).encode()
+
+
+async def chamber_4(
+    target_ip: str, target_port: int, chamber_id: bytes, username: str
+) -> bytes:
+    """Sends the chamber_id and answers every sentence with its uppercase letters.
+    The answers to the sentences completed by one read are written together, and the
+    next read does not wait for the server to receive them.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+        username (str): The username to send.
+
+    Returns:
+        bytes: The next chamber prompt.
+
+    Raises:
+        ConnectionError: If the chamber closes the connection without the prompt.
+    """
+    stream: json_stream.JsonStream = json_stream.JsonStream()
+    async with connection(target_ip, target_port) as (reader, writer):
+        writer.write(chamber_id)
+        await writer.drain()
+
+        while data := await reader.read(RECV_SIZE):
+            for request in stream.feed(data):
+                sentence: str = request["sentence"]
+                writer.write(sentence_answer(username, sentence))
+                if sentence.startswith("identifier:"):
+                    await writer.drain()
+                    return sentence.encode()
+            await writer.drain()
+    raise ConnectionError("the chamber closed the connection without the prompt")
+
+
+async def chamber_5(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
+    """Sends a YAP request with the chamber_id as payload over UDP.
+    Returns the decoded response.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+
+    Returns:
+        bytes: The decoded response.
+    """
+    encoded_payload: bytes = base64.b64encode(chamber_id)
+    no_sum_header: bytes = struct.pack("!3sHBHH", b"YAP", 0, 0, 0, 1)
+    checksum: int = cksum(no_sum_header + encoded_payload)
+    full_header: bytes = struct.pack("!3sHBHH", b"YAP", 0, 0, checksum, 1)
+
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        DatagramQueue, remote_addr=(target_ip, target_port)
+    )
+    try:
+        transport.sendto(full_header + encoded_payload)
+        received_data, _ = await protocol.receive()
+    finally:
+        transport.close()
+    return base64.b64decode(received_data[10:])
+
+
+async def chamber_7(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
+    """Sends chamber_id and obtains cake.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+
+    Returns:
+        bytes: The cake.
+    """
+    async with connection(target_ip, target_port) as (reader, writer):
+        writer.write(chamber_id)
+        await writer.drain()
+        return await reader.read(1024)
+
+
+async def next_chamber(
+    message: bytes,
+    chamber: Callable[..., Awaitable[bytes]],
+    default: tuple[str, int],
+    *args: Any,
+    provider: Optional[tuple[str, int]] = None,
+    timeout: float = CHAMBER_TIMEOUT,
+) -> bytes:
+    """Runs a chamber where the previous prompt says, with its identifier, under a timeout.
+
+    Args:
+        message (bytes): The previous prompt.
+        chamber (Callable[..., Awaitable[bytes]]): The chamber, called with the host, port and
+            identifier of the prompt, the provider if any, and the other arguments.
+        default (tuple[str, int]): The host and port of the chamber if the prompt omits them.
+        *args (Any): The arguments of the chamber after the identifier.
+        provider (Optional[tuple[str, int]]): Default address of the provider of the HTTP
+            chamber; the prompt's second address is passed if it has one.
+        timeout (float): Seconds the chamber has.
+
+    Returns:
+        bytes: The next prompt.
+
+    Raises:
+        ValueError: If the prompt has no identifier.
+        asyncio.TimeoutError: If the chamber does not finish in time; it is cancelled.
+    """
+    # pylint: disable=too-many-arguments
+    logging.info(message.decode())
+    prompt: prompt_parser.Prompt = prompt_parser.parse_prompt(message)
+    if prompt.identifier is None:
+        raise ValueError(f"no identifier in {message!r}")
+    provider_address: tuple[Any, ...] = () if provider is None else prompt.provider(provider)
+    return await asyncio.wait_for(
+        chamber(*prompt.target(default), prompt.identifier, *provider_address, *args), timeout
+    )
+
+
+async def timed(
+    name: str,
+    step: Awaitable[bytes],
+    record: Optional[Callable[[str, float, bool], None]] = None,
+) -> bytes:
+    """Awaits a chamber and records how long it took and whether it succeeded.
+
+    Args:
+        name (str): The name of the chamber.
+        step (Awaitable[bytes]): The chamber.
+        record (Optional[Callable[[str, float, bool], None]]): Called with the name, the
+            seconds and whether the chamber succeeded; None to only await it.
+
+    Returns:
+        bytes: What the chamber returned.
+    """
+    start: float = time.monotonic()
+    try:
+        result: bytes = await step
+    except Exception:
+        if record is not None:
+            record(name, time.monotonic() - start, False)
+        raise
+    if record is not None:
+        record(name, time.monotonic() - start, True)
+    return result
+
+
+async def run_session(
+    username: str,
+    host: str = "rick",
+    port: int = 2000,
+    provider: tuple[str, int] = ("web", 81),
+    record: Optional[Callable[[str, float, bool], None]] = None,
+) -> bytes:
+    """Goes through every chamber, each one where the previous prompt says.
+    Cancelling the task abandons the session and closes its connections.
+
+    Args:
+        username (str): The player.
+        host (str): The host of the chambers when a prompt does not name it.
+        port (int): The port of the first chamber.
+        provider (tuple[str, int]): The HTTP provider when the prompt does not name it.
+        record (Optional[Callable[[str, float, bool], None]]): Called after every chamber
+            with its name, its seconds and whether it succeeded.
+
+    Returns:
+        bytes: The cake.
+    """
+    # pylint: disable=too-many-arguments
+    message: bytes = await timed(
+        "chamber_0",
+        asyncio.wait_for(chamber_0(host, port, username.encode()), CHAMBER_TIMEOUT),
+        record,
+    )
+    message = await timed("chamber_1", next_chamber(message, chamber_1, (host, 4000)), record)
+    message = await timed(
+        "chamber_2", next_chamber(message, chamber_2, (host, 3002), b"that's the end"), record
+    )
+    message = await timed("chamber_3", next_chamber(message, chamber_3, (host, 6510)), record)
+    message = await timed(
+        "chamber_4", next_chamber(message, chamber_4, (host, 3061), username), record
+    )
+    message = await timed("chamber_5", next_chamber(message, chamber_5, (host, 6001)), record)
+    message = await timed(
+        "chamber_6",
+        next_chamber(
+            message,
+            async_proxy.chamber_6_async,
+            (host, 8002),
+            provider=provider,
+            timeout=HTTP_CHAMBER_TIMEOUT,
+        ),
+        record,
+    )
+    return await timed("chamber_7", next_chamber(message, chamber_7, (host, 33333)), record)
+
+
+async def run_sessions(usernames: list[str]) -> list[Any]:
+    """Runs a session per player on the same loop.
+
+    Args:
+        usernames (list[str]): The players.
+
+    Returns:
+        list[Any]: The cake of each session, or the exception that ended it.
+    """
+    return await asyncio.gather(
+        *(run_session(username) for username in usernames), return_exceptions=True
+    )
+
+
+def main() -> None:
+    """Runs a session for each player given as argument, on_eagle by default."""
+    logging.basicConfig(format="%(levelname)s: %(funcName)s: %(message)s", level=logging.INFO)
+    usernames: list[str] = sys.argv[1:] or ["on_eagle"]
+    for username, cake in zip(usernames, asyncio.run(run_sessions(usernames))):
+        if isinstance(cake, BaseException):
+            logging.error("%s: %r", username, cake)
+        else:
+            logging.info("%s: %s", username, cake.decode())
+
+
+if __name__ == "__main__":
+    main()
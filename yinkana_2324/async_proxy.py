@@ -0,0 +1,746 @@
+#!/usr/bin/env python3
+"""Asyncio implementation of the HTTP chamber (Hito6 / chamber_6).
+
+Everything runs as tasks of one event loop: the error listener connection, the HTTP server,
+every client connection and the relays to the RFC provider. Bodies are streamed with
+bounded buffers and flow control, so memory depends on the number of connections and not
+on the size of the documents.
+
+chamber_6 has the same signature as yinkana.chamber_6 and can replace it.
+"""
+
+import socket
+import asyncio
+import logging
+import urllib.parse
+from typing import AsyncIterator, Iterable, Optional, SupportsIndex
+
+import http_pool
+import http_cache
+import http_parser
+import circuit_breaker
+import rfc_proxy
+
+
+STREAM_LIMIT: int = 64 * 1024
+
+
+class ProviderReader(asyncio.StreamReader):
+    """Stream of a provider connection that remembers when it last received data, so a
+    pooled connection can tell whether the provider sent anything while it was idle."""
+
+    def __init__(self, limit: int = STREAM_LIMIT) -> None:
+        super().__init__(limit=limit)
+        self.received_at: float = 0.0
+
+    def feed_data(self, data: Iterable[SupportsIndex]) -> None:
+        self.received_at = asyncio.get_running_loop().time()
+        super().feed_data(data)
+
+
+async def open_provider_connection(
+    address: tuple[str, int]
+) -> tuple[ProviderReader, asyncio.StreamWriter]:
+    """Opens a connection like asyncio.open_connection, with a ProviderReader.
+
+    Args:
+        address (tuple[str, int]): The host and port of the provider.
+
+    Returns:
+        tuple[ProviderReader, asyncio.StreamWriter]: The streams of the connection.
+    """
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    reader: ProviderReader = ProviderReader()
+    protocol: asyncio.StreamReaderProtocol = asyncio.StreamReaderProtocol(reader)
+    transport, _ = await loop.create_connection(lambda: protocol, *address)
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+class AsyncConnection:
+    """A keep-alive connection to the provider."""
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        reader: ProviderReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.address: tuple[str, int] = address
+        self.reader: ProviderReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.last_used: float = asyncio.get_running_loop().time()
+
+    def is_healthy(self) -> bool:
+        """Checks that an idle connection can be reused: nothing was received while idle."""
+        return (
+            not self.writer.is_closing()
+            and not self.reader.at_eof()
+            and self.reader.received_at <= self.last_used
+        )
+
+    def close(self) -> None:
+        """Closes the connection without waiting."""
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """Asyncio counterpart of http_pool.ConnectionPool.
+
+    Args:
+        max_idle_per_host (int): Maximum number of idle connections kept for each host.
+        idle_timeout (float): Seconds after which an idle connection is evicted.
+        connect_timeout (float): Seconds to wait while connecting to the provider.
+        read_timeout (float): Seconds to wait for each read from the provider.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = 32,
+        idle_timeout: float = 15.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+    ) -> None:
+        self.max_idle_per_host: int = max_idle_per_host
+        self.idle_timeout: float = idle_timeout
+        self.connect_timeout: float = connect_timeout
+        self.read_timeout: float = read_timeout
+
+        self.idle: dict[tuple[str, int], list[AsyncConnection]] = {}
+        self.created: int = 0
+        self.reused: int = 0
+
+    async def acquire(self, address: tuple[str, int]) -> tuple[AsyncConnection, bool]:
+        """Returns a healthy idle connection to the address or a new one.
+
+        Args:
+            address (tuple[str, int]): The host and port to connect to.
+
+        Returns:
+            tuple[AsyncConnection, bool]: The connection and whether it was reused.
+        """
+        deadline: float = asyncio.get_running_loop().time() - self.idle_timeout
+        idle: list[AsyncConnection] = self.idle.get(address, [])
+        while idle:
+            connection: AsyncConnection = idle.pop()
+            if connection.last_used >= deadline and connection.is_healthy():
+                self.reused += 1
+                return connection, True
+            connection.close()
+
+        reader, writer = await asyncio.wait_for(
+            open_provider_connection(address), self.connect_timeout
+        )
+        self.created += 1
+        return AsyncConnection(address, reader, writer), False
+
+    def release(self, connection: AsyncConnection) -> None:
+        """Stores a connection whose last response was fully read, so it can be reused.
+
+        Args:
+            connection (AsyncConnection): The connection to store.
+        """
+        connection.last_used = asyncio.get_running_loop().time()
+        idle: list[AsyncConnection] = self.idle.setdefault(connection.address, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append(connection)
+        else:
+            connection.close()
+
+    async def request(
+        self,
+        address: tuple[str, int],
+        method: bytes,
+        target: bytes,
+        headers: Optional[list[tuple[bytes, bytes]]] = None,
+    ) -> "AsyncResponse":
+        """Sends a request without body and returns the response once its head is read.
+        A request that fails on a reused connection is retried once on a new one.
+
+        Args:
+            address (tuple[str, int]): The host and port of the provider.
+            method (bytes): The HTTP method.
+            target (bytes): The request target.
+            headers (Optional[list[tuple[bytes, bytes]]]): Extra headers to send.
+
+        Returns:
+            AsyncResponse: The response, its body must be read or closed.
+        """
+        request: bytes = (
+            method
+            + b" "
+            + target
+            + b" HTTP/1.1\r\nHost: "
+            + f"{address[0]}:{address[1]}".encode()
+            + b"\r\n"
+            + b"".join(name + b": " + value + b"\r\n" for name, value in headers or [])
+            + b"\r\n"
+        )
+
+        while True:
+            connection, reused = await self.acquire(address)
+            try:
+                connection.writer.write(request)
+                head: bytes = await asyncio.wait_for(
+                    connection.reader.readuntil(b"\r\n\r\n"), self.read_timeout
+                )
+                return AsyncResponse(self, connection, head, method)
+            except (
+                OSError,
+                asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError,
+                http_pool.HTTPProtocolError,
+            ):
+                connection.close()
+                if not reused:
+                    raise
+                logging.debug("reused connection to %s failed, retrying", address)
+
+
+class AsyncResponse(http_pool.PooledResponse):
+    """A response being read from an asyncio connection of the pool.
+    Framing and headers are handled like in http_pool.PooledResponse.
+    """
+
+    # pylint: disable=super-init-not-called
+
+    def __init__(
+        self,
+        pool: AsyncConnectionPool,
+        connection: AsyncConnection,
+        head: bytes,
+        method: bytes,
+    ) -> None:
+        self.async_pool: AsyncConnectionPool = pool
+        self.async_connection: Optional[AsyncConnection] = connection
+        self.connection = None
+        self.parse(head, method)
+
+    async def iter_body_async(self) -> AsyncIterator[bytes]:
+        """Yields the decoded body as it arrives, then releases the connection.
+
+        Yields:
+            bytes: Pieces of the body, at most STREAM_LIMIT bytes each.
+        """
+        connection: Optional[AsyncConnection] = self.async_connection
+        if connection is None:
+            return
+        reader: asyncio.StreamReader = connection.reader
+        timeout: float = self.async_pool.read_timeout
+
+        try:
+            if self.chunked:
+                while True:
+                    size_line: bytes = await asyncio.wait_for(reader.readline(), timeout)
+                    try:
+                        size: int = int(size_line.split(b";", 1)[0].strip(), 16)
+                    except ValueError as ex:
+                        raise http_pool.HTTPProtocolError(
+                            f"bad chunk size {size_line!r}"
+                        ) from ex
+                    if size == 0:
+                        break
+                    while size > 0:
+                        data: bytes = await asyncio.wait_for(
+                            reader.read(min(size, STREAM_LIMIT)), timeout
+                        )
+                        if not data:
+                            raise ConnectionResetError("chunk truncated by the provider")
+                        size -= len(data)
+                        yield data
+                    if await asyncio.wait_for(reader.readexactly(2), timeout) != b"\r\n":
+                        raise http_pool.HTTPProtocolError("chunk data not followed by CRLF")
+                while await asyncio.wait_for(reader.readline(), timeout) not in (b"\r\n", b""):
+                    pass
+            elif self.content_length is not None:
+                remaining: int = self.content_length
+                while remaining > 0:
+                    data = await asyncio.wait_for(
+                        reader.read(min(remaining, STREAM_LIMIT)), timeout
+                    )
+                    if not data:
+                        raise ConnectionResetError("body truncated by the provider")
+                    remaining -= len(data)
+                    yield data
+            else:
+                while data := await asyncio.wait_for(reader.read(STREAM_LIMIT), timeout):
+                    yield data
+        except BaseException:
+            self.close()
+            raise
+
+        self.finished = True
+        self.release()
+
+    async def read_async(self) -> bytes:
+        """Reads the whole body.
+
+        Returns:
+            bytes: The body.
+        """
+        return b"".join([data async for data in self.iter_body_async()])
+
+    def release(self) -> None:
+        """Gives the connection back to the pool, or closes it if it can not be reused."""
+        if self.async_connection is None:
+            return
+        connection, self.async_connection = self.async_connection, None
+        if self.finished and self.keep_alive:
+            self.async_pool.release(connection)
+        else:
+            connection.close()
+
+
+class AsyncRfcProxy:
+    """Asyncio counterpart of rfc_proxy.RfcProxy, with the same cache and breaker rules.
+
+    Args:
+        pool (Optional[AsyncConnectionPool]): Connections to the provider.
+        cache (Optional[http_cache.ResponseCache]): Cache of the provider responses.
+        failure_threshold (int): Consecutive provider failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial request.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[AsyncConnectionPool] = None,
+        cache: Optional[http_cache.ResponseCache] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+    ) -> None:
+        self.pool: AsyncConnectionPool = pool or AsyncConnectionPool()
+        self.cache: http_cache.ResponseCache = cache or http_cache.ResponseCache()
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.breakers: dict[tuple[str, int], circuit_breaker.CircuitBreaker] = {}
+
+    def breaker(self, address: tuple[str, int]) -> circuit_breaker.CircuitBreaker:
+        """Returns the circuit breaker of a provider, creating it the first time.
+
+        Args:
+            address (tuple[str, int]): The host and port of the provider.
+
+        Returns:
+            circuit_breaker.CircuitBreaker: The breaker.
+        """
+        if address not in self.breakers:
+            self.breakers[address] = circuit_breaker.CircuitBreaker(
+                f"{address[0]}:{address[1]}", self.failure_threshold, self.reset_timeout
+            )
+        return self.breakers[address]
+
+    async def serve(
+        self,
+        writer: asyncio.StreamWriter,
+        address: tuple[str, int],
+        uri: bytes,
+        keep_alive: bool = False,
+        preferences: Optional[http_cache.Preferences] = None,
+    ) -> int:
+        """Answers a GET for the URI on the client stream, see rfc_proxy.RfcProxy.serve.
+        Compressed variants are produced in the default executor of the loop.
+
+        Args:
+            writer (asyncio.StreamWriter): The stream of the client, closed by the caller.
+            address (tuple[str, int]): The host and port of the provider.
+            uri (bytes): The request target.
+            keep_alive (bool): Whether the client connection will be reused.
+            preferences (Optional[http_cache.Preferences]): Content coding and byte ranges
+                asked by the client.
+
+        Returns:
+            int: The number of body bytes sent to the client.
+        """
+        preferences = preferences or http_cache.Preferences()
+        key: bytes = rfc_proxy.RfcProxy.cache_key(address, uri)
+        entry: Optional[http_cache.CachedResponse] = self.cache.get(key)
+
+        if entry is not None and entry.is_fresh():
+            self.cache.count(
+                "negative_hits" if entry.status in http_cache.NEGATIVE_STATUSES else "hits"
+            )
+            return await self._send_entry(writer, key, entry, preferences)
+
+        breaker: circuit_breaker.CircuitBreaker = self.breaker(address)
+        try:
+            breaker.before_call()
+        except circuit_breaker.CircuitOpenError as ex:
+            logging.debug("%s: %s", str(key), ex)
+            return await self._fail(
+                writer,
+                key,
+                entry,
+                503,
+                b"Service Unavailable",
+                breaker,
+                keep_alive,
+                preferences,
+            )
+
+        conditions: list[tuple[bytes, bytes]] = entry.validators() if entry else []
+        response: AsyncResponse
+        try:
+            response = await self.pool.request(
+                address, b"GET", uri, conditions + preferences.upstream_headers()
+            )
+        except (
+            OSError,
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            http_pool.HTTPProtocolError,
+        ) as ex:
+            logging.warning("provider %s failed: %r", address, ex)
+            breaker.record_failure()
+            return await self._fail(
+                writer,
+                key,
+                entry,
+                502,
+                b"Bad Gateway",
+                breaker,
+                keep_alive,
+                preferences,
+            )
+
+        if response.status >= 500:
+            breaker.record_failure()
+            if entry is not None:
+                response.close()
+                return await self._fail(
+                    writer,
+                    key,
+                    entry,
+                    502,
+                    b"Bad Gateway",
+                    breaker,
+                    keep_alive,
+                    preferences,
+                )
+        else:
+            breaker.record_success()
+
+        if entry is not None and response.status == 304:
+            await response.read_async()
+            self.cache.revalidate(key, entry, response.end_to_end_headers())
+            self.cache.count("revalidations")
+            return await self._send_entry(writer, key, entry, preferences)
+
+        self.cache.count("misses")
+        if entry is not None and not http_cache.is_storable(response.status, response.headers):
+            self.cache.discard(key)
+        return await self._relay(writer, key, response, keep_alive, preferences)
+
+    async def _send_entry(
+        self,
+        writer: asyncio.StreamWriter,
+        key: bytes,
+        entry: http_cache.CachedResponse,
+        preferences: http_cache.Preferences,
+    ) -> int:
+        wire, length = entry.select(preferences)
+        if wire is not entry.wire:
+            self.cache.count("compressed_hits")
+        self._compress_later(key, entry, preferences)
+        writer.write(wire)
+        await writer.drain()
+        return length
+
+    def _compress_later(
+        self,
+        key: bytes,
+        entry: http_cache.CachedResponse,
+        preferences: http_cache.Preferences,
+    ) -> None:
+        encoding: Optional[bytes] = self.cache.claim_variant(
+            entry, preferences.accept_encoding
+        )
+        if encoding is not None:
+            # not awaited, the response goes out with the identity body meanwhile
+            asyncio.get_running_loop().run_in_executor(
+                None, self.cache.compress_variant, key, entry, encoding
+            )
+
+    async def _fail(
+        self,
+        writer: asyncio.StreamWriter,
+        key: bytes,
+        entry: Optional[http_cache.CachedResponse],
+        status: int,
+        reason: bytes,
+        breaker: circuit_breaker.CircuitBreaker,
+        keep_alive: bool,
+        preferences: http_cache.Preferences,
+    ) -> int:
+        # pylint: disable=too-many-arguments
+        if entry is not None:
+            logging.debug("serving stale copy")
+            return await self._send_entry(writer, key, entry, preferences)
+        writer.write(rfc_proxy.error_response(status, reason, breaker.retry_after(), keep_alive))
+        await writer.drain()
+        return 0
+
+    async def _relay(
+        self,
+        writer: asyncio.StreamWriter,
+        key: bytes,
+        response: AsyncResponse,
+        keep_alive: bool,
+        preferences: http_cache.Preferences,
+    ) -> int:
+        """Streams the response to the client, storing a copy if it is cacheable and small.
+
+        Raises:
+            ConnectionAbortedError: If the provider fails mid-body, the client connection
+                can not be reused.
+        """
+        collector: Optional[http_cache.BodyCollector] = (
+            http_cache.BodyCollector(self.cache.max_entry_bytes)
+            if http_cache.is_storable(response.status, response.headers)
+            else None
+        )
+        relayed: int = 0
+
+        try:
+            head, chunked = http_pool.client_head(response, keep_alive)
+            writer.write(head)
+            async for data in response.iter_body_async():
+                writer.write(http_pool.chunk(data) if chunked else data)
+                # flow control: do not read faster than the client can receive
+                await writer.drain()
+                relayed += len(data)
+                if collector is not None:
+                    collector(data)
+            if chunked:
+                writer.write(http_pool.chunk(b""))
+                await writer.drain()
+        except (asyncio.TimeoutError, http_pool.HTTPProtocolError) as ex:
+            logging.warning("provider %s failed while relaying: %r", key, ex)
+            raise ConnectionAbortedError(f"relay of {key!r} aborted") from ex
+        finally:
+            response.close()
+
+        body: Optional[bytes] = collector.body() if collector is not None else None
+        if body is not None and response.finished:
+            entry: http_cache.CachedResponse = self.cache.create_entry(
+                response.status, response.reason, response.end_to_end_headers(), body
+            )
+            if self.cache.put(key, entry):
+                self._compress_later(key, entry, preferences)
+        return relayed
+
+
+def prompt_from_request(method: bytes, target: bytes, body: bytes) -> Optional[bytes]:
+    """Extracts the next chamber prompt from a request, if it carries one.
+    The prompt comes either as the query of a GET /submit or as the body of any other method.
+
+    Args:
+        method (bytes): The request method.
+        target (bytes): The request target.
+        body (bytes): The request body.
+
+    Returns:
+        Optional[bytes]: The prompt, None if the request asks for a document.
+    """
+    if method != b"GET":
+        return body
+    if target.startswith(b"/submit"):
+        return urllib.parse.unquote_to_bytes(target.partition(b"?")[2])
+    return None
+
+
+class AsyncChamber6:
+    """The HTTP server of the chamber: proxies documents until the prompt arrives.
+
+    Args:
+        provider (tuple[str, int]): The host and port of the RFC provider.
+        uri_prefix (bytes): Prefix added to the requested path before asking the provider.
+        proxy (Optional[AsyncRfcProxy]): The proxy to use, one is created if not given.
+        request_timeout (float): Seconds a client has to send its request.
+    """
+
+    def __init__(
+        self,
+        provider: tuple[str, int],
+        uri_prefix: bytes = b"/rfc/",
+        proxy: Optional[AsyncRfcProxy] = None,
+        request_timeout: float = 10.0,
+    ) -> None:
+        self.provider: tuple[str, int] = provider
+        self.uri_prefix: bytes = uri_prefix
+        self.proxy: AsyncRfcProxy = proxy or AsyncRfcProxy()
+        self.request_timeout: float = request_timeout
+        self.prompt: "asyncio.Future[bytes]" = asyncio.get_running_loop().create_future()
+        self.active: int = 0
+
+    def provider_uri(self, target: bytes) -> bytes:
+        """Maps the target requested by a client to the URI asked to the provider.
+
+        Args:
+            target (bytes): The request target, e.g. b"/1234".
+
+        Returns:
+            bytes: The URI for the provider, e.g. b"/rfc/1234".
+        """
+        return self.uri_prefix.rstrip(b"/") + b"/" + target.lstrip(b"/")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves one client connection, answering its pipelined requests in order.
+
+        Args:
+            reader (asyncio.StreamReader): The stream from the client.
+            writer (asyncio.StreamWriter): The stream to the client.
+        """
+        self.active += 1
+        parser: http_parser.RequestParser = http_parser.RequestParser()
+        try:
+            while data := await asyncio.wait_for(
+                reader.read(STREAM_LIMIT), self.request_timeout
+            ):
+                for request in parser.feed(data):
+                    if not await self.answer(writer, request):
+                        return
+        except http_parser.RequestError as ex:
+            writer.write(rfc_proxy.error_response(ex.status, ex.reason))
+            await writer.drain()
+        except (OSError, asyncio.TimeoutError) as ex:
+            logging.warning("could not serve client: %r", ex)
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def answer(self, writer: asyncio.StreamWriter, request: http_parser.Request) -> bool:
+        """Answers one request of a client.
+
+        Args:
+            writer (asyncio.StreamWriter): The stream to the client.
+            request (http_parser.Request): The request.
+
+        Returns:
+            bool: Whether the connection can be used for more requests.
+        """
+        keep_alive: bool = request.keep_alive
+        prompt: Optional[bytes] = prompt_from_request(
+            request.method, request.target, request.body
+        )
+        if prompt is None:
+            relayed: int = await self.proxy.serve(
+                writer,
+                self.provider,
+                self.provider_uri(request.target),
+                keep_alive,
+                http_cache.Preferences.from_headers(request.header),
+            )
+            logging.debug("relayed %d bytes of %s", relayed, str(request.target))
+        else:
+            writer.write(rfc_proxy.error_response(200, b"OK", keep_alive=keep_alive))
+            await writer.drain()
+            if not self.prompt.done():
+                self.prompt.set_result(prompt)
+        return keep_alive
+
+
+async def error_message_listener(
+    target_ip: str, target_port: int, first_message: bytes
+) -> None:
+    """Sends the first message to the target and logs every error message received.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        first_message (bytes): The first message to send.
+    """
+    reader, writer = await asyncio.open_connection(target_ip, target_port)
+    try:
+        writer.write(first_message)
+        await writer.drain()
+        while received_data := await reader.read(1024):
+            logging.warning(received_data)
+    finally:
+        writer.close()
+
+
+async def chamber_6_async(
+    target_ip: str,
+    target_port: int,
+    chamber_id: bytes,
+    http_provider_ip: str,
+    http_provider_port: int,
+    concurrent_connection_limit: int = 1024,
+    uri_prefix: bytes = b"/rfc/",
+) -> bytes:
+    """Sends the chamber_id, serves the HTTP requests of the chamber and returns the prompt.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+        http_provider_ip (str): The IP address of the provider.
+        http_provider_port (int): The port of the provider.
+        concurrent_connection_limit (int): Backlog of the listening socket.
+        uri_prefix (bytes): Prefix of the documents in the provider.
+
+    Returns:
+        bytes: The next chamber prompt.
+    """
+    chamber: AsyncChamber6 = AsyncChamber6(
+        (http_provider_ip, http_provider_port), uri_prefix
+    )
+    # one socket bound like in the threaded version, start_server(port=0) would bind
+    # a different free port for each address family
+    http_server_socket: socket.socket = socket.socket()
+    http_server_socket.bind(("", 0))
+    free_port: int = http_server_socket.getsockname()[1]
+    server: asyncio.base_events.Server = await asyncio.start_server(
+        chamber.handle,
+        sock=http_server_socket,
+        backlog=concurrent_connection_limit,
+        limit=STREAM_LIMIT,
+    )
+
+    async with server:
+        listener: asyncio.Task[None] = asyncio.create_task(
+            error_message_listener(
+                target_ip, target_port, chamber_id + b" " + str(free_port).encode()
+            )
+        )
+        try:
+            # the listener ends when the chamber closes it, that must not hide the prompt
+            await asyncio.wait((chamber.prompt, listener), return_when=asyncio.FIRST_COMPLETED)
+            if not chamber.prompt.done() and listener.exception() is not None:
+                raise listener.exception()  # type: ignore
+            return await chamber.prompt
+        finally:
+            listener.cancel()
+
+
+def chamber_6(
+    target_ip: str,
+    target_port: int,
+    chamber_id: bytes,
+    http_provider_ip: str,
+    http_provider_port: int,
+    concurrent_connection_limit: int = 1024,
+) -> bytes:
+    """Runs chamber_6_async on a new event loop, drop-in replacement of yinkana.chamber_6.
+
+    Args:
+        target_ip (str): The target IP address to send the message to.
+        target_port (int): The target port to send the message to.
+        chamber_id (bytes): The identifier to send.
+        http_provider_ip (str): The IP address of the provider.
+        http_provider_port (int): The port of the provider.
+        concurrent_connection_limit (int): Backlog of the listening socket.
+
+    Returns:
+        bytes: The next chamber prompt.
+    """
+    return asyncio.run(
+        chamber_6_async(
+            target_ip,
+            target_port,
+            chamber_id,
+            http_provider_ip,
+            http_provider_port,
+            concurrent_connection_limit,
+        )
+    )
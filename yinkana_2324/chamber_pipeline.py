@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Runs the chambers as declared stages, checkpointing every prompt to a local state file.
+
+Every stage takes the outputs of the stages it declares as inputs, by default the prompt of
+the previous one, and returns its own. Once a stage completes, its prompt and identifier are
+written to the state file, so a run that fails at a late chamber can be resumed from the
+last completed stage instead of starting over. A failed stage is not run again unless it
+opts in to retries, with exponential backoff: only stages that are safe to replay should,
+e.g. a handshake, not a chamber whose server may have already taken the identifier. The
+wall-clock time of each stage is reported at the end of the run.
+
+The identifiers belong to a session of the server, so a run only resumes when asked to, e.g.
+with --resume, and never from a state file older than STATE_MAX_AGE; otherwise it starts
+over and replaces the state. The state file is JSON, written to a temporary file and
+renamed, so a crash never leaves a partial one. It is removed once every stage completes.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+from typing import Any, Callable, Optional, Sequence
+
+import prompt_parser
+
+
+DEFAULT_DIRECTORY: str = os.environ.get(
+    "YINKANA_STATE_DIR", os.path.join(os.path.expanduser("~"), ".local", "state", "yinkana")
+)
+STATE_VERSION: int = 2
+# seconds after which a state file is not resumed, its identifiers have likely expired
+STATE_MAX_AGE: float = 3600.0
+
+
+class Stage:
+    """A step of the pipeline, usually a chamber.
+
+    Args:
+        name (str): Unique name, the key of its output in the state file.
+        function (Callable[..., bytes]): Called with the outputs of the inputs, in order.
+        inputs (tuple[str, ...]): Names of the earlier stages whose outputs it takes.
+        retries (int): Times it is run again after failing.
+        backoff (float): Seconds before the first retry, doubled on every other one.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[..., bytes],
+        inputs: tuple[str, ...],
+        retries: int,
+        backoff: float,
+    ) -> None:
+        self.name: str = name
+        self.function: Callable[..., bytes] = function
+        self.inputs: tuple[str, ...] = inputs
+        self.retries: int = retries
+        self.backoff: float = backoff
+
+
+class Pipeline:
+    """Stages run in the order they are added, skipping those already checkpointed.
+
+    Args:
+        name (str): Name of the run, e.g. the username; it names the state file.
+        resume (bool): Whether to skip the stages checkpointed by a previous run, instead
+            of starting over.
+        directory (str): Where the state file is kept.
+        retries (int): Default retries of a stage, 0 so only the stages that are safe to
+            replay opt in to them with add.
+        backoff (float): Default seconds before the first retry of a stage.
+        max_backoff (float): Longest wait between two attempts.
+        max_age (float): Seconds after which a state file is not resumed.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(
+        self,
+        name: str,
+        resume: bool = False,
+        directory: str = DEFAULT_DIRECTORY,
+        retries: int = 0,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+        max_age: float = STATE_MAX_AGE,
+    ) -> None:
+        self.path: str = os.path.join(directory, f"{name}.json")
+        self.resume: bool = resume
+        self.max_age: float = max_age
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.stages: list[Stage] = []
+        # seconds and attempts of the stages run by this process
+        self.timings: dict[str, tuple[float, int]] = {}
+
+    def add(
+        self,
+        name: str,
+        function: Callable[..., bytes],
+        inputs: Optional[Sequence[str]] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+    ) -> None:
+        """Declares the next stage.
+
+        Args:
+            name (str): Unique name of the stage.
+            function (Callable[..., bytes]): Called with the outputs of the inputs, in order,
+                returns the output of the stage, e.g. the next chamber prompt.
+            inputs (Optional[Sequence[str]]): Names of earlier stages whose outputs it takes,
+                None for the previous stage, if any.
+            retries (Optional[int]): Times it is run again after failing, None for the default;
+                only for stages that are safe to replay.
+            backoff (Optional[float]): Seconds before the first retry, None for the default.
+
+        Raises:
+            ValueError: If the name is repeated or an input is not an earlier stage.
+        """
+        names: list[str] = [stage.name for stage in self.stages]
+        if name in names:
+            raise ValueError(f"stage {name} added twice")
+        if inputs is None:
+            inputs = names[-1:]
+        for stage_input in inputs:
+            if stage_input not in names:
+                raise ValueError(f"input {stage_input} of {name} is not an earlier stage")
+        self.stages.append(
+            Stage(
+                name,
+                function,
+                tuple(inputs),
+                self.retries if retries is None else retries,
+                self.backoff if backoff is None else backoff,
+            )
+        )
+
+    def load(self) -> dict[str, dict[str, Any]]:
+        """Reads the checkpointed stages.
+
+        Returns:
+            dict[str, dict[str, Any]]: The state of each completed stage by name, empty if
+                there is no state file, it can not be read or it is older than max_age.
+        """
+        try:
+            with open(self.path, "rb") as state_file:
+                state: dict[str, Any] = json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            logging.warning("ignoring the state file %s: %s", self.path, ex)
+            return {}
+        if state.get("version") != STATE_VERSION:
+            logging.warning("ignoring the state file %s: unknown version", self.path)
+            return {}
+        if time.time() - state.get("saved", 0.0) > self.max_age:
+            logging.warning(
+                "ignoring the state file %s: older than %.0f s", self.path, self.max_age
+            )
+            return {}
+        return state["stages"]
+
+    def save(self, stages: dict[str, dict[str, Any]]) -> None:
+        """Replaces the state file with the given completed stages.
+
+        Args:
+            stages (dict[str, dict[str, Any]]): The state of each completed stage by name.
+        """
+        directory: str = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".state-")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as state_file:
+                json.dump(
+                    {"version": STATE_VERSION, "saved": time.time(), "stages": stages},
+                    state_file,
+                    indent=1,
+                )
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def reset(self) -> None:
+        """Removes the state file, the next run starts from the first stage."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def run(self) -> bytes:
+        """Runs the stages, checkpointing each; with resume, only those after the last
+        checkpointed one.
+
+        Returns:
+            bytes: The output of the last stage.
+
+        Raises:
+            Exception: What the failing stage raised on its last attempt; the stages
+                completed before it stay checkpointed.
+        """
+        stages: dict[str, dict[str, Any]] = {}
+        if self.resume:
+            stages = self.load()
+            if stages:
+                logging.info("resuming from %s", self.path)
+        elif os.path.exists(self.path):
+            logging.info("starting over, resume to continue from %s", self.path)
+        outputs: dict[str, bytes] = {}
+
+        try:
+            for stage in self.stages:
+                if stage.name in stages:
+                    # latin-1 maps every byte to one character and back
+                    outputs[stage.name] = stages[stage.name]["output"].encode("latin-1")
+                    continue
+                output: bytes = self._run_stage(
+                    stage, [outputs[name] for name in stage.inputs]
+                )
+                outputs[stage.name] = output
+                identifier: Optional[bytes] = prompt_parser.parse_prompt(output).identifier
+                seconds, attempts = self.timings[stage.name]
+                stages[stage.name] = {
+                    "output": output.decode("latin-1"),
+                    "identifier": None if identifier is None else identifier.decode("latin-1"),
+                    "seconds": seconds,
+                    "attempts": attempts,
+                }
+                self.save(stages)
+        finally:
+            logging.info("stage times:\n%s", self.report(stages))
+
+        self.reset()
+        return outputs[self.stages[-1].name] if self.stages else b""
+
+    def _run_stage(self, stage: Stage, arguments: list[bytes]) -> bytes:
+        start: float = time.monotonic()
+        attempt: int = 0
+        while True:
+            attempt += 1
+            try:
+                output: bytes = stage.function(*arguments)
+                break
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                if attempt > stage.retries:
+                    self.timings[stage.name] = (time.monotonic() - start, attempt)
+                    logging.error(
+                        "%s failed after %d attempts: %s, the next run can resume",
+                        stage.name,
+                        attempt,
+                        ex,
+                    )
+                    raise
+                delay: float = min(self.max_backoff, stage.backoff * 2 ** (attempt - 1))
+                logging.warning("%s failed: %s, retrying in %.1f s", stage.name, ex, delay)
+                time.sleep(delay)
+        self.timings[stage.name] = (time.monotonic() - start, attempt)
+        logging.info("%s done in %.3f s", stage.name, self.timings[stage.name][0])
+        return output
+
+    def report(self, stages: Optional[dict[str, dict[str, Any]]] = None) -> str:
+        """Formats the wall-clock time of every stage, one per line.
+
+        Args:
+            stages (Optional[dict[str, dict[str, Any]]]): The checkpointed stages, to tell
+                apart those restored from the state file.
+
+        Returns:
+            str: The report.
+        """
+        lines: list[str] = []
+        for stage in self.stages:
+            if stage.name in self.timings:
+                seconds, attempts = self.timings[stage.name]
+                lines.append(f"{stage.name}: {seconds:.3f} s, {attempts} attempt(s)")
+            elif stages and stage.name in stages:
+                lines.append(f"{stage.name}: restored from the checkpoint")
+            else:
+                lines.append(f"{stage.name}: not run")
+        return "\n".join(lines)
@@ -0,0 +1,1038 @@
+#!/usr/bin/env python3
+"""Local stand-in of the chamber servers, to run the solvers end to end without rick.
+
+Every kind of chamber the solvers of this repository speak is served on its own port by one
+asyncio loop: the username handshake, the UDP upper-code exchange, the word lengths, the sum
+and word, the palindromes, the flag, the Caesar and substitution ciphers, the <length>:<file>
+digests, the JSON sentences, the YAP and WYP responders, the HTTP proxy test with its error
+channel and the cake. Each player goes through the sequence of its solver, chosen by its
+username, and every prompt names the address of the next chamber, so the solvers that read
+it need no configuration. The documents of the HTTP chamber come from an rfc_provider
+stand-in started in the same process.
+
+Contents and identifiers are drawn from generators seeded with --seed, so the same seed and
+the same order of connections give the same run. Answers are checked, a wrong one gets an
+"error:" line and no prompt. With --real-ports every chamber listens on the port of the real
+server; map rick and yinkana to this host to run the solvers that hard-code them.
+
+Usage: python3 chamber_server.py [--port 2000] [--sequence yinkana] [--real-ports] ...
+"""
+
+import sys
+import json
+import time
+import array
+import base64
+import gzip
+import random
+import socket
+import string
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+import urllib.parse
+from typing import Any, Awaitable, Callable, Optional
+
+import http_pool
+import async_proxy
+import json_stream
+import rfc_provider
+
+
+RECV_SIZE: int = 64 * 1024
+# receive buffer of the UDP chambers, the default one drops datagrams of sessions that start
+# together; the kernel caps it at net.core.rmem_max
+DATAGRAM_BUFFER: int = 4 * 1024 * 1024
+ID_LENGTH: int = 20
+ID_ALPHABET: str = string.ascii_lowercase + string.digits
+# seconds a player has to complete a chamber once connected
+CHAMBER_TIMEOUT: float = 60.0
+# seconds the HTTP chamber waits for all the documents and the delivery of the prompt
+HTTP_CHAMBER_TIMEOUT: float = 120.0
+# seconds to answer each document request of the HTTP chamber
+HTTP_TIMEOUT: float = 30.0
+# seconds the last message of a chamber waits for the player to close the connection
+FINAL_WAIT: float = 2.0
+# seconds a session is kept without progress
+SESSION_TTL: float = 3600.0
+PURGE_INTERVAL: float = 60.0
+FLAG: bytes = b"that's the end"
+WORD_SUM: int = 1000
+WORD_AFTER_SUM: int = 1200
+PALINDROMES: tuple[str, ...] = tuple(
+    "level radar rotor kayak refer civic madam racecar noon stats".split()
+)
+# words with uppercase letters outside ASCII for the JSON sentences
+ACCENTED_WORDS: tuple[str, ...] = ("Ñandú", "Éxito", "ÁRBOL", "Über", "Órbita", "Çà")
+GREETING: bytes = b"Welcome to the stand-in yinkana, send your username\n"
+CAKE: str = "Congratulations {username}, here is your cake. The cake is a lie!\n"
+
+# ports of the real server
+PORTS: dict[str, int] = {
+    "handshake": 2000,
+    "upper_code": 4000,
+    "flag_count": 3002,
+    "word_lengths": 3010,
+    "sum_word": 5501,
+    "palindrome": 6500,
+    "caesar": 6501,
+    "substitution": 6510,
+    "md5_digest": 9000,
+    "sha1_digest": 9003,
+    "json_sentences": 3061,
+    "yap": 6001,
+    "wyp": 6000,
+    "http_post": 8002,
+    "http_submit": 8003,
+    "cake": 33333,
+}
+# chambers after the handshake of each solver
+SEQUENCES: dict[str, tuple[str, ...]] = {
+    # yinkana.py and async_chambers.py
+    "yinkana": (
+        "upper_code",
+        "flag_count",
+        "substitution",
+        "json_sentences",
+        "yap",
+        "http_post",
+        "cake",
+    ),
+    "yinkana_2324": (
+        "upper_code",
+        "word_lengths",
+        "caesar",
+        "md5_digest",
+        "yap",
+        "http_submit",
+        "cake",
+    ),
+    "yinkaana": (
+        "upper_code",
+        "word_lengths",
+        "sum_word",
+        "json_sentences",
+        "yap",
+        "http_post",
+        "cake",
+    ),
+    # ../Yincana/Yincana.py
+    "yincana": (
+        "upper_code",
+        "word_lengths",
+        "sum_word",
+        "md5_digest",
+        "yap",
+        "http_post",
+        "cake",
+    ),
+    # ../Yincana/otra_yincana.py
+    "otra_yincana": (
+        "upper_code",
+        "word_lengths",
+        "palindrome",
+        "sha1_digest",
+        "wyp",
+        "http_post",
+        "cake",
+    ),
+}
+# usernames hard-coded by the solvers, the others get the default sequence
+PLAYERS: dict[str, str] = {
+    "on_eagle": "yinkana",
+    "fast_rhino": "yinkana_2324",
+    "rapid_gnat": "yinkaana",
+    "heuristic_cray": "otra_yincana",
+}
+# what each prompt says about the next chamber; "name: number", "to host:port" for the
+# chamber and "of host:port" for the provider are the forms prompt_parser reads
+DESCRIPTIONS: dict[str, str] = {
+    "upper_code": 'send "<port> <identifier>" over UDP from that port to {address}, '
+    "then answer the upper-code? question",
+    "flag_count": 'connect to {address} and send "<identifier> <count>" with the number of '
+    'spaces and newlines before the flag "that\'s the end"',
+    "word_lengths": 'connect to {address} and send "<identifier> <length> ... --" with the '
+    f"lengths of the words until they add up to sum: {WORD_SUM}",
+    "sum_word": "connect to {address} and send the identifier and the first word after the "
+    f"numbers, plus one per word, add up to more than sum: {WORD_AFTER_SUM}",
+    "palindrome": 'connect to {address} and send "<identifier> <word> ... --" with every '
+    "word reversed and the numbers as they are, until the first palindrome",
+    "caesar": "connect to {address}, send the identifier and then the last N words before "
+    "the number N, with their letters moved N places forward, followed by --",
+    "substitution": "connect to {address}, send the identifier and then the last N words "
+    "before the number N, encrypted with the alphabet received first, followed by --",
+    "md5_digest": "connect to {address}, send the identifier and then the MD5 digest of "
+    "the <length>:<file> received",
+    "sha1_digest": "connect to {address}, send the identifier and then the SHA1 digest of "
+    "the <length>:<file> received",
+    "json_sentences": "connect to {address}, send the identifier and answer every sentence "
+    "with the player, its uppercase letters and a timestamp",
+    "yap": "send a YAP request with the identifier to {address} over UDP",
+    "wyp": "send a WYP request with the identifier to {address} over UDP",
+    "http_post": 'connect to {address}, send "<identifier> <port>" and proxy the documents '
+    "of {provider} over HTTP on that port, the next prompt comes in a POST",
+    "http_submit": 'connect to {address}, send "<identifier> <port>" and proxy the '
+    "documents of {provider} over HTTP on that port, the next prompt comes in a GET /submit",
+    "cake": "connect to {address} and send the identifier to get the cake",
+}
+# header formats of the YAP and WYP requests and responses
+DATAGRAM_HEADERS: dict[str, tuple[bytes, str]] = {
+    "yap": (b"YAP", "!3sHBHH"),
+    "wyp": (b"WYP", "!3sBHHH"),
+}
+DIGESTS: dict[str, str] = {"md5_digest": "md5", "sha1_digest": "sha1"}
+
+
+def cksum(pkt: bytes) -> int:
+    # pylint: disable=invalid-name disable=missing-function-docstring
+    if len(pkt) % 2 == 1:
+        pkt += b"\0"
+    s = sum(array.array("H", pkt))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    s = ~s
+
+    if sys.byteorder == "little":
+        s = ((s >> 8) & 0xFF) | s << 8
+
+    return s & 0xFFFF
+
+
+class ChamberError(Exception):
+    """A wrong or missing answer, the player gets the reason instead of the prompt."""
+
+
+class Session:
+    """A player going through the chambers of its sequence.
+
+    Args:
+        username (str): The player.
+        sequence (tuple[str, ...]): The chambers after the handshake.
+        generator (random.Random): Draws the identifiers of the session.
+    """
+
+    def __init__(
+        self, username: str, sequence: tuple[str, ...], generator: random.Random
+    ) -> None:
+        self.username: str = username
+        self.sequence: tuple[str, ...] = sequence
+        self.generator: random.Random = generator
+        # index of the chamber the current identifier is for, -1 during the handshake
+        self.position: int = -1
+        self.identifier: bytes = b""
+        self.updated: float = time.monotonic()
+
+    @property
+    def chamber(self) -> Optional[str]:
+        """The chamber the current identifier is for, None once the cake is served."""
+        if 0 <= self.position < len(self.sequence):
+            return self.sequence[self.position]
+        return None
+
+
+class DatagramChamber(asyncio.DatagramProtocol):
+    """Passes every datagram of a UDP chamber to its handler.
+
+    Args:
+        handler (Callable[[asyncio.DatagramTransport, bytes, Any], None]): Called with the
+            transport, the datagram and its sender.
+    """
+
+    def __init__(self, handler: Callable[[asyncio.DatagramTransport, bytes, Any], None]) -> None:
+        self.handler: Callable[[asyncio.DatagramTransport, bytes, Any], None] = handler
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        assert self.transport is not None
+        self.handler(self.transport, data, addr)
+
+
+async def read_until(reader: asyncio.StreamReader, complete: Callable[[bytes], bool]) -> bytes:
+    """Reads until what was received is a complete answer.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of the player.
+        complete (Callable[[bytes], bool]): Tells whether the bytes received are enough.
+
+    Returns:
+        bytes: Everything received.
+
+    Raises:
+        ChamberError: If the player closes the connection before.
+    """
+    data: bytes = b""
+    while not complete(data):
+        received: bytes = await reader.read(RECV_SIZE)
+        if not received:
+            raise ChamberError("connection closed before the answer")
+        data += received
+    return data
+
+
+def ends_with_dashes(data: bytes) -> bool:
+    """Tells whether an answer ending in -- is complete."""
+    return data.rstrip().endswith(b"--")
+
+
+def without_dashes(data: bytes) -> list[bytes]:
+    """Returns the words of an answer ending in --, without it."""
+    return data.rstrip()[:-2].split()
+
+
+def rotate(word: str, places: int) -> str:
+    """Moves the lowercase letters of a word some places along the alphabet, wrapping around.
+
+    Args:
+        word (str): The word.
+        places (int): Places forward, negative for backward.
+
+    Returns:
+        str: The rotated word, other characters are left as they are.
+    """
+    lower: str = string.ascii_lowercase
+    shift: int = places % 26
+    return word.translate(str.maketrans(lower, lower[shift:] + lower[:shift]))
+
+
+class ChamberServer:
+    """Serves every chamber, keeping the sessions by their current identifier.
+
+    Args:
+        corpus (rfc_provider.Corpus): The documents the HTTP chamber asks for.
+        provider (tuple[str, int]): The address of the provider of the corpus, as named in
+            the prompts.
+        public_host (str): The host named in the prompts, it must start with a letter.
+        seed (int): Seed of the contents and identifiers.
+        sequence (str): Sequence of the players not in PLAYERS.
+        documents (int): Documents asked for in each HTTP chamber.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    def __init__(
+        self,
+        corpus: rfc_provider.Corpus,
+        provider: tuple[str, int],
+        public_host: str = "localhost",
+        seed: int = 2324,
+        sequence: str = "yinkana",
+        documents: int = 4,
+    ) -> None:
+        self.corpus: rfc_provider.Corpus = corpus
+        self.provider: tuple[str, int] = provider
+        self.public_host: str = public_host
+        self.seed: int = seed
+        self.sequence: str = sequence
+        self.documents: int = documents
+
+        self.ports: dict[str, int] = {}
+        self.sessions: dict[bytes, Session] = {}
+        # sessions by the address their upper-code question was sent to
+        self.upper_pending: dict[Any, Session] = {}
+        # connections of each chamber, to seed their contents
+        self.connections: dict[str, int] = {}
+        # sessions started by each username, to seed their identifiers
+        self.players: dict[str, int] = {}
+        self.servers: list[asyncio.base_events.Server] = []
+        self.transports: list[asyncio.BaseTransport] = []
+        self.purger: Optional["asyncio.Task[None]"] = None
+
+        self.started: int = 0
+        self.completed: int = 0
+        self.passed: dict[str, int] = {}
+        self.failed: dict[str, int] = {}
+
+    async def start(
+        self,
+        port: int = PORTS["handshake"],
+        real_ports: bool = False,
+        bind: str = "0.0.0.0",
+        backlog: int = 4096,
+    ) -> None:
+        """Starts listening on every chamber.
+
+        Args:
+            port (int): The port of the handshake, 0 for a free one.
+            real_ports (bool): Whether the other chambers listen on the ports of the real
+                server instead of free ones.
+            bind (str): The address to listen on.
+            backlog (int): The listen backlog of each chamber.
+        """
+        streams: dict[str, Callable[..., Awaitable[None]]] = {
+            "handshake": self.handshake,
+            "flag_count": self.flag_count,
+            "word_lengths": self.word_lengths,
+            "sum_word": self.sum_word,
+            "palindrome": self.palindrome,
+            "caesar": self.caesar,
+            "substitution": self.substitution,
+            "md5_digest": self.digest,
+            "sha1_digest": self.digest,
+            "json_sentences": self.json_sentences,
+            "http_post": self.http,
+            "http_submit": self.http,
+            "cake": self.cake,
+        }
+        datagrams: dict[str, Callable[[asyncio.DatagramTransport, bytes, Any], None]] = {
+            "upper_code": self.upper_code,
+            "yap": lambda transport, data, addr: self.yap("yap", transport, data, addr),
+            "wyp": lambda transport, data, addr: self.yap("wyp", transport, data, addr),
+        }
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+        for kind, chamber in streams.items():
+            server: asyncio.base_events.Server = await asyncio.start_server(
+                self._handler(kind, chamber),
+                bind,
+                port if kind == "handshake" else PORTS[kind] if real_ports else 0,
+                backlog=backlog,
+                limit=RECV_SIZE,
+                reuse_address=True,
+            )
+            self.servers.append(server)
+            self.ports[kind] = server.sockets[0].getsockname()[1]
+        for kind, handler in datagrams.items():
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda handler=handler: DatagramChamber(handler),  # type: ignore
+                local_addr=(bind, PORTS[kind] if real_ports else 0),
+            )
+            transport.get_extra_info("socket").setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, DATAGRAM_BUFFER
+            )
+            self.transports.append(transport)
+            self.ports[kind] = transport.get_extra_info("sockname")[1]
+        self.purger = asyncio.create_task(self._purge())
+
+    def close(self) -> None:
+        """Stops listening, the chambers in progress are abandoned."""
+        for server in self.servers:
+            server.close()
+        for transport in self.transports:
+            transport.close()
+        if self.purger is not None:
+            self.purger.cancel()
+
+    def _handler(
+        self, kind: str, chamber: Callable[..., Awaitable[None]]
+    ) -> Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]:
+        timeout: float = HTTP_CHAMBER_TIMEOUT if kind.startswith("http") else CHAMBER_TIMEOUT
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                await asyncio.wait_for(
+                    chamber(kind, reader, writer, self._generator(kind)), timeout
+                )
+                await writer.drain()
+                self.passed[kind] = self.passed.get(kind, 0) + 1
+            except ChamberError as ex:
+                logging.info("%s: %s", kind, ex)
+                self.failed[kind] = self.failed.get(kind, 0) + 1
+                writer.write(f"error: {ex}\n".encode())
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError) as ex:
+                logging.debug("%s: %r", kind, ex)
+                self.failed[kind] = self.failed.get(kind, 0) + 1
+            finally:
+                writer.close()
+
+        return handle
+
+    def _generator(self, kind: str) -> random.Random:
+        """Returns the generator of the contents of a new connection to a chamber."""
+        number: int = self.connections.get(kind, 0)
+        self.connections[kind] = number + 1
+        return random.Random(f"{self.seed}-{kind}-{number}")
+
+    async def _purge(self) -> None:
+        while True:
+            await asyncio.sleep(PURGE_INTERVAL)
+            oldest: float = time.monotonic() - SESSION_TTL
+            for identifier, session in list(self.sessions.items()):
+                if session.updated < oldest:
+                    del self.sessions[identifier]
+            for address, session in list(self.upper_pending.items()):
+                if session.updated < oldest:
+                    del self.upper_pending[address]
+
+    def lookup(self, identifier: bytes, kind: str) -> Session:
+        """Returns the session an identifier was given to for a chamber.
+
+        Args:
+            identifier (bytes): The identifier sent by the player.
+            kind (str): The chamber it was sent to.
+
+        Returns:
+            Session: The session.
+
+        Raises:
+            ChamberError: If the identifier is unknown or for another chamber.
+        """
+        session: Optional[Session] = self.sessions.get(identifier)
+        if session is None:
+            raise ChamberError(f"unknown identifier {identifier!r}")
+        if session.chamber != kind:
+            raise ChamberError(f"the identifier is for {session.chamber}, not {kind}")
+        return session
+
+    def split_identifier(self, data: bytes) -> tuple[bytes, bytes]:
+        """Separates the identifier from an answer, before it, with or without a space, or
+        after it.
+
+        Args:
+            data (bytes): The answer.
+
+        Returns:
+            tuple[bytes, bytes]: The identifier and the rest of the answer.
+
+        Raises:
+            ChamberError: If the answer has no identifier of a session.
+        """
+        if data[:ID_LENGTH] in self.sessions:
+            return data[:ID_LENGTH], data[ID_LENGTH:]
+        tokens: list[bytes] = data.split()
+        if tokens and tokens[-1] in self.sessions:
+            return tokens[-1], data[: data.rfind(tokens[-1])]
+        raise ChamberError("no identifier in the answer")
+
+    def advance(self, session: Session) -> bytes:
+        """Moves a session to its next chamber and returns the prompt of it, with a new
+        identifier; after the last chamber, the session is completed.
+
+        Args:
+            session (Session): The session, whose current chamber was passed.
+
+        Returns:
+            bytes: The prompt, empty after the last chamber.
+        """
+        self.sessions.pop(session.identifier, None)
+        session.position += 1
+        session.updated = time.monotonic()
+        kind: Optional[str] = session.chamber
+        if kind is None:
+            self.completed += 1
+            return b""
+
+        identifier: bytes = b""
+        while not identifier or identifier in self.sessions or identifier.isdigit():
+            identifier = "".join(session.generator.choices(ID_ALPHABET, k=ID_LENGTH)).encode()
+        session.identifier = identifier
+        self.sessions[identifier] = session
+        description: str = DESCRIPTIONS[kind].format(
+            address=f"{self.public_host}:{self.ports[kind]}",
+            provider=f"{self.provider[0]}:{self.provider[1]}",
+        )
+        return (
+            f"identifier:{identifier.decode()}\n"
+            f"Chamber {session.position + 1}, {kind}: {description}\n"
+        ).encode()
+
+    async def handshake(
+        self,
+        _: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        __: random.Random,
+    ) -> None:
+        """Greets the player, reads its username and starts its session."""
+        writer.write(GREETING)
+        username: str = (await reader.read(RECV_SIZE)).strip().decode(errors="replace")
+        if not username:
+            raise ChamberError("no username")
+        number: int = self.players.get(username, 0)
+        self.players[username] = number + 1
+        self.started += 1
+        session: Session = Session(
+            username,
+            SEQUENCES[PLAYERS.get(username, self.sequence)],
+            random.Random(f"{self.seed}-{username}-{number}"),
+        )
+        writer.write(self.advance(session))
+
+    def upper_code(self, transport: asyncio.DatagramTransport, data: bytes, addr: Any) -> None:
+        """Asks the port announced with an identifier for it in uppercase, then sends the
+        prompt there once it is answered."""
+        kind: str = "upper_code"
+        try:
+            session: Optional[Session] = self.upper_pending.pop(addr, None)
+            if session is not None:
+                if data.strip() != session.identifier.upper():
+                    raise ChamberError(f"expected the identifier in uppercase, got {data!r}")
+                transport.sendto(self.advance(session), addr)
+                self.passed[kind] = self.passed.get(kind, 0) + 1
+                return
+            port, identifier = data.split()
+            session = self.lookup(identifier, kind)
+            self.upper_pending[(addr[0], int(port))] = session
+            transport.sendto(b"upper-code?", (addr[0], int(port)))
+        except (ChamberError, ValueError) as ex:
+            logging.info("%s: %s", kind, ex)
+            self.failed[kind] = self.failed.get(kind, 0) + 1
+            transport.sendto(f"error: {ex}".encode(), addr)
+
+    async def flag_count(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Sends words separated by spaces or newlines and then the flag; expects the
+        identifier and the number of separators before it."""
+        words: int = generator.randint(200, 2000)
+        writer.write(
+            b"".join(
+                generator.choice(rfc_provider.WORDS).encode() + generator.choice((b" ", b"\n"))
+                for _ in range(words)
+            )
+            # a byte after the flag, for the readers that keep its length back
+            + FLAG
+            + b"\n"
+        )
+        answer: bytes = await read_until(reader, lambda data: len(data.split()) >= 2)
+        identifier, count = answer.split()[:2]
+        session: Session = self.lookup(identifier, kind)
+        if count != str(words).encode():
+            raise ChamberError(f"expected {words} words, got {count!r}")
+        writer.write(self.advance(session))
+
+    async def word_lengths(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Sends words and numbers until their lengths add up to WORD_SUM; expects the
+        identifier and the lengths, ended by --."""
+        tokens: list[str] = []
+        total: int = 0
+        while total < WORD_SUM:
+            token: str = (
+                generator.choice(rfc_provider.WORDS)
+                if generator.random() < 0.8
+                else str(generator.randrange(100000))
+            )
+            tokens.append(token)
+            total += len(token)
+        writer.write(" ".join(tokens).encode() + b" ")
+
+        identifier, lengths = self.split_identifier(await read_until(reader, ends_with_dashes))
+        session: Session = self.lookup(identifier, kind)
+        if without_dashes(lengths) != [str(len(token)).encode() for token in tokens]:
+            raise ChamberError(f"wrong lengths {lengths[:80]!r}")
+        writer.write(self.advance(session))
+
+    async def sum_word(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Sends numbers and words, each word counting 1, until a number takes the sum over
+        WORD_AFTER_SUM, and then a word; expects the identifier, before or after it."""
+        tokens: list[str] = []
+        total: int = 0
+        while True:
+            value: int = generator.randint(1, 60) if generator.random() < 0.5 else 1
+            if total + value > WORD_AFTER_SUM:
+                break
+            tokens.append(str(value) if value > 1 else generator.choice(rfc_provider.WORDS))
+            total += value
+        word: str = generator.choice(rfc_provider.WORDS)
+        tokens += [str(WORD_AFTER_SUM - total + generator.randint(1, 60)), word]
+        writer.write(" ".join(tokens).encode() + b" ")
+
+        def complete(data: bytes) -> bool:
+            try:
+                return bool(self.split_identifier(data)[1].split())
+            except ChamberError:
+                return False
+
+        identifier, answer = self.split_identifier(await read_until(reader, complete))
+        session: Session = self.lookup(identifier, kind)
+        if answer.split()[0] != word.encode():
+            raise ChamberError(f"expected {word}, got {answer[:80]!r}")
+        writer.write(self.advance(session))
+
+    async def palindrome(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Sends words and numbers and then a palindrome; expects the identifier and the
+        words before it reversed, ended by --."""
+        tokens: list[str] = [
+            (
+                generator.choice(rfc_provider.WORDS)
+                if generator.random() < 0.8
+                else str(generator.randrange(1000))
+            )
+            for _ in range(generator.randint(50, 400))
+        ]
+        writer.write(
+            " ".join(tokens + [generator.choice(PALINDROMES)]).encode() + b" "
+        )
+
+        identifier, words = self.split_identifier(await read_until(reader, ends_with_dashes))
+        session: Session = self.lookup(identifier, kind)
+        expected: list[bytes] = [
+            (token if token.isdecimal() else token[::-1]).encode() for token in tokens
+        ]
+        if without_dashes(words) != expected:
+            raise ChamberError(f"wrong words {words[:80]!r}")
+        writer.write(self.advance(session))
+
+    async def caesar(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Reads the identifier, sends words moved N letters back, the number N and a
+        newline; expects the last N words moved forward again, ended by --."""
+        session: Session = self.lookup(await reader.readexactly(ID_LENGTH), kind)
+        words: list[str] = [
+            generator.choice(rfc_provider.WORDS).lower()
+            for _ in range(generator.randint(30, 300))
+        ]
+        shift: int = generator.randint(1, 25)
+        writer.write(
+            " ".join(rotate(word, -shift) for word in words).encode() + f" {shift} \n".encode()
+        )
+
+        answer: bytes = await read_until(reader, ends_with_dashes)
+        if without_dashes(answer) != [word.encode() for word in words[-shift:]]:
+            raise ChamberError(f"wrong words {answer[:80]!r}")
+        writer.write(self.advance(session))
+
+    async def substitution(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Reads the identifier, sends an alphabet, words and a number N; expects the last N
+        words encrypted with the alphabet, ended by --."""
+        session: Session = self.lookup(await reader.readexactly(ID_LENGTH), kind)
+        alphabet: bytes = "".join(generator.sample(string.ascii_lowercase, 26)).encode()
+        words: list[str] = [
+            generator.choice(rfc_provider.WORDS).lower()
+            for _ in range(generator.randint(30, 300))
+        ]
+        last: int = generator.randint(1, min(50, len(words) - 1))
+        writer.write(alphabet + " ".join(words).encode() + f" {last} ".encode())
+
+        table: bytes = bytes.maketrans(string.ascii_lowercase.encode(), alphabet)
+        answer: bytes = await read_until(reader, ends_with_dashes)
+        if without_dashes(answer) != " ".join(words[-last:]).encode().translate(table).split():
+            raise ChamberError(f"wrong words {answer[:80]!r}")
+        writer.write(self.advance(session))
+
+    async def digest(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Reads the identifier, sends <length>:<file> with random bytes; expects the
+        digest of the file."""
+        session: Session = self.lookup(await reader.readexactly(ID_LENGTH), kind)
+        size: int = int(1024 * 256 ** generator.random())
+        content: bytes = generator.randbytes(size)
+        writer.write(str(size).encode() + b":" + content)
+
+        expected: "hashlib._Hash" = hashlib.new(DIGESTS[kind], content)
+        if await reader.readexactly(expected.digest_size) != expected.digest():
+            raise ChamberError(f"wrong {DIGESTS[kind]} digest")
+        writer.write(self.advance(session))
+
+    async def json_sentences(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Reads the identifier and sends sentences back to back; expects an answer with
+        the player, the uppercase letters and the time for each one, then sends the prompt
+        as one more sentence."""
+        session: Session = self.lookup(await reader.readexactly(ID_LENGTH), kind)
+        sentences: list[str] = [
+            " ".join(
+                word.capitalize() if generator.random() < 0.3 else word
+                for word in generator.choices(rfc_provider.WORDS + ACCENTED_WORDS, k=12)
+            )
+            + "."
+            for _ in range(generator.randint(5, 30))
+        ]
+        writer.write(b"".join(json.dumps({"sentence": text}).encode() for text in sentences))
+
+        stream: json_stream.JsonStream = json_stream.JsonStream()
+        answered: int = 0
+        while answered < len(sentences):
+            data: bytes = await reader.read(RECV_SIZE)
+            if not data:
+                raise ChamberError(f"connection closed after {answered} answers")
+            for answer in stream.feed(data):
+                self.check_sentence(session, sentences[answered], answer)
+                answered += 1
+        writer.write(json.dumps({"sentence": self.advance(session).decode()}).encode())
+        # the player answers the prompt too, or just leaves
+        try:
+            await asyncio.wait_for(reader.read(RECV_SIZE), FINAL_WAIT)
+        except asyncio.TimeoutError:
+            pass
+
+    @staticmethod
+    def check_sentence(session: Session, sentence: str, answer: Any) -> None:
+        """Checks the answer to a sentence of the JSON chamber.
+
+        Raises:
+            ChamberError: If it is not the expected one.
+        """
+        if not isinstance(answer, dict) or answer.get("player") != session.username:
+            raise ChamberError(f"wrong player in {answer!r}")
+        if answer.get("upperletters") != [letter for letter in sentence if letter.isupper()]:
+            raise ChamberError(f"wrong letters for {sentence!r}: {answer!r}")
+        timestamp: Any = answer.get("timestamp")
+        if not isinstance(timestamp, int) or abs(timestamp - time.time()) > 300:
+            raise ChamberError(f"wrong timestamp {timestamp!r}")
+
+    def yap(
+        self, kind: str, transport: asyncio.DatagramTransport, data: bytes, addr: Any
+    ) -> None:
+        """Answers a YAP or WYP request carrying an identifier with the prompt, or with an
+        error code."""
+        magic, header = DATAGRAM_HEADERS[kind]
+        sequence: int = 0
+        code: int = 0
+        try:
+            received_magic, request, _, checksum, sequence = struct.unpack(header, data[:10])
+            if received_magic != magic or request != 0:
+                raise ChamberError(f"not a {magic.decode()} request")
+            if cksum(struct.pack(header, magic, 0, 0, 0, sequence) + data[10:]) != checksum:
+                raise ChamberError("wrong checksum")
+            payload: bytes = self.advance(
+                self.lookup(base64.b64decode(data[10:], validate=True), kind)
+            )
+            self.passed[kind] = self.passed.get(kind, 0) + 1
+        except (ChamberError, ValueError, struct.error) as ex:
+            logging.info("%s: %s", kind, ex)
+            self.failed[kind] = self.failed.get(kind, 0) + 1
+            code = 1
+            payload = f"error: {ex}".encode()
+        encoded: bytes = base64.b64encode(payload)
+        checksum = cksum(struct.pack(header, magic, 1, code, 0, sequence) + encoded)
+        transport.sendto(struct.pack(header, magic, 1, code, checksum, sequence) + encoded, addr)
+
+    async def http(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        generator: random.Random,
+    ) -> None:
+        """Reads the identifier and the port of the proxy of the player, asks it for
+        documents of the corpus at once and checks them, reporting every wrong one on this
+        connection; then delivers the prompt and closes this connection."""
+        announcement: bytes = await read_until(reader, lambda data: len(data.split()) >= 2)
+        identifier, port = announcement.split()[:2]
+        session: Session = self.lookup(identifier, kind)
+        address: tuple[str, int] = (writer.get_extra_info("peername")[0], int(port))
+
+        numbers: list[int] = generator.sample(
+            sorted(self.corpus.sizes), min(self.documents, len(self.corpus.sizes))
+        )
+        pool: async_proxy.AsyncConnectionPool = async_proxy.AsyncConnectionPool(
+            read_timeout=HTTP_TIMEOUT
+        )
+        errors: list[Optional[str]] = await asyncio.gather(
+            *(self.fetch(pool, address, number) for number in numbers)
+        )
+        for error in errors:
+            if error is not None:
+                writer.write(f"error: {error}\n".encode())
+        if any(errors):
+            raise ChamberError(f"{len(numbers) - errors.count(None)} wrong documents")
+
+        await self.deliver(address, self.advance(session), kind == "http_submit")
+
+    async def fetch(
+        self, pool: async_proxy.AsyncConnectionPool, address: tuple[str, int], number: int
+    ) -> Optional[str]:
+        """Asks the proxy of a player for a document and compares it with the corpus.
+
+        Args:
+            pool (async_proxy.AsyncConnectionPool): Connects to the proxy.
+            address (tuple[str, int]): The address of the proxy.
+            number (int): The document.
+
+        Returns:
+            Optional[str]: What was wrong, None if the document is right.
+        """
+        target: bytes = f"/rfc{number}.txt".encode()
+        try:
+            response: async_proxy.AsyncResponse = await pool.request(
+                address, b"GET", target, [(b"Connection", b"close")]
+            )
+            body: bytes = await response.read_async()
+        except (
+            OSError,
+            EOFError,
+            asyncio.TimeoutError,
+            asyncio.LimitOverrunError,
+            http_pool.HTTPProtocolError,
+        ) as ex:
+            return f"{target.decode()}: {ex!r}"
+        if response.status != 200:
+            return f"{target.decode()}: status {response.status}"
+        if response.header(b"content-encoding").lower() == b"gzip":
+            body = gzip.decompress(body)
+        with open(self.corpus.path(number), "rb") as document:
+            expected: bytes = document.read()
+        if body != expected:
+            return f"{target.decode()}: {len(body)} bytes, not the {len(expected)} of the document"
+        return None
+
+    @staticmethod
+    async def deliver(address: tuple[str, int], prompt: bytes, submit: bool) -> None:
+        """Sends the prompt to the proxy of a player, as the body of a POST or the query of
+        a GET /submit, and waits a little for the player to close the connection.
+
+        Args:
+            address (tuple[str, int]): The address of the proxy.
+            prompt (bytes): The prompt.
+            submit (bool): Whether it goes in a GET /submit.
+        """
+        host: bytes = f"{address[0]}:{address[1]}".encode()
+        request: bytes = (
+            b"GET /submit?"
+            + urllib.parse.quote_from_bytes(prompt, safe="").encode()
+            + b" HTTP/1.1\r\nHost: "
+            + host
+            + b"\r\n\r\n"
+            if submit
+            else b"POST / HTTP/1.1\r\nHost: "
+            + host
+            + b"\r\nContent-Type: text/plain\r\nContent-Length: "
+            + str(len(prompt)).encode()
+            + b"\r\n\r\n"
+            + prompt
+        )
+        reader, writer = await asyncio.open_connection(*address)
+        try:
+            writer.write(request)
+            await writer.drain()
+            await asyncio.wait_for(reader.read(RECV_SIZE), FINAL_WAIT)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            writer.close()
+
+    async def cake(
+        self,
+        kind: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        _: random.Random,
+    ) -> None:
+        """Reads the identifier and serves the cake."""
+        session: Session = self.lookup((await reader.read(RECV_SIZE)).strip(), kind)
+        self.advance(session)
+        writer.write(CAKE.format(username=session.username).encode())
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the counters.
+
+        Returns:
+            dict[str, float]: Sessions started, in progress and completed, and the chambers
+                passed and failed of each kind, as <kind>_passed and <kind>_failed.
+        """
+        stats: dict[str, float] = {
+            "sessions": self.started,
+            "active": len(self.sessions),
+            "completed": self.completed,
+        }
+        for kind in PORTS:
+            if kind in self.passed or kind in self.failed:
+                stats[f"{kind}_passed"] = self.passed.get(kind, 0)
+                stats[f"{kind}_failed"] = self.failed.get(kind, 0)
+        return stats
+
+
+async def serve(server: ChamberServer, arguments: argparse.Namespace) -> None:
+    """Runs the chambers until cancelled, logging the counters every few seconds.
+
+    Args:
+        server (ChamberServer): The chambers.
+        arguments (argparse.Namespace): The command line options.
+    """
+    await server.start(arguments.port, arguments.real_ports, arguments.bind)
+    logging.info(
+        "chambers: %s",
+        ", ".join(f"{kind} {port}" for kind, port in server.ports.items()),
+    )
+    try:
+        while True:
+            await asyncio.sleep(arguments.stats_interval)
+            logging.info("chambers: %s", server.stats())
+    finally:
+        server.close()
+
+
+def main() -> None:
+    """Serves the chambers and the provider until interrupted."""
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=PORTS["handshake"], help="of the handshake")
+    parser.add_argument("--real-ports", action="store_true", help="of every chamber")
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--public-host", default="localhost", help="named in the prompts")
+    parser.add_argument("--sequence", choices=sorted(SEQUENCES), default="yinkana")
+    parser.add_argument("--seed", type=int, default=2324)
+    parser.add_argument("--documents", type=int, default=4, help="per HTTP chamber")
+    parser.add_argument("--corpus", help="directory of the documents, a temporary one if omitted")
+    parser.add_argument("--corpus-size", type=int, default=50, help="number of documents")
+    parser.add_argument("--provider-port", type=int, default=0, help="0 for a free one")
+    parser.add_argument("--provider-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    arguments: argparse.Namespace = parser.parse_args()
+
+    corpus: rfc_provider.Corpus = rfc_provider.Corpus(
+        arguments.corpus, arguments.corpus_size, 2 * 1024, 64 * 1024, seed=arguments.seed
+    )
+    provider: rfc_provider.ProviderStandIn = rfc_provider.ProviderStandIn(
+        corpus, arguments.provider_latency, seed=arguments.seed
+    )
+    provider_port: int = provider.serve(arguments.provider_port)
+    logging.info("provider: %s on port %d", corpus.directory, provider_port)
+
+    server: ChamberServer = ChamberServer(
+        corpus,
+        (arguments.public_host, provider_port),
+        arguments.public_host,
+        arguments.seed,
+        arguments.sequence,
+        arguments.documents,
+    )
+    try:
+        asyncio.run(serve(server, arguments))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        provider.shutdown()
+        logging.info("chambers: %s", server.stats())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s: %(funcName)s: %(message)s", level=logging.INFO)
+    main()
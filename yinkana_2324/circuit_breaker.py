@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Circuit breaker that stops sending requests to an upstream that keeps failing."""
+
+import time
+import logging
+import threading
+
+
+CLOSED: str = "closed"
+OPEN: str = "open"
+HALF_OPEN: str = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures of an upstream and rejects calls while it is unhealthy.
+
+    closed: calls go through, failure_threshold consecutive failures open the circuit.
+    open: calls are rejected until reset_timeout seconds have passed.
+    half-open: up to half_open_calls trial calls go through, one success closes the circuit
+    and one failure opens it again.
+
+    Args:
+        name (str): Name used in the log messages.
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before trying again.
+        half_open_calls (int): Concurrent trial calls allowed while half-open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+        half_open_calls: int = 1,
+    ) -> None:
+        self.name: str = name
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.half_open_calls: int = half_open_calls
+
+        self.state: str = CLOSED
+        self.failures: int = 0
+        self.opened_at: float = 0.0
+        self.trials: int = 0
+        self.rejected: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Must be called before each call to the upstream.
+
+        Raises:
+            CircuitOpenError: If the call must not be made.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"circuit to {self.name} is open")
+                logging.info("circuit to %s is half-open", self.name)
+                self.state = HALF_OPEN
+                self.trials = 0
+
+            if self.state == HALF_OPEN:
+                if self.trials >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"circuit to {self.name} is half-open")
+                self.trials += 1
+
+    def record_success(self) -> None:
+        """Must be called after a successful call."""
+        with self.lock:
+            if self.state != CLOSED:
+                logging.info("circuit to %s is closed", self.name)
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """Must be called after a failed call."""
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logging.warning(
+                        "circuit to %s is open after %d failures", self.name, self.failures
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> int:
+        """Seconds until the circuit will let a trial call through.
+
+        Returns:
+            int: The seconds, rounded up, 0 if the circuit is not open.
+        """
+        with self.lock:
+            if self.state != OPEN:
+                return 0
+            remaining: float = self.reset_timeout - (time.monotonic() - self.opened_at)
+            return max(0, int(remaining + 0.999))
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""Persistent cache of the RFC provider responses, kept on disk across runs.
+
+Layout of the cache directory:
+    index: one JSON record per line, mapping a cache key to the hash and size of its body,
+        its status, headers and freshness. Later records replace earlier ones.
+    objects/ab/ab01...: the bodies, named by their SHA-256, so a document is stored once
+        even if several URIs return it.
+
+Bodies and the compacted index are written to a temporary file and renamed, so a crash
+never leaves a partial file under its final name; a record cut by a crash is skipped.
+Fresh bodies are sent with socket.sendfile, they never go through Python objects.
+
+Several processes can share the directory: writes take an flock on the lock file and
+every process catches up with the records appended by the others.
+"""
+
+import os
+import json
+import fcntl
+import contextlib
+import time
+import socket
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+
+import http_pool
+import http_cache
+
+
+DEFAULT_DIRECTORY: str = os.environ.get(
+    "YINKANA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "yinkana")
+)
+DEFAULT_MAX_BYTES: int = 512 * 1024 * 1024
+
+# the index is rewritten once it holds this many records more than live entries
+COMPACT_SLACK: int = 256
+
+
+class DiskEntry:
+    """A response stored on disk, the body stays in its file.
+
+    Args:
+        digest (str): The SHA-256 of the body, in hexadecimal.
+        size (int): The length of the body.
+        status (int): The status code.
+        reason (bytes): The reason phrase.
+        headers (list[tuple[bytes, bytes]]): The end to end headers, without Content-Length.
+        stored_at (float): When the response was received or last revalidated.
+        freshness (float): Seconds the response is fresh after stored_at.
+        must_revalidate (bool): Whether it must be revalidated before every use.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        digest: str,
+        size: int,
+        status: int,
+        reason: bytes,
+        headers: list[tuple[bytes, bytes]],
+        stored_at: float,
+        freshness: float,
+        must_revalidate: bool,
+    ) -> None:
+        self.digest: str = digest
+        self.size: int = size
+        self.status: int = status
+        self.reason: bytes = reason
+        self.headers: list[tuple[bytes, bytes]] = headers
+        self.stored_at: float = stored_at
+        self.freshness: float = freshness
+        self.must_revalidate: bool = must_revalidate
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """Checks whether the response can be served without asking the provider.
+
+        Args:
+            now (Optional[float]): The current time, defaults to time.time().
+
+        Returns:
+            bool: True if the response is fresh.
+        """
+        if self.must_revalidate:
+            return False
+        return (now or time.time()) - self.stored_at < self.freshness
+
+    def head(self) -> bytes:
+        """Serializes the status line and headers, framed by Content-Length like the
+        responses of the memory cache."""
+        return http_pool.response_head(
+            self.status,
+            self.reason,
+            self.headers + [(b"Content-Length", str(self.size).encode())],
+        )
+
+    def to_record(self, key: bytes) -> dict[str, Any]:
+        """Converts the entry to its index record, bytes are kept as latin-1 strings."""
+        return {
+            "key": key.decode("latin-1"),
+            "hash": self.digest,
+            "size": self.size,
+            "status": self.status,
+            "reason": self.reason.decode("latin-1"),
+            "headers": [
+                [name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers
+            ],
+            "stored_at": self.stored_at,
+            "freshness": self.freshness,
+            "must_revalidate": self.must_revalidate,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict[str, Any]) -> "DiskEntry":
+        """Builds an entry from its index record.
+
+        Raises:
+            KeyError: If the record misses a field.
+        """
+        return cls(
+            record["hash"],
+            record["size"],
+            record["status"],
+            record["reason"].encode("latin-1"),
+            [
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in record["headers"]
+            ],
+            record["stored_at"],
+            record["freshness"],
+            record["must_revalidate"],
+        )
+
+
+class DiskCache:
+    """LRU cache of complete responses on disk, bounded by the total size of the bodies.
+    The index is read on first use, so creating the cache costs nothing.
+
+    Args:
+        directory (str): Where the index and the bodies are kept, created if missing.
+            Defaults to $YINKANA_CACHE_DIR or ~/.cache/yinkana.
+        max_bytes (int): Total byte budget of the bodies.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.index_path: str = os.path.join(directory, "index")
+        self.objects: str = os.path.join(directory, "objects")
+        self.lock_path: str = os.path.join(directory, "lock")
+
+        self.entries: OrderedDict[bytes, DiskEntry] = OrderedDict()
+        # entries using each body file, it is deleted when none does
+        self.references: dict[str, int] = {}
+        self.size: int = 0
+        self.records: int = 0
+        # the index file read so far, replaced by a compaction
+        self.inode: int = 0
+        self.offset: int = 0
+        self.loaded: bool = False
+        self.lock: threading.Lock = threading.Lock()
+
+        self.hits: int = 0
+        self.writes: int = 0
+        self.evictions: int = 0
+
+    def path(self, digest: str) -> str:
+        """Returns the path of the body file with the given hash."""
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def _load(self) -> None:
+        """Reads the index the first time the cache is used, must be called with the lock held."""
+        if self.loaded:
+            return
+        self.loaded = True
+        os.makedirs(self.objects, exist_ok=True)
+
+        with self._exclusive():
+            for key, entry in list(self.entries.items()):
+                if not os.path.exists(self.path(entry.digest)):
+                    self._forget(key)
+            self._append(self._evict())
+        logging.info(
+            "disk cache %s: %d entries, %d bytes", self.directory, len(self.entries), self.size
+        )
+
+    def _read_index(self) -> None:
+        """Applies the records appended since the last read, by this or other processes.
+        Must be called with the lock held."""
+        try:
+            with open(self.index_path, "rb") as index:
+                inode: int = os.fstat(index.fileno()).st_ino
+                if inode != self.inode:
+                    # compacted, possibly by another process: read again from the start
+                    self.entries.clear()
+                    self.references.clear()
+                    self.size = self.records = self.offset = 0
+                    self.inode = inode
+                index.seek(self.offset)
+                data: bytes = index.read()
+        except FileNotFoundError:
+            return
+
+        # a record still being written has no line end yet
+        data = data[: data.rfind(b"\n") + 1]
+        self.offset += len(data)
+        for line in data.splitlines():
+            self.records += 1
+            try:
+                record: dict[str, Any] = json.loads(line)
+                key: bytes = record["key"].encode("latin-1")
+                self._forget(key)
+                if record.get("hash") is not None:
+                    self._remember(key, DiskEntry.from_record(record))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # a record cut by a crash, or written by another version
+                continue
+
+    @contextlib.contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Locks the directory against the other processes and catches up with their records,
+        must be entered with the lock held."""
+        with open(self.lock_path, "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._read_index()
+            yield
+
+    def _remember(self, key: bytes, entry: DiskEntry) -> None:
+        self.entries[key] = entry
+        references: int = self.references.get(entry.digest, 0)
+        if not references:
+            self.size += entry.size
+        self.references[entry.digest] = references + 1
+
+    def _forget(self, key: bytes) -> Optional[DiskEntry]:
+        """Removes an entry from the index in memory, returns it if its body is now unused."""
+        entry: Optional[DiskEntry] = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.references[entry.digest] -= 1
+        if self.references[entry.digest]:
+            return None
+        del self.references[entry.digest]
+        self.size -= entry.size
+        return entry
+
+    def _append(self, records: list[dict[str, Any]]) -> None:
+        """Adds records to the index, rewriting it without dead records when they pile up.
+        Must be called inside _exclusive, records already applied in memory."""
+        self.records += len(records)
+        if self.records > 2 * len(self.entries) + COMPACT_SLACK:
+            self._compact()
+            return
+        if not records:
+            return
+        lines: bytes = b"".join(json.dumps(record).encode() + b"\n" for record in records)
+        with open(self.index_path, "ab") as index:
+            if not self.inode:
+                self.inode = os.fstat(index.fileno()).st_ino
+            index.write(lines)
+            self.offset = index.tell()
+
+    def _compact(self) -> None:
+        records: list[dict[str, Any]] = [
+            entry.to_record(key) for key, entry in self.entries.items()
+        ]
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".index-")
+        try:
+            with os.fdopen(descriptor, "wb") as index:
+                for record in records:
+                    index.write(json.dumps(record).encode() + b"\n")
+            os.replace(temporary, self.index_path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        stat: os.stat_result = os.stat(self.index_path)
+        self.inode = stat.st_ino
+        self.offset = stat.st_size
+        self.records = len(records)
+
+    def _evict(self) -> list[dict[str, Any]]:
+        """Evicts the least recently used entries until the bodies are within budget,
+        must be called with the lock held.
+
+        Returns:
+            list[dict[str, Any]]: The index records of the evictions, to be appended.
+        """
+        records: list[dict[str, Any]] = []
+        while self.size > self.max_bytes:
+            key: bytes = next(iter(self.entries))
+            unused: Optional[DiskEntry] = self._forget(key)
+            if unused is not None:
+                self._unlink(unused.digest)
+            records.append({"key": key.decode("latin-1"), "hash": None})
+            self.evictions += 1
+        return records
+
+    def _unlink(self, digest: str) -> None:
+        # a body being sent stays readable through its open descriptor
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, key: bytes) -> bool:
+        """Checks whether a response is stored, without marking it as used."""
+        with self.lock:
+            self._load()
+            if key not in self.entries:
+                self._read_index()
+            return key in self.entries
+
+    def get(self, key: bytes) -> Optional[DiskEntry]:
+        """Looks up a response and marks it as the most recently used.
+
+        Args:
+            key (bytes): The cache key.
+
+        Returns:
+            Optional[DiskEntry]: The stored response, fresh or not.
+        """
+        with self.lock:
+            self._load()
+            if key not in self.entries:
+                # maybe stored by another process
+                self._read_index()
+            entry: Optional[DiskEntry] = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key: bytes, response: http_cache.CachedResponse) -> bool:
+        """Stores a response of the memory cache, it is slow and must run off the request path.
+        Only the index is written if the body is already on disk.
+
+        Args:
+            key (bytes): The cache key.
+            response (http_cache.CachedResponse): The response, only 200 answers are stored.
+
+        Returns:
+            bool: False if the response is not stored.
+        """
+        body: memoryview = response.body
+        if response.status != 200 or len(body) > self.max_bytes:
+            return False
+        digest: str = hashlib.sha256(body).hexdigest()
+        entry: DiskEntry = DiskEntry(
+            digest,
+            len(body),
+            response.status,
+            response.reason,
+            response.headers,
+            response.stored_at,
+            response.freshness,
+            response.must_revalidate,
+        )
+
+        with self.lock:
+            self._load()
+            stored: bool = digest in self.references
+        temporary: Optional[str] = None if stored else self._write(digest, body)
+
+        with self.lock, self._exclusive():
+            if temporary is None and digest not in self.references:
+                # evicted meanwhile, rare enough to write it with the lock held
+                temporary = self._write(digest, body)
+            if temporary is not None:
+                # renamed with the lock held, so an eviction can not delete it meanwhile
+                os.replace(temporary, self.path(digest))
+            unused: Optional[DiskEntry] = self._forget(key)
+            self._remember(key, entry)
+            if unused is not None and unused.digest != digest:
+                self._unlink(unused.digest)
+            self._append([entry.to_record(key)] + self._evict())
+            self.writes += 1
+        return True
+
+    def _write(self, digest: str, body: memoryview) -> str:
+        """Writes a body to a temporary file next to its final path.
+
+        Returns:
+            str: The path of the temporary file.
+        """
+        directory: str = os.path.dirname(self.path(digest))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".body-")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(body)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return temporary
+
+    def discard(self, key: bytes) -> None:
+        """Removes a response, e.g. because its body file disappeared.
+
+        Args:
+            key (bytes): The cache key.
+        """
+        with self.lock:
+            self._load()
+            with self._exclusive():
+                if key not in self.entries:
+                    return
+                unused: Optional[DiskEntry] = self._forget(key)
+                if unused is not None:
+                    self._unlink(unused.digest)
+                self._append([{"key": key.decode("latin-1"), "hash": None}])
+
+    def read(self, entry: DiskEntry) -> bytes:
+        """Reads a body into memory, used to revalidate stale responses.
+
+        Raises:
+            FileNotFoundError: If the body was deleted.
+        """
+        with open(self.path(entry.digest), "rb") as file:
+            return file.read()
+
+    def send(self, client_socket: socket.socket, entry: DiskEntry) -> int:
+        """Sends a response, the body goes from the file to the socket inside the kernel.
+
+        Args:
+            client_socket (socket.socket): The socket of the client.
+            entry (DiskEntry): The response.
+
+        Returns:
+            int: The number of body bytes sent.
+
+        Raises:
+            FileNotFoundError: If the body was deleted, nothing has been sent then.
+        """
+        with open(self.path(entry.digest), "rb") as file:
+            client_socket.sendall(entry.head())
+            sent: int = client_socket.sendfile(file, 0, entry.size)
+        with self.lock:
+            self.hits += 1
+        return sent
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the counters of this process and the size of the cache.
+
+        Returns:
+            dict[str, float]: The counters, the entries and the bytes of their bodies.
+        """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
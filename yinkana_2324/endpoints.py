@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Addresses and connections of the chamber endpoints.
+
+Host names are resolved once and cached for RESOLVE_TTL seconds, and known hosts can be
+resolved in the background before they are needed. The connection to the next chamber is
+opened from a background thread as soon as its address is known, from its prompt, or even
+speculatively, from its configured address, while the current chamber is still running, so
+the chamber finds the socket already connected. The time each chamber spends resolving and
+connecting is kept for a report, to see the dead time between chambers.
+"""
+
+import time
+import socket
+import logging
+import threading
+from typing import Iterable, Optional
+
+
+# seconds a resolved address is reused before resolving the host again
+RESOLVE_TTL: float = 300.0
+
+
+class Endpoint:
+    """Resolution and connection times of a chamber.
+
+    Args:
+        address (tuple[str, int]): The resolved address.
+    """
+
+    def __init__(self, address: tuple[str, int]) -> None:
+        self.address: tuple[str, int] = address
+        self.resolve: float = 0.0
+        # seconds the chamber waited for its connection
+        self.connect: float = 0.0
+        # whether the connection was already open, or being opened, when the chamber asked
+        self.preconnected: bool = False
+
+
+class EndpointManager:
+    """Resolves the chamber hosts and opens their connections ahead of time.
+
+    Args:
+        timeout (Optional[float]): Seconds to connect, None for the default of the sockets.
+        ttl (float): Seconds a resolved address is reused.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, ttl: float = RESOLVE_TTL) -> None:
+        self.timeout: Optional[float] = timeout
+        self.ttl: float = ttl
+        self.lock: threading.Lock = threading.Lock()
+        # IP address and expiry of each host
+        self.addresses: dict[str, tuple[str, float]] = {}
+        # connections in progress or done, by address, with the event set once done
+        self.pending: dict[tuple[str, int], tuple[threading.Event, list[socket.socket]]] = {}
+        # pending connections opened before the prompt confirmed their address
+        self.speculative: set[tuple[str, int]] = set()
+        self.endpoints: dict[str, Endpoint] = {}
+        self.labels: dict[tuple[str, int], str] = {}
+
+    def __enter__(self) -> "EndpointManager":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def resolve(self, host: str) -> str:
+        """Returns the IP address of a host, resolving it only if it is not cached.
+
+        Args:
+            host (str): The host name or address.
+
+        Returns:
+            str: The IP address.
+
+        Raises:
+            OSError: If the host can not be resolved.
+        """
+        now: float = time.monotonic()
+        with self.lock:
+            cached: Optional[tuple[str, float]] = self.addresses.get(host)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        address: str = str(socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0][4][0])
+        with self.lock:
+            self.addresses[host] = (address, now + self.ttl)
+        return address
+
+    def warm(self, hosts: Iterable[str]) -> None:
+        """Resolves hosts from a background thread, so they are cached when needed.
+
+        Args:
+            hosts (Iterable[str]): The host names.
+        """
+        threading.Thread(target=self._warm, args=(list(hosts),), daemon=True).start()
+
+    def _warm(self, hosts: list[str]) -> None:
+        for host in hosts:
+            try:
+                self.resolve(host)
+            except OSError as ex:
+                logging.debug("could not resolve %s: %s", host, ex)
+
+    def prepare(
+        self,
+        address: tuple[str, int],
+        stream: bool = True,
+        speculative: bool = False,
+        label: Optional[str] = None,
+    ) -> tuple[str, int]:
+        """Resolves the address of a chamber and, for a TCP one, starts connecting.
+        A confirmed address drops the speculative connections to other addresses.
+
+        Args:
+            address (tuple[str, int]): The host and port.
+            stream (bool): Whether the chamber is reached over TCP.
+            speculative (bool): Whether the address is a guess, e.g. the configured address
+                of the chamber after the current one.
+            label (Optional[str]): Name of the chamber in the report.
+
+        Returns:
+            tuple[str, int]: The IP address and port, the host if it could not be resolved.
+        """
+        start: float = time.monotonic()
+        try:
+            address = (self.resolve(address[0]), address[1])
+        except OSError as ex:
+            logging.warning("could not resolve %s: %s", address[0], ex)
+            return address
+        if not speculative:
+            endpoint: Endpoint = Endpoint(address)
+            endpoint.resolve = time.monotonic() - start
+            label = label or f"{address[0]}:{address[1]}"
+            with self.lock:
+                self.endpoints[label] = endpoint
+                self.labels[address] = label
+            self._drop_speculative(address)
+        if stream:
+            done: threading.Event = threading.Event()
+            connected: list[socket.socket] = []
+            with self.lock:
+                if address in self.pending:
+                    if not speculative:
+                        self.speculative.discard(address)
+                    return address
+                self.pending[address] = (done, connected)
+                if speculative:
+                    self.speculative.add(address)
+            threading.Thread(
+                target=self._connect, args=(address, done, connected), daemon=True
+            ).start()
+        return address
+
+    def _connect(
+        self, address: tuple[str, int], done: threading.Event, connected: list[socket.socket]
+    ) -> None:
+        try:
+            connected.append(socket.create_connection(address, self.timeout))
+        except OSError as ex:
+            logging.debug("could not preconnect to %s: %s", address, ex)
+        finally:
+            done.set()
+
+    def _drop_speculative(self, keep: tuple[str, int]) -> None:
+        with self.lock:
+            dropped: list[tuple[threading.Event, list[socket.socket]]] = [
+                self.pending.pop(address)
+                for address in self.speculative
+                if address != keep and address in self.pending
+            ]
+            self.speculative.intersection_update({keep})
+        if dropped:
+            # a wrong guess may still be connecting, the chamber does not wait for it
+            threading.Thread(target=discard, args=(dropped,), daemon=True).start()
+
+    def connect(self, address: tuple[str, int]) -> socket.socket:
+        """Returns the connection started by prepare, or opens a new one.
+
+        Args:
+            address (tuple[str, int]): The address passed to or returned by prepare.
+
+        Returns:
+            socket.socket: The connected socket, owned by the caller.
+
+        Raises:
+            OSError: If the address can not be reached.
+        """
+        start: float = time.monotonic()
+        client_socket: Optional[socket.socket] = None
+        with self.lock:
+            pending = self.pending.pop(address, None)
+            self.speculative.discard(address)
+        if pending is not None:
+            done, connected = pending
+            done.wait()
+            if connected and is_open(connected[0]):
+                client_socket = connected[0]
+            elif connected:
+                # a speculative connection the server closed while the previous chamber ran
+                connected[0].close()
+        preconnected: bool = client_socket is not None
+        if client_socket is None:
+            client_socket = socket.create_connection(address, self.timeout)
+
+        with self.lock:
+            endpoint: Optional[Endpoint] = self.endpoints.get(self.labels.get(address, ""))
+        if endpoint is not None:
+            endpoint.connect = time.monotonic() - start
+            endpoint.preconnected = preconnected
+        return client_socket
+
+    def report(self) -> str:
+        """Formats the resolution and connection times of every chamber, one per line.
+
+        Returns:
+            str: The report.
+        """
+        with self.lock:
+            endpoints: list[tuple[str, Endpoint]] = list(self.endpoints.items())
+        return "\n".join(
+            f"{label} {endpoint.address[0]}:{endpoint.address[1]}: "
+            f"resolve {endpoint.resolve * 1000:.1f} ms, connect {endpoint.connect * 1000:.1f} ms"
+            + (" (preconnected)" if endpoint.preconnected else "")
+            for label, endpoint in endpoints
+        )
+
+    def close(self) -> None:
+        """Closes the connections prepared and never used."""
+        with self.lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.speculative.clear()
+        discard(pending)
+
+
+def discard(pending: list[tuple[threading.Event, list[socket.socket]]]) -> None:
+    """Closes connections opened ahead of time once they are done connecting.
+
+    Args:
+        pending (list[tuple[threading.Event, list[socket.socket]]]): The events set once
+            done and the lists that get the connected sockets.
+    """
+    for done, connected in pending:
+        done.wait()
+        for unused in connected:
+            unused.close()
+
+
+def is_open(client_socket: socket.socket) -> bool:
+    """Tells whether the peer has not closed or reset a connection, without reading from it.
+
+    Args:
+        client_socket (socket.socket): The connected socket.
+
+    Returns:
+        bool: False if the peer closed it.
+    """
+    timeout: Optional[float] = client_socket.gettimeout()
+    # with a timeout, recv would wait for data before peeking
+    client_socket.setblocking(False)
+    try:
+        return client_socket.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        # nothing to read, but open
+        return True
+    except OSError:
+        return False
+    finally:
+        client_socket.settimeout(timeout)
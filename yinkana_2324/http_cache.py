@@ -0,0 +1,796 @@
+#!/usr/bin/env python3
+"""In-process, byte-budgeted LRU cache for the responses of the RFC provider."""
+
+import time
+import gzip
+import zlib
+import secrets
+import threading
+import posixpath
+import urllib.parse
+import email.utils
+from collections import OrderedDict
+from typing import Callable, Optional, Union
+
+import http_pool
+
+
+# headers that a 304 Not Modified answer may update in a stored response
+# https://www.rfc-editor.org/rfc/rfc9111#section-4.3.4
+REVALIDATION_HEADERS: frozenset[bytes] = frozenset(
+    (b"cache-control", b"date", b"etag", b"expires", b"last-modified", b"vary")
+)
+
+# fraction of the time since Last-Modified used as heuristic freshness
+# https://www.rfc-editor.org/rfc/rfc9111#section-4.2.2
+HEURISTIC_FRACTION: float = 0.1
+HEURISTIC_MAXIMUM: float = 24 * 60 * 60
+
+# content codings produced for clients that accept them, in order of preference
+ENCODINGS: tuple[bytes, ...] = (b"gzip", b"deflate")
+COMPRESSIBLE_TYPES: tuple[bytes, ...] = (b"text/", b"application/json", b"application/xml")
+# smaller bodies do not gain enough to pay for the extra headers
+MIN_COMPRESS_SIZE: int = 1024
+COMPRESS_LEVEL: int = 6
+
+# more ranges than this in one request are ignored and the whole body is sent
+MAX_RANGES: int = 16
+
+
+def normalize_uri(uri: bytes) -> bytes:
+    """Normalizes a request target so equivalent URIs share a cache entry.
+    Unreserved characters are unquoted, dot segments and repeated slashes removed
+    and the fragment dropped.
+
+    Args:
+        uri (bytes): The request target as received.
+
+    Returns:
+        bytes: The normalized request target.
+    """
+    parts: urllib.parse.SplitResult = urllib.parse.urlsplit(uri.decode("latin-1"))
+    path: str = urllib.parse.quote(urllib.parse.unquote(parts.path), safe="/:@!$&'()*+,;=")
+    path = posixpath.normpath("/" + path) if path else "/"
+    if path.startswith("//"):
+        # posixpath keeps two leading slashes
+        path = "/" + path.lstrip("/")
+    if parts.path.endswith("/") and path != "/":
+        path += "/"
+    return (path + ("?" + parts.query if parts.query else "")).encode("latin-1")
+
+
+def parse_cache_control(value: bytes) -> dict[bytes, Optional[bytes]]:
+    """Parses the directives of a Cache-Control header.
+
+    Args:
+        value (bytes): The value of the header.
+
+    Returns:
+        dict[bytes, Optional[bytes]]: The directives, in lower case, with their argument.
+    """
+    directives: dict[bytes, Optional[bytes]] = {}
+    for directive in value.split(b","):
+        name, separator, argument = directive.strip().partition(b"=")
+        if name:
+            directives[name.lower()] = argument.strip(b'"') if separator else None
+    return directives
+
+
+def parse_http_date(value: bytes) -> Optional[float]:
+    """Parses an HTTP date into a timestamp.
+
+    Args:
+        value (bytes): The date, as sent in Expires, Date or Last-Modified.
+
+    Returns:
+        Optional[float]: The timestamp, None if the date is not valid.
+    """
+    try:
+        return email.utils.parsedate_to_datetime(value.decode("latin-1")).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def parse_accept_encoding(value: bytes) -> dict[bytes, float]:
+    """Parses an Accept-Encoding header.
+
+    Args:
+        value (bytes): The value of the header.
+
+    Returns:
+        dict[bytes, float]: The quality of each coding, in lower case.
+    """
+    qualities: dict[bytes, float] = {}
+    for item in value.split(b","):
+        coding, *parameters = item.split(b";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality: float = 1.0
+        for parameter in parameters:
+            name, _, argument = parameter.strip().partition(b"=")
+            if name.lower() == b"q":
+                try:
+                    quality = float(argument)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def negotiate_encoding(accept_encoding: bytes) -> Optional[bytes]:
+    """Chooses the content coding for a client.
+
+    Args:
+        accept_encoding (bytes): The Accept-Encoding header of the request, may be empty.
+
+    Returns:
+        Optional[bytes]: One of ENCODINGS, None for the identity body.
+    """
+    if not accept_encoding:
+        return None
+    qualities: dict[bytes, float] = parse_accept_encoding(accept_encoding)
+    best: Optional[bytes] = None
+    best_quality: float = 0.0
+    for encoding in ENCODINGS:
+        quality: float = qualities.get(encoding, qualities.get(b"*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: bytes) -> bytes:
+    """Compresses a body with a content coding.
+
+    Args:
+        body (bytes): The identity body.
+        encoding (bytes): gzip or deflate.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    if encoding == b"gzip":
+        # fixed mtime, so the same body always gives the same bytes
+        return gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+    # deflate in HTTP is the zlib format
+    # https://www.rfc-editor.org/rfc/rfc9110#section-8.4.1.2
+    return zlib.compress(body, COMPRESS_LEVEL)
+
+
+def parse_range(value: bytes, length: int) -> Optional[list[tuple[int, int]]]:
+    """Parses a Range header against the length of a body.
+    https://www.rfc-editor.org/rfc/rfc9110#section-14.1.2
+
+    Args:
+        value (bytes): The value of the header, e.g. b"bytes=0-99,-500".
+        length (int): The length of the body.
+
+    Returns:
+        Optional[list[tuple[int, int]]]: The satisfiable ranges as first and last position,
+            both included. Empty if none is satisfiable, None if the header must be ignored.
+    """
+    unit, _, specification = value.partition(b"=")
+    if unit.strip().lower() != b"bytes":
+        return None
+
+    ranges: list[tuple[int, int]] = []
+    for item in specification.split(b","):
+        first, dash, last = (part.strip() for part in item.strip().partition(b"-"))
+        if not dash:
+            return None
+        if not first:
+            # suffix range, the last bytes of the body
+            if not last.isdigit():
+                return None
+            start, end = max(0, length - int(last)), length - 1
+        else:
+            if not first.isdigit() or (last and not last.isdigit()):
+                return None
+            start = int(first)
+            end = min(int(last), length - 1) if last else length - 1
+            if last and int(last) < start:
+                return None
+        if start <= end:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+class Preferences:
+    """What a client asks about the representation of a document, besides its URI.
+
+    Args:
+        accept_encoding (bytes): The Accept-Encoding header of the request.
+        byte_range (bytes): The Range header of the request.
+        if_range (bytes): The If-Range header of the request.
+    """
+
+    def __init__(
+        self, accept_encoding: bytes = b"", byte_range: bytes = b"", if_range: bytes = b""
+    ) -> None:
+        self.accept_encoding: bytes = accept_encoding
+        self.byte_range: bytes = byte_range
+        self.if_range: bytes = if_range
+
+    @classmethod
+    def from_headers(cls, header: Callable[[bytes], bytes]) -> "Preferences":
+        """Builds the preferences from the headers of a request.
+
+        Args:
+            header (Callable[[bytes], bytes]): Returns the value of a header by name,
+                e.g. http_parser.Request.header.
+
+        Returns:
+            Preferences: The preferences of the request.
+        """
+        return cls(header(b"accept-encoding"), header(b"range"), header(b"if-range"))
+
+    def upstream_headers(self) -> list[tuple[bytes, bytes]]:
+        """Returns the headers forwarded to the provider when the document is not cached.
+
+        Returns:
+            list[tuple[bytes, bytes]]: Range and If-Range, if the client sent them.
+        """
+        headers: list[tuple[bytes, bytes]] = []
+        if self.byte_range:
+            headers.append((b"Range", self.byte_range))
+            if self.if_range:
+                headers.append((b"If-Range", self.if_range))
+        return headers
+
+
+class CachedResponse:
+    """A complete response kept in memory.
+    The response is stored already serialized for the client, so a hit is a single send.
+
+    Args:
+        status (int): The status code.
+        reason (bytes): The reason phrase.
+        headers (list[tuple[bytes, bytes]]): The end to end headers of the response.
+        body (bytes): The decoded body.
+        default_ttl (float): Freshness used when the provider gives no information.
+        max_ttl (Optional[float]): Upper bound of the freshness, used for negative entries.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        status: int,
+        reason: bytes,
+        headers: list[tuple[bytes, bytes]],
+        body: bytes,
+        default_ttl: float,
+        max_ttl: Optional[float] = None,
+    ) -> None:
+        self.status: int = status
+        self.reason: bytes = reason
+        self.headers: list[tuple[bytes, bytes]] = [
+            (name, value) for name, value in headers if name.lower() != b"content-length"
+        ]
+        self.body_length: int = len(body)
+        self.default_ttl: float = default_ttl
+        self.max_ttl: Optional[float] = max_ttl
+
+        self.stored_at: float = 0.0
+        self.freshness: float = 0.0
+        self.must_revalidate: bool = False
+        self.wire: bytes = b""
+        self.body_offset: int = 0
+
+        # encoded variants, each serialized like wire, None if it did not make the body smaller
+        self.variants: dict[bytes, Optional[tuple[bytes, int]]] = {}
+        self.pending: set[bytes] = set()
+        content_type: bytes = self.header(b"content-type", b"text/plain").lower()
+        self.compressible: bool = (
+            status == 200
+            and not self.header(b"content-encoding")
+            and self.body_length >= MIN_COMPRESS_SIZE
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+        )
+        if self.compressible and b"accept-encoding" not in self.header(b"vary").lower():
+            # the identity body is also a variant, shared caches must not mix them up
+            self.headers.append((b"Vary", b"Accept-Encoding"))
+        if status == 200 and not self.header(b"accept-ranges"):
+            self.headers.append((b"Accept-Ranges", b"bytes"))
+
+        self.update(self.headers, body)
+
+    def header(self, name: bytes, default: bytes = b"") -> bytes:
+        """Returns the value of the first header with the given name.
+
+        Args:
+            name (bytes): The name of the header, case insensitive.
+            default (bytes): Value returned if the header is not present.
+
+        Returns:
+            bytes: The value of the header.
+        """
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    @property
+    def body(self) -> memoryview:
+        """The body, as a view over the stored buffer."""
+        return memoryview(self.wire)[self.body_offset :]
+
+    @property
+    def size(self) -> int:
+        """Bytes of memory accounted to this response, variants included."""
+        return len(self.wire) + sum(
+            len(variant[0]) for variant in self.variants.values() if variant is not None
+        )
+
+    def select(self, preferences: Preferences) -> tuple[bytes, int]:
+        """Returns the stored variant for a client, or the part of it the client asked for.
+
+        Args:
+            preferences (Preferences): Content coding and byte ranges asked by the client.
+
+        Returns:
+            tuple[bytes, int]: The serialized response and the length of its body.
+        """
+        if preferences.byte_range and self.status == 200 and self.if_range(preferences.if_range):
+            ranges: Optional[list[tuple[int, int]]] = parse_range(
+                preferences.byte_range, self.body_length
+            )
+            if ranges is not None:
+                return self.partial(ranges)
+
+        encoding: Optional[bytes] = (
+            negotiate_encoding(preferences.accept_encoding) if self.variants else None
+        )
+        if encoding and (variant := self.variants.get(encoding)) is not None:
+            wire, body_offset = variant
+            return wire, len(wire) - body_offset
+        return self.wire, self.body_length
+
+    def if_range(self, value: bytes) -> bool:
+        """Evaluates an If-Range condition, ranges are only served if it holds.
+        https://www.rfc-editor.org/rfc/rfc9110#section-13.1.5
+
+        Args:
+            value (bytes): The If-Range header, empty if the request has none.
+
+        Returns:
+            bool: True if there is no condition or the stored response matches it.
+        """
+        if not value:
+            return True
+        if value.startswith(b'"'):
+            # strong comparison, weak entity tags never match
+            return value == self.header(b"etag")
+        if value.startswith(b"W/"):
+            return False
+        date: Optional[float] = parse_http_date(value)
+        return date is not None and date == parse_http_date(self.header(b"last-modified"))
+
+    def partial(self, ranges: list[tuple[int, int]]) -> tuple[bytes, int]:
+        """Serializes a 206 Partial Content answer, or a 416 if no range is satisfiable.
+
+        Args:
+            ranges (list[tuple[int, int]]): First and last position of each range, see parse_range.
+
+        Returns:
+            tuple[bytes, int]: The serialized response and the length of its body.
+        """
+        length: bytes = str(self.body_length).encode()
+        if not ranges:
+            return (
+                http_pool.response_head(
+                    416,
+                    b"Range Not Satisfiable",
+                    [(b"Content-Range", b"bytes */" + length), (b"Content-Length", b"0")],
+                ),
+                0,
+            )
+
+        body: memoryview = self.body
+        headers: list[tuple[bytes, bytes]]
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers = self.headers + [(b"Content-Range", b"bytes %d-%d/%s" % (start, end, length))]
+            parts: list[Union[bytes, memoryview]] = [body[start : end + 1]]
+        else:
+            boundary: bytes = secrets.token_hex(16).encode()
+            content_type: bytes = self.header(b"content-type", b"text/plain")
+            headers = [
+                (name, value) for name, value in self.headers if name.lower() != b"content-type"
+            ]
+            headers.append((b"Content-Type", b"multipart/byteranges; boundary=" + boundary))
+            parts = []
+            for start, end in ranges:
+                parts.append(
+                    b"\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%s\r\n\r\n"
+                    % (boundary, content_type, start, end, length)
+                )
+                parts.append(body[start : end + 1])
+            parts.append(b"\r\n--" + boundary + b"--\r\n")
+
+        payload: bytes = b"".join(parts)
+        head: bytes = http_pool.response_head(
+            206,
+            b"Partial Content",
+            headers + [(b"Content-Length", str(len(payload)).encode())],
+        )
+        return head + payload, len(payload)
+
+    def _variant_wire(self, encoding: bytes, encoded: bytes) -> tuple[bytes, int]:
+        headers: list[tuple[bytes, bytes]] = []
+        for name, value in self.headers:
+            if name.lower() == b"etag" and value.endswith(b'"'):
+                # a different representation needs a different entity tag
+                value = value[:-1] + b"-" + encoding + b'"'
+            headers.append((name, value))
+        head: bytes = http_pool.response_head(
+            self.status,
+            self.reason,
+            headers
+            + [(b"Content-Encoding", encoding), (b"Content-Length", str(len(encoded)).encode())],
+        )
+        return head + encoded, len(head)
+
+    def add_variant(self, encoding: bytes, encoded: Optional[bytes]) -> None:
+        """Stores an encoded variant of the body.
+
+        Args:
+            encoding (bytes): The content coding.
+            encoded (Optional[bytes]): The encoded body, None if it is not worth serving.
+        """
+        self.variants[encoding] = (
+            self._variant_wire(encoding, encoded) if encoded is not None else None
+        )
+        self.pending.discard(encoding)
+
+    def update(self, headers: list[tuple[bytes, bytes]], body: Optional[bytes] = None) -> None:
+        """Replaces the stored headers (and optionally the body) and recomputes freshness.
+
+        Args:
+            headers (list[tuple[bytes, bytes]]): The new headers.
+            body (Optional[bytes]): The new body, None to keep the current one.
+        """
+        if body is None:
+            body = bytes(self.body)
+        self.headers = headers
+        self.stored_at = time.time()
+        self.freshness, self.must_revalidate = self._compute_freshness()
+        if self.max_ttl is not None:
+            self.freshness = min(self.freshness, self.max_ttl)
+
+        # framed by Content-Length, so the same buffer serves kept-alive and closed clients
+        head: bytes = http_pool.response_head(
+            self.status,
+            self.reason,
+            self.headers + [(b"Content-Length", str(len(body)).encode())],
+        )
+        self.wire = head + body
+        self.body_offset = len(head)
+
+        # the heads of the variants carry the same headers
+        for encoding, variant in list(self.variants.items()):
+            if variant is not None:
+                self.variants[encoding] = self._variant_wire(encoding, variant[0][variant[1] :])
+
+    def revalidated(self, headers: list[tuple[bytes, bytes]]) -> None:
+        """Applies the headers of a 304 Not Modified answer to the stored response.
+
+        Args:
+            headers (list[tuple[bytes, bytes]]): The headers of the 304 answer.
+        """
+        updated: dict[bytes, tuple[bytes, bytes]] = {
+            name.lower(): (name, value)
+            for name, value in headers
+            if name.lower() in REVALIDATION_HEADERS
+        }
+        merged: list[tuple[bytes, bytes]] = [
+            updated.pop(name.lower(), (name, value)) for name, value in self.headers
+        ]
+        self.update(merged + list(updated.values()))
+
+    def _compute_freshness(self) -> tuple[float, bool]:
+        directives: dict[bytes, Optional[bytes]] = parse_cache_control(
+            self.header(b"cache-control")
+        )
+        must_revalidate: bool = b"no-cache" in directives
+
+        for name in (b"s-maxage", b"max-age"):
+            argument: Optional[bytes] = directives.get(name)
+            if argument is not None and argument.isdigit():
+                return float(argument), must_revalidate
+
+        expires: Optional[float] = parse_http_date(self.header(b"expires"))
+        if expires is not None:
+            date: Optional[float] = parse_http_date(self.header(b"date"))
+            return max(0.0, expires - (date or self.stored_at)), must_revalidate
+
+        last_modified: Optional[float] = parse_http_date(self.header(b"last-modified"))
+        if last_modified is not None:
+            age: float = self.stored_at - last_modified
+            return min(HEURISTIC_MAXIMUM, max(0.0, age * HEURISTIC_FRACTION)), must_revalidate
+
+        return self.default_ttl, must_revalidate
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """Checks whether the response can be served without asking the provider.
+
+        Args:
+            now (Optional[float]): The current time, defaults to time.time().
+
+        Returns:
+            bool: True if the response is fresh.
+        """
+        if self.must_revalidate:
+            return False
+        return (now or time.time()) - self.stored_at < self.freshness
+
+    def validators(self) -> list[tuple[bytes, bytes]]:
+        """Returns the conditional headers to revalidate this response.
+
+        Returns:
+            list[tuple[bytes, bytes]]: If-None-Match and/or If-Modified-Since, may be empty.
+        """
+        conditions: list[tuple[bytes, bytes]] = []
+        if etag := self.header(b"etag"):
+            conditions.append((b"If-None-Match", etag))
+        if last_modified := self.header(b"last-modified"):
+            conditions.append((b"If-Modified-Since", last_modified))
+        return conditions
+
+
+# answers that say the document does not exist, stored for a short time only
+NEGATIVE_STATUSES: frozenset[int] = frozenset((404, 410))
+
+
+def is_storable(status: int, headers: list[tuple[bytes, bytes]]) -> bool:
+    """Checks whether a response from the provider may be stored.
+
+    Args:
+        status (int): The status code.
+        headers (list[tuple[bytes, bytes]]): The headers of the response.
+
+    Returns:
+        bool: True if the response can be cached.
+    """
+    if status != 200 and status not in NEGATIVE_STATUSES:
+        return False
+    for name, value in headers:
+        if name.lower() == b"cache-control":
+            directives: dict[bytes, Optional[bytes]] = parse_cache_control(value)
+            if b"no-store" in directives or b"private" in directives:
+                return False
+        elif name.lower() == b"vary" and value.strip() == b"*":
+            return False
+    return True
+
+
+class BodyCollector:
+    """Keeps a copy of a body while it is relayed, giving up once it exceeds a limit.
+
+    Args:
+        limit (int): Largest body kept.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit: int = limit
+        self.pieces: Optional[list[bytes]] = []
+        self.size: int = 0
+
+    def __call__(self, data: bytes) -> None:
+        if self.pieces is None:
+            return
+        self.size += len(data)
+        if self.size > self.limit:
+            self.pieces = None
+        else:
+            self.pieces.append(data)
+
+    def body(self) -> Optional[bytes]:
+        """Returns the body collected, None if it exceeded the limit."""
+        return None if self.pieces is None else b"".join(self.pieces)
+
+
+class ResponseCache:
+    """LRU cache of complete responses bounded by the total size of the stored buffers.
+
+    Args:
+        max_bytes (int): Total byte budget of the cache.
+        max_entry_bytes (Optional[int]): Largest response stored, defaults to a quarter of the
+            budget.
+        default_ttl (float): Freshness of responses without Cache-Control, Expires or Last-Modified.
+        negative_ttl (float): Freshness of 404 and 410 answers, 0 disables negative caching.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: Optional[int] = None,
+        default_ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+    ) -> None:
+        self.max_bytes: int = max_bytes
+        self.max_entry_bytes: int = max_entry_bytes or max_bytes // 4
+        self.default_ttl: float = default_ttl
+        self.negative_ttl: float = negative_ttl
+
+        self.entries: OrderedDict[bytes, CachedResponse] = OrderedDict()
+        self.size: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+        self.hits: int = 0
+        self.compressed_hits: int = 0
+        self.negative_hits: int = 0
+        self.misses: int = 0
+        self.revalidations: int = 0
+        self.evictions: int = 0
+
+    def create_entry(
+        self,
+        status: int,
+        reason: bytes,
+        headers: list[tuple[bytes, bytes]],
+        body: bytes,
+    ) -> CachedResponse:
+        """Builds an entry with the freshness rules of this cache.
+
+        Args:
+            status (int): The status code.
+            reason (bytes): The reason phrase.
+            headers (list[tuple[bytes, bytes]]): The end to end headers of the response.
+            body (bytes): The decoded body.
+
+        Returns:
+            CachedResponse: The entry, not stored yet.
+        """
+        max_ttl: Optional[float] = None
+        if status in NEGATIVE_STATUSES:
+            max_ttl = self.negative_ttl
+        return CachedResponse(status, reason, headers, body, self.default_ttl, max_ttl)
+
+    def get(self, key: bytes) -> Optional[CachedResponse]:
+        """Looks up a response and marks it as the most recently used.
+
+        Args:
+            key (bytes): The normalized URI.
+
+        Returns:
+            Optional[CachedResponse]: The stored response, fresh or not.
+        """
+        with self.lock:
+            entry: Optional[CachedResponse] = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def __contains__(self, key: bytes) -> bool:
+        """Checks whether a response is stored, without marking it as used."""
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key: bytes, entry: CachedResponse) -> bool:
+        """Stores a response, evicting the least recently used ones to stay within budget.
+
+        Args:
+            key (bytes): The normalized URI.
+            entry (CachedResponse): The response to store.
+
+        Returns:
+            bool: False if the response is too big to be stored.
+        """
+        if entry.size > self.max_entry_bytes:
+            return False
+        if entry.status in NEGATIVE_STATUSES and self.negative_ttl <= 0:
+            return False
+        with self.lock:
+            previous: Optional[CachedResponse] = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.entries[key] = entry
+            self.size += entry.size
+            self._evict()
+        return True
+
+    def _evict(self) -> None:
+        """Evicts the least recently used responses until the cache is within budget,
+        must be called with the lock held."""
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def claim_variant(self, entry: CachedResponse, accept_encoding: bytes) -> Optional[bytes]:
+        """Checks whether a variant the client would prefer is still missing.
+        The variant is marked as pending, so only the caller produces it.
+
+        Args:
+            entry (CachedResponse): The stored response.
+            accept_encoding (bytes): The Accept-Encoding header of the request.
+
+        Returns:
+            Optional[bytes]: The encoding to produce with compress_variant, None if there is none.
+        """
+        if not entry.compressible:
+            return None
+        encoding: Optional[bytes] = negotiate_encoding(accept_encoding)
+        with self.lock:
+            if encoding is None or encoding in entry.variants or encoding in entry.pending:
+                return None
+            entry.pending.add(encoding)
+            return encoding
+
+    def compress_variant(self, key: bytes, entry: CachedResponse, encoding: bytes) -> None:
+        """Produces a variant claimed with claim_variant, it is slow and must run off the
+        request path.
+
+        Args:
+            key (bytes): The normalized URI.
+            entry (CachedResponse): The stored response.
+            encoding (bytes): The content coding.
+        """
+        encoded: bytes = compress(bytes(entry.body), encoding)
+        with self.lock:
+            size: int = entry.size
+            entry.add_variant(encoding, encoded if len(encoded) < entry.body_length else None)
+            if self.entries.get(key) is entry:
+                self.size += entry.size - size
+                self._evict()
+
+    def revalidate(
+        self, key: bytes, entry: CachedResponse, headers: list[tuple[bytes, bytes]]
+    ) -> None:
+        """Applies the headers of a 304 Not Modified answer to a stored response, with the
+        lock held so it does not race with compress_variant, and accounts its new size.
+
+        Args:
+            key (bytes): The normalized URI.
+            entry (CachedResponse): The stored response.
+            headers (list[tuple[bytes, bytes]]): The headers of the 304 answer.
+        """
+        with self.lock:
+            size: int = entry.size
+            entry.revalidated(headers)
+            if self.entries.get(key) is entry:
+                self.size += entry.size - size
+                self._evict()
+
+    def discard(self, key: bytes) -> None:
+        """Removes a response from the cache.
+
+        Args:
+            key (bytes): The normalized URI.
+        """
+        with self.lock:
+            entry: Optional[CachedResponse] = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def count(self, counter: str) -> None:
+        """Increments one of the statistics counters.
+
+        Args:
+            counter (str): hits, compressed_hits, negative_hits, misses or revalidations.
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the cache counters and its size.
+
+        Returns:
+            dict[str, float]: The counters, the entries and the bytes they use.
+        """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "compressed_hits": self.compressed_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Incremental HTTP/1.1 request parser, supports bodies and pipelined requests."""
+
+import socket
+import select
+from typing import Iterator, Optional, Union
+
+
+MAX_HEADER_SIZE: int = 16 * 1024
+MAX_BODY_SIZE: int = 1024 * 1024
+RECV_SIZE: int = 64 * 1024
+# enough for the request line of any request worth classifying
+PEEK_SIZE: int = 1024
+
+# parser states
+REQUEST_HEAD: int = 0
+BODY: int = 1
+CHUNK_SIZE: int = 2
+CHUNK_DATA: int = 3
+CHUNK_END: int = 4
+TRAILERS: int = 5
+
+
+class RequestError(Exception):
+    """Raised when a request can not be parsed, carries the status to answer with.
+
+    Args:
+        status (int): The status code for the client.
+        reason (bytes): The reason phrase.
+    """
+
+    def __init__(self, status: int, reason: bytes) -> None:
+        super().__init__(f"{status} {reason.decode()}")
+        self.status: int = status
+        self.reason: bytes = reason
+
+
+class Request:
+    """A complete HTTP request.
+
+    Args:
+        method (bytes): The request method.
+        target (bytes): The request target.
+        version (bytes): The HTTP version, e.g. b"HTTP/1.1".
+        headers (list[tuple[bytes, bytes]]): The headers in the order they were received.
+    """
+
+    def __init__(
+        self,
+        method: bytes,
+        target: bytes,
+        version: bytes,
+        headers: list[tuple[bytes, bytes]],
+    ) -> None:
+        self.method: bytes = method
+        self.target: bytes = target
+        self.version: bytes = version
+        self.headers: list[tuple[bytes, bytes]] = headers
+        self.body: bytes = b""
+
+    def header(self, name: bytes, default: bytes = b"") -> bytes:
+        """Returns the value of the first header with the given name.
+
+        Args:
+            name (bytes): The name of the header, case insensitive.
+            default (bytes): Value returned if the header is not present.
+
+        Returns:
+            bytes: The value of the header.
+        """
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    @property
+    def keep_alive(self) -> bool:
+        """Whether the connection can be reused after answering this request.
+        Only HTTP/1.1 clients are kept, responses of unknown length are sent to them chunked.
+        """
+        tokens: list[bytes] = [
+            token.strip() for token in self.header(b"connection").lower().split(b",")
+        ]
+        return self.version == b"HTTP/1.1" and b"close" not in tokens
+
+
+class RequestParser:
+    """Builds requests from the bytes of a connection as they arrive.
+    Unconsumed bytes stay in the buffer, so several pipelined requests can be fed at once
+    and a request can be split across any number of reads.
+
+    Args:
+        max_header_size (int): Largest request line plus headers accepted.
+        max_body_size (int): Largest body accepted.
+    """
+
+    def __init__(
+        self, max_header_size: int = MAX_HEADER_SIZE, max_body_size: int = MAX_BODY_SIZE
+    ) -> None:
+        self.max_header_size: int = max_header_size
+        self.max_body_size: int = max_body_size
+
+        self.buffer: bytearray = bytearray()
+        self.state: int = REQUEST_HEAD
+        self.request: Optional[Request] = None
+        self.body: bytearray = bytearray()
+        self.remaining: int = 0
+        # where to resume the search of the end of the head
+        self.scanned: int = 0
+
+    def feed(self, data: Union[bytes, memoryview]) -> list[Request]:
+        """Adds received bytes and returns the requests completed by them.
+
+        Args:
+            data (Union[bytes, memoryview]): The bytes received, they are copied.
+
+        Returns:
+            list[Request]: The complete requests, in order. May be empty.
+
+        Raises:
+            RequestError: If the data is not a valid request or exceeds a limit.
+        """
+        self.buffer += data
+        completed: list[Request] = []
+        while (request := self._step()) is not None:
+            completed.append(request)
+        return completed
+
+    @property
+    def idle(self) -> bool:
+        """True if no request is partially received."""
+        return self.state == REQUEST_HEAD and not self.buffer
+
+    def _step(self) -> Optional[Request]:
+        """Advances the state machine as far as the buffer allows.
+
+        Returns:
+            Optional[Request]: A complete request, None if more data is needed.
+        """
+        while True:
+            if self.state == REQUEST_HEAD:
+                if not self._parse_head():
+                    return None
+            elif self.state == BODY:
+                if not self._take_body(self.remaining):
+                    return None
+                return self._finish()
+            elif self.state == CHUNK_SIZE:
+                line: Optional[bytes] = self._take_line()
+                if line is None:
+                    return None
+                try:
+                    self.remaining = int(line.split(b";", 1)[0].strip(), 16)
+                except ValueError as ex:
+                    raise RequestError(400, b"Bad Request") from ex
+                if len(self.body) + self.remaining > self.max_body_size:
+                    raise RequestError(413, b"Content Too Large")
+                self.state = CHUNK_DATA if self.remaining else TRAILERS
+            elif self.state == CHUNK_DATA:
+                if not self._take_body(self.remaining):
+                    return None
+                self.state = CHUNK_END
+            elif self.state == CHUNK_END:
+                if len(self.buffer) < 2:
+                    return None
+                if self.buffer[:2] != b"\r\n":
+                    raise RequestError(400, b"Bad Request")
+                del self.buffer[:2]
+                self.state = CHUNK_SIZE
+            elif self.state == TRAILERS:
+                line = self._take_line()
+                if line is None:
+                    return None
+                if not line:
+                    return self._finish()
+
+    def _take_line(self) -> Optional[bytes]:
+        end: int = self.buffer.find(b"\r\n")
+        if end == -1:
+            if len(self.buffer) > self.max_header_size:
+                raise RequestError(431, b"Request Header Fields Too Large")
+            return None
+        line: bytes = bytes(self.buffer[:end])
+        del self.buffer[: end + 2]
+        return line
+
+    def _take_body(self, size: int) -> bool:
+        """Moves up to size bytes of body from the buffer, True once all have been moved."""
+        taken: int = min(size, len(self.buffer))
+        self.body += self.buffer[:taken]
+        del self.buffer[:taken]
+        self.remaining -= taken
+        return self.remaining == 0
+
+    def _parse_head(self) -> bool:
+        # empty lines before a request are allowed
+        # https://www.rfc-editor.org/rfc/rfc9112#section-2.2
+        while self.buffer.startswith(b"\r\n"):
+            del self.buffer[:2]
+
+        end: int = self.buffer.find(b"\r\n\r\n", self.scanned)
+        if end == -1:
+            if len(self.buffer) > self.max_header_size:
+                raise RequestError(431, b"Request Header Fields Too Large")
+            self.scanned = max(0, len(self.buffer) - 3)
+            return False
+        if end + 4 > self.max_header_size:
+            raise RequestError(431, b"Request Header Fields Too Large")
+
+        lines: list[bytes] = bytes(self.buffer[:end]).split(b"\r\n")
+        del self.buffer[: end + 4]
+        self.scanned = 0
+
+        request_line: list[bytes] = lines[0].split(b" ")
+        if len(request_line) != 3 or not request_line[2].startswith(b"HTTP/1."):
+            raise RequestError(400, b"Bad Request")
+
+        headers: list[tuple[bytes, bytes]] = []
+        for line in lines[1:]:
+            name, separator, value = line.partition(b":")
+            if not separator or not name or name != name.strip():
+                raise RequestError(400, b"Bad Request")
+            headers.append((name, value.strip()))
+
+        self.request = Request(request_line[0], request_line[1], request_line[2], headers)
+        self.body = bytearray()
+
+        if b"chunked" in self.request.header(b"transfer-encoding").lower():
+            self.state = CHUNK_SIZE
+        elif length := self.request.header(b"content-length"):
+            if not length.isdigit():
+                raise RequestError(400, b"Bad Request")
+            self.remaining = int(length)
+            if self.remaining > self.max_body_size:
+                raise RequestError(413, b"Content Too Large")
+            self.state = BODY
+        else:
+            self.remaining = 0
+            self.state = BODY
+        return True
+
+    def _finish(self) -> Request:
+        request: Optional[Request] = self.request
+        assert request is not None
+        request.body = bytes(self.body)
+        self.request = None
+        self.body = bytearray()
+        self.state = REQUEST_HEAD
+        return request
+
+
+def iter_requests(
+    client_socket: socket.socket,
+    parser: Optional[RequestParser] = None,
+    buffer: Optional[bytearray] = None,
+) -> Iterator[Request]:
+    """Yields the requests received on a socket until the client closes it.
+    Data is received into one reusable buffer.
+
+    Args:
+        client_socket (socket.socket): The socket of the client.
+        parser (Optional[RequestParser]): A parser that may already hold received data.
+        buffer (Optional[bytearray]): The receive buffer, one is allocated if not given.
+
+    Yields:
+        Request: Each complete request, a request cut by the end of the connection is dropped.
+
+    Raises:
+        RequestError: If a request is not valid, the caller should answer and close.
+    """
+    parser = parser or RequestParser()
+    buffer = buffer or bytearray(RECV_SIZE)
+    view: memoryview = memoryview(buffer)
+
+    # requests left in the parser from previous reads
+    yield from parser.feed(b"")
+
+    while received := client_socket.recv_into(buffer):
+        yield from parser.feed(view[:received])
+
+
+def peek_request_line(client_socket: socket.socket, timeout: float) -> bytes:
+    """Returns the start of the first request of a connection without consuming it,
+    so connections can be classified as they are accepted.
+
+    Args:
+        client_socket (socket.socket): A newly accepted socket.
+        timeout (float): Seconds to wait for the client to send something.
+
+    Returns:
+        bytes: The request line, may be partial, or empty if nothing arrived in time.
+    """
+    ready, _, _ = select.select([client_socket], [], [], timeout)
+    if not ready:
+        return b""
+    try:
+        data: bytes = client_socket.recv(PEEK_SIZE, socket.MSG_PEEK)
+    except OSError:
+        return b""
+    return data.split(b"\r\n", 1)[0]
@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+"""Persistent HTTP/1.1 connection pool used to reach the RFC provider."""
+
+import socket
+import select
+import logging
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+import splice_relay
+import proxy_metrics
+
+
+# hop-by-hop headers, they describe the upstream connection and must not be relayed
+HOP_BY_HOP_HEADERS: frozenset[bytes] = frozenset(
+    (
+        b"connection",
+        b"keep-alive",
+        b"proxy-connection",
+        b"transfer-encoding",
+        b"te",
+        b"trailer",
+        b"upgrade",
+    )
+)
+
+MAX_HEAD_SIZE: int = 64 * 1024
+RECV_SIZE: int = 64 * 1024
+
+
+class HTTPProtocolError(Exception):
+    """Raised when the provider answers with something that is not valid HTTP/1.x."""
+
+
+class BufferedConnection:
+    """A socket with a read buffer, so that responses can be framed without losing bytes."""
+
+    def __init__(self, sock: socket.socket, address: tuple[str, int]) -> None:
+        self.sock: socket.socket = sock
+        self.address: tuple[str, int] = address
+        self.buffer: bytearray = bytearray()
+        self.created: float = time.monotonic()
+        self.last_used: float = self.created
+        self.requests: int = 0
+
+    def fill(self) -> bool:
+        """Reads more data from the socket into the buffer.
+
+        Returns:
+            bool: False if the peer closed the connection.
+        """
+        data: bytes = self.sock.recv(RECV_SIZE)
+        self.buffer += data
+        return bool(data)
+
+    def read_until(self, delimiter: bytes, limit: int) -> bytes:
+        """Returns everything up to and including the delimiter.
+
+        Args:
+            delimiter (bytes): The delimiter to search for.
+            limit (int): Maximum number of bytes to buffer while searching.
+
+        Returns:
+            bytes: The data, delimiter included.
+        """
+        start: int = 0
+        while (end := self.buffer.find(delimiter, start)) == -1:
+            if len(self.buffer) > limit:
+                raise HTTPProtocolError("line or header block too long")
+            # the delimiter may be split between two reads
+            start = max(0, len(self.buffer) - len(delimiter) + 1)
+            if not self.fill():
+                raise ConnectionResetError("connection closed by the provider")
+        end += len(delimiter)
+        data: bytes = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def read_exactly(self, size: int) -> bytes:
+        """Returns the next size bytes.
+
+        Args:
+            size (int): The number of bytes.
+
+        Returns:
+            bytes: The data.
+        """
+        while len(self.buffer) < size:
+            if not self.fill():
+                raise ConnectionResetError("connection closed by the provider")
+        data: bytes = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_some(self, maximum: int) -> bytes:
+        """Returns at most maximum bytes, reading from the socket only if the buffer is empty.
+
+        Returns:
+            bytes: The data read, empty if the peer closed the connection.
+        """
+        if not self.buffer:
+            self.fill()
+        data: bytes = bytes(self.buffer[:maximum])
+        del self.buffer[:maximum]
+        return data
+
+    def is_healthy(self) -> bool:
+        """Checks that an idle connection is still usable.
+        An idle HTTP connection must not be readable: if it is, the provider either closed it
+        or sent unsolicited data, both mean it can not be reused.
+
+        Returns:
+            bool: True if the connection can be reused.
+        """
+        if self.buffer:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close(self) -> None:
+        """Closes the underlying socket."""
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def parse_head(head: bytes) -> tuple[int, bytes, list[tuple[bytes, bytes]]]:
+    """Parses the status line and the headers of a response.
+
+    Args:
+        head (bytes): The response head, ending with an empty line.
+
+    Returns:
+        tuple[int, bytes, list[tuple[bytes, bytes]]]: The status code, the reason phrase and
+        the headers in the order they were received.
+    """
+    lines: list[bytes] = head.split(b"\r\n")
+    status_line: list[bytes] = lines[0].split(b" ", 2)
+
+    if (
+        len(status_line) < 2
+        or not status_line[0].startswith(b"HTTP/1.")
+        or not status_line[1].isdigit()
+    ):
+        raise HTTPProtocolError(f"bad status line {lines[0]!r}")
+
+    headers: list[tuple[bytes, bytes]] = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, separator, value = line.partition(b":")
+        if not separator:
+            raise HTTPProtocolError(f"bad header line {line!r}")
+        headers.append((name.strip(), value.strip()))
+
+    reason: bytes = status_line[2] if len(status_line) > 2 else b""
+    return int(status_line[1]), reason, headers
+
+
+class PooledResponse:
+    """A response being read from a pooled connection.
+    The connection goes back to the pool once the body has been fully read,
+    if its framing allows it to be reused.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        pool: "ConnectionPool",
+        connection: BufferedConnection,
+        method: bytes,
+    ) -> None:
+        self.pool: ConnectionPool = pool
+        self.connection: Optional[BufferedConnection] = connection
+        self.parse(connection.read_until(b"\r\n\r\n", MAX_HEAD_SIZE), method)
+
+    def parse(self, head: bytes, method: bytes) -> None:
+        """Parses the response head and works out how the body is framed.
+
+        Args:
+            head (bytes): The status line and headers, ending with an empty line.
+            method (bytes): The method of the request, HEAD responses have no body.
+        """
+        self.version: bytes = head[:8]
+        self.status, self.reason, self.headers = parse_head(head[:-4])
+
+        self.content_length: Optional[int] = None
+        self.chunked: bool = False
+        self.keep_alive: bool = self.version == b"HTTP/1.1"
+
+        for token in self.header(b"connection").lower().split(b","):
+            if token.strip() == b"close":
+                self.keep_alive = False
+            elif token.strip() == b"keep-alive":
+                self.keep_alive = True
+
+        if b"chunked" in self.header(b"transfer-encoding").lower():
+            self.chunked = True
+        elif self.header(b"content-length"):
+            if not self.header(b"content-length").isdigit():
+                raise HTTPProtocolError("bad Content-Length")
+            self.content_length = int(self.header(b"content-length"))
+        elif method == b"HEAD" or self.status in (204, 304) or self.status < 200:
+            self.content_length = 0
+        else:
+            # delimited by the end of the connection, can not be reused
+            self.keep_alive = False
+
+        self.finished: bool = False
+
+    def header(self, name: bytes, default: bytes = b"") -> bytes:
+        """Returns the value of the first header with the given name.
+
+        Args:
+            name (bytes): The name of the header, case insensitive.
+            default (bytes): Value returned if the header is not present.
+
+        Returns:
+            bytes: The value of the header.
+        """
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def end_to_end_headers(self) -> list[tuple[bytes, bytes]]:
+        """Returns the headers that can be relayed to a client.
+
+        Returns:
+            list[tuple[bytes, bytes]]: The headers without the hop-by-hop ones.
+        """
+        return [
+            (name, value)
+            for name, value in self.headers
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        ]
+
+    def iter_body(self) -> Iterator[bytes]:
+        """Yields the decoded body as it arrives.
+        Once the body is complete the connection is released to the pool.
+
+        Yields:
+            bytes: Pieces of the body.
+        """
+        connection: Optional[BufferedConnection] = self.connection
+        if connection is None:
+            return
+        try:
+            if self.chunked:
+                yield from self._iter_chunked(connection)
+            elif self.content_length is not None:
+                remaining: int = self.content_length
+                while remaining > 0:
+                    data: bytes = connection.read_some(min(remaining, RECV_SIZE))
+                    if not data:
+                        raise ConnectionResetError("body truncated by the provider")
+                    remaining -= len(data)
+                    yield data
+            else:
+                while data := connection.read_some(RECV_SIZE):
+                    yield data
+        except BaseException:
+            self.close()
+            raise
+
+        self.finished = True
+        self.release()
+
+    @staticmethod
+    def _iter_chunked(connection: BufferedConnection) -> Iterator[bytes]:
+        while True:
+            size_line: bytes = connection.read_until(b"\r\n", MAX_HEAD_SIZE)
+            # chunk extensions are ignored
+            try:
+                size: int = int(size_line.split(b";", 1)[0].strip(), 16)
+            except ValueError as ex:
+                raise HTTPProtocolError(f"bad chunk size {size_line!r}") from ex
+            if size == 0:
+                break
+            while size > 0:
+                data: bytes = connection.read_some(min(size, RECV_SIZE))
+                if not data:
+                    raise ConnectionResetError("chunk truncated by the provider")
+                size -= len(data)
+                yield data
+            if connection.read_exactly(2) != b"\r\n":
+                raise HTTPProtocolError("chunk data not followed by CRLF")
+
+        # trailers, we do not need them
+        while connection.read_until(b"\r\n", MAX_HEAD_SIZE) != b"\r\n":
+            pass
+
+    def splice_body(self, client_socket: socket.socket) -> int:
+        """Sends the body to a socket as it is, without decoding it or copying it into Python.
+        Only for bodies that are not chunked. The bytes already buffered are sent first and the
+        rest is moved by splice_relay. Once the body is complete the connection is released.
+
+        Args:
+            client_socket (socket.socket): The socket to send the body to.
+
+        Returns:
+            int: The number of body bytes sent.
+        """
+        connection: Optional[BufferedConnection] = self.connection
+        if connection is None:
+            return 0
+        try:
+            buffered: bytes = bytes(connection.buffer[: self.content_length])
+            del connection.buffer[: len(buffered)]
+            client_socket.sendall(buffered)
+
+            remaining: Optional[int] = None
+            if self.content_length is not None:
+                remaining = self.content_length - len(buffered)
+            relayed: int = len(buffered) + splice_relay.relay(
+                connection.sock, client_socket, remaining
+            )
+        except BaseException:
+            self.close()
+            raise
+
+        self.finished = True
+        self.release()
+        return relayed
+
+    def read(self) -> bytes:
+        """Reads the whole body.
+
+        Returns:
+            bytes: The body.
+        """
+        return b"".join(self.iter_body())
+
+    def release(self) -> None:
+        """Gives the connection back to the pool, or closes it if it can not be reused."""
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        if self.finished and self.keep_alive:
+            self.pool.release(connection)
+        else:
+            connection.close()
+
+    def close(self) -> None:
+        """Discards the response, the connection is closed if the body was not fully read."""
+        self.release()
+
+
+class ConnectionPool:
+    """Keeps idle HTTP/1.1 connections per host so they can be reused between requests.
+
+    Args:
+        max_idle_per_host (int): Maximum number of idle connections kept for each host.
+        idle_timeout (float): Seconds after which an idle connection is evicted.
+        connect_timeout (float): Seconds to wait while connecting to the provider.
+        read_timeout (Optional[float]): Seconds to wait for each read from the provider,
+            None waits forever.
+        metrics (Optional[proxy_metrics.ProxyMetrics]): Where the connect times and the
+            times to the first byte of the responses are recorded.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = 8,
+        idle_timeout: float = 15.0,
+        connect_timeout: float = 5.0,
+        read_timeout: Optional[float] = 10.0,
+        metrics: Optional[proxy_metrics.ProxyMetrics] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.max_idle_per_host: int = max_idle_per_host
+        self.idle_timeout: float = idle_timeout
+        self.connect_timeout: float = connect_timeout
+        self.read_timeout: Optional[float] = read_timeout
+        self.metrics: Optional[proxy_metrics.ProxyMetrics] = metrics
+
+        self.idle: dict[tuple[str, int], list[BufferedConnection]] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+        self.created: int = 0
+        self.reused: int = 0
+        self.evicted: int = 0
+
+    def connect(self, address: tuple[str, int]) -> BufferedConnection:
+        """Opens a new connection to the given address.
+
+        Args:
+            address (tuple[str, int]): The host and port to connect to.
+
+        Returns:
+            BufferedConnection: The new connection.
+        """
+        started: float = time.perf_counter()
+        sock: socket.socket = socket.create_connection(address, self.connect_timeout)
+        if self.metrics is not None:
+            self.metrics.connect.record(time.perf_counter() - started)
+        sock.settimeout(self.read_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.lock:
+            self.created += 1
+        return BufferedConnection(sock, address)
+
+    def acquire(self, address: tuple[str, int]) -> tuple[BufferedConnection, bool]:
+        """Returns a healthy idle connection to the address or a new one.
+
+        Args:
+            address (tuple[str, int]): The host and port to connect to.
+
+        Returns:
+            tuple[BufferedConnection, bool]: The connection and whether it was reused.
+        """
+        self.evict_idle()
+
+        while True:
+            with self.lock:
+                idle: list[BufferedConnection] = self.idle.get(address, [])
+                # the most recently used connection is the least likely to be closed
+                connection: Optional[BufferedConnection] = idle.pop() if idle else None
+            if connection is None:
+                return self.connect(address), False
+            if connection.is_healthy():
+                with self.lock:
+                    self.reused += 1
+                return connection, True
+            logging.debug("discarding unhealthy connection to %s", address)
+            connection.close()
+
+    def release(self, connection: BufferedConnection) -> None:
+        """Stores a connection whose last response was fully read, so it can be reused.
+
+        Args:
+            connection (BufferedConnection): The connection to store.
+        """
+        connection.last_used = time.monotonic()
+        with self.lock:
+            idle: list[BufferedConnection] = self.idle.setdefault(connection.address, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def evict_idle(self) -> int:
+        """Closes the connections that have been idle for longer than the idle timeout.
+
+        Returns:
+            int: The number of connections closed.
+        """
+        deadline: float = time.monotonic() - self.idle_timeout
+        expired: list[BufferedConnection] = []
+        with self.lock:
+            for idle in self.idle.values():
+                expired.extend(c for c in idle if c.last_used < deadline)
+                idle[:] = [c for c in idle if c.last_used >= deadline]
+            self.evicted += len(expired)
+        for connection in expired:
+            connection.close()
+        return len(expired)
+
+    def request(
+        self,
+        address: tuple[str, int],
+        method: bytes,
+        target: bytes,
+        headers: Optional[list[tuple[bytes, bytes]]] = None,
+    ) -> PooledResponse:
+        """Sends a request without body and returns the response once its head is read.
+        A request that fails on a reused connection is retried once on a new one,
+        since the provider may close idle connections at any time.
+
+        Args:
+            address (tuple[str, int]): The host and port of the provider.
+            method (bytes): The HTTP method.
+            target (bytes): The request target, usually the path.
+            headers (list[tuple[bytes, bytes]]): Extra headers to send.
+
+        Returns:
+            PooledResponse: The response, its body must be read or closed.
+        """
+        request: bytes = (
+            method
+            + b" "
+            + target
+            + b" HTTP/1.1\r\nHost: "
+            + address[0].encode()
+            + b":"
+            + str(address[1]).encode()
+            + b"\r\n"
+            + b"".join(name + b": " + value + b"\r\n" for name, value in headers or [])
+            + b"\r\n"
+        )
+        logging.debug("outgoing header: %s", str(request))
+        started: float = time.perf_counter()
+
+        while True:
+            connection, reused = self.acquire(address)
+            try:
+                connection.sock.sendall(request)
+                connection.requests += 1
+                response: PooledResponse = PooledResponse(self, connection, method)
+                if self.metrics is not None:
+                    self.metrics.first_byte.record(time.perf_counter() - started)
+                return response
+            except (ConnectionError, HTTPProtocolError, OSError):
+                connection.close()
+                if not reused:
+                    raise
+                logging.debug("reused connection to %s failed, retrying", address)
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the pool counters.
+
+        Returns:
+            dict[str, float]: Connections created, reused, evicted and idle.
+        """
+        with self.lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "idle": sum(len(idle) for idle in self.idle.values()),
+            }
+
+    def close(self) -> None:
+        """Closes every idle connection."""
+        with self.lock:
+            connections: list[BufferedConnection] = [
+                c for idle in self.idle.values() for c in idle
+            ]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+def response_head(status: int, reason: bytes, headers: list[tuple[bytes, bytes]]) -> bytes:
+    """Serializes a response head to send to a client.
+
+    Args:
+        status (int): The status code.
+        reason (bytes): The reason phrase.
+        headers (list[tuple[bytes, bytes]]): The headers.
+
+    Returns:
+        bytes: The status line and headers, followed by an empty line.
+    """
+    return (
+        b"HTTP/1.1 "
+        + str(status).encode()
+        + b" "
+        + reason
+        + b"\r\n"
+        + b"".join(name + b": " + value + b"\r\n" for name, value in headers)
+        + b"\r\n"
+    )
+
+
+def client_head(response: PooledResponse, keep_alive: bool) -> tuple[bytes, bool]:
+    """Serializes the head of a provider response for a client.
+    A client that is kept alive needs a framed body: the Content-Length of the provider is kept
+    if there is one, otherwise the body is sent chunked. Other clients get Connection: close
+    and a body delimited by the end of the connection.
+
+    Args:
+        response (PooledResponse): The response of the provider.
+        keep_alive (bool): Whether the client connection will be reused.
+
+    Returns:
+        tuple[bytes, bool]: The head and whether the body must be sent chunked.
+    """
+    headers: list[tuple[bytes, bytes]] = response.end_to_end_headers()
+    chunked: bool = False
+
+    if not keep_alive:
+        headers.append((b"Connection", b"close"))
+    elif response.chunked or response.content_length is None:
+        headers.append((b"Transfer-Encoding", b"chunked"))
+        chunked = True
+
+    return response_head(response.status, response.reason, headers), chunked
+
+
+def chunk(data: bytes) -> bytes:
+    """Frames data as one chunk of a chunked body, an empty chunk ends the body.
+
+    Args:
+        data (bytes): The data.
+
+    Returns:
+        bytes: The chunk.
+    """
+    return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+
+def relay_response(
+    client_socket: socket.socket,
+    response: PooledResponse,
+    keep_alive: bool = False,
+    sink: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    """Sends a pooled response to a client.
+    A body that needs no reframing and no copy is spliced straight from the provider socket.
+
+    Args:
+        client_socket (socket.socket): The socket of the client.
+        response (PooledResponse): The response to relay.
+        keep_alive (bool): Whether the client connection will be reused, see client_head.
+        sink (Optional[Callable[[bytes], None]]): Called with each piece of the body.
+
+    Returns:
+        int: The number of body bytes relayed.
+    """
+    relayed: int = 0
+
+    try:
+        head, chunked = client_head(response, keep_alive)
+        client_socket.sendall(head)
+        if sink is None and not chunked and not response.chunked:
+            return response.splice_body(client_socket)
+
+        for data in response.iter_body():
+            client_socket.sendall(chunk(data) if chunked else data)
+            relayed += len(data)
+            if sink is not None:
+                sink(data)
+        if chunked:
+            client_socket.sendall(chunk(b""))
+    finally:
+        response.close()
+
+    return relayed
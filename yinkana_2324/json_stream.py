@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Incremental reader of JSON values sent back to back over a stream, e.g. a TCP socket.
+
+The bytes are scanned once as they arrive, keeping track of the nesting depth and of
+whether the scan is inside a string, so a value is decoded exactly once, when its closing
+brace arrives, instead of retrying to parse the whole buffer after every read.
+"""
+
+import re
+import json
+import socket
+from typing import Any, Iterator, Optional
+
+
+RECV_SIZE: int = 64 * 1024
+# characters that change the depth or start a string, outside strings
+STRUCTURAL: re.Pattern[bytes] = re.compile(rb'[{}\[\]"]')
+# characters that end a string or escape the next one, inside strings
+STRING_SPECIAL: re.Pattern[bytes] = re.compile(rb'["\\]')
+
+
+class JsonStream:
+    """Splits a stream of bytes into the objects and arrays sent one after another.
+    Anything between them, such as whitespace or newlines, is skipped.
+
+    Args:
+        decoder (Optional[json.JSONDecoder]): Decodes each complete value.
+    """
+
+    def __init__(self, decoder: Optional[json.JSONDecoder] = None) -> None:
+        self.decoder: json.JSONDecoder = decoder or json.JSONDecoder()
+        self.buffer: bytearray = bytearray()
+        # where the scan goes on, may be past the end after a backslash at the end
+        self.scanned: int = 0
+        self.depth: int = 0
+        self.in_string: bool = False
+        # where the value being scanned starts
+        self.start: int = 0
+
+    @property
+    def pending(self) -> bytes:
+        """The bytes received after the last complete value."""
+        return bytes(self.buffer)
+
+    def feed(self, data: bytes) -> list[Any]:
+        """Adds received bytes and decodes the values they complete.
+
+        Args:
+            data (bytes): The bytes, from any point of the stream.
+
+        Returns:
+            list[Any]: The complete values, in order, possibly none.
+
+        Raises:
+            json.JSONDecodeError: If a complete value is not valid JSON or there are more
+                closing than opening brackets.
+        """
+        self.buffer += data
+        values: list[Any] = []
+        buffer: bytearray = self.buffer
+        position: int = self.scanned
+        # the bytes before it are not needed anymore
+        consumed: int = 0
+
+        while position < len(buffer):
+            if self.in_string:
+                special: Optional[re.Match[bytes]] = STRING_SPECIAL.search(buffer, position)
+                if special is None:
+                    position = len(buffer)
+                elif buffer[special.start()] == ord("\\"):
+                    # the escaped character can not end the string
+                    position = special.end() + 1
+                else:
+                    self.in_string = False
+                    position = special.end()
+                continue
+
+            structural: Optional[re.Match[bytes]] = STRUCTURAL.search(buffer, position)
+            if structural is None:
+                position = len(buffer)
+                if not self.depth:
+                    consumed = position
+                break
+            character: int = buffer[structural.start()]
+            position = structural.end()
+
+            if character == ord('"'):
+                self.in_string = True
+            elif character in b"{[":
+                if not self.depth:
+                    self.start = structural.start()
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth < 0:
+                    raise json.JSONDecodeError(
+                        "unbalanced closing bracket", buffer.decode(errors="replace"), position - 1
+                    )
+                if not self.depth:
+                    text: str = buffer[self.start : position].decode()
+                    value, _ = self.decoder.raw_decode(text)
+                    values.append(value)
+                    consumed = position
+
+        if self.depth:
+            consumed = self.start
+        del buffer[:consumed]
+        self.scanned = position - consumed
+        self.start -= consumed
+        return values
+
+
+def iter_json(
+    client_socket: socket.socket, stream: Optional[JsonStream] = None
+) -> Iterator[Any]:
+    """Yields the JSON values received on a socket until the peer closes it.
+
+    Args:
+        client_socket (socket.socket): The connected socket.
+        stream (Optional[JsonStream]): Keeps the state between calls, e.g. to stop reading
+            after a value and go on later without losing the values received with it.
+
+    Yields:
+        Any: The decoded values, in order.
+    """
+    stream = stream or JsonStream()
+    while data := client_socket.recv(RECV_SIZE):
+        yield from stream.feed(data)
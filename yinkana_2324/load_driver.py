@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Load driver of the chamber servers: many players going through the chambers at once.
+
+Every session is async_chambers.run_session with its own username, all of them on one event
+loop. At most a given number run at the same time, and they are started evenly over a
+ramp-up period instead of all at once, so the servers see the load grow. The latency of each
+chamber is kept in a histogram across sessions, and the report gives the success rate and
+percentiles of every chamber and the sessions completed per minute, to size the servers.
+
+Usage: python3 load_driver.py [--host rick] [--sessions 100] [--concurrency 20] ...
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from typing import Optional
+
+import async_chambers
+import proxy_metrics
+
+
+CHAMBERS: tuple[str, ...] = tuple(f"chamber_{number}" for number in range(8))
+
+
+class ChamberStats:
+    """Outcomes of a chamber across sessions."""
+
+    def __init__(self) -> None:
+        # seconds of the successful attempts
+        self.latency: proxy_metrics.Histogram = proxy_metrics.Histogram(1e6, 600.0)
+        self.successes: int = 0
+        self.failures: int = 0
+
+    def success_rate(self) -> float:
+        """Returns the share of attempts that succeeded, 0.0 if there were none."""
+        attempts: int = self.successes + self.failures
+        return self.successes / attempts if attempts else 0.0
+
+
+class LoadDriver:
+    """Runs sessions with distinct usernames against the same chamber servers.
+
+    Args:
+        host (str): The host of the chambers when a prompt does not name it.
+        port (int): The port of the first chamber.
+        provider (tuple[str, int]): The HTTP provider when the prompt does not name it.
+        concurrency (int): Sessions running at the same time, at most.
+        ramp_up (float): Seconds over which the sessions are started.
+        prefix (str): The usernames are the prefix followed by the number of the session.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(
+        self,
+        host: str = "rick",
+        port: int = 2000,
+        provider: tuple[str, int] = ("web", 81),
+        concurrency: int = 20,
+        ramp_up: float = 0.0,
+        prefix: str = "load_",
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.provider: tuple[str, int] = provider
+        self.concurrency: int = concurrency
+        self.ramp_up: float = ramp_up
+        self.prefix: str = prefix
+        self.chambers: dict[str, ChamberStats] = {name: ChamberStats() for name in CHAMBERS}
+        self.lock: threading.Lock = threading.Lock()
+        self.completed: int = 0
+        self.failed: int = 0
+        self.elapsed: float = 0.0
+        # exceptions that ended sessions, by type, with the number of sessions
+        self.errors: dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, success: bool) -> None:
+        """Counts an attempt at a chamber, passed to run_session.
+
+        Args:
+            name (str): The chamber.
+            seconds (float): How long it took.
+            success (bool): Whether it returned the next prompt.
+        """
+        stats: ChamberStats = self.chambers.setdefault(name, ChamberStats())
+        if success:
+            stats.latency.record(seconds)
+        with self.lock:
+            if success:
+                stats.successes += 1
+            else:
+                stats.failures += 1
+
+    async def run(self, sessions: int) -> None:
+        """Runs the sessions and waits for all of them.
+
+        Args:
+            sessions (int): The number of sessions, each with its own username.
+        """
+        slots: asyncio.Semaphore = asyncio.Semaphore(self.concurrency)
+        start: float = time.monotonic()
+        try:
+            await asyncio.gather(
+                *(self._session(index, sessions, slots) for index in range(sessions))
+            )
+        finally:
+            self.elapsed = time.monotonic() - start
+
+    async def _session(self, index: int, sessions: int, slots: asyncio.Semaphore) -> None:
+        await asyncio.sleep(self.ramp_up * index / sessions)
+        async with slots:
+            try:
+                await async_chambers.run_session(
+                    f"{self.prefix}{index}", self.host, self.port, self.provider, self.record
+                )
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                logging.debug("session %d failed: %r", index, ex)
+                with self.lock:
+                    self.failed += 1
+                    self.errors[type(ex).__name__] = self.errors.get(type(ex).__name__, 0) + 1
+                return
+        with self.lock:
+            self.completed += 1
+
+    def sessions_per_minute(self) -> float:
+        """Returns the sessions completed per minute of the run, 0.0 before it ends."""
+        return self.completed * 60 / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        """Formats the success rate and latency percentiles of every chamber, one per line,
+        followed by the sessions completed, failed and per minute.
+
+        Returns:
+            str: The report.
+        """
+        lines: list[str] = []
+        for name, stats in self.chambers.items():
+            attempts: int = stats.successes + stats.failures
+            if not attempts:
+                lines.append(f"{name}: not reached")
+                continue
+            if not stats.successes:
+                lines.append(f"{name}: 0.0% of {attempts} ok")
+                continue
+            snapshot: dict[str, float] = stats.latency.snapshot()
+            lines.append(
+                f"{name}: {stats.success_rate():.1%} of {attempts} ok, "
+                + ", ".join(
+                    f"p{percent:g} {snapshot[f'p{percent:g}'] * 1000:.1f} ms"
+                    for percent in proxy_metrics.PERCENTILES
+                )
+                + f", max {snapshot['max'] * 1000:.1f} ms"
+            )
+        lines.append(
+            f"sessions: {self.completed} completed, {self.failed} failed in "
+            f"{self.elapsed:.1f} s, {self.sessions_per_minute():.1f} per minute"
+        )
+        if self.errors:
+            lines.append(
+                "errors: "
+                + ", ".join(f"{error} {count}" for error, count in sorted(self.errors.items()))
+            )
+        return "\n".join(lines)
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """Splits host:port.
+
+    Args:
+        address (str): The address.
+
+    Returns:
+        tuple[str, int]: The host and port.
+
+    Raises:
+        ValueError: If the port is missing or not a number.
+    """
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    """Runs the sessions given on the command line and logs the report.
+
+    Args:
+        arguments (Optional[list[str]]): The command line arguments, sys.argv if None.
+    """
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="rick", help="host of the chambers")
+    parser.add_argument("--port", type=int, default=2000, help="port of the first chamber")
+    parser.add_argument("--provider", type=parse_address, default=("web", 81), help="host:port")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds to start them all")
+    parser.add_argument("--prefix", default="load_", help="of the usernames")
+    parser.add_argument("--verbose", action="store_true", help="log every prompt")
+    options: argparse.Namespace = parser.parse_args(arguments)
+
+    logging.getLogger().setLevel(logging.DEBUG if options.verbose else logging.WARNING)
+    driver: LoadDriver = LoadDriver(
+        options.host,
+        options.port,
+        options.provider,
+        options.concurrency,
+        options.ramp_up,
+        options.prefix,
+    )
+    try:
+        asyncio.run(driver.run(options.sessions))
+    except KeyboardInterrupt:
+        pass
+    logging.getLogger().setLevel(logging.INFO)
+    logging.info("load:\n%s", driver.report())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s: %(funcName)s: %(message)s", level=logging.INFO)
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Prefetching of the RFC documents referenced by the ones being served.
+
+RFCs cite each other ("see RFC 9110") and the chamber tends to ask for the cited documents
+next, so while a document streams to a client its references are counted, and once it is
+complete the most cited ones are fetched into the cache by a few low priority threads.
+"""
+
+import re
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Optional
+
+import http_pool
+import worker_pool
+
+
+# "RFC 9110", "RFC9110", "rfc-9110"
+REFERENCE: re.Pattern[bytes] = re.compile(rb"\bRFC[ -]?(\d{1,5})\b", re.IGNORECASE)
+# longer than any reference, so one split between two pieces of body is found in the next one
+SCAN_OVERLAP: int = 16
+# the last number of a URI is the RFC number, e.g. /rfc/9110 or /rfc/rfc9110.txt
+URI_NUMBER: re.Pattern[bytes] = re.compile(rb"\d+(?=\D*$)")
+
+
+class ReferenceScanner:
+    """Counts the RFCs referenced by a body fed piece by piece.
+
+    Args:
+        address (tuple[str, int]): The host and port of the provider.
+        uri (bytes): The URI of the document, the references become URIs like it.
+    """
+
+    def __init__(self, address: tuple[str, int], uri: bytes) -> None:
+        self.address: tuple[str, int] = address
+        self.uri: bytes = uri
+        match: Optional[re.Match[bytes]] = URI_NUMBER.search(uri)
+        self.number: int = int(match.group()) if match else -1
+        self.counts: Counter[int] = Counter()
+        self.tail: bytes = b""
+
+    def __call__(self, data: bytes) -> None:
+        text: bytes = self.tail + bytes(data)
+        # matches starting in the overlap may be cut, they are counted with the next piece
+        end: int = max(0, len(text) - SCAN_OVERLAP)
+        self._count(text, end)
+        self.tail = text[end:]
+
+    def _count(self, text: bytes, end: int) -> None:
+        for match in REFERENCE.finditer(text):
+            if match.start() >= end:
+                break
+            number: int = int(match.group(1))
+            if number != self.number:
+                self.counts[number] += 1
+
+    def uris(self, limit: int) -> list[bytes]:
+        """Returns the URIs of the most referenced documents, once the body is complete.
+
+        Args:
+            limit (int): Maximum number of URIs.
+
+        Returns:
+            list[bytes]: The URIs, most referenced first.
+        """
+        self._count(self.tail, len(self.tail))
+        self.tail = b""
+        return [
+            URI_NUMBER.sub(str(number).encode(), self.uri, count=1)
+            for number, _ in self.counts.most_common(limit)
+        ]
+
+
+class Prefetcher:
+    """Fetches the documents referenced by the served ones before the clients ask for them.
+    At most max_bytes of prefetched documents may be waiting for a client, the rest of the
+    references are ignored until the clients catch up.
+
+    Args:
+        fetch (Callable[[tuple[str, int], bytes], tuple[bytes, int]]): Fetches a URI into the
+            cache if it is not there yet, returns its cache key and the body bytes fetched.
+        contains (Callable[[bytes], bool]): Whether a cache key is still cached.
+        workers (int): Documents fetched at the same time.
+        max_bytes (int): Budget of prefetched bytes not requested yet.
+        per_document (int): References followed from each document.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        fetch: Callable[[tuple[str, int], bytes], tuple[bytes, int]],
+        contains: Callable[[bytes], bool],
+        workers: int = 2,
+        max_bytes: int = 8 * 1024 * 1024,
+        per_document: int = 4,
+    ) -> None:
+        self.fetch: Callable[[tuple[str, int], bytes], tuple[bytes, int]] = fetch
+        self.contains: Callable[[bytes], bool] = contains
+        self.max_bytes: int = max_bytes
+        self.per_document: int = per_document
+        self.pool: worker_pool.WorkerPool = worker_pool.WorkerPool(workers, 64, "prefetch")
+
+        # prefetched documents not requested yet, by cache key, with their size
+        self.unclaimed: dict[bytes, int] = {}
+        self.unclaimed_bytes: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+        self.issued: int = 0
+        self.fetched: int = 0
+        self.fetched_bytes: int = 0
+        self.hits: int = 0
+        self.skipped: int = 0
+        self.wasted_bytes: int = 0
+
+    def scanner(
+        self, address: tuple[str, int], uri: bytes, response: http_pool.PooledResponse
+    ) -> Optional[ReferenceScanner]:
+        """Returns a scanner for the body of a response worth scanning, i.e. a text document.
+
+        Args:
+            address (tuple[str, int]): The host and port of the provider.
+            uri (bytes): The URI of the document.
+            response (http_pool.PooledResponse): The response, before its body is read.
+
+        Returns:
+            Optional[ReferenceScanner]: The scanner to feed with the body, None to skip it.
+        """
+        if response.status != 200:
+            return None
+        if not response.header(b"content-type", b"text/plain").lower().startswith(b"text/"):
+            return None
+        return ReferenceScanner(address, uri)
+
+    def schedule(self, scanner: ReferenceScanner) -> None:
+        """Queues the most referenced documents of a complete body.
+        Nothing waits for the queue: if it is full, the references are dropped.
+
+        Args:
+            scanner (ReferenceScanner): The scanner fed with the whole body.
+        """
+        for uri in scanner.uris(self.per_document):
+            if not self.pool.submit(self._prefetch, scanner.address, uri, block=False):
+                with self.lock:
+                    self.skipped += 1
+
+    def _prefetch(self, address: tuple[str, int], uri: bytes) -> None:
+        with self.lock:
+            self._collect_waste()
+            if self.unclaimed_bytes >= self.max_bytes:
+                self.skipped += 1
+                return
+            self.issued += 1
+
+        key, size = self.fetch(address, uri)
+        if not size:
+            return
+        logging.debug("prefetched %s, %d bytes", str(key), size)
+        with self.lock:
+            self.fetched += 1
+            self.fetched_bytes += size
+            self.unclaimed_bytes += size - self.unclaimed.get(key, 0)
+            self.unclaimed[key] = size
+
+    def _collect_waste(self) -> None:
+        """Forgets the prefetched documents evicted before anyone asked for them,
+        must be called with the lock held."""
+        for key, size in list(self.unclaimed.items()):
+            if not self.contains(key):
+                del self.unclaimed[key]
+                self.unclaimed_bytes -= size
+                self.wasted_bytes += size
+
+    def claim(self, key: bytes) -> None:
+        """Records that a client asked for a document, a hit if it was prefetched.
+
+        Args:
+            key (bytes): The cache key of the document.
+        """
+        with self.lock:
+            size: Optional[int] = self.unclaimed.pop(key, None)
+            if size is not None:
+                self.unclaimed_bytes -= size
+                self.hits += 1
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the prefetch metrics. Documents still waiting for a client
+        count as wasted, as they are if the run ends now.
+
+        Returns:
+            dict[str, float]: Counters, hit ratio and wasted bytes.
+        """
+        with self.lock:
+            self._collect_waste()
+            return {
+                "issued": self.issued,
+                "fetched": self.fetched,
+                "fetched_bytes": self.fetched_bytes,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.fetched if self.fetched else 0.0,
+                "skipped": self.skipped,
+                "unclaimed_bytes": self.unclaimed_bytes,
+                "wasted_bytes": self.wasted_bytes + self.unclaimed_bytes,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Drops the queued prefetches and waits for the ones in progress.
+
+        Args:
+            wait (bool): Wait for the prefetches in progress.
+        """
+        self.pool.shutdown(wait, cancel_pending=True)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Parser of the chamber prompts.
+
+The prompt of a chamber gives its identifier and describes the next one: where to connect,
+as "to host:port" or "at port N", where its documents come from, as "of host:port" or
+"from host:port", and its parameters, as "name: number", "--flag" or quoted text. Addresses
+without one of those prepositions are only mentioned, the next chamber is never sent to
+them. All of them are matched by the alternatives of a single compiled pattern, so the
+prompt is scanned once whatever its length, and the runner gets them in a typed record
+instead of hard-coding them in main().
+"""
+
+import re
+import logging
+from typing import Optional
+
+
+# the identifier is the rest of the line after the first "identifier:", wherever it is,
+# as get_message_identifier has always read it
+PROMPT_IDENTIFIER: re.Pattern[bytes] = re.compile(rb"identifier:(.+)")
+# one alternative per kind of token, the first that matches at a position wins; the
+# identifier line is skipped; "name:1000" reads as an address, numeric parameters need
+# "name: 1000" or "name=1000"
+PROMPT_TOKEN: re.Pattern[bytes] = re.compile(
+    rb"""
+    identifier:.+
+    | (?:\b(?P<preposition>to|at|of|from)\s+)?
+      (?:
+        \b(?P<host>[A-Za-z][\w.-]*):(?P<port>\d{1,5})\b
+        | \bport\s+(?P<lone_port>\d{1,5})\b
+      )
+    | \b(?P<name>[A-Za-z_][\w-]*)\s*[:=]\s*(?P<value>-?\d+)\b
+    | (?<![\w-])--(?P<flag>[A-Za-z][\w-]*)
+    | "(?P<quoted>[^"\n]*)"
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+HIGHEST_PORT: int = 65535
+
+
+class Prompt:
+    """What a chamber prompt says about the next chamber.
+
+    Args:
+        text (bytes): The whole prompt.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, text: bytes) -> None:
+        self.text: bytes = text
+        self.identifier: Optional[bytes] = None
+        # host:port pairs, in the order they appear
+        self.addresses: list[tuple[str, int]] = []
+        # ports given without a host
+        self.ports: list[int] = []
+        # where the prompt says to connect or send, "to host:port" or "at port N", with None
+        # for the host of the chamber
+        self.destinations: list[tuple[Optional[str], int]] = []
+        # where the prompt says the documents come from, "of host:port" or "from host:port"
+        self.sources: list[tuple[str, int]] = []
+        self.numbers: dict[str, int] = {}
+        self.flags: list[str] = []
+        self.quoted: list[bytes] = []
+
+    def target(self, default: tuple[str, int]) -> tuple[str, int]:
+        """Returns the address of the next chamber, the first one the prompt says to connect
+        or send to; the addresses it only mentions are not used.
+
+        Args:
+            default (tuple[str, int]): The host and port if the prompt does not say them, and
+                the host if it only gives the port.
+
+        Returns:
+            tuple[str, int]: The host and port.
+        """
+        if not self.destinations:
+            return default
+        host, port = self.destinations[0]
+        return host or default[0], port
+
+    def provider(self, default: tuple[str, int]) -> tuple[str, int]:
+        """Returns the address the prompt says the documents come from, e.g. the provider of
+        the HTTP chamber.
+
+        Args:
+            default (tuple[str, int]): The address to use if the prompt does not say it.
+
+        Returns:
+            tuple[str, int]: The host and port.
+        """
+        return self.sources[0] if self.sources else default
+
+    def number(self, name: str, default: int) -> int:
+        """Returns a numeric parameter, e.g. the maximum sum of a chamber.
+
+        Args:
+            name (str): Its name in the prompt, case insensitive.
+            default (int): The value if the prompt does not give it.
+
+        Returns:
+            int: The value.
+        """
+        return self.numbers.get(name.lower(), default)
+
+    def __repr__(self) -> str:
+        return (
+            f"Prompt(identifier={self.identifier!r}, destinations={self.destinations}, "
+            f"sources={self.sources}, addresses={self.addresses}, ports={self.ports}, "
+            f"numbers={self.numbers}, flags={self.flags})"
+        )
+
+
+def parse_prompt(text: bytes) -> Prompt:
+    """Extracts the identifier and the next chamber's address and parameters from a prompt.
+
+    Args:
+        text (bytes): The prompt.
+
+    Returns:
+        Prompt: The record, with empty fields for what the prompt does not mention.
+    """
+    # pylint: disable=too-many-branches
+    prompt: Prompt = Prompt(text)
+    identifier: Optional[re.Match[bytes]] = PROMPT_IDENTIFIER.search(text)
+    if identifier is not None:
+        prompt.identifier = identifier.group(1)
+    for token in PROMPT_TOKEN.finditer(text):
+        kind: Optional[str] = token.lastgroup
+        preposition: Optional[bytes] = token["preposition"]
+        if kind == "port":
+            if int(token["port"]) <= HIGHEST_PORT:
+                address: tuple[str, int] = (token["host"].decode(), int(token["port"]))
+                prompt.addresses.append(address)
+                if preposition in (b"to", b"at"):
+                    prompt.destinations.append(address)
+                elif preposition in (b"of", b"from"):
+                    prompt.sources.append(address)
+        elif kind == "lone_port":
+            if int(token["lone_port"]) <= HIGHEST_PORT:
+                prompt.ports.append(int(token["lone_port"]))
+                if preposition in (b"to", b"at"):
+                    prompt.destinations.append((None, int(token["lone_port"])))
+        elif kind == "value":
+            name: str = token["name"].decode().lower()
+            if name == "port":
+                prompt.ports.append(int(token["value"]))
+            else:
+                prompt.numbers.setdefault(name, int(token["value"]))
+        elif kind == "flag":
+            prompt.flags.append(token["flag"].decode())
+        elif kind == "quoted":
+            prompt.quoted.append(token["quoted"])
+    logging.debug("%r", prompt)
+    return prompt
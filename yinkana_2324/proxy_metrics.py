@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Latency and size histograms of the proxy, and a plain text endpoint to read them.
+
+The histograms have fixed log-linear buckets, like HDR histograms: every power of two is
+split in SUB_BUCKETS linear buckets, so a value is kept with a relative error below
+1 / SUB_BUCKETS whatever its magnitude, recording it is a few integer operations and the
+memory used does not grow with the number of values.
+"""
+
+import socket
+import logging
+import threading
+import contextlib
+from typing import Callable, Iterator
+
+import http_parser
+
+
+# linear buckets per power of two, 2 ** SUB_BITS
+SUB_BITS: int = 3
+SUB_BUCKETS: int = 1 << SUB_BITS
+# the percentiles of the snapshots
+PERCENTILES: tuple[float, ...] = (50.0, 90.0, 99.0, 99.9)
+# seconds the metrics endpoint waits for a request
+ENDPOINT_TIMEOUT: float = 5.0
+
+
+def bucket_index(value: int) -> int:
+    """Returns the bucket of a non-negative integer value.
+
+    Args:
+        value (int): The value.
+
+    Returns:
+        int: The index of its bucket.
+    """
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift: int = value.bit_length() - SUB_BITS - 1
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_bounds(index: int) -> tuple[int, int]:
+    """Returns the values kept in a bucket.
+
+    Args:
+        index (int): The index of the bucket.
+
+    Returns:
+        tuple[int, int]: The lowest value of the bucket and the lowest of the next one.
+    """
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift: int = (index >> SUB_BITS) - 1
+    lowest: int = (index - (shift << SUB_BITS)) << shift
+    return lowest, lowest + (1 << shift)
+
+
+class Histogram:
+    """Counts values in fixed log-linear buckets.
+
+    Args:
+        scale (float): Units of the buckets per unit of the recorded values,
+            e.g. 1e6 to record seconds with microsecond resolution.
+        highest (float): Highest value told apart, greater ones go to the last bucket.
+    """
+
+    def __init__(self, scale: float = 1.0, highest: float = 2**40) -> None:
+        self.scale: float = scale
+        self.counts: list[int] = [0] * (bucket_index(int(highest * scale)) + 1)
+        self.lock: threading.Lock = threading.Lock()
+        self.count: int = 0
+        self.total: float = 0.0
+        self.minimum: float = float("inf")
+        self.maximum: float = 0.0
+
+    def record(self, value: float) -> None:
+        """Adds a value, negative ones count as 0.
+
+        Args:
+            value (float): The value, in the units of the caller.
+        """
+        scaled: int = int(value * self.scale)
+        index: int = bucket_index(scaled) if scaled > 0 else 0
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value < self.minimum:
+                self.minimum = value
+            if value > self.maximum:
+                self.maximum = value
+
+    def percentile(self, percent: float) -> float:
+        """Returns a value that percent of the recorded ones do not exceed.
+
+        Args:
+            percent (float): Between 0 and 100.
+
+        Returns:
+            float: The middle of the bucket of that value, within the recorded ones,
+                0.0 if nothing was recorded.
+        """
+        with self.lock:
+            counts: list[int] = list(self.counts)
+            count: int = self.count
+            minimum: float = self.minimum
+            maximum: float = self.maximum
+        if not count:
+            return 0.0
+        # the rank of the value, at least the first one
+        rank: int = max(1, int(count * percent / 100 + 0.5))
+        seen: int = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= rank:
+                lowest, following = bucket_bounds(index)
+                middle: float = (lowest + following - 1) / 2 / self.scale
+                return min(maximum, max(minimum, middle))
+        return maximum
+
+    def snapshot(self) -> dict[str, float]:
+        """Returns the count, mean, minimum, maximum and PERCENTILES of the values.
+
+        Returns:
+            dict[str, float]: The statistics, p50 for the median and so on.
+        """
+        with self.lock:
+            count: int = self.count
+            total: float = self.total
+            minimum: float = self.minimum if count else 0.0
+            maximum: float = self.maximum
+        snapshot: dict[str, float] = {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "min": minimum,
+            "max": maximum,
+        }
+        for percent in PERCENTILES:
+            snapshot[f"p{percent:g}"] = self.percentile(percent)
+        return snapshot
+
+
+class ProxyMetrics:
+    """The instruments of a proxy: histograms, gauges of things in progress and the
+    counters of other components, read through callables registered as sources.
+    """
+
+    def __init__(self) -> None:
+        # seconds to open a connection to the provider
+        self.connect: Histogram = Histogram(1e6, 60.0)
+        # seconds from sending a request to the provider until its response head is read
+        self.first_byte: Histogram = Histogram(1e6, 60.0)
+        # seconds to answer a client request, from the cache or through the provider
+        self.relay: Histogram = Histogram(1e6, 600.0)
+        # body bytes sent to the client per request
+        self.bytes: Histogram = Histogram(1.0, 2**32)
+
+        self.gauges: dict[str, int] = {}
+        self.sources: dict[str, Callable[[], dict[str, float]]] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def histograms(self) -> dict[str, Histogram]:
+        """Returns the histograms by name."""
+        return {
+            "upstream_connect_seconds": self.connect,
+            "upstream_first_byte_seconds": self.first_byte,
+            "request_seconds": self.relay,
+            "response_bytes": self.bytes,
+        }
+
+    def add_source(self, name: str, source: Callable[[], dict[str, float]]) -> None:
+        """Registers the counters of a component, read on every snapshot.
+
+        Args:
+            name (str): Prefix of the counters.
+            source (Callable[[], dict[str, float]]): Returns the counters by name.
+        """
+        self.sources[name] = source
+
+    @contextlib.contextmanager
+    def active(self, gauge: str) -> Iterator[None]:
+        """Counts something in progress, e.g. a client connection, while in the block.
+
+        Args:
+            gauge (str): The name of the gauge.
+        """
+        with self.lock:
+            self.gauges[gauge] = self.gauges.get(gauge, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.gauges[gauge] -= 1
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """Returns every metric, grouped by histogram, "gauges" and source.
+
+        Returns:
+            dict[str, dict[str, float]]: The metrics.
+        """
+        snapshot: dict[str, dict[str, float]] = {
+            name: histogram.snapshot() for name, histogram in self.histograms().items()
+        }
+        with self.lock:
+            snapshot["gauges"] = dict(self.gauges)
+        for name, source in self.sources.items():
+            snapshot[name] = {
+                counter: value
+                for counter, value in source().items()
+                if isinstance(value, (int, float))
+            }
+        return snapshot
+
+    def render(self) -> bytes:
+        """Formats the snapshot as plain text, one "group_metric value" per line.
+
+        Returns:
+            bytes: The text.
+        """
+        return "".join(
+            f"{group}_{name} {value:g}\n"
+            for group, metrics in self.snapshot().items()
+            for name, value in metrics.items()
+        ).encode()
+
+    def serve(self, port: int = 0) -> socket.socket:
+        """Answers every HTTP request on a side port with the rendered metrics,
+        from a daemon thread, until the returned socket is closed.
+
+        Args:
+            port (int): The port, 0 for a free one.
+
+        Returns:
+            socket.socket: The listening socket, the port is in getsockname()[1].
+        """
+        server: socket.socket = socket.create_server(("", port))
+        threading.Thread(
+            target=self._serve, args=(server,), name="metrics", daemon=True
+        ).start()
+        logging.info("metrics on port %d", server.getsockname()[1])
+        return server
+
+    def _serve(self, server: socket.socket) -> None:
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                # closed
+                return
+            with client:
+                client.settimeout(ENDPOINT_TIMEOUT)
+                try:
+                    # the first request is enough, whatever it asks for
+                    next(http_parser.iter_requests(client), None)
+                    body: bytes = self.render()
+                    client.sendall(
+                        b"HTTP/1.1 200 OK\r\n"
+                        b"Content-Type: text/plain; charset=utf-8\r\n"
+                        b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                        b"Connection: close\r\n\r\n" + body
+                    )
+                except (OSError, http_parser.RequestError) as ex:
+                    logging.debug("metrics request failed: %s", ex)
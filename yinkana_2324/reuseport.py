@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Serving one TCP port from several processes with SO_REUSEPORT.
+
+Every worker process opens its own listening socket on the same port and the kernel
+balances the incoming connections between them, so each process has its own interpreter
+and GIL. The coordinator reserves the port, starts the workers and waits for the one
+result the chamber needs, the prompt of the next one, from whichever worker receives it.
+"""
+
+import queue
+import socket
+import logging
+import multiprocessing
+import multiprocessing.context
+import multiprocessing.synchronize
+from typing import Any, Callable, Optional
+
+
+# seconds between checks that the workers are still alive while waiting for the prompt
+POLL_INTERVAL: float = 0.5
+
+
+def reserve_port(port: int = 0) -> socket.socket:
+    """Binds a socket that keeps the port for the workers, it does not accept connections.
+
+    Args:
+        port (int): The port, 0 for a free one.
+
+    Returns:
+        socket.socket: The bound socket, the port is in getsockname()[1]. Close it when done.
+    """
+    sock: socket.socket = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", port))
+    return sock
+
+
+def listen(port: int, backlog: int) -> socket.socket:
+    """Opens the listening socket of a worker on a port shared with the other workers.
+
+    Args:
+        port (int): The port reserved by the coordinator.
+        backlog (int): The backlog of this worker.
+
+    Returns:
+        socket.socket: The listening socket.
+    """
+    sock: socket.socket = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", port))
+    sock.listen(backlog)
+    return sock
+
+
+class ProcessGroup:
+    """Worker processes that serve a port until one of them receives the prompt.
+    The workers are spawned, not forked, so they do not inherit the threads and locks of
+    the coordinator; each one imports the main module and builds its own pools and caches.
+
+    The target is called as target(*args, ready, prompts, stop): it must release ready once
+    it listens, put the prompt in the prompts queue when it gets it and return once stop is
+    set. The group is returned when every worker listens, so the port can be announced.
+
+    Args:
+        processes (int): Number of worker processes.
+        target (Callable[..., Any]): The worker, a function of a module, so it can be pickled.
+        args (tuple[Any, ...]): The first arguments of the worker.
+        name (str): Prefix of the process names.
+        start_timeout (float): Seconds the workers have to start listening.
+
+    Raises:
+        ChildProcessError: If a worker does not start listening in time.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        target: Callable[..., Any],
+        args: tuple[Any, ...],
+        name: str = "worker",
+        start_timeout: float = 30.0,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        context: multiprocessing.context.SpawnContext = multiprocessing.get_context("spawn")
+        self.ready: multiprocessing.synchronize.Semaphore = context.Semaphore(0)
+        self.prompts: "multiprocessing.Queue[bytes]" = context.Queue()
+        self.stop: multiprocessing.synchronize.Event = context.Event()
+        self.processes: list[multiprocessing.context.SpawnProcess] = [
+            context.Process(
+                target=target,
+                args=args + (self.ready, self.prompts, self.stop),
+                name=f"{name}-{i}",
+                daemon=True,
+            )
+            for i in range(processes)
+        ]
+        for process in self.processes:
+            process.start()
+
+        for _ in self.processes:
+            if not self.ready.acquire(timeout=start_timeout):
+                self.shutdown()
+                raise ChildProcessError("a worker process did not start listening")
+
+    def __enter__(self) -> "ProcessGroup":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.shutdown()
+
+    def wait_prompt(self, timeout: Optional[float] = None) -> bytes:
+        """Waits for the prompt received by any worker.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait, None to wait while a worker is alive.
+
+        Returns:
+            bytes: The prompt.
+
+        Raises:
+            TimeoutError: If no prompt arrives in time.
+            ChildProcessError: If every worker died without sending it.
+        """
+        waited: float = 0.0
+        while timeout is None or waited < timeout:
+            try:
+                return self.prompts.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                waited += POLL_INTERVAL
+            if not any(process.is_alive() for process in self.processes):
+                raise ChildProcessError("every worker process exited without the prompt")
+        raise TimeoutError("no prompt received")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Asks the workers to stop and waits for them, killing the ones that do not.
+
+        Args:
+            timeout (float): Seconds each worker gets to finish.
+        """
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logging.warning("%s did not stop, terminating it", process.name)
+                process.terminate()
+                process.join()
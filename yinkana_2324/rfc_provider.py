@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Local stand-in of the RFC provider, to load test the proxy without the real one.
+
+It serves a synthetic corpus of RFC-like text documents, generated once into a directory,
+as /rfc<n>, /rfc/<n> or any other path ending in the number. Bodies are sent with sendfile,
+connections are kept alive, ETag validators, single byte ranges and HEAD are supported,
+and a fixed latency and a share of failed answers can be injected.
+
+Usage: python3 rfc_provider.py [--port 8081] [--documents 200] [--latency 0.02] ...
+"""
+
+import os
+import re
+import time
+import random
+import socket
+import struct
+import logging
+import argparse
+import tempfile
+import threading
+import email.utils
+from typing import Optional
+
+import http_pool
+import http_cache
+import http_parser
+
+
+# the last number of the path is the RFC number, as in prefetch.URI_NUMBER
+URI_NUMBER: re.Pattern[bytes] = re.compile(rb"(\d+)(?=\D*$)")
+# seconds an idle client connection is kept open
+IDLE_TIMEOUT: float = 30.0
+# words the documents are made of
+WORDS: tuple[str, ...] = tuple(
+    "the client server request response header field message connection cache origin proxy "
+    "resource representation MUST SHOULD MAY NOT semantics syntax octets method status "
+    "recipient sender intermediary stored valid fresh stale".split()
+)
+
+
+class Corpus:
+    """RFC-like documents on disk, numbered from first. They are generated the first time
+    and reused by the next runs with the same directory and parameters.
+    Each document cites a few others of the corpus, like the real ones do.
+
+    Args:
+        directory (Optional[str]): Where the documents are kept, a new temporary one if None.
+        documents (int): Number of documents.
+        min_size (int): Size of the smallest document, in bytes.
+        max_size (int): Size of the largest one, the sizes are log-uniformly distributed.
+        first (int): Number of the first document.
+        seed (int): Seed of the sizes and contents, the same seed gives the same corpus.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        documents: int = 200,
+        min_size: int = 4 * 1024,
+        max_size: int = 512 * 1024,
+        first: int = 1,
+        seed: int = 2324,
+    ) -> None:
+        self.directory: str = directory or tempfile.mkdtemp(prefix="rfc-corpus-")
+        self.first: int = first
+        os.makedirs(self.directory, exist_ok=True)
+
+        sizes: random.Random = random.Random(seed)
+        self.sizes: dict[int, int] = {}
+        for number in range(first, first + documents):
+            size: int = int(min_size * (max_size / min_size) ** sizes.random())
+            self.sizes[number] = size
+            if not self._complete(number, size):
+                # a generator per document, so the sizes do not depend on what is generated
+                self._generate(number, size, random.Random(f"{seed}-{number}"), documents)
+
+    def path(self, number: int) -> str:
+        """Returns the file of a document."""
+        return os.path.join(self.directory, f"rfc{number}.txt")
+
+    def _complete(self, number: int, size: int) -> bool:
+        try:
+            return os.path.getsize(self.path(number)) == size
+        except OSError:
+            return False
+
+    def _generate(
+        self, number: int, size: int, generator: random.Random, documents: int
+    ) -> None:
+        lines: list[str] = [
+            f"Request for Comments: {number}",
+            "Category: Standards Track",
+            "",
+            f"RFC {number}: A synthetic document of {size} octets",
+            "",
+        ]
+        length: int = sum(len(line) + 1 for line in lines)
+        section: int = 1
+        while length < size:
+            if generator.random() < 0.1:
+                line: str = f"{section}.  Section {section}"
+                section += 1
+            else:
+                words: list[str] = generator.choices(WORDS, k=10)
+                if generator.random() < 0.2:
+                    cited: int = self.first + generator.randrange(documents)
+                    words.insert(generator.randrange(len(words)), f"(see RFC {cited})")
+                line = " ".join(words).capitalize() + "."
+            lines.append(line)
+            length += len(line) + 1
+
+        text: bytes = "\n".join(lines).encode()[: size - 1] + b"\n"
+        # written aside and renamed, a run interrupted midway leaves no truncated document
+        temporary: str = self.path(number) + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(text)
+        os.replace(temporary, self.path(number))
+
+    def find(self, target: bytes) -> Optional[int]:
+        """Returns the number of the document a request target asks for, if it exists.
+
+        Args:
+            target (bytes): The request target, e.g. b"/rfc9110" or b"/rfc/9110".
+
+        Returns:
+            Optional[int]: The number, None if there is no such document.
+        """
+        match: Optional[re.Match[bytes]] = URI_NUMBER.search(target.partition(b"?")[0])
+        if match is None or int(match.group(1)) not in self.sizes:
+            return None
+        return int(match.group(1))
+
+
+class ProviderStandIn:
+    """HTTP/1.1 server of a corpus, one thread per client connection.
+
+    Args:
+        corpus (Corpus): The documents to serve.
+        latency (float): Seconds waited before answering each request.
+        jitter (float): Extra seconds, uniformly random up to this, added to the latency.
+        error_rate (float): Share of requests answered with 503 Service Unavailable.
+        reset_rate (float): Share of requests whose connection is closed without an answer.
+        max_age (int): Seconds of freshness sent in Cache-Control.
+        seed (Optional[int]): Seed of the injected latencies and errors.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        corpus: Corpus,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        reset_rate: float = 0.0,
+        max_age: int = 60,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.corpus: Corpus = corpus
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.reset_rate: float = reset_rate
+        self.max_age: int = max_age
+        self.random: random.Random = random.Random(seed)
+        self.server: Optional[socket.socket] = None
+
+        self.lock: threading.Lock = threading.Lock()
+        self.connections: int = 0
+        self.active: int = 0
+        self.requests: int = 0
+        self.bytes_sent: int = 0
+        self.resets: int = 0
+        self.statuses: dict[int, int] = {}
+        self.documents: dict[int, int] = {}
+
+    def serve(self, port: int = 0, backlog: int = 512) -> int:
+        """Starts accepting connections in a daemon thread.
+
+        Args:
+            port (int): The port, 0 for a free one.
+            backlog (int): The listen backlog.
+
+        Returns:
+            int: The port.
+        """
+        self.server = socket.create_server(("", port), backlog=backlog)
+        threading.Thread(target=self._accept, name="provider", daemon=True).start()
+        return self.server.getsockname()[1]
+
+    def shutdown(self) -> None:
+        """Stops accepting connections, the open ones end when their clients close them."""
+        if self.server is not None:
+            self.server.close()
+
+    def _accept(self) -> None:
+        assert self.server is not None
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._connection, args=(client,), daemon=True).start()
+
+    def _connection(self, client: socket.socket) -> None:
+        with self.lock:
+            self.connections += 1
+            self.active += 1
+        try:
+            with client:
+                client.settimeout(IDLE_TIMEOUT)
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                for request in http_parser.iter_requests(client):
+                    if not self._answer(client, request):
+                        break
+        except (OSError, http_parser.RequestError) as ex:
+            logging.debug("provider connection closed: %s", ex)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def _answer(self, client: socket.socket, request: http_parser.Request) -> bool:
+        """Answers one request.
+
+        Returns:
+            bool: Whether the connection can be used for more requests.
+        """
+        with self.lock:
+            self.requests += 1
+            delay: float = self.latency + self.jitter * self.random.random()
+            roll: float = self.random.random()
+        if delay:
+            time.sleep(delay)
+
+        if roll < self.reset_rate:
+            with self.lock:
+                self.resets += 1
+            # lingering 0 seconds closes with a RST, like a provider that crashed
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            return False
+        keep_alive: bool = request.keep_alive
+        if roll < self.reset_rate + self.error_rate:
+            return self._empty(
+                client, 503, b"Service Unavailable", keep_alive, [(b"Retry-After", b"1")]
+            )
+        if request.method not in (b"GET", b"HEAD"):
+            return self._empty(
+                client, 405, b"Method Not Allowed", keep_alive, [(b"Allow", b"GET, HEAD")]
+            )
+        number: Optional[int] = self.corpus.find(request.target)
+        if number is None:
+            return self._empty(client, 404, b"Not Found", keep_alive)
+
+        return self._document(client, request, number, keep_alive)
+
+    def _document(
+        self, client: socket.socket, request: http_parser.Request, number: int, keep_alive: bool
+    ) -> bool:
+        path: str = self.corpus.path(number)
+        size: int = self.corpus.sizes[number]
+        etag: bytes = f'"{number:x}-{size:x}"'.encode()
+        modified: float = os.path.getmtime(path)
+        headers: list[tuple[bytes, bytes]] = [
+            (b"Content-Type", b"text/plain; charset=utf-8"),
+            (b"ETag", etag),
+            (b"Last-Modified", email.utils.formatdate(modified, usegmt=True).encode()),
+            (b"Cache-Control", f"max-age={self.max_age}".encode()),
+            (b"Accept-Ranges", b"bytes"),
+        ]
+        with self.lock:
+            self.documents[number] = self.documents.get(number, 0) + 1
+
+        if etag in [tag.strip() for tag in request.header(b"if-none-match").split(b",")]:
+            return self._empty(client, 304, b"Not Modified", keep_alive, headers[1:])
+
+        offset: int = 0
+        length: int = size
+        status: int = 200
+        reason: bytes = b"OK"
+        ranges: Optional[list[tuple[int, int]]] = None
+        if_range: bytes = request.header(b"if-range")
+        if request.header(b"range") and (not if_range or if_range == etag):
+            ranges = http_cache.parse_range(request.header(b"range"), size)
+        if ranges == []:
+            return self._empty(
+                client,
+                416,
+                b"Range Not Satisfiable",
+                keep_alive,
+                [(b"Content-Range", f"bytes */{size}".encode())],
+            )
+        if ranges is not None and len(ranges) == 1:
+            # several ranges would need multipart/byteranges, the whole document is sent instead
+            offset, last = ranges[0]
+            length = last - offset + 1
+            status, reason = 206, b"Partial Content"
+            headers.append((b"Content-Range", f"bytes {offset}-{last}/{size}".encode()))
+
+        headers.append((b"Content-Length", str(length).encode()))
+        if not keep_alive:
+            headers.append((b"Connection", b"close"))
+        client.sendall(http_pool.response_head(status, reason, headers))
+        sent: int = 0
+        if request.method == b"GET":
+            with open(path, "rb") as file:
+                sent = client.sendfile(file, offset, length)
+        self._count(status, sent)
+        return keep_alive
+
+    def _empty(
+        self,
+        client: socket.socket,
+        status: int,
+        reason: bytes,
+        keep_alive: bool,
+        headers: Optional[list[tuple[bytes, bytes]]] = None,
+    ) -> bool:
+        """Sends an answer without body."""
+        # pylint: disable=too-many-arguments
+        headers = list(headers or []) + [(b"Content-Length", b"0")]
+        if not keep_alive:
+            headers.append((b"Connection", b"close"))
+        client.sendall(http_pool.response_head(status, reason, headers))
+        self._count(status, 0)
+        return keep_alive
+
+    def _count(self, status: int, sent: int) -> None:
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes_sent += sent
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the request counters.
+
+        Returns:
+            dict[str, float]: Connections, requests, body bytes sent, resets, answers by
+                status as status_<code> and the number of distinct documents asked for.
+        """
+        with self.lock:
+            stats: dict[str, float] = {
+                "connections": self.connections,
+                "active": self.active,
+                "requests": self.requests,
+                "bytes_sent": self.bytes_sent,
+                "resets": self.resets,
+                "documents": len(self.documents),
+            }
+            for status, count in sorted(self.statuses.items()):
+                stats[f"status_{status}"] = count
+            return stats
+
+
+def main() -> None:
+    """Serves a corpus until interrupted, logging the counters every few seconds."""
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--directory", help="where the corpus is kept, a temporary one if omitted")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--min-size", type=int, default=4 * 1024)
+    parser.add_argument("--max-size", type=int, default=512 * 1024)
+    parser.add_argument("--first", type=int, default=1, help="number of the first document")
+    parser.add_argument("--seed", type=int, default=2324)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 answers")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="share of resets")
+    parser.add_argument("--max-age", type=int, default=60)
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    arguments: argparse.Namespace = parser.parse_args()
+
+    corpus: Corpus = Corpus(
+        arguments.directory,
+        arguments.documents,
+        arguments.min_size,
+        arguments.max_size,
+        arguments.first,
+        arguments.seed,
+    )
+    provider: ProviderStandIn = ProviderStandIn(
+        corpus,
+        arguments.latency,
+        arguments.jitter,
+        arguments.error_rate,
+        arguments.reset_rate,
+        arguments.max_age,
+        arguments.seed,
+    )
+    port: int = provider.serve(arguments.port)
+    logging.info(
+        "serving rfc%d to rfc%d from %s on port %d",
+        corpus.first,
+        corpus.first + len(corpus.sizes) - 1,
+        corpus.directory,
+        port,
+    )
+    try:
+        while True:
+            time.sleep(arguments.stats_interval)
+            logging.info("provider: %s", provider.stats())
+    except KeyboardInterrupt:
+        provider.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s: %(funcName)s: %(message)s", level=logging.INFO)
+    main()
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+"""Proxy between the clients of the HTTP chamber and the RFC provider."""
+
+import time
+import socket
+import logging
+import threading
+from typing import Any, Optional
+
+import http_pool
+import prefetch
+import http_cache
+import disk_cache
+import worker_pool
+import proxy_metrics
+import single_flight
+import circuit_breaker
+
+
+def error_response(
+    status: int, reason: bytes, retry_after: int = 0, keep_alive: bool = False
+) -> bytes:
+    """Builds a response without body, used for errors and acknowledgements.
+
+    Args:
+        status (int): The status code.
+        reason (bytes): The reason phrase.
+        retry_after (int): Seconds to send in Retry-After, 0 to leave it out.
+        keep_alive (bool): Whether the client connection will be reused.
+
+    Returns:
+        bytes: The complete response.
+    """
+    headers: list[tuple[bytes, bytes]] = [(b"Content-Length", b"0")]
+    if not keep_alive:
+        headers.append((b"Connection", b"close"))
+    if retry_after:
+        headers.append((b"Retry-After", str(retry_after).encode()))
+    return http_pool.response_head(status, reason, headers)
+
+
+class RfcProxy:
+    """Serves RFC requests from the response cache, asking the provider only when needed.
+    A circuit breaker per provider turns an unhealthy provider into fast failures.
+    Cached documents are compressed in the background for clients that accept it, and
+    copied to the disk cache, if any, so the next runs do not start cold.
+    Optionally, the RFCs referenced by the served documents are prefetched into the cache.
+    Latencies, sizes and the counters of its components are gathered in metrics.
+
+    Args:
+        pool (Optional[http_pool.ConnectionPool]): Connections to the provider.
+        cache (Optional[http_cache.ResponseCache]): Cache of the provider responses.
+        failure_threshold (int): Consecutive provider failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial request.
+        background_threads (int): Threads that compress cached documents and write them to
+            disk, 0 to disable compression and write them on the request path.
+        disk (Optional[disk_cache.DiskCache]): Second cache tier behind the memory cache.
+        prefetch_workers (int): Documents prefetched at the same time, 0 disables prefetching.
+        metrics (Optional[proxy_metrics.ProxyMetrics]): Where the requests are measured,
+            also used by the connection pool unless it has its own.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        pool: Optional[http_pool.ConnectionPool] = None,
+        cache: Optional[http_cache.ResponseCache] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+        background_threads: int = 2,
+        disk: Optional[disk_cache.DiskCache] = None,
+        prefetch_workers: int = 0,
+        metrics: Optional[proxy_metrics.ProxyMetrics] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.metrics: proxy_metrics.ProxyMetrics = metrics or proxy_metrics.ProxyMetrics()
+        self.pool: http_pool.ConnectionPool = pool or http_pool.ConnectionPool(
+            metrics=self.metrics
+        )
+        if self.pool.metrics is None:
+            self.pool.metrics = self.metrics
+        self.cache: http_cache.ResponseCache = cache or http_cache.ResponseCache()
+        self.disk: Optional[disk_cache.DiskCache] = disk
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+
+        self.flights: single_flight.FlightTable = single_flight.FlightTable(
+            self.cache.max_entry_bytes
+        )
+        self.breakers: dict[tuple[str, int], circuit_breaker.CircuitBreaker] = {}
+        self.lock: threading.Lock = threading.Lock()
+        # zlib and file writes release the GIL, so this work really runs beside the proxy threads
+        self.background: Optional[worker_pool.WorkerPool] = (
+            worker_pool.WorkerPool(background_threads, 64, "background")
+            if background_threads
+            else None
+        )
+        self.prefetcher: Optional[prefetch.Prefetcher] = (
+            prefetch.Prefetcher(self._prefetch, self._cached, prefetch_workers)
+            if prefetch_workers
+            else None
+        )
+
+        self.metrics.add_source("cache", self.cache.stats)
+        self.metrics.add_source("pool", self.pool.stats)
+        self.metrics.add_source("flights", self.flight_stats)
+        if self.disk is not None:
+            self.metrics.add_source("disk", self.disk.stats)
+        if self.prefetcher is not None:
+            self.metrics.add_source("prefetch", self.prefetcher.stats)
+
+    def __enter__(self) -> "RfcProxy":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stops the background threads once the queued disk writes are done, the queued
+        prefetches are dropped and the ones in progress are not waited for."""
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown(wait=False)
+        if self.background is not None:
+            self.background.shutdown()
+
+    @staticmethod
+    def cache_key(address: tuple[str, int], uri: bytes) -> bytes:
+        """Builds the cache key of a URI requested to a provider.
+
+        Args:
+            address (tuple[str, int]): The host and port of the provider.
+            uri (bytes): The request target.
+
+        Returns:
+            bytes: The key, the provider followed by the normalized URI.
+        """
+        return f"{address[0]}:{address[1]}".encode() + http_cache.normalize_uri(uri)
+
+    def breaker(self, address: tuple[str, int]) -> circuit_breaker.CircuitBreaker:
+        """Returns the circuit breaker of a provider, creating it the first time.
+
+        Args:
+            address (tuple[str, int]): The host and port of the provider.
+
+        Returns:
+            circuit_breaker.CircuitBreaker: The breaker.
+        """
+        with self.lock:
+            if address not in self.breakers:
+                self.breakers[address] = circuit_breaker.CircuitBreaker(
+                    f"{address[0]}:{address[1]}", self.failure_threshold, self.reset_timeout
+                )
+            return self.breakers[address]
+
+    def serve(
+        self,
+        client_socket: socket.socket,
+        address: tuple[str, int],
+        uri: bytes,
+        keep_alive: bool = False,
+        preferences: Optional[http_cache.Preferences] = None,
+    ) -> int:
+        """Answers a GET for the URI on the client socket.
+        Fresh cached responses (including recent 404s) are sent straight from memory,
+        or from disk with sendfile when they are only in the disk cache (identity and
+        whole, whatever the client prefers); stale ones are revalidated with the provider
+        and misses are relayed while they are stored.
+        If the provider fails or its circuit is open, a stale copy is sent if there is one,
+        otherwise the client gets an immediate 502 or 503.
+        Concurrent requests for the same URI share one request to the provider: the first one
+        leads it and the others receive the same outcome and body as it arrives.
+        Cached documents are sent gzip or deflate encoded to clients that accept it, once the
+        variant has been compressed; until then, and on misses, the identity body is sent.
+        Byte ranges are cut from cached documents; on a miss the Range is forwarded to the
+        provider and the partial answer is relayed without sharing or storing it.
+        With keep_alive every response is framed, so the client can send more requests
+        unless an OSError is raised.
+
+        Args:
+            client_socket (socket.socket): The socket of the client, closed by the caller.
+            address (tuple[str, int]): The host and port of the provider.
+            uri (bytes): The request target.
+            keep_alive (bool): Whether the client connection will be reused.
+            preferences (Optional[http_cache.Preferences]): Content coding and byte ranges
+                asked by the client.
+
+        Returns:
+            int: The number of body bytes sent to the client.
+        """
+        started: float = time.perf_counter()
+        with self.metrics.active("requests"):
+            sent: int = self._serve(client_socket, address, uri, keep_alive, preferences)
+        self.metrics.relay.record(time.perf_counter() - started)
+        self.metrics.bytes.record(sent)
+        return sent
+
+    def _serve(
+        self,
+        client_socket: socket.socket,
+        address: tuple[str, int],
+        uri: bytes,
+        keep_alive: bool,
+        preferences: Optional[http_cache.Preferences],
+    ) -> int:
+        """Answers a GET, see serve."""
+        # pylint: disable=too-many-arguments
+        preferences = preferences or http_cache.Preferences()
+        key: bytes = self.cache_key(address, uri)
+        entry: Optional[http_cache.CachedResponse] = self.cache.get(key)
+
+        if entry is not None and entry.is_fresh():
+            self.cache.count(
+                "negative_hits" if entry.status in http_cache.NEGATIVE_STATUSES else "hits"
+            )
+            self._claim(key)
+            return self._send_entry(client_socket, key, entry, preferences)
+
+        if entry is None and self.disk is not None:
+            stored: Optional[disk_cache.DiskEntry] = self.disk.get(key)
+            if stored is not None and stored.is_fresh():
+                try:
+                    self._claim(key)
+                    return self.disk.send(client_socket, stored)
+                except FileNotFoundError:
+                    self.disk.discard(key)
+            elif stored is not None:
+                entry = self._load(key, stored)
+
+        flight: single_flight.Flight
+        leader: bool = True
+        if preferences.byte_range:
+            # a flight of its own that nobody can join, the answer is only for this client
+            flight = single_flight.Flight(0)
+        else:
+            flight, leader = self.flights.join(key)
+        if not leader:
+            self._claim(key)
+            return self._follow(client_socket, key, flight, keep_alive, preferences)
+        try:
+            return self._fetch(
+                client_socket, address, uri, key, entry, keep_alive, preferences, flight
+            )
+        finally:
+            self.flights.land(key, flight)
+
+    def _fetch(
+        self,
+        client_socket: socket.socket,
+        address: tuple[str, int],
+        uri: bytes,
+        key: bytes,
+        entry: Optional[http_cache.CachedResponse],
+        keep_alive: bool,
+        preferences: http_cache.Preferences,
+        flight: single_flight.Flight,
+    ) -> int:
+        """Asks the provider for a URI that is not fresh in the cache, leading its flight."""
+        # pylint: disable=too-many-arguments
+        breaker: circuit_breaker.CircuitBreaker = self.breaker(address)
+        try:
+            breaker.before_call()
+        except circuit_breaker.CircuitOpenError as ex:
+            logging.debug("%s: %s", str(key), ex)
+            return self._fail(
+                client_socket,
+                key,
+                entry,
+                503,
+                b"Service Unavailable",
+                breaker,
+                keep_alive,
+                preferences,
+                flight,
+            )
+
+        conditions: list[tuple[bytes, bytes]] = entry.validators() if entry else []
+        response: http_pool.PooledResponse
+        try:
+            response = self.pool.request(
+                address, b"GET", uri, conditions + preferences.upstream_headers()
+            )
+        except (OSError, http_pool.HTTPProtocolError) as ex:
+            logging.warning("provider %s failed: %s", address, ex)
+            breaker.record_failure()
+            return self._fail(
+                client_socket,
+                key,
+                entry,
+                502,
+                b"Bad Gateway",
+                breaker,
+                keep_alive,
+                preferences,
+                flight,
+            )
+
+        if response.status >= 500:
+            breaker.record_failure()
+            if entry is not None:
+                response.close()
+                return self._fail(
+                    client_socket,
+                    key,
+                    entry,
+                    502,
+                    b"Bad Gateway",
+                    breaker,
+                    keep_alive,
+                    preferences,
+                    flight,
+                )
+        else:
+            breaker.record_success()
+
+        if entry is not None and response.status == 304:
+            response.read()
+            self.cache.revalidate(key, entry, response.end_to_end_headers())
+            self.cache.count("revalidations")
+            logging.debug("%s revalidated", str(key))
+            self._store_later(key, entry)
+            flight.settle_entry(entry)
+            return self._send_entry(client_socket, key, entry, preferences)
+
+        self.cache.count("misses")
+        storable: bool = http_cache.is_storable(response.status, response.headers)
+        # only a full answer or a negative one supersedes the stored response, a partial
+        # or unexpected one says nothing about it and the stale copy is still worth keeping
+        supersedes: bool = (
+            200 <= response.status < 300 and response.status != 206
+        ) or response.status in http_cache.NEGATIVE_STATUSES
+        if entry is not None and supersedes and not storable:
+            self.cache.discard(key)
+        too_big: bool = (
+            response.content_length is not None
+            and response.content_length > self.cache.max_entry_bytes
+        )
+
+        try:
+            if (too_big or not storable) and flight.close():
+                # nobody else waits for it, relayed without copying it
+                return http_pool.relay_response(client_socket, response, keep_alive)
+
+            return self._relay_shared(
+                client_socket,
+                key,
+                response,
+                keep_alive,
+                flight,
+                preferences if storable and not too_big else None,
+                self.prefetcher.scanner(address, uri, response) if self.prefetcher else None,
+            )
+        except http_pool.HTTPProtocolError as ex:
+            # the client got part of a response, the connection can not be reused
+            raise ConnectionAbortedError(f"provider {address} sent a malformed body") from ex
+
+    def _send_entry(
+        self,
+        client_socket: socket.socket,
+        key: bytes,
+        entry: http_cache.CachedResponse,
+        preferences: http_cache.Preferences,
+    ) -> int:
+        """Sends the best stored variant of a response, scheduling the compression of a
+        better one if the client accepts it."""
+        wire, length = entry.select(preferences)
+        if wire is not entry.wire:
+            self.cache.count("compressed_hits")
+        self._compress_later(key, entry, preferences)
+        client_socket.sendall(wire)
+        return length
+
+    def _compress_later(
+        self,
+        key: bytes,
+        entry: http_cache.CachedResponse,
+        preferences: http_cache.Preferences,
+    ) -> None:
+        """Queues the compression of the variant the client prefers if it is missing."""
+        if self.background is None:
+            return
+        encoding: Optional[bytes] = self.cache.claim_variant(entry, preferences.accept_encoding)
+        if encoding is not None and not self.background.submit(
+            self.cache.compress_variant, key, entry, encoding, block=False
+        ):
+            # the background threads are busy, another request will claim it again
+            entry.pending.discard(encoding)
+
+    def _store_later(self, key: bytes, entry: http_cache.CachedResponse) -> None:
+        """Queues the copy of a stored or revalidated response to the disk cache."""
+        if self.disk is None or entry.status != 200:
+            return
+        if self.background is None:
+            self.disk.put(key, entry)
+        elif not self.background.submit(self.disk.put, key, entry, block=False):
+            logging.debug("%s not written to disk, background threads busy", str(key))
+
+    def _load(
+        self, key: bytes, stored: disk_cache.DiskEntry
+    ) -> Optional[http_cache.CachedResponse]:
+        """Moves a stale response from disk to memory, so it is revalidated like the others."""
+        assert self.disk is not None
+        try:
+            body: bytes = self.disk.read(stored)
+        except FileNotFoundError:
+            self.disk.discard(key)
+            return None
+        entry: http_cache.CachedResponse = self.cache.create_entry(
+            stored.status, stored.reason, stored.headers, body
+        )
+        # still stale, as it was on disk
+        entry.stored_at = stored.stored_at
+        entry.freshness = stored.freshness
+        entry.must_revalidate = stored.must_revalidate
+        self.cache.put(key, entry)
+        return entry
+
+    def _fail(
+        self,
+        client_socket: socket.socket,
+        key: bytes,
+        entry: Optional[http_cache.CachedResponse],
+        status: int,
+        reason: bytes,
+        breaker: circuit_breaker.CircuitBreaker,
+        keep_alive: bool,
+        preferences: http_cache.Preferences,
+        flight: single_flight.Flight,
+    ) -> int:
+        """Answers without the provider: with the stale copy if there is one, or an error."""
+        # pylint: disable=too-many-arguments
+        if entry is not None:
+            logging.debug("serving stale copy")
+            flight.settle_entry(entry)
+            return self._send_entry(client_socket, key, entry, preferences)
+
+        flight.settle_error(status, reason, breaker.retry_after())
+        client_socket.sendall(error_response(status, reason, breaker.retry_after(), keep_alive))
+        return 0
+
+    @staticmethod
+    def _send(
+        client_socket: Optional[socket.socket], data: bytes, flight: single_flight.Flight
+    ) -> Optional[socket.socket]:
+        """Sends to the leading client, which may go away while others still want the body.
+
+        Returns:
+            Optional[socket.socket]: The socket, None once the client is gone.
+        """
+        if client_socket is None:
+            return None
+        try:
+            client_socket.sendall(data)
+        except OSError:
+            if not flight.followers:
+                raise
+            logging.debug("client gone, still fetching for %d followers", flight.followers)
+            return None
+        return client_socket
+
+    def _relay_shared(
+        self,
+        client_socket: Optional[socket.socket],
+        key: bytes,
+        response: http_pool.PooledResponse,
+        keep_alive: bool,
+        flight: single_flight.Flight,
+        preferences: Optional[http_cache.Preferences],
+        scanner: Optional[prefetch.ReferenceScanner] = None,
+    ) -> int:
+        """Relays a response to the client while publishing the body to the flight.
+        Unless preferences is None, a copy of the body is kept for the cache and the
+        variant the client prefers is compressed for the next requests.
+        The body is also fed to the scanner, if any, to prefetch the documents it references.
+        Without client_socket the body is only published and stored, e.g. when prefetching.
+        """
+        # pylint: disable=too-many-arguments
+        collector: Optional[http_cache.BodyCollector] = (
+            http_cache.BodyCollector(self.cache.max_entry_bytes)
+            if preferences is not None
+            else None
+        )
+        head, chunked = http_pool.client_head(response, keep_alive)
+        flight.settle_response(response)
+        client: Optional[socket.socket] = client_socket
+        relayed: int = 0
+
+        try:
+            client = self._send(client, head, flight)
+            for data in response.iter_body():
+                flight.publish(data)
+                if collector is not None:
+                    collector(data)
+                if scanner is not None:
+                    scanner(data)
+                client = self._send(client, http_pool.chunk(data) if chunked else data, flight)
+                relayed += len(data)
+            if chunked:
+                client = self._send(client, http_pool.chunk(b""), flight)
+        finally:
+            response.close()
+            flight.finish(response.finished)
+
+        body: Optional[bytes] = collector.body() if collector is not None else None
+        if body is not None and response.finished:
+            entry: http_cache.CachedResponse = self.cache.create_entry(
+                response.status, response.reason, response.end_to_end_headers(), body
+            )
+            if self.cache.put(key, entry) and preferences is not None:
+                self._compress_later(key, entry, preferences)
+                self._store_later(key, entry)
+        if scanner is not None and self.prefetcher is not None and response.finished:
+            self.prefetcher.schedule(scanner)
+
+        if client is None and client_socket is not None:
+            raise ConnectionAbortedError("client went away")
+        return relayed
+
+    def flight_stats(self) -> dict[str, float]:
+        """Returns the number of fetches led and of requests that joined another one.
+
+        Returns:
+            dict[str, float]: The counters and the flights in progress.
+        """
+        with self.flights.lock:
+            return {
+                "led": self.flights.led,
+                "coalesced": self.flights.coalesced,
+                "in_flight": len(self.flights.flights),
+            }
+
+    def _cached(self, key: bytes) -> bool:
+        """Whether a response is in the memory or the disk cache, fresh or not."""
+        return key in self.cache or (self.disk is not None and key in self.disk)
+
+    def _claim(self, key: bytes) -> None:
+        if self.prefetcher is not None:
+            self.prefetcher.claim(key)
+
+    def _prefetch(self, address: tuple[str, int], uri: bytes) -> tuple[bytes, int]:
+        """Fetches a URI nobody asked for yet into the cache, see prefetch.Prefetcher.
+        It leads a flight, so clients asking for the URI meanwhile wait for it instead of
+        fetching it again; it is skipped if the URI is cached, being fetched or if the
+        provider is not healthy.
+
+        Returns:
+            tuple[bytes, int]: The cache key and the number of body bytes fetched.
+        """
+        key: bytes = self.cache_key(address, uri)
+        breaker: circuit_breaker.CircuitBreaker = self.breaker(address)
+        if self._cached(key) or breaker.state != circuit_breaker.CLOSED:
+            return key, 0
+        flight: Optional[single_flight.Flight] = self.flights.lead(key)
+        if flight is None:
+            return key, 0
+
+        try:
+            try:
+                response: http_pool.PooledResponse = self.pool.request(address, b"GET", uri, [])
+            except (OSError, http_pool.HTTPProtocolError) as ex:
+                logging.debug("prefetch of %s failed: %s", str(key), ex)
+                breaker.record_failure()
+                flight.settle_error(502, b"Bad Gateway", 0)
+                return key, 0
+            if response.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            storable: bool = (
+                http_cache.is_storable(response.status, response.headers)
+                and response.status == 200
+            )
+            try:
+                fetched: int = self._relay_shared(
+                    None,
+                    key,
+                    response,
+                    False,
+                    flight,
+                    http_cache.Preferences() if storable else None,
+                )
+            except (OSError, http_pool.HTTPProtocolError) as ex:
+                logging.debug("prefetch of %s failed: %s", str(key), ex)
+                return key, 0
+            # too big for the cache, or cut short
+            return key, fetched if key in self.cache else 0
+        finally:
+            self.flights.land(key, flight)
+
+    def _follow(
+        self,
+        client_socket: socket.socket,
+        key: bytes,
+        flight: single_flight.Flight,
+        keep_alive: bool,
+        preferences: http_cache.Preferences,
+    ) -> int:
+        """Answers a client with the outcome of a flight led by another one."""
+        try:
+            flight.wait()
+            if flight.entry is not None:
+                return self._send_entry(client_socket, key, flight.entry, preferences)
+
+            if flight.response is None:
+                # the leader failed before the provider answered
+                status, reason, retry_after = flight.error or (502, b"Bad Gateway", 0)
+                client_socket.sendall(error_response(status, reason, retry_after, keep_alive))
+                return 0
+
+            head, chunked = http_pool.client_head(flight.response, keep_alive)
+            client_socket.sendall(head)
+            relayed: int = 0
+            for data in flight.iter_body():
+                client_socket.sendall(http_pool.chunk(data) if chunked else data)
+                relayed += len(data)
+            if chunked:
+                client_socket.sendall(http_pool.chunk(b""))
+            return relayed
+        finally:
+            # the pieces this follower still needed can be dropped
+            flight.leave()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Coalescing of concurrent fetches of the same URI into one request to the provider."""
+
+import threading
+from typing import Iterator, Optional
+
+import http_pool
+import http_cache
+
+
+class Flight:
+    """The outcome of one fetch, shared by every client that asked for the same URI meanwhile.
+
+    The leader makes the request and settles the flight with one of:
+    a complete cached response (fresh, stale or revalidated), an error, or the head of a
+    response whose body is then published piece by piece. Followers wait for the outcome and
+    read the published pieces with their own cursor, so a slow follower never delays a fast
+    one nor the leader. Once the flight accepts no more followers, only the pieces the
+    slowest current follower has not sent yet are kept, so a large body is never buffered
+    whole.
+
+    Args:
+        max_bytes (int): Body size after which no more followers can join.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self.condition: threading.Condition = threading.Condition()
+
+        self.settled: bool = False
+        self.entry: Optional[http_cache.CachedResponse] = None
+        self.error: Optional[tuple[int, bytes, int]] = None
+        self.response: Optional[http_pool.PooledResponse] = None
+
+        self.pieces: list[bytes] = []
+        # number of pieces dropped from the start of pieces
+        self.first: int = 0
+        self.size: int = 0
+        self.done: bool = False
+        self.complete: bool = False
+        self.followers: int = 0
+        # followers that have not left yet
+        self.readers: int = 0
+        # next piece of each follower reading the body
+        self.cursors: dict[object, int] = {}
+        self.open: bool = True
+
+    def join(self) -> bool:
+        """Adds a follower if the flight still accepts them.
+
+        Returns:
+            bool: True if the caller is now a follower.
+        """
+        with self.condition:
+            if not self.open or self.done:
+                return False
+            self.followers += 1
+            self.readers += 1
+            return True
+
+    def leave(self) -> None:
+        """Removes a follower once it is done with the flight, whatever the outcome."""
+        with self.condition:
+            self.readers -= 1
+            self._trim()
+
+    def close(self) -> bool:
+        """Stops accepting followers, so the leader can relay the body without publishing it.
+
+        Returns:
+            bool: False if there are followers already, the body must be published.
+        """
+        with self.condition:
+            if self.followers:
+                return False
+            self.open = False
+            return True
+
+    def settle_entry(self, entry: http_cache.CachedResponse) -> None:
+        """Settles the flight with a complete response."""
+        with self.condition:
+            self.entry = entry
+            self._settle()
+
+    def settle_error(self, status: int, reason: bytes, retry_after: int) -> None:
+        """Settles the flight with an error, see rfc_proxy.error_response."""
+        with self.condition:
+            self.error = (status, reason, retry_after)
+            self._settle()
+
+    def settle_response(self, response: http_pool.PooledResponse) -> None:
+        """Settles the flight with the head of a response, the body comes with publish."""
+        with self.condition:
+            self.response = response
+            self.settled = True
+            self.condition.notify_all()
+
+    def _settle(self) -> None:
+        self.settled = True
+        self.done = True
+        self.complete = True
+        self.condition.notify_all()
+
+    def publish(self, data: bytes) -> None:
+        """Adds a piece of the body and wakes up the followers."""
+        with self.condition:
+            self.pieces.append(data)
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self.open = False
+            self._trim()
+            self.condition.notify_all()
+
+    def _trim(self) -> None:
+        """Drops the pieces every follower has sent, once no more followers can join.
+        A follower that joined and has not started reading needs them all."""
+        if (self.open and not self.done) or self.readers > len(self.cursors):
+            return
+        keep: int = min(self.cursors.values(), default=self.first + len(self.pieces))
+        if keep > self.first:
+            del self.pieces[: keep - self.first]
+            self.first = keep
+
+    def finish(self, complete: bool) -> None:
+        """Ends the flight, must be called by the leader even if the fetch failed.
+
+        Args:
+            complete (bool): Whether the whole body was published.
+        """
+        with self.condition:
+            if self.done:
+                return
+            self.settled = True
+            self.done = True
+            self.complete = complete
+            self._trim()
+            self.condition.notify_all()
+
+    def wait(self) -> None:
+        """Waits until the leader settles the flight."""
+        with self.condition:
+            while not self.settled:
+                self.condition.wait()
+
+    def iter_body(self) -> Iterator[bytes]:
+        """Yields the published body from the beginning, waiting for the pieces still to come.
+
+        Yields:
+            bytes: Pieces of the body.
+
+        Raises:
+            ConnectionAbortedError: If the leader could not fetch the whole body, or the
+                caller did not join the flight and its start was already dropped.
+        """
+        cursor: object = object()
+        index: int = 0
+        try:
+            while True:
+                with self.condition:
+                    # the pieces before index are sent
+                    self.cursors[cursor] = index
+                    self._trim()
+                    while index == self.first + len(self.pieces) and not self.done:
+                        self.condition.wait()
+                    if index < self.first:
+                        raise ConnectionAbortedError("the start of the shared body was dropped")
+                    pieces: list[bytes] = self.pieces[index - self.first :]
+                    if not pieces:
+                        if not self.complete:
+                            raise ConnectionAbortedError("the shared fetch failed")
+                        return
+                index += len(pieces)
+                yield from pieces
+        finally:
+            with self.condition:
+                del self.cursors[cursor]
+                self._trim()
+
+
+class FlightTable:
+    """The flights in progress, by cache key.
+
+    Args:
+        max_bytes (int): Body size after which a flight accepts no more followers,
+            they would need the whole body kept in memory.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self.flights: dict[bytes, Flight] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.led: int = 0
+        self.coalesced: int = 0
+
+    def join(self, key: bytes) -> tuple[Flight, bool]:
+        """Joins the flight of a key, or starts one if there is none that can be joined.
+
+        Args:
+            key (bytes): The cache key.
+
+        Returns:
+            tuple[Flight, bool]: The flight and whether the caller is its leader.
+        """
+        with self.lock:
+            flight: Optional[Flight] = self.flights.get(key)
+            if flight is not None and flight.join():
+                self.coalesced += 1
+                return flight, False
+
+            flight = self.flights[key] = Flight(self.max_bytes)
+            self.led += 1
+            return flight, True
+
+    def lead(self, key: bytes) -> Optional[Flight]:
+        """Starts a flight for a key unless there is one already, used by fetches that
+        nobody waits for and that must not delay or duplicate the others.
+
+        Args:
+            key (bytes): The cache key.
+
+        Returns:
+            Optional[Flight]: The new flight, None if the key is already being fetched.
+        """
+        with self.lock:
+            if key in self.flights:
+                return None
+            flight: Flight = Flight(self.max_bytes)
+            self.flights[key] = flight
+            self.led += 1
+            return flight
+
+    def land(self, key: bytes, flight: Flight) -> None:
+        """Removes a flight from the table, finishing it as failed if the leader did not.
+
+        Args:
+            key (bytes): The cache key.
+            flight (Flight): The flight led by the caller.
+        """
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.finish(False)
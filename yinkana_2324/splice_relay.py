@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Socket to socket relay of bodies that does not copy them through Python objects.
+
+On Linux the bytes go from the source socket into a pipe and from the pipe into the
+destination socket with os.splice, so they stay in the kernel. Elsewhere they are received
+into one reusable buffer per thread with recv_into. Either way the body is streamed as it
+arrives and never held whole in memory.
+"""
+
+import os
+import socket
+import select
+import threading
+from typing import Optional
+
+
+SPLICE_SIZE: int = 1024 * 1024
+BUFFER_SIZE: int = 256 * 1024
+
+HAS_SPLICE: bool = hasattr(os, "splice")
+# F_SETPIPE_SZ, not exported by the fcntl module before Python 3.10
+SET_PIPE_SIZE: int = 1031
+
+# pipes and buffers are reused by the thread that created them
+_local: threading.local = threading.local()
+
+
+def _pipe() -> tuple[int, int]:
+    """Returns the pipe of the current thread, creating it the first time."""
+    pipe: Optional[tuple[int, int]] = getattr(_local, "pipe", None)
+    if pipe is None:
+        pipe = os.pipe()
+        try:
+            import fcntl  # pylint: disable=import-outside-toplevel
+
+            fcntl.fcntl(pipe[1], SET_PIPE_SIZE, SPLICE_SIZE)
+        except OSError:
+            # above /proc/sys/fs/pipe-max-size, the default size still works
+            pass
+        _local.pipe = pipe
+    return pipe
+
+
+def _discard_pipe() -> None:
+    """Closes the pipe of the current thread, used when it may still hold data."""
+    pipe: Optional[tuple[int, int]] = getattr(_local, "pipe", None)
+    _local.pipe = None
+    if pipe is not None:
+        os.close(pipe[0])
+        os.close(pipe[1])
+
+
+def _buffer() -> memoryview:
+    """Returns the receive buffer of the current thread."""
+    view: Optional[memoryview] = getattr(_local, "buffer", None)
+    if view is None:
+        view = _local.buffer = memoryview(bytearray(BUFFER_SIZE))
+    return view
+
+
+def _wait(sock: socket.socket, writing: bool) -> None:
+    """Waits until a non-blocking socket is ready, honouring its timeout.
+
+    Raises:
+        TimeoutError: If the socket is not ready within its timeout.
+    """
+    timeout: Optional[float] = sock.gettimeout()
+    if writing:
+        _, ready, _ = select.select([], [sock], [], timeout)
+    else:
+        ready, _, _ = select.select([sock], [], [], timeout)
+    if not ready:
+        raise TimeoutError("timed out")
+
+
+def _splice(source: int, destination: int, count: int, sock: socket.socket, writing: bool) -> int:
+    """Calls os.splice, waiting on the socket end while it would block."""
+    while True:
+        try:
+            return os.splice(source, destination, count, flags=os.SPLICE_F_MOVE)
+        except BlockingIOError:
+            _wait(sock, writing)
+
+
+def relay(
+    source: socket.socket,
+    destination: socket.socket,
+    length: Optional[int] = None,
+) -> int:
+    """Moves bytes from the source socket to the destination socket.
+
+    Args:
+        source (socket.socket): The socket to read from, e.g. the provider.
+        destination (socket.socket): The socket to write to, e.g. the client.
+        length (Optional[int]): Bytes to move, None to move until the source is closed.
+
+    Returns:
+        int: The number of bytes relayed.
+
+    Raises:
+        ConnectionResetError: If the source is closed before length bytes were moved.
+    """
+    if length == 0:
+        return 0
+    if HAS_SPLICE:
+        return _relay_splice(source, destination, length)
+    return _relay_copy(source, destination, length)
+
+
+def _relay_splice(source: socket.socket, destination: socket.socket, length: Optional[int]) -> int:
+    read_end, write_end = _pipe()
+    relayed: int = 0
+
+    try:
+        while length is None or relayed < length:
+            wanted: int = SPLICE_SIZE if length is None else min(SPLICE_SIZE, length - relayed)
+            received: int = _splice(source.fileno(), write_end, wanted, source, False)
+            if not received:
+                break
+            # the pipe must be empty before the next read, otherwise it may hold stale data
+            sent: int = 0
+            while sent < received:
+                sent += _splice(read_end, destination.fileno(), received - sent, destination, True)
+            relayed += received
+    except BaseException:
+        _discard_pipe()
+        raise
+
+    if length is not None and relayed < length:
+        raise ConnectionResetError("body truncated by the provider")
+    return relayed
+
+
+def _relay_copy(source: socket.socket, destination: socket.socket, length: Optional[int]) -> int:
+    view: memoryview = _buffer()
+    relayed: int = 0
+
+    while length is None or relayed < length:
+        wanted: int = len(view) if length is None else min(len(view), length - relayed)
+        received: int = source.recv_into(view, wanted)
+        if not received:
+            break
+        destination.sendall(view[:received])
+        relayed += received
+
+    if length is not None and relayed < length:
+        raise ConnectionResetError("body truncated by the provider")
+    return relayed
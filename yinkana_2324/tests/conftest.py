@@ -0,0 +1,6 @@
+"""The modules are imported by their bare name, as the scripts next to them do."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
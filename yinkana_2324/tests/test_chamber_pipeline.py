@@ -0,0 +1,119 @@
+"""Chamber pipeline: checkpoints, resume, stale state files and opt-in retries."""
+
+import os
+import json
+import pathlib
+from typing import Any
+
+import pytest
+
+import chamber_pipeline
+
+
+class Flaky:
+    """A stage that fails a number of times before returning its output."""
+
+    def __init__(self, output: bytes, failures: int = 0) -> None:
+        self.output: bytes = output
+        self.failures: int = failures
+        self.calls: list[tuple[bytes, ...]] = []
+
+    def __call__(self, *arguments: bytes) -> bytes:
+        self.calls.append(arguments)
+        if len(self.calls) <= self.failures:
+            raise ConnectionError("chamber closed the connection")
+        return self.output
+
+
+def test_outputs_are_chained_and_the_state_removed(tmp_path: pathlib.Path) -> None:
+    first: Flaky = Flaky(b"identifier:abc\nnext")
+    second: Flaky = Flaky(b"done")
+    pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", directory=str(tmp_path)
+    )
+    pipeline.add("first", first)
+    pipeline.add("second", second)
+
+    assert pipeline.run() == b"done"
+    assert second.calls == [(b"identifier:abc\nnext",)]
+    assert not os.path.exists(pipeline.path)
+
+
+def test_resume_skips_checkpointed_stages(tmp_path: pathlib.Path) -> None:
+    first: Flaky = Flaky(b"identifier:abc")
+    second: Flaky = Flaky(b"second", failures=1)
+    pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", directory=str(tmp_path)
+    )
+    pipeline.add("first", first)
+    pipeline.add("second", second)
+    with pytest.raises(ConnectionError):
+        pipeline.run()
+
+    with open(pipeline.path, "rb") as state_file:
+        state: dict[str, Any] = json.load(state_file)
+    assert state["stages"]["first"]["identifier"] == "abc"
+    assert "second" not in state["stages"]
+
+    resumed: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", resume=True, directory=str(tmp_path)
+    )
+    resumed.add("first", first)
+    resumed.add("second", second)
+    assert resumed.run() == b"second"
+    assert len(first.calls) == 1
+    assert second.calls[-1] == (b"identifier:abc",)
+
+
+@pytest.mark.parametrize(
+    "resume,max_age", [(False, chamber_pipeline.STATE_MAX_AGE), (True, -1.0)]
+)
+def test_starts_over_without_resume_or_from_a_stale_state(
+    tmp_path: pathlib.Path, resume: bool, max_age: float
+) -> None:
+    pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", directory=str(tmp_path)
+    )
+    pipeline.save({"first": {"output": "old", "identifier": None}})
+
+    first: Flaky = Flaky(b"new")
+    restarted: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", resume=resume, directory=str(tmp_path), max_age=max_age
+    )
+    restarted.add("first", first)
+    assert restarted.run() == b"new"
+    assert len(first.calls) == 1
+
+
+def test_stages_are_not_retried_by_default(tmp_path: pathlib.Path) -> None:
+    chamber: Flaky = Flaky(b"done", failures=1)
+    pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", directory=str(tmp_path)
+    )
+    pipeline.add("chamber", chamber)
+    with pytest.raises(ConnectionError):
+        pipeline.run()
+    assert len(chamber.calls) == 1
+    assert pipeline.timings["chamber"][1] == 1
+
+
+def test_stages_that_opt_in_are_retried(tmp_path: pathlib.Path) -> None:
+    handshake: Flaky = Flaky(b"prompt", failures=2)
+    pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", directory=str(tmp_path)
+    )
+    pipeline.add("handshake", handshake, retries=2, backoff=0.0)
+    assert pipeline.run() == b"prompt"
+    assert len(handshake.calls) == 3
+    assert pipeline.timings["handshake"][1] == 3
+
+
+def test_inputs_must_be_earlier_stages(tmp_path: pathlib.Path) -> None:
+    pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+        "test", directory=str(tmp_path)
+    )
+    pipeline.add("first", Flaky(b"first"))
+    with pytest.raises(ValueError):
+        pipeline.add("first", Flaky(b"again"))
+    with pytest.raises(ValueError):
+        pipeline.add("second", Flaky(b"second"), inputs=["later"])
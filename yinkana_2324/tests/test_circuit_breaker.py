@@ -0,0 +1,70 @@
+"""Circuit breaker: opening after failures, rejecting, half-open trials and closing."""
+
+import pytest
+
+import circuit_breaker
+
+
+def fail(breaker: circuit_breaker.CircuitBreaker, times: int) -> None:
+    """Records failed calls."""
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures() -> None:
+    breaker: circuit_breaker.CircuitBreaker = circuit_breaker.CircuitBreaker(
+        "test", failure_threshold=3, reset_timeout=60.0
+    )
+    fail(breaker, 2)
+    assert breaker.state == circuit_breaker.CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == circuit_breaker.OPEN
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+    assert 59 <= breaker.retry_after() <= 60
+
+
+def test_success_resets_the_failures() -> None:
+    breaker: circuit_breaker.CircuitBreaker = circuit_breaker.CircuitBreaker(
+        "test", failure_threshold=3
+    )
+    fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.retry_after() == 0
+
+
+def test_half_open_lets_trials_through() -> None:
+    breaker: circuit_breaker.CircuitBreaker = circuit_breaker.CircuitBreaker(
+        "test", failure_threshold=1, reset_timeout=0.0, half_open_calls=1
+    )
+    fail(breaker, 1)
+    assert breaker.state == circuit_breaker.OPEN
+
+    # the timeout has passed, one trial goes through and the next waits for its result
+    breaker.before_call()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_opens_again() -> None:
+    breaker: circuit_breaker.CircuitBreaker = circuit_breaker.CircuitBreaker(
+        "test", failure_threshold=5, reset_timeout=0.0
+    )
+    fail(breaker, 5)
+    breaker.before_call()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+
+    # a single failure while half-open is enough
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.OPEN
@@ -0,0 +1,77 @@
+"""The on-disk index of the responses and their bodies."""
+
+import os
+import pathlib
+from typing import Optional
+
+import http_cache
+import disk_cache
+
+
+def entry(body: bytes, etag: bytes = b'"v1"') -> http_cache.CachedResponse:
+    return http_cache.CachedResponse(
+        200, b"OK", [(b"ETag", etag), (b"Cache-Control", b"max-age=60")], body, 60.0
+    )
+
+
+def test_index_survives_a_restart(tmp_path: pathlib.Path) -> None:
+    cache: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    assert cache.put(b"/rfc1", entry(b"first document"))
+    assert not cache.put(b"/missing", http_cache.CachedResponse(404, b"Not Found", [], b"", 5))
+
+    reopened: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    stored: Optional[disk_cache.DiskEntry] = reopened.get(b"/rfc1")
+    assert stored is not None and stored.is_fresh()
+    assert (stored.status, stored.size) == (200, len(b"first document"))
+    assert (b"ETag", b'"v1"') in stored.headers
+    assert reopened.read(stored) == b"first document"
+    assert stored.head().endswith(b"Content-Length: 14\r\n\r\n")
+    assert b"/missing" not in reopened
+
+
+def test_bodies_are_shared(tmp_path: pathlib.Path) -> None:
+    cache: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    cache.put(b"/rfc1", entry(b"same body"))
+    cache.put(b"/rfc1.txt", entry(b"same body"))
+    stored: Optional[disk_cache.DiskEntry] = cache.get(b"/rfc1")
+    assert stored is not None
+    assert cache.stats()["bytes"] == len(b"same body")
+
+    cache.discard(b"/rfc1")
+    assert os.path.exists(cache.path(stored.digest))
+    cache.discard(b"/rfc1.txt")
+    assert not os.path.exists(cache.path(stored.digest))
+    assert cache.stats()["entries"] == 0
+
+
+def test_record_cut_by_a_crash(tmp_path: pathlib.Path) -> None:
+    cache: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    cache.put(b"/rfc1", entry(b"kept"))
+    with open(cache.index_path, "ab") as index:
+        index.write(b'{"key": "/rfc2", "hash": "ab')
+
+    reopened: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    assert b"/rfc1" in reopened
+    assert b"/rfc2" not in reopened
+
+
+def test_least_recently_used_is_evicted(tmp_path: pathlib.Path) -> None:
+    cache: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path), max_bytes=20)
+    cache.put(b"/a", entry(b"a" * 8))
+    cache.put(b"/b", entry(b"b" * 8))
+    assert cache.get(b"/a") is not None
+    cache.put(b"/c", entry(b"c" * 8))
+
+    assert b"/a" in cache and b"/c" in cache
+    assert b"/b" not in cache
+    reopened: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path), max_bytes=20)
+    assert b"/b" not in reopened and b"/c" in reopened
+
+
+def test_processes_share_the_directory(tmp_path: pathlib.Path) -> None:
+    first: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    second: disk_cache.DiskCache = disk_cache.DiskCache(str(tmp_path))
+    assert b"/rfc1" not in second
+
+    first.put(b"/rfc1", entry(b"written by the first"))
+    assert second.get(b"/rfc1") is not None
@@ -0,0 +1,91 @@
+"""Resolution cache and connections opened ahead of time for the chambers."""
+
+import socket
+import threading
+from typing import Iterator
+
+import pytest
+
+import endpoints
+
+
+@pytest.fixture(name="server")
+def fixture_server() -> Iterator[socket.socket]:
+    with socket.create_server(("127.0.0.1", 0)) as listening:
+        yield listening
+
+
+def test_resolution_is_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    lookups: list[str] = []
+    getaddrinfo = socket.getaddrinfo
+
+    def counting(host: str, *args: object, **kwargs: object) -> list[tuple[object, ...]]:
+        lookups.append(host)
+        return getaddrinfo(host, *args, **kwargs)  # type: ignore
+
+    monkeypatch.setattr(socket, "getaddrinfo", counting)
+    manager: endpoints.EndpointManager = endpoints.EndpointManager()
+    assert manager.resolve("localhost") == manager.resolve("localhost")
+    assert lookups == ["localhost"]
+
+    # once expired, the host is resolved again
+    manager = endpoints.EndpointManager(ttl=0.0)
+    manager.resolve("localhost")
+    manager.resolve("localhost")
+    assert len(lookups) == 3
+
+
+def test_prepared_connection_is_reused(server: socket.socket) -> None:
+    with endpoints.EndpointManager() as manager:
+        address: tuple[str, int] = manager.prepare(server.getsockname(), label="chamber")
+        with manager.connect(address) as client:
+            accepted, _ = server.accept()
+            with accepted:
+                client.sendall(b"ping")
+                assert accepted.recv(4) == b"ping"
+        assert manager.endpoints["chamber"].preconnected
+        assert "chamber 127.0.0.1" in manager.report()
+
+
+def test_confirmed_address_drops_speculative_ones(server: socket.socket) -> None:
+    with socket.create_server(("127.0.0.1", 0)) as guessed:
+        with endpoints.EndpointManager() as manager:
+            manager.prepare(guessed.getsockname(), speculative=True)
+            accepted, _ = guessed.accept()
+            with accepted:
+                address: tuple[str, int] = manager.prepare(server.getsockname())
+                assert guessed.getsockname() not in manager.pending
+                # the wrong guess is closed in the background
+                accepted.settimeout(10)
+                assert accepted.recv(1) == b""
+                manager.connect(address).close()
+
+
+def test_connection_closed_by_the_server_is_replaced(server: socket.socket) -> None:
+    with endpoints.EndpointManager() as manager:
+        address: tuple[str, int] = manager.prepare(server.getsockname(), label="chamber")
+        manager.pending[address][0].wait(10)
+        accepted, _ = server.accept()
+        accepted.close()
+
+        connected: threading.Event = threading.Event()
+
+        def accept() -> None:
+            server.accept()[0].close()
+            connected.set()
+
+        threading.Thread(target=accept, daemon=True).start()
+        with manager.connect(address):
+            assert connected.wait(10)
+        assert not manager.endpoints["chamber"].preconnected
+
+
+def test_is_open(server: socket.socket) -> None:
+    with socket.create_connection(server.getsockname()) as client:
+        accepted, _ = server.accept()
+        assert endpoints.is_open(client)
+        accepted.sendall(b"data")
+        assert endpoints.is_open(client)
+        assert client.recv(4) == b"data"
+        accepted.close()
+        assert not endpoints.is_open(client)
@@ -0,0 +1,195 @@
+"""Cached responses: byte ranges, compressed variants and revalidation."""
+
+import gzip
+import zlib
+from typing import Optional
+
+import pytest
+
+import http_cache
+
+
+BODY: bytes = bytes(range(100))
+LAST_MODIFIED: bytes = b"Sun, 06 Nov 1994 08:49:37 GMT"
+
+
+@pytest.mark.parametrize(
+    "value, ranges",
+    [
+        (b"bytes=0-9", [(0, 9)]),
+        (b"bytes=90-", [(90, 99)]),
+        (b"bytes=-10", [(90, 99)]),
+        (b"bytes=-500", [(0, 99)]),
+        (b"bytes=95-200", [(95, 99)]),
+        (b"Bytes = 0-0, 5-5", [(0, 0), (5, 5)]),
+        (b"bytes=100-", []),
+        (b"bytes=10-5", None),
+        (b"bytes=a-5", None),
+        (b"bytes=5", None),
+        (b"items=0-5", None),
+        (b"bytes=" + b",".join(b"%d-%d" % (n, n) for n in range(17)), None),
+    ],
+)
+def test_parse_range(value: bytes, ranges: Optional[list[tuple[int, int]]]) -> None:
+    assert http_cache.parse_range(value, len(BODY)) == ranges
+
+
+def stored() -> http_cache.CachedResponse:
+    return http_cache.CachedResponse(
+        200,
+        b"OK",
+        [(b"ETag", b'"v1"'), (b"Last-Modified", LAST_MODIFIED), (b"Content-Type", b"text/x")],
+        BODY,
+        60.0,
+    )
+
+
+def split(wire: bytes) -> tuple[bytes, bytes]:
+    head, _, body = wire.partition(b"\r\n\r\n")
+    return head, body
+
+
+def test_single_range() -> None:
+    wire, length = stored().select(http_cache.Preferences(byte_range=b"bytes=10-19"))
+    head, body = split(wire)
+
+    assert head.startswith(b"HTTP/1.1 206 Partial Content")
+    assert b"Content-Range: bytes 10-19/100" in head
+    assert body == BODY[10:20] and length == 10
+
+
+def test_multiple_ranges() -> None:
+    wire, length = stored().select(http_cache.Preferences(byte_range=b"bytes=0-1,-2"))
+    head, body = split(wire)
+
+    assert b"Content-Type: multipart/byteranges; boundary=" in head
+    assert b"Content-Range: bytes 0-1/100\r\n\r\n" + BODY[:2] in body
+    assert b"Content-Range: bytes 98-99/100\r\n\r\n" + BODY[98:] in body
+    assert length == len(body)
+
+
+def test_unsatisfiable_range() -> None:
+    wire, length = stored().select(http_cache.Preferences(byte_range=b"bytes=200-"))
+
+    assert wire.startswith(b"HTTP/1.1 416 Range Not Satisfiable")
+    assert b"Content-Range: bytes */100" in wire and length == 0
+
+
+@pytest.mark.parametrize(
+    "if_range, partial",
+    [
+        (b'"v1"', True),
+        (b'"v2"', False),
+        (b'W/"v1"', False),
+        (LAST_MODIFIED, True),
+        (b"Mon, 07 Nov 1994 08:49:37 GMT", False),
+        (b"not a date", False),
+    ],
+)
+def test_if_range(if_range: bytes, partial: bool) -> None:
+    preferences: http_cache.Preferences = http_cache.Preferences(
+        byte_range=b"bytes=0-9", if_range=if_range
+    )
+    wire, length = stored().select(preferences)
+
+    # the whole document when the condition fails
+    assert wire.startswith(b"HTTP/1.1 206") == partial
+    assert length == (10 if partial else len(BODY))
+
+
+def test_ignored_range_sends_everything() -> None:
+    wire, length = stored().select(http_cache.Preferences(byte_range=b"lines=1-2"))
+
+    assert wire.startswith(b"HTTP/1.1 200 OK") and length == len(BODY)
+
+
+def test_upstream_headers() -> None:
+    assert http_cache.Preferences(if_range=b'"v1"').upstream_headers() == []
+    preferences: http_cache.Preferences = http_cache.Preferences(b"", b"bytes=0-1", b'"v1"')
+    assert preferences.upstream_headers() == [(b"Range", b"bytes=0-1"), (b"If-Range", b'"v1"')]
+
+
+def test_revalidation_accounts_the_new_size() -> None:
+    entry: http_cache.CachedResponse = stored()
+    cache: http_cache.ResponseCache = http_cache.ResponseCache(entry.size + 16, entry.size + 16)
+    assert cache.put(b"/a", entry)
+
+    cache.revalidate(b"/a", entry, [(b"ETag", b'"v2"'), (b"Content-Type", b"text/ignored")])
+    assert entry.header(b"etag") == b'"v2"' and entry.header(b"content-type") == b"text/x"
+    assert cache.size == entry.size
+
+    # headers that do not fit in the budget any more evict the response
+    cache.revalidate(b"/a", entry, [(b"Expires", b"x" * 64)])
+    assert b"/a" not in cache and cache.size == 0
+
+
+TEXT: bytes = b"The quick brown fox jumps over the lazy dog. " * 100
+
+
+def text_entry() -> http_cache.CachedResponse:
+    return http_cache.CachedResponse(
+        200, b"OK", [(b"ETag", b'"t1"'), (b"Content-Type", b"text/plain")], TEXT, 60.0
+    )
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        (b"", None),
+        (b"gzip", b"gzip"),
+        (b"deflate, gzip;q=0.5", b"deflate"),
+        (b"br", None),
+        (b"*", b"gzip"),
+        (b"gzip;q=0, *;q=0.1", b"deflate"),
+        (b"GZIP;q=bad", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding: bytes, encoding: Optional[bytes]) -> None:
+    assert http_cache.negotiate_encoding(accept_encoding) == encoding
+
+
+def test_only_large_text_is_compressible() -> None:
+    assert text_entry().compressible
+    assert b"Accept-Encoding" in text_entry().header(b"vary")
+    assert not stored().compressible
+    assert not http_cache.CachedResponse(
+        200, b"OK", [(b"Content-Type", b"image/png")], TEXT, 60.0
+    ).compressible
+
+
+def test_variant_is_produced_once_and_served() -> None:
+    cache: http_cache.ResponseCache = http_cache.ResponseCache()
+    entry: http_cache.CachedResponse = text_entry()
+    assert cache.put(b"/t", entry)
+    size: int = cache.size
+
+    assert cache.claim_variant(entry, b"gzip") == b"gzip"
+    # already claimed by another request
+    assert cache.claim_variant(entry, b"gzip") is None
+    cache.compress_variant(b"/t", entry, b"gzip")
+    assert cache.claim_variant(entry, b"gzip") is None
+    assert cache.size == entry.size > size
+
+    wire, length = entry.select(http_cache.Preferences(b"gzip"))
+    head, body = split(wire)
+    assert b"Content-Encoding: gzip" in head and b'ETag: "t1-gzip"' in head
+    assert len(body) == length and gzip.decompress(body) == TEXT
+    # clients that do not accept it still get the identity body
+    wire, length = entry.select(http_cache.Preferences())
+    assert split(wire)[1] == TEXT and length == len(TEXT)
+
+
+def test_deflate_is_the_zlib_format() -> None:
+    entry: http_cache.CachedResponse = text_entry()
+    entry.add_variant(b"deflate", http_cache.compress(TEXT, b"deflate"))
+    wire, _ = entry.select(http_cache.Preferences(b"deflate"))
+    assert zlib.decompress(split(wire)[1]) == TEXT
+
+
+def test_variant_not_smaller_is_not_served() -> None:
+    entry: http_cache.CachedResponse = text_entry()
+    entry.add_variant(b"gzip", None)
+    wire, _ = entry.select(http_cache.Preferences(b"gzip"))
+    assert split(wire)[1] == TEXT
+    # and it is not produced again
+    assert http_cache.ResponseCache().claim_variant(entry, b"gzip") is None
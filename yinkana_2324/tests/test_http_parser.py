@@ -0,0 +1,79 @@
+"""The request parser state machine, fed whole or one byte at a time."""
+
+import pytest
+
+import http_parser
+
+
+PIPELINED: bytes = (
+    b"GET /rfc1.txt HTTP/1.1\r\nHost: proxy\r\n\r\n"
+    b"POST /submit HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+    b"\r\nPUT /chunked HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+    b"3;ext=1\r\nabc\r\n2\r\nde\r\n0\r\nX-Trailer: 1\r\n\r\n"
+)
+
+
+def feed_bytes(parser: http_parser.RequestParser, data: bytes) -> list[http_parser.Request]:
+    requests: list[http_parser.Request] = []
+    for index in range(len(data)):
+        requests.extend(parser.feed(data[index : index + 1]))
+    return requests
+
+
+@pytest.mark.parametrize("one_by_one", [False, True])
+def test_pipelined_requests(one_by_one: bool) -> None:
+    parser: http_parser.RequestParser = http_parser.RequestParser()
+    requests: list[http_parser.Request] = (
+        feed_bytes(parser, PIPELINED) if one_by_one else parser.feed(PIPELINED)
+    )
+
+    assert [(r.method, r.target, r.body) for r in requests] == [
+        (b"GET", b"/rfc1.txt", b""),
+        (b"POST", b"/submit", b"hello"),
+        (b"PUT", b"/chunked", b"abcde"),
+    ]
+    assert requests[0].header(b"HOST") == b"proxy"
+    assert all(request.keep_alive for request in requests)
+    assert parser.idle
+
+
+def test_partial_request_is_not_idle() -> None:
+    parser: http_parser.RequestParser = http_parser.RequestParser()
+
+    assert parser.feed(b"POST / HTTP/1.1\r\nContent-Length: 3\r\n\r\nab") == []
+    assert not parser.idle
+    assert [request.body for request in parser.feed(b"c")] == [b"abc"]
+
+
+def test_keep_alive() -> None:
+    parser: http_parser.RequestParser = http_parser.RequestParser()
+    requests: list[http_parser.Request] = parser.feed(
+        b"GET / HTTP/1.1\r\nConnection: keep-alive, close\r\n\r\nGET / HTTP/1.0\r\n\r\n"
+    )
+
+    assert [request.keep_alive for request in requests] == [False, False]
+
+
+@pytest.mark.parametrize(
+    "data, status",
+    [
+        (b"GET /\r\n\r\n", 400),
+        (b"GET / HTTP/1.1\r\nNo colon\r\n\r\n", 400),
+        (b"GET / HTTP/1.1\r\nName : value\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nxyz\r\n", 400),
+        # chunk data must be followed by CRLF
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabcX\r\n", 400),
+        (b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n", 413),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n65\r\n", 413),
+        (b"GET / HTTP/1.1\r\nX: " + b"a" * 200, 431),
+    ],
+)
+def test_bad_requests(data: bytes, status: int) -> None:
+    parser: http_parser.RequestParser = http_parser.RequestParser(
+        max_header_size=128, max_body_size=64
+    )
+
+    with pytest.raises(http_parser.RequestError) as error:
+        parser.feed(data)
+    assert error.value.status == status
@@ -0,0 +1,151 @@
+"""Framing of the responses read from the provider."""
+
+import socket
+from typing import Callable
+
+import pytest
+
+import http_pool
+
+
+ADDRESS: tuple[str, int] = ("provider", 80)
+
+
+class Pieces:
+    """Stands in for a socket, every recv returns the next piece."""
+
+    def __init__(self, pieces: list[bytes]) -> None:
+        self.pieces: list[bytes] = pieces
+
+    def recv(self, _: int) -> bytes:
+        return self.pieces.pop(0) if self.pieces else b""
+
+    def close(self) -> None:
+        self.pieces = []
+
+
+def response(
+    pieces: list[bytes], method: bytes = b"GET"
+) -> tuple[http_pool.PooledResponse, http_pool.ConnectionPool]:
+    pool: http_pool.ConnectionPool = http_pool.ConnectionPool()
+    connection: http_pool.BufferedConnection = http_pool.BufferedConnection(
+        Pieces(pieces), ADDRESS  # type: ignore[arg-type]
+    )
+    return http_pool.PooledResponse(pool, connection, method), pool
+
+
+def one_byte_each(data: bytes) -> list[bytes]:
+    return [data[index : index + 1] for index in range(len(data))]
+
+
+CHUNKED: bytes = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+
+
+@pytest.mark.parametrize("split", [lambda data: [data], one_byte_each])
+def test_chunked_body(split: Callable[[bytes], list[bytes]]) -> None:
+    body: bytes = b"5;name=value\r\nhello\r\n7\r\n, world\r\n0\r\nTrailer: yes\r\n\r\n"
+    pooled, pool = response(split(CHUNKED + body))
+
+    assert pooled.chunked and pooled.keep_alive
+    assert pooled.read() == b"hello, world"
+    assert pooled.finished
+    assert len(pool.idle[ADDRESS]) == 1
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        # a CRLF further on must not be taken for the end of the chunk
+        b"3\r\nabcX\r\n0\r\n\r\n",
+        b"3\r\nabc\n\r0\r\n\r\n",
+        b"3\r\nabcdef\r\n0\r\n\r\n",
+    ],
+)
+def test_chunk_data_must_end_with_crlf(body: bytes) -> None:
+    pooled, pool = response([CHUNKED + body])
+
+    with pytest.raises(http_pool.HTTPProtocolError):
+        pooled.read()
+    assert pooled.connection is None
+    assert not pool.idle
+
+
+def test_bad_chunk_size() -> None:
+    pooled, _ = response([CHUNKED + b"zz\r\nabc\r\n"])
+
+    with pytest.raises(http_pool.HTTPProtocolError):
+        pooled.read()
+
+
+def test_content_length_body() -> None:
+    pooled, pool = response(one_byte_each(b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nbody"))
+
+    assert pooled.content_length == 4
+    assert pooled.read() == b"body"
+    assert len(pool.idle[ADDRESS]) == 1
+
+
+def test_truncated_body() -> None:
+    pooled, pool = response([b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nshort"])
+
+    with pytest.raises(ConnectionResetError):
+        pooled.read()
+    assert not pool.idle
+
+
+def test_body_until_close_is_not_reused() -> None:
+    pooled, pool = response([b"HTTP/1.1 200 OK\r\n\r\nall", b" of it"])
+
+    assert not pooled.keep_alive
+    assert pooled.read() == b"all of it"
+    assert not pool.idle
+
+
+def test_head_has_no_body() -> None:
+    pooled, _ = response([b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\n"], b"HEAD")
+
+    assert pooled.content_length == 0
+    assert pooled.read() == b""
+
+
+@pytest.mark.parametrize("status_line", [b"HTTP/2 200 OK", b"HTTP/1.1 OK", b"garbage"])
+def test_bad_status_line(status_line: bytes) -> None:
+    with pytest.raises(http_pool.HTTPProtocolError):
+        http_pool.parse_head(status_line + b"\r\nServer: x")
+
+
+def test_parse_head() -> None:
+    status, reason, headers = http_pool.parse_head(
+        b"HTTP/1.1 404 Not Found\r\nServer:  stand-in \r\nX-Empty:"
+    )
+
+    assert (status, reason) == (404, b"Not Found")
+    assert headers == [(b"Server", b"stand-in"), (b"X-Empty", b"")]
+
+
+def test_chunk() -> None:
+    assert http_pool.chunk(b"0123456789abcdef!") == b"11\r\n0123456789abcdef!\r\n"
+    assert http_pool.chunk(b"") == b"0\r\n\r\n"
+
+
+def test_read_until_across_reads() -> None:
+    connection: http_pool.BufferedConnection = http_pool.BufferedConnection(
+        Pieces([b"line\r", b"\nrest"]), ADDRESS  # type: ignore[arg-type]
+    )
+
+    assert connection.read_until(b"\r\n", 100) == b"line\r\n"
+    assert connection.read_exactly(4) == b"rest"
+    with pytest.raises(ConnectionResetError):
+        connection.read_exactly(1)
+
+
+def test_socket_response() -> None:
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        theirs.sendall(CHUNKED + b"2\r\nok\r\n0\r\n\r\n")
+        pool: http_pool.ConnectionPool = http_pool.ConnectionPool()
+        pooled: http_pool.PooledResponse = http_pool.PooledResponse(
+            pool, http_pool.BufferedConnection(ours, ADDRESS), b"GET"
+        )
+        assert list(pooled.iter_body()) == [b"ok"]
+        assert pool.idle[ADDRESS][0].is_healthy()
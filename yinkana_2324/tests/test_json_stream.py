@@ -0,0 +1,51 @@
+"""Splitting a byte stream into the JSON values sent back to back."""
+
+import json
+
+import pytest
+
+import json_stream
+
+
+VALUES: list[object] = [
+    {"sentence": "braces { and } and [ ] in a string", "n": 1},
+    [1, 2, {"nested": ["deep"]}],
+    {"quote": 'escaped \\" quote and backslash \\\\', "unicode": "ñandú"},
+    {},
+]
+STREAM: bytes = b"\n".join(json.dumps(value, ensure_ascii=False).encode() for value in VALUES)
+
+
+def test_whole_stream() -> None:
+    assert json_stream.JsonStream().feed(STREAM) == VALUES
+
+
+@pytest.mark.parametrize("split", range(1, len(STREAM)))
+def test_split_anywhere(split: int) -> None:
+    stream: json_stream.JsonStream = json_stream.JsonStream()
+
+    assert stream.feed(STREAM[:split]) + stream.feed(STREAM[split:]) == VALUES
+    assert stream.pending == b""
+
+
+def test_one_byte_at_a_time() -> None:
+    stream: json_stream.JsonStream = json_stream.JsonStream()
+    values: list[object] = []
+    for index in range(len(STREAM)):
+        values.extend(stream.feed(STREAM[index : index + 1]))
+
+    assert values == VALUES
+
+
+def test_pending() -> None:
+    stream: json_stream.JsonStream = json_stream.JsonStream()
+
+    assert stream.feed(b'{"a": 1} {"b": ') == [{"a": 1}]
+    assert stream.pending == b'{"b": '
+    assert stream.feed(b"2}") == [{"b": 2}]
+
+
+@pytest.mark.parametrize("data", [b"}", b'{"a": 1}]', b'{"a": nope}'])
+def test_invalid(data: bytes) -> None:
+    with pytest.raises(json.JSONDecodeError):
+        json_stream.JsonStream().feed(data)
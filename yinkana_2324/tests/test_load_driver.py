@@ -0,0 +1,101 @@
+"""Sessions of load_driver against chamber_server and rfc_provider over loopback."""
+
+import asyncio
+import pathlib
+
+import pytest
+
+import load_driver
+import rfc_provider
+import chamber_server
+
+
+SESSIONS: int = 12
+
+
+def run_loopback(directory: str, sessions: int) -> tuple[load_driver.LoadDriver, dict[str, float]]:
+    """Runs the sessions against a fresh stand-in with a fixed seed.
+
+    Returns:
+        tuple[load_driver.LoadDriver, dict[str, float]]: The driver and the server counters.
+    """
+
+    async def run() -> tuple[load_driver.LoadDriver, dict[str, float]]:
+        corpus: rfc_provider.Corpus = rfc_provider.Corpus(directory, 20, 2048, 32768, seed=7)
+        provider: rfc_provider.ProviderStandIn = rfc_provider.ProviderStandIn(corpus)
+        provider_port: int = provider.serve(0)
+        server: chamber_server.ChamberServer = chamber_server.ChamberServer(
+            corpus, ("localhost", provider_port), seed=7
+        )
+        try:
+            await server.start(0, bind="127.0.0.1")
+            driver: load_driver.LoadDriver = load_driver.LoadDriver(
+                "127.0.0.1", server.ports["handshake"], ("localhost", provider_port), 4
+            )
+            await asyncio.wait_for(driver.run(sessions), 300)
+            return driver, server.stats()
+        finally:
+            server.close()
+            provider.shutdown()
+
+    return asyncio.run(run())
+
+
+def test_every_session_completes(tmp_path: pathlib.Path) -> None:
+    driver, stats = run_loopback(str(tmp_path), SESSIONS)
+
+    assert driver.completed == SESSIONS, driver.report()
+    assert driver.failed == 0 and not driver.errors
+    for name, chamber in driver.chambers.items():
+        assert chamber.successes == SESSIONS, name
+        assert chamber.failures == 0, name
+        assert chamber.success_rate() == 1.0
+        assert chamber.latency.count == SESSIONS
+        assert 0 < chamber.latency.minimum <= chamber.latency.maximum < driver.elapsed
+    assert driver.sessions_per_minute() == pytest.approx(SESSIONS * 60 / driver.elapsed)
+    assert f"{SESSIONS} completed, 0 failed" in driver.report()
+
+    assert stats["sessions"] == SESSIONS
+    assert stats["completed"] == SESSIONS
+    assert stats["active"] == 0
+    for name, value in stats.items():
+        if name.endswith("_passed"):
+            assert value == SESSIONS, name
+        elif name.endswith("_failed"):
+            assert value == 0, name
+
+
+def test_chamber_stats() -> None:
+    stats: load_driver.ChamberStats = load_driver.ChamberStats()
+    assert stats.success_rate() == 0.0
+
+    for millisecond in range(1, 1001):
+        stats.latency.record(millisecond / 1000)
+        stats.successes += 1
+    stats.failures = 1000
+    assert stats.success_rate() == 0.5
+
+    snapshot: dict[str, float] = stats.latency.snapshot()
+    assert snapshot["count"] == 1000
+    assert snapshot["mean"] == pytest.approx(0.5005)
+    assert snapshot["min"] == pytest.approx(0.001)
+    assert snapshot["max"] == pytest.approx(1.0)
+    assert snapshot["p50"] == pytest.approx(0.5, rel=0.05)
+    assert snapshot["p90"] == pytest.approx(0.9, rel=0.05)
+    assert snapshot["p99"] == pytest.approx(0.99, rel=0.05)
+    assert snapshot["p50"] <= snapshot["p90"] <= snapshot["p99"] <= snapshot["p99.9"] <= 1.0
+
+
+def test_record_counts_by_chamber() -> None:
+    driver: load_driver.LoadDriver = load_driver.LoadDriver()
+    driver.record("chamber_0", 0.25, True)
+    driver.record("chamber_0", 0.5, False)
+    driver.record("extra", 1.0, True)
+
+    assert driver.chambers["chamber_0"].successes == 1
+    assert driver.chambers["chamber_0"].failures == 1
+    # only the successful attempts have a latency
+    assert driver.chambers["chamber_0"].latency.count == 1
+    assert driver.chambers["extra"].success_rate() == 1.0
+    assert driver.sessions_per_minute() == 0.0
+    assert "chamber_1: not reached" in driver.report()
@@ -0,0 +1,111 @@
+"""Prefetch of referenced RFCs: scanning the references, budget, hits and waste."""
+
+import threading
+
+import pytest
+
+import http_pool
+import prefetch
+
+
+ADDRESS: tuple[str, int] = ("provider", 80)
+
+
+def scan(pieces: list[bytes], uri: bytes = b"/rfc/rfc9110.txt") -> prefetch.ReferenceScanner:
+    scanner: prefetch.ReferenceScanner = prefetch.ReferenceScanner(ADDRESS, uri)
+    for piece in pieces:
+        scanner(piece)
+    return scanner
+
+
+def test_most_referenced_first() -> None:
+    scanner: prefetch.ReferenceScanner = scan(
+        [b"see RFC 9111, rfc-9112 and RFC9111; RFC 9110 is this one"]
+    )
+    assert scanner.uris(4) == [b"/rfc/rfc9111.txt", b"/rfc/rfc9112.txt"]
+    assert scanner.uris(1) == [b"/rfc/rfc9111.txt"]
+
+
+@pytest.mark.parametrize("split", range(1, 12))
+def test_reference_split_between_pieces(split: int) -> None:
+    body: bytes = b"see RFC 7230 too"
+    scanner: prefetch.ReferenceScanner = scan([body[:split], body[split:]], b"/rfc/1")
+    assert scanner.uris(4) == [b"/rfc/7230"]
+
+
+@pytest.mark.parametrize(
+    "head,scanned",
+    [
+        (b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\n", True),
+        (b"HTTP/1.1 200 OK\r\n\r\n", True),
+        (b"HTTP/1.1 200 OK\r\nContent-Type: application/pdf\r\n\r\n", False),
+        (b"HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n\r\n", False),
+    ],
+)
+def test_only_text_documents_are_scanned(head: bytes, scanned: bool) -> None:
+    response: http_pool.PooledResponse = http_pool.PooledResponse.__new__(
+        http_pool.PooledResponse
+    )
+    response.parse(head, b"GET")
+    prefetcher: prefetch.Prefetcher = prefetch.Prefetcher(lambda *_: (b"", 0), bool)
+    assert (prefetcher.scanner(ADDRESS, b"/rfc/1", response) is not None) == scanned
+    prefetcher.shutdown()
+
+
+class Provider:
+    """Fetches documents of a fixed size into a set that stands in for the cache."""
+
+    def __init__(self, size: int) -> None:
+        self.size: int = size
+        self.cached: set[bytes] = set()
+        self.fetched: list[bytes] = []
+
+    def fetch(self, _: tuple[str, int], uri: bytes) -> tuple[bytes, int]:
+        self.fetched.append(uri)
+        self.cached.add(uri)
+        return uri, self.size
+
+
+def prefetched(prefetcher: prefetch.Prefetcher, scanner: prefetch.ReferenceScanner) -> None:
+    """Schedules the references and waits for them, the pool has a single worker."""
+    done: threading.Event = threading.Event()
+    prefetcher.schedule(scanner)
+    assert prefetcher.pool.submit(done.set)
+    assert done.wait(10)
+
+
+def test_hits_and_waste() -> None:
+    provider: Provider = Provider(100)
+    prefetcher: prefetch.Prefetcher = prefetch.Prefetcher(
+        provider.fetch, provider.cached.__contains__, workers=1
+    )
+    prefetched(prefetcher, scan([b"RFC 1 RFC 2 RFC 2"], b"/rfc/3"))
+    assert provider.fetched == [b"/rfc/2", b"/rfc/1"]
+
+    prefetcher.claim(b"/rfc/2")
+    # evicted before a client asked for it
+    provider.cached.discard(b"/rfc/1")
+    stats: dict[str, float] = prefetcher.stats()
+    prefetcher.shutdown()
+
+    assert stats["fetched"] == 2
+    assert stats["hits"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["unclaimed_bytes"] == 0
+    assert stats["wasted_bytes"] == 100
+
+
+def test_budget_of_unclaimed_bytes() -> None:
+    provider: Provider = Provider(100)
+    prefetcher: prefetch.Prefetcher = prefetch.Prefetcher(
+        provider.fetch, provider.cached.__contains__, workers=1, max_bytes=150
+    )
+    prefetched(prefetcher, scan([b"RFC 1 RFC 2 RFC 3"], b"/rfc/4"))
+    # the second document fills the budget, the third waits for the clients
+    assert len(provider.fetched) == 2
+    assert prefetcher.stats()["skipped"] == 1
+
+    prefetcher.claim(provider.fetched[0])
+    prefetched(prefetcher, scan([b"RFC 3"], b"/rfc/4"))
+    prefetcher.shutdown()
+    assert provider.fetched[-1] == b"/rfc/3"
@@ -0,0 +1,55 @@
+"""Identifier, addresses and parameters read from the chamber prompts."""
+
+import prompt_parser
+
+
+DEFAULT: tuple[str, int] = ("rick", 3000)
+
+
+def test_identifier_is_the_rest_of_its_line() -> None:
+    prompt: prompt_parser.Prompt = prompt_parser.parse_prompt(
+        b"Chamber 2\nYour identifier:abc123 def\nidentifier:other\n"
+    )
+    assert prompt.identifier == b"abc123 def"
+    assert prompt_parser.parse_prompt(b"no id here").identifier is None
+
+
+def target(text: bytes) -> tuple[str, int]:
+    return prompt_parser.parse_prompt(text).target(DEFAULT)
+
+
+def provider(text: bytes) -> tuple[str, int]:
+    return prompt_parser.parse_prompt(text).provider(("web", 81))
+
+
+def test_target_from_to_and_at() -> None:
+    assert target(b"identifier:x\nsend it to yinkana:3011") == ("yinkana", 3011)
+    assert target(b"identifier:x\nconnect at port 5501") == ("rick", 5501)
+    assert target(b"identifier:x\nconnect at web:81") == ("web", 81)
+    # the first destination wins
+    assert target(b"to web:81 then to rick:82") == ("web", 81)
+
+
+def test_mentioned_addresses_are_not_targets() -> None:
+    prompt: prompt_parser.Prompt = prompt_parser.parse_prompt(
+        b"identifier:x\nthe old server rick:4000 is gone, port 99999 too"
+    )
+    assert prompt.target(DEFAULT) == DEFAULT
+    assert prompt.addresses == [("rick", 4000)] and prompt.ports == []
+
+
+def test_provider_from_of_and_from() -> None:
+    assert provider(b"documents of web:8081") == ("web", 8081)
+    assert provider(b"fetch them from cdn:80 and send to rick:3000") == ("cdn", 80)
+    assert provider(b"send to rick:3000") == ("web", 81)
+
+
+def test_numbers_flags_and_quoted_text() -> None:
+    prompt: prompt_parser.Prompt = prompt_parser.parse_prompt(
+        b'identifier:x\nMaximum: 1200, delay=-5, port: 65001\nuse --fast and reply "done"'
+    )
+    assert prompt.number("maximum", 1000) == 1200
+    assert prompt.number("delay", 0) == -5
+    assert prompt.number("missing", 7) == 7
+    assert prompt.ports == [65001]
+    assert prompt.flags == ["fast"] and prompt.quoted == [b"done"]
@@ -0,0 +1,76 @@
+"""Log-linear histograms of the proxy and the endpoint that serves them."""
+
+import socket
+
+import pytest
+
+import proxy_metrics
+
+
+@pytest.mark.parametrize("value", [0, 1, 15, 16, 17, 100, 1023, 1024, 12345, 2**31 + 7])
+def test_value_is_within_its_bucket(value: int) -> None:
+    lowest, following = proxy_metrics.bucket_bounds(proxy_metrics.bucket_index(value))
+    assert lowest <= value < following
+    # the relative error stays below 1 / SUB_BUCKETS
+    assert following - lowest <= max(1, lowest / proxy_metrics.SUB_BUCKETS)
+
+
+def test_buckets_are_contiguous() -> None:
+    following: int = 0
+    for index in range(200):
+        lowest, following_next = proxy_metrics.bucket_bounds(index)
+        assert lowest == following
+        following = following_next
+
+
+def test_percentiles() -> None:
+    histogram: proxy_metrics.Histogram = proxy_metrics.Histogram(1e6, 60.0)
+    for millisecond in range(1, 1001):
+        histogram.record(millisecond / 1000)
+
+    snapshot: dict[str, float] = histogram.snapshot()
+    assert snapshot["count"] == 1000
+    assert snapshot["min"] == 0.001 and snapshot["max"] == 1.0
+    assert snapshot["mean"] == pytest.approx(0.5005)
+    for percent, expected in ((50.0, 0.5), (90.0, 0.9), (99.0, 0.99)):
+        assert histogram.percentile(percent) == pytest.approx(expected, rel=1 / 8)
+    assert histogram.percentile(100.0) == pytest.approx(1.0, rel=1 / 8)
+
+
+def test_empty_and_out_of_range_values() -> None:
+    histogram: proxy_metrics.Histogram = proxy_metrics.Histogram(1.0, 100.0)
+    assert histogram.snapshot()["p50"] == 0.0 and histogram.snapshot()["min"] == 0.0
+    histogram.record(-5)
+    histogram.record(10**9)
+    # negative values count as 0, the ones above highest go to the last bucket
+    assert histogram.percentile(1.0) == 0.0
+    lowest, following = proxy_metrics.bucket_bounds(len(histogram.counts) - 1)
+    assert lowest <= histogram.percentile(100.0) < following <= 2 * 100
+    assert histogram.snapshot()["max"] == 10**9
+
+
+def test_gauges_sources_and_render() -> None:
+    metrics: proxy_metrics.ProxyMetrics = proxy_metrics.ProxyMetrics()
+    metrics.add_source("cache", lambda: {"hits": 3, "name": "ignored"})  # type: ignore
+    with metrics.active("connections"):
+        assert metrics.snapshot()["gauges"] == {"connections": 1}
+    assert metrics.snapshot()["gauges"] == {"connections": 0}
+    assert metrics.snapshot()["cache"] == {"hits": 3}
+
+    metrics.bytes.record(100)
+    text: bytes = metrics.render()
+    assert b"cache_hits 3\n" in text and b"response_bytes_count 1\n" in text
+
+
+def test_endpoint_serves_the_metrics() -> None:
+    metrics: proxy_metrics.ProxyMetrics = proxy_metrics.ProxyMetrics()
+    metrics.relay.record(0.25)
+    with metrics.serve(0) as server:
+        with socket.create_connection(("127.0.0.1", server.getsockname()[1]), 10) as client:
+            client.sendall(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+            response: bytes = b""
+            while data := client.recv(65536):
+                response += data
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200 OK")
+    assert b"request_seconds_count 1\n" in body
@@ -0,0 +1,72 @@
+"""Serving one port from several processes: shared listening sockets and the process group."""
+
+import socket
+from typing import Any
+
+import pytest
+
+import reuseport
+
+
+def echo_prompt(port: int, ready: Any, prompts: Any, stop: Any) -> None:
+    """Worker that puts the first line a client sends as the prompt."""
+    with reuseport.listen(port, 8) as server:
+        server.settimeout(0.1)
+        ready.release()
+        while not stop.is_set():
+            try:
+                client, _ = server.accept()
+            except socket.timeout:
+                continue
+            with client, client.makefile("rb") as reader:
+                prompts.put(reader.readline().strip())
+
+
+def exit_early(ready: Any, _: Any, __: Any) -> None:
+    """Worker that listens and exits without the prompt."""
+    ready.release()
+
+
+def never_ready(*_: Any) -> None:
+    """Worker that never starts listening."""
+
+
+def test_workers_share_the_port() -> None:
+    with reuseport.reserve_port() as reserved:
+        port: int = reserved.getsockname()[1]
+        with reuseport.listen(port, 8) as first, reuseport.listen(port, 8) as second:
+            for _ in range(4):
+                with socket.create_connection(("127.0.0.1", port), 10):
+                    pass
+            first.settimeout(0)
+            second.settimeout(0)
+            accepted: int = 0
+            for server in (first, second):
+                while True:
+                    try:
+                        server.accept()[0].close()
+                    except BlockingIOError:
+                        break
+                    accepted += 1
+            assert accepted == 4
+
+
+def test_prompt_from_any_worker() -> None:
+    with reuseport.reserve_port() as reserved:
+        port: int = reserved.getsockname()[1]
+        with reuseport.ProcessGroup(2, echo_prompt, (port,), "test") as group:
+            with socket.create_connection(("127.0.0.1", port), 10) as client:
+                client.sendall(b"identifier:abc\n")
+            assert group.wait_prompt(30) == b"identifier:abc"
+        assert not any(process.is_alive() for process in group.processes)
+
+
+def test_workers_exit_without_the_prompt() -> None:
+    with reuseport.ProcessGroup(2, exit_early, (), "test") as group:
+        with pytest.raises(ChildProcessError):
+            group.wait_prompt(30)
+
+
+def test_workers_that_do_not_listen() -> None:
+    with pytest.raises(ChildProcessError):
+        reuseport.ProcessGroup(1, never_ready, (), "test", start_timeout=0.5)
@@ -0,0 +1,106 @@
+"""Sharing one fetch between the clients that ask for the same document meanwhile."""
+
+import threading
+from typing import Iterator
+
+import pytest
+
+import single_flight
+
+
+def test_followers_read_the_whole_body() -> None:
+    flight: single_flight.Flight = single_flight.Flight(1024)
+    assert flight.join() and flight.join()
+    bodies: list[bytes] = []
+
+    def follow() -> None:
+        try:
+            flight.wait()
+            bodies.append(b"".join(flight.iter_body()))
+        finally:
+            flight.leave()
+
+    followers: list[threading.Thread] = [threading.Thread(target=follow) for _ in range(2)]
+    for follower in followers:
+        follower.start()
+    for number in range(100):
+        flight.publish(b"%d," % number)
+    flight.finish(True)
+    for follower in followers:
+        follower.join(10)
+
+    expected: bytes = b"".join(b"%d," % number for number in range(100))
+    assert bodies == [expected, expected]
+    # no more followers, the pieces they sent are gone
+    assert not flight.pieces
+
+
+def test_failed_fetch() -> None:
+    flight: single_flight.Flight = single_flight.Flight(1024)
+    assert flight.join()
+    flight.publish(b"part")
+    flight.finish(False)
+
+    with pytest.raises(ConnectionAbortedError):
+        list(flight.iter_body())
+
+
+def test_closed_flight_keeps_only_unsent_pieces() -> None:
+    flight: single_flight.Flight = single_flight.Flight(4)
+    assert flight.join()
+    body: Iterator[bytes] = flight.iter_body()
+
+    flight.publish(b"ab")
+    assert next(body) == b"ab"
+    # too big for more followers, the flight closes
+    flight.publish(b"cdef")
+    assert not flight.join()
+    assert next(body) == b"cdef"
+    assert flight.pieces == [b"cdef"] and flight.first == 1
+
+    flight.publish(b"gh")
+    assert next(body) == b"gh"
+    assert flight.pieces == [b"gh"]
+    flight.finish(True)
+    assert list(body) == []
+    flight.leave()
+    assert not flight.pieces
+
+
+def test_unstarted_follower_keeps_every_piece() -> None:
+    flight: single_flight.Flight = single_flight.Flight(1)
+    assert flight.join() and flight.join()
+    fast: Iterator[bytes] = flight.iter_body()
+
+    flight.publish(b"ab")
+    flight.publish(b"cd")
+    assert next(fast) == b"ab" and next(fast) == b"cd"
+    flight.finish(True)
+    assert list(fast) == []
+
+    # the other follower has not started reading yet
+    assert flight.pieces == [b"ab", b"cd"]
+    assert b"".join(flight.iter_body()) == b"abcd"
+
+
+def test_nothing_kept_without_followers() -> None:
+    flight: single_flight.Flight = single_flight.Flight(1024)
+    assert flight.close()
+    flight.publish(b"relayed")
+
+    assert not flight.pieces
+    assert not flight.join()
+
+
+def test_table() -> None:
+    table: single_flight.FlightTable = single_flight.FlightTable(1024)
+    flight, leader = table.join(b"/rfc1")
+    assert leader
+    assert table.join(b"/rfc1") == (flight, False)
+    assert table.lead(b"/rfc1") is None
+
+    table.land(b"/rfc1", flight)
+    assert flight.done and not flight.complete
+    other, leader = table.join(b"/rfc1")
+    assert leader and other is not flight
+    assert (table.led, table.coalesced) == (2, 1)
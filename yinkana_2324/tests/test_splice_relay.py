@@ -0,0 +1,87 @@
+"""Socket to socket relay of bodies, with os.splice and with the reused buffer."""
+
+import socket
+import threading
+from typing import Iterator, Optional
+
+import pytest
+
+import splice_relay
+
+
+BODY: bytes = bytes(range(256)) * 4096
+
+
+@pytest.fixture(name="spliced", params=[True, False], ids=["splice", "copy"])
+def fixture_spliced(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> bool:
+    """Runs the test with os.splice, where there is one, and with recv_into."""
+    if request.param and not hasattr(splice_relay.os, "splice"):
+        pytest.skip("no os.splice")
+    monkeypatch.setattr(splice_relay, "HAS_SPLICE", request.param)
+    return bool(request.param)
+
+
+@pytest.fixture(name="sockets")
+def fixture_sockets() -> Iterator[tuple[socket.socket, ...]]:
+    """The provider, the source, the destination and the client ends of two connections."""
+    provider, source = socket.socketpair()
+    destination, client = socket.socketpair()
+    for sock in (source, destination):
+        sock.settimeout(10)
+    yield provider, source, destination, client
+    for sock in (provider, source, destination, client):
+        sock.close()
+
+
+def send(provider: socket.socket, body: bytes) -> threading.Thread:
+    """Sends a body and closes the sending side, from a thread."""
+
+    def sender() -> None:
+        provider.sendall(body)
+        provider.shutdown(socket.SHUT_WR)
+
+    thread: threading.Thread = threading.Thread(target=sender)
+    thread.start()
+    return thread
+
+
+def receive(client: socket.socket) -> bytes:
+    """Receives until the other side closes."""
+    chunks: list[bytes] = []
+    while chunk := client.recv(65536):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@pytest.mark.usefixtures("spliced")
+@pytest.mark.parametrize("length", [len(BODY), 1000, None])
+def test_relays_the_body(sockets: tuple[socket.socket, ...], length: Optional[int]) -> None:
+    provider, source, destination, client = sockets
+    sender: threading.Thread = send(provider, BODY)
+    received: list[bytes] = []
+    receiver: threading.Thread = threading.Thread(target=lambda: received.append(receive(client)))
+    receiver.start()
+
+    relayed: int = splice_relay.relay(source, destination, length)
+    destination.shutdown(socket.SHUT_WR)
+    # the rest of the body stays in the source, e.g. for the next response
+    rest: bytes = receive(source)
+    sender.join(10)
+    receiver.join(10)
+
+    assert relayed == (len(BODY) if length is None else length)
+    assert received == [BODY[:relayed]]
+    assert rest == BODY[relayed:]
+
+
+@pytest.mark.usefixtures("spliced")
+def test_truncated_body(sockets: tuple[socket.socket, ...]) -> None:
+    provider, source, destination, _ = sockets
+    send(provider, b"short").join(10)
+    with pytest.raises(ConnectionResetError):
+        splice_relay.relay(source, destination, 100)
+
+
+def test_nothing_to_relay(sockets: tuple[socket.socket, ...]) -> None:
+    _, source, destination, _ = sockets
+    assert splice_relay.relay(source, destination, 0) == 0
@@ -0,0 +1,134 @@
+"""Bounded pool of worker threads: backpressure, cancellation, priority lane and shutdown."""
+
+import functools
+import threading
+
+import worker_pool
+
+
+def test_jobs_run_on_the_workers() -> None:
+    done: list[int] = []
+    with worker_pool.WorkerPool(2, 4, "test") as pool:
+        for number in range(10):
+            assert pool.submit(done.append, number)
+    assert sorted(done) == list(range(10))
+    assert pool.stats()["completed"] == 10
+
+
+def test_full_queue_drops_or_blocks() -> None:
+    release: threading.Event = threading.Event()
+    started: threading.Event = threading.Event()
+
+    def hold() -> None:
+        started.set()
+        release.wait(10)
+
+    pool: worker_pool.WorkerPool = worker_pool.WorkerPool(1, 1, "test")
+    assert pool.submit(hold)
+    assert started.wait(10)
+    assert pool.submit(hold)
+    # the worker is busy and the queue full
+    assert not pool.submit(hold, block=False)
+
+    blocked: list[bool] = []
+    submitter: threading.Thread = threading.Thread(
+        target=lambda: blocked.append(pool.submit(lambda: None))
+    )
+    submitter.start()
+    submitter.join(0.2)
+    assert submitter.is_alive()
+
+    release.set()
+    submitter.join(10)
+    assert blocked == [True]
+    pool.shutdown()
+    assert pool.stats()["blocked_submits"] == 1
+
+
+def test_shutdown_cancels_pending_jobs() -> None:
+    release: threading.Event = threading.Event()
+    started: threading.Event = threading.Event()
+    cancelled: list[int] = []
+
+    def hold() -> None:
+        started.set()
+        release.wait(10)
+
+    pool: worker_pool.WorkerPool = worker_pool.WorkerPool(1, 4, "test")
+    assert pool.submit(hold)
+    assert started.wait(10)
+    for number in range(3):
+        assert pool.submit(str, number, on_cancel=functools.partial(cancelled.append, number))
+
+    # does not wait for the job in progress
+    pool.shutdown(wait=False, cancel_pending=True)
+    assert cancelled == [0, 1, 2]
+    assert pool.stats()["cancelled"] == 3
+    assert not pool.submit(str)
+    release.set()
+
+
+def test_blocked_submit_gives_up_on_shutdown() -> None:
+    release: threading.Event = threading.Event()
+    started: threading.Event = threading.Event()
+
+    def hold() -> None:
+        started.set()
+        release.wait(10)
+
+    pool: worker_pool.WorkerPool = worker_pool.WorkerPool(1, 1, "test")
+    assert pool.submit(hold)
+    assert started.wait(10)
+    assert pool.submit(hold)
+
+    results: list[bool] = []
+    submitter: threading.Thread = threading.Thread(
+        target=lambda: results.append(pool.submit(str))
+    )
+    submitter.start()
+    pool.shutdown(wait=False, cancel_pending=True)
+    submitter.join(10)
+    assert results == [False]
+    release.set()
+
+
+def test_no_job_is_left_behind_the_sentinels() -> None:
+    # jobs submitted while the pool shuts down either run or are rejected, none is lost
+    for _ in range(20):
+        pool: worker_pool.WorkerPool = worker_pool.WorkerPool(2, 2, "test")
+        ran: list[int] = []
+        accepted: list[int] = []
+
+        def produce(pool: worker_pool.WorkerPool = pool, accepted: list[int] = accepted) -> None:
+            for number in range(200):
+                if pool.submit(ran.append, number):
+                    accepted.append(number)
+
+        producer: threading.Thread = threading.Thread(target=produce)
+        producer.start()
+        pool.shutdown()
+        producer.join(10)
+        assert sorted(ran) == accepted
+
+
+def test_priority_lane_skips_the_queue() -> None:
+    release: threading.Event = threading.Event()
+    started: threading.Event = threading.Event()
+    urgent: threading.Event = threading.Event()
+
+    def hold() -> None:
+        started.set()
+        release.wait(10)
+
+    pool: worker_pool.WorkerPool = worker_pool.WorkerPool(1, 1, "test")
+    assert pool.submit(hold)
+    assert started.wait(10)
+    assert pool.submit(hold)
+
+    # every worker is busy and the queue is full, the lane still runs it
+    assert pool.submit(urgent.set, priority=True)
+    assert urgent.wait(10)
+    release.set()
+    pool.shutdown()
+    assert pool.stats()["priority_completed"] == 1
+    assert not pool.submit(str, priority=True)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Fixed-size pool of worker threads fed by a bounded job queue."""
+
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+
+# the function, its arguments and the callback used if it is cancelled
+Job = tuple[Callable[..., Any], tuple[Any, ...], Optional[Callable[[], Any]]]
+
+# seconds a blocked submit waits for room before checking whether the pool was shut down
+SUBMIT_POLL_INTERVAL: float = 0.1
+
+
+class WorkerPool:
+    """Runs jobs on a fixed number of threads.
+    The queue is bounded: when every worker is busy and the queue is full, submit blocks,
+    so the producer (the accept loop) slows down instead of creating more threads.
+    Urgent jobs can be submitted to the priority lane instead: its own thread, created on
+    first use, that does not wait for the workers or the queue.
+
+    Args:
+        workers (int): Number of worker threads.
+        queue_size (int): Maximum number of jobs waiting for a worker.
+        name (str): Prefix of the thread names.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, workers: int = 8, queue_size: int = 32, name: str = "worker") -> None:
+        self.workers: int = workers
+        # the queue itself is unbounded, so the sentinels never wait; its size is bounded
+        # by the slots, one per job waiting for a worker
+        self.jobs: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self.slots: threading.Semaphore = threading.Semaphore(queue_size)
+        self.lock: threading.Lock = threading.Lock()
+        self.closed: bool = False
+        self.name: str = name
+        self.lane: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self.lane_thread: Optional[threading.Thread] = None
+
+        self.started_at: float = time.monotonic()
+        self.waiting: int = 0
+        self.busy: int = 0
+        self.busy_time: float = 0.0
+        self.completed: int = 0
+        self.failed: int = 0
+        self.cancelled: int = 0
+        self.blocked_submits: int = 0
+        self.blocked_time: float = 0.0
+        self.max_queue_depth: int = 0
+        self.priority_completed: int = 0
+
+        self.threads: list[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.shutdown()
+
+    def submit(
+        self,
+        function: Callable[..., Any],
+        *args: Any,
+        on_cancel: Optional[Callable[[], Any]] = None,
+        block: bool = True,
+        priority: bool = False,
+    ) -> bool:
+        """Queues a job, waiting for room in the queue if it is full.
+
+        Args:
+            function (Callable[..., Any]): The job.
+            *args (Any): Arguments of the job.
+            on_cancel (Optional[Callable[[], Any]]): Called instead of the job if the pool is
+                shut down before the job starts, e.g. to close its socket.
+            block (bool): Wait if the queue is full, otherwise the job is dropped.
+            priority (bool): Run it on the priority lane, it never waits nor is dropped.
+                Only for rare and short jobs, they run one after another.
+
+        Returns:
+            bool: False if the job was not queued: the pool is shut down or it is full
+                and block is False.
+        """
+        job: Job = (function, args, on_cancel)
+        if priority:
+            with self.lock:
+                if self.closed:
+                    return False
+                if self.lane_thread is None:
+                    self.lane_thread = threading.Thread(
+                        target=self._work_lane, name=f"{self.name}-priority", daemon=True
+                    )
+                    self.lane_thread.start()
+                self.lane.put(job)
+            return True
+
+        if not self._take_slot(block):
+            return False
+
+        # checked together with the enqueue, so no job is queued after the sentinels
+        with self.lock:
+            if self.closed:
+                self.slots.release()
+                return False
+            self.jobs.put(job)
+            self.waiting += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.waiting)
+        return True
+
+    def _take_slot(self, block: bool) -> bool:
+        """Takes the room of one job in the queue, the worker that gets the job frees it."""
+        # pylint: disable=consider-using-with
+        if self.slots.acquire(blocking=False):
+            return True
+        if not block:
+            return False
+        # backpressure: the caller waits until a worker takes a job
+        started: float = time.monotonic()
+        while not self.slots.acquire(timeout=SUBMIT_POLL_INTERVAL):
+            if self.closed:
+                return False
+        with self.lock:
+            self.blocked_submits += 1
+            self.blocked_time += time.monotonic() - started
+        return True
+
+    def _work(self) -> None:
+        while (job := self.jobs.get()) is not None:
+            self.slots.release()
+            function, args, _ = job
+            started: float = time.monotonic()
+            with self.lock:
+                self.waiting -= 1
+                self.busy += 1
+            try:
+                function(*args)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logging.exception("job %s failed", getattr(function, "__name__", function))
+                with self.lock:
+                    self.failed += 1
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.busy_time += time.monotonic() - started
+                    self.completed += 1
+
+    def _work_lane(self) -> None:
+        while (job := self.lane.get()) is not None:
+            function, args, _ = job
+            try:
+                function(*args)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logging.exception("job %s failed", getattr(function, "__name__", function))
+                with self.lock:
+                    self.failed += 1
+            finally:
+                with self.lock:
+                    self.priority_completed += 1
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False) -> None:
+        """Stops the workers once the queued jobs are done.
+
+        Args:
+            wait (bool): Wait for the workers to finish.
+            cancel_pending (bool): Drop the jobs that have not started, calling their on_cancel.
+        """
+        cancelled: list[Job] = []
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+            if cancel_pending:
+                cancelled = self._drain(self.jobs) + self._drain(self.lane)
+                self.cancelled += len(cancelled)
+
+            # queued jobs are served before the sentinels
+            for _ in self.threads:
+                self.jobs.put(None)
+            self.lane.put(None)
+
+        for pending in cancelled:
+            if pending[2] is not None:
+                pending[2]()
+
+        if wait:
+            for thread in self.threads:
+                thread.join()
+            if self.lane_thread is not None:
+                self.lane_thread.join()
+
+    def _drain(self, jobs: "queue.Queue[Optional[Job]]") -> list[Job]:
+        """Takes the jobs that have not started out of a queue, must be called with the lock
+        held."""
+        pending: list[Job] = []
+        while True:
+            try:
+                job: Optional[Job] = jobs.get_nowait()
+            except queue.Empty:
+                return pending
+            if job is not None:
+                pending.append(job)
+                if jobs is self.jobs:
+                    self.waiting -= 1
+                    self.slots.release()
+
+    def stats(self) -> dict[str, float]:
+        """Returns a snapshot of the pool metrics.
+
+        Returns:
+            dict[str, float]: Queue depth, busy workers, utilization and job counters.
+        """
+        with self.lock:
+            elapsed: float = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                "workers": self.workers,
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_queue_depth,
+                "busy": self.busy,
+                "utilization": self.busy_time / (elapsed * self.workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "blocked_submits": self.blocked_submits,
+                "blocked_time": self.blocked_time,
+                "priority_completed": self.priority_completed,
+            }
@@ -2,6 +2,11 @@ import socket
 import json
 import time
 import base64
+import logging
+
+import json_stream
+import prompt_parser
+import chamber_pipeline
 
 # Función para manejar la conexión y enviar la respuesta al Test Chamber 0
 def test_chamber_0():
@@ -28,15 +33,13 @@ def test_chamber_0():
         return identifier
 
 
-# Función para encontrar el identificador en el mensaje recibido
+# Función para encontrar el identificador en el mensaje recibido, con el analizador de enunciados
 def encontrar_identificador(received_text):
-    identifier_index = received_text.find('identifier:')
-
-    identifier_start_index = identifier_index + len('identifier:')
-    identifier_end_index = received_text.find('\n', identifier_start_index)
-    identifier = received_text[identifier_start_index:identifier_end_index].strip()
+    identifier = prompt_parser.parse_prompt(received_text.encode()).identifier
+    if identifier is None:
+        return ""
 
-    return identifier
+    return identifier.decode().strip()
 
 
 # Función para manejar el servidor UDP del Test Chamber 1
@@ -171,19 +174,8 @@ def test_chamber_4(identifier):
         mi_conector_tc4.connect((SERVER_TC4, PORT_TC4))
         mi_conector_tc4.sendall(identifier.encode())
 
-        while True:
-            # Receive data from the server
-            data = b""
-            while True:
-                chunk = mi_conector_tc4.recv(1024)
-                data += chunk
-
-                try:
-                    received_json = json.loads(data)
-                    break
-                except json.JSONDecodeError:
-                    pass
-
+        # Receive the JSONs from the server as they complete, even if several come together
+        for received_json in json_stream.iter_json(mi_conector_tc4):
             print("Mensaje recibido en TCP Test Chamber 4:", received_json)
             # Extract the relevant information
             player = "rapid_gnat"
@@ -210,8 +202,6 @@ def test_chamber_4(identifier):
             if "identifier:" in sentence:
                 print("Identificador encontrado en la oración:", sentence)
                 return encontrar_identificador(sentence)
-            elif not data:
-                break
 
 #!/usr/bin/python3
 "Internet checksum algorithm RFC-1071"
@@ -282,13 +272,20 @@ def test_chamber_5(identifier):
 
 
 # Función principal para manejar la comunicación inicial y lanzar el servidor UDP
+# Cada hito recibe el identificador del anterior; se guardan en un fichero y si algo
+# falla la siguiente ejecución con --resume continúa desde el hito que falló
 def main():
-    identificador = test_chamber_0()
-    identificador = test_chamber_1(identificador)
-    identificador = test_chamber_2(identificador)
-    identificador = test_chamber_3(identificador)
-    identificador = test_chamber_4(identificador)
-    identificador = test_chamber_5(identificador)
+    # para ver los tiempos de cada hito que muestra el pipeline
+    logging.basicConfig(level=logging.INFO)
+
+    pipeline = chamber_pipeline.Pipeline("rapid_gnat", "--resume" in sys.argv[1:])
+    # solo el primer hito se repite si falla, los demás gastan el identificador del anterior
+    pipeline.add("test_chamber_0", lambda: test_chamber_0().encode(), retries=2)
+
+    for hito in (test_chamber_1, test_chamber_2, test_chamber_3, test_chamber_4, test_chamber_5):
+        pipeline.add(hito.__name__, lambda identificador, hito=hito: hito(identificador.decode()).encode())
+
+    pipeline.run()
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Collection of functions to solve the Yinkana challenge."""
 
+import os
 import socket
 import logging
 import re
@@ -10,13 +11,62 @@ import base64
 import sys
 import struct
 import array
+import queue
+import multiprocessing
+import multiprocessing.synchronize
 import _thread
+import collections
+import contextlib
+import selectors
+from typing import Any, Callable, ContextManager, Optional
+
+import rfc_proxy
+import http_cache
+import http_parser
+import json_stream
+import reuseport
+import endpoints
+import prompt_parser
+import chamber_pipeline
+import disk_cache
+import worker_pool
 
 
 logging.basicConfig(
     format="%(levelname)s: %(funcName)s: %(message)s", level=logging.INFO
 )
 
+# the socket of each chamber, connected as soon as the prompt that describes it is parsed,
+# or while the previous chamber runs with SPECULATIVE_CONNECT; hosts are resolved once
+chamber_connector: endpoints.EndpointManager = endpoints.EndpointManager()
+
+# seconds an idle client connection keeps its worker before it is closed
+KEEP_ALIVE_TIMEOUT: float = 5.0
+# seconds between checks of the prompt while no connection arrives
+ACCEPT_POLL_INTERVAL: float = 0.1
+# seconds between attempts to hand held connections to a full worker pool
+HELD_POLL_INTERVAL: float = 0.005
+# connections held while the worker pool is full before the accept loop blocks
+MAX_HELD_CONNECTIONS: int = 1024
+# seconds a new connection has to send its request line to be classified, the accept loop
+# does not wait for it meanwhile
+CLASSIFY_TIMEOUT: float = 0.01
+# seconds the accept loop keeps checking often for the prompt after a connection is
+# classified as the one that delivers it
+PROMPT_WAIT: float = 1.0
+# processes that serve the HTTP chamber, $YINKANA_HTTP_PROCESSES; more than one spawns
+# workers sharing the port with SO_REUSEPORT, each with its own caches and connections
+HTTP_PROCESSES: int = int(os.environ.get("YINKANA_HTTP_PROCESSES") or 1)
+# port of the plain text metrics of the proxy, $YINKANA_METRICS_PORT, None disables them
+METRICS_PORT: Optional[int] = (
+    int(os.environ["YINKANA_METRICS_PORT"]) if os.environ.get("YINKANA_METRICS_PORT") else None
+)
+# whether to connect to the configured address of the next chamber while the current one
+# runs, $YINKANA_SPECULATE=1; the connection is dropped if the prompt names another one
+SPECULATIVE_CONNECT: bool = os.environ.get("YINKANA_SPECULATE") == "1"
+# times the handshake is run again if it fails, the only chamber that is safe to replay
+HANDSHAKE_RETRIES: int = 2
+
 
 def cksum(pkt: bytes) -> int:
     # pylint: disable=invalid-name disable=missing-function-docstring
@@ -42,7 +92,79 @@ def get_message_identifier(message: bytes) -> bytes:
     Returns:
         bytes: The identifier of the message.
     """
-    return re.search(b"identifier:(.+)", message).group(1)  # type: ignore
+    identifier: Optional[bytes] = prompt_parser.parse_prompt(message).identifier
+    if identifier is None:
+        raise ValueError(f"no identifier in {message!r}")
+    return identifier
+
+
+def prepare_next_chamber(
+    message: bytes, default: tuple[str, int], stream: bool = True, label: Optional[str] = None
+) -> tuple[prompt_parser.Prompt, tuple[str, int]]:
+    """Parses the prompt of a chamber and starts connecting to the next one,
+    so its socket is ready when the next chamber starts.
+    The hosts the prompt says the documents come from are resolved in the background.
+
+    Args:
+        message (bytes): The prompt.
+        default (tuple[str, int]): The host and port of the next chamber if the prompt omits them.
+        stream (bool): Whether the next chamber is reached over TCP.
+        label (Optional[str]): Name of the next chamber in the connection report.
+
+    Returns:
+        tuple[prompt_parser.Prompt, tuple[str, int]]: The parsed prompt and the resolved
+            address of the next chamber.
+
+    Raises:
+        ValueError: If the prompt has no identifier.
+    """
+    logging.info(message.decode())
+    prompt: prompt_parser.Prompt = prompt_parser.parse_prompt(message)
+    if prompt.identifier is None:
+        raise ValueError(f"no identifier in {message!r}")
+    address: tuple[str, int] = chamber_connector.prepare(
+        prompt.target(default), stream, label=label
+    )
+    chamber_connector.warm(host for host, _ in prompt.sources)
+    return prompt, address
+
+
+def chamber_stage(
+    chamber: Callable[..., bytes],
+    default: tuple[str, int],
+    *args: Any,
+    stream: bool = True,
+    provider: Optional[tuple[str, int]] = None,
+    following: Optional[tuple[str, int]] = None,
+    **kwargs: Any,
+) -> Callable[[bytes], bytes]:
+    """Returns a pipeline stage that runs a chamber where the previous prompt says.
+    With SPECULATIVE_CONNECT, the connection to the following chamber is opened meanwhile.
+
+    Args:
+        chamber (Callable[..., bytes]): Called with the host, port and identifier of the
+            prompt, the provider if any, and the other arguments.
+        default (tuple[str, int]): The host and port of the chamber if the prompt omits them.
+        *args (Any): The arguments of the chamber after the identifier.
+        stream (bool): Whether the chamber is reached over TCP.
+        provider (Optional[tuple[str, int]]): Default address of a provider, e.g. of the
+            HTTP chamber; the prompt's second address is passed if it has one.
+        following (Optional[tuple[str, int]]): Configured address of the following chamber,
+            if it is reached over TCP.
+        **kwargs (Any): The keyword arguments of the chamber.
+
+    Returns:
+        Callable[[bytes], bytes]: Takes the previous prompt and returns the next one.
+    """
+
+    def stage(message: bytes) -> bytes:
+        prompt, address = prepare_next_chamber(message, default, stream, chamber.__name__)
+        if SPECULATIVE_CONNECT and following is not None:
+            chamber_connector.prepare(following, speculative=True)
+        provider_address: tuple[Any, ...] = () if provider is None else prompt.provider(provider)
+        return chamber(*address, prompt.identifier, *provider_address, *args, **kwargs)
+
+    return stage
 
 
 def chamber_0(target_ip: str, target_port: int, username: bytes) -> bytes:
@@ -59,8 +181,7 @@ def chamber_0(target_ip: str, target_port: int, username: bytes) -> bytes:
     """
     received_data: bytes
 
-    with socket.socket() as client_socket:
-        client_socket.connect((target_ip, target_port))
+    with chamber_connector.connect((target_ip, target_port)) as client_socket:
 
         received_data = client_socket.recv(1024)
         logging.info(received_data.decode())
@@ -161,8 +282,7 @@ def chamber_2(
     """
     next_chamber_prompt: bytes = b""
 
-    with socket.socket() as client_socket:
-        client_socket.connect((target_ip, target_port))
+    with chamber_connector.connect((target_ip, target_port)) as client_socket:
 
         message: bytes = (
             chamber_id + b" " + str(word_count_flag(client_socket, flag)).encode()
@@ -262,8 +382,7 @@ def chamber_3(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
     """
     next_chamber_prompt: bytes = b""
 
-    with socket.socket() as client_socket:
-        client_socket.connect((target_ip, target_port))
+    with chamber_connector.connect((target_ip, target_port)) as client_socket:
         client_socket.sendall(chamber_id)
 
         encrypted_alphabet: bytes = client_socket.recv(26)
@@ -291,63 +410,142 @@ def chamber_3(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
     return next_chamber_prompt
 
 
+# uppercase letters of ASCII sentences, the usual ones; others are checked letter by letter
+ASCII_UPPERCASE: re.Pattern[str] = re.compile(r"[A-Z]")
+
+
+def uppercase_letters(sentence: str) -> list[str]:
+    """Returns the uppercase letters of a sentence, in order.
+
+    Args:
+        sentence (str): The sentence.
+
+    Returns:
+        list[str]: The letters for which str.isupper is true.
+    """
+    if sentence.isascii():
+        return ASCII_UPPERCASE.findall(sentence)
+    return [letter for letter in sentence if letter.isupper()]
+
+
+class SentenceAnswers:
+    """Serializes the answers of chamber_4 from a template, as json.dumps would.
+    Only the letters and the timestamp change between answers, the rest is built once.
+
+    Args:
+        username (str): The player of every answer.
+    """
+
+    def __init__(self, username: str) -> None:
+        self.head: bytes = b'{"player": ' + json.dumps(username).encode() + b', "upperletters": ['
+        self.second: int = -1
+        self.tail: bytes = b""
+
+    def answer(self, letters: list[str]) -> bytes:
+        """Returns the answer to a sentence.
+
+        Args:
+            letters (list[str]): The uppercase letters of the sentence.
+
+        Returns:
+            bytes: The serialized answer.
+        """
+        now: int = int(time.time())
+        if now != self.second:
+            self.second = now
+            self.tail = b'], "timestamp": ' + str(now).encode() + b"}"
+        if not letters:
+            return self.head + self.tail
+        joined: str = '", "'.join(letters)
+        if joined.isascii():
+            # ASCII letters need no escaping
+            return self.head + ('"' + joined + '"').encode() + self.tail
+        return self.head + json.dumps(letters)[1:-1].encode() + self.tail
+
+
 def chamber_4(
-    target_ip: str, target_port: int, chamber_id: bytes, username: str
+    target_ip: str,
+    target_port: int,
+    chamber_id: bytes,
+    username: str,
+    pipelined: bool = False,
 ) -> bytes:
     """Sends the chamber_id to the target IP address and port.
-    Then, reads jsons until they are complete, extracts the uppercase letters from the sentence.
+    Then, reads each json as it completes, extracts the uppercase letters from the sentence.
     Finally, sends the uppercase letters, username and timestamp to the target IP address and port.
+    In pipelined mode the sentences keep arriving while the answers to the previous ones
+    are sent, and the answers ready together go in one send; the server must then accept
+    several answers in one read.
 
     Args:
         target_ip (str): The target IP address to send the message to.
         target_port (int): The target port to send the message to.
         chamber_id (bytes): The identifier to send.
         username (str): The username to send.
+        pipelined (bool): Whether to overlap reading the sentences with answering them.
 
     Returns:
         bytes: The next chamber prompt.
     """
     next_chamber_prompt: bytes = b""
+    answers: SentenceAnswers = SentenceAnswers(username)
 
-    with socket.socket() as client_socket:
-        client_socket.connect((target_ip, target_port))
+    with chamber_connector.connect((target_ip, target_port)) as client_socket:
         client_socket.sendall(chamber_id)
 
-        while not next_chamber_prompt:
-            received_data: bytes = b""
-            data_is_complete: bool = False
-            request: dict[str, str] = {}
-
-            while not data_is_complete:
-                received_data += client_socket.recv(1024)
-                logging.debug(received_data)
-
-                try:
-                    request = json.loads(received_data)
-                    data_is_complete = True
-                except json.JSONDecodeError:
-                    pass
+        if pipelined:
+            return answer_sentences_pipelined(client_socket, answers)
 
+        # the sentences may be split across reads or several may come in one read
+        request: dict[str, str]
+        for request in json_stream.iter_json(client_socket):
             logging.debug(request)
 
             sentence: str = request["sentence"]
-            uppers: list[str] = list(filter(lambda x: x.isupper(), sentence))
-            message: bytes = json.dumps(
-                {
-                    "player": username,
-                    "upperletters": uppers,
-                    "timestamp": int(time.time()),
-                }
-            ).encode()
+            message: bytes = answers.answer(uppercase_letters(sentence))
             logging.debug("message: %s", str(message))
             client_socket.sendall(message)
 
             if sentence.startswith("identifier:"):
                 next_chamber_prompt = sentence.encode()
+                break
 
     return next_chamber_prompt
 
 
+def answer_sentences_pipelined(
+    client_socket: socket.socket, answers: SentenceAnswers
+) -> bytes:
+    """Answers every sentence completed by each read with a single send.
+    Sends do not wait for the server to read them, so while it does the next sentences
+    pile up in the receive buffer and the next read parses them all at once.
+
+    Args:
+        client_socket (socket.socket): The connected socket.
+        answers (SentenceAnswers): Serializes the answers.
+
+    Returns:
+        bytes: The next chamber prompt, empty if the server closed the connection first.
+    """
+    stream: json_stream.JsonStream = json_stream.JsonStream()
+    messages: list[bytes] = []
+
+    while data := client_socket.recv(json_stream.RECV_SIZE):
+        for request in stream.feed(data):
+            sentence: str = request["sentence"]
+            messages.append(answers.answer(uppercase_letters(sentence)))
+            if sentence.startswith("identifier:"):
+                client_socket.sendall(b"".join(messages))
+                return sentence.encode()
+
+        if messages:
+            logging.debug("answering %d sentences", len(messages))
+            client_socket.sendall(b"".join(messages))
+            messages.clear()
+
+    return b""
+
+
 def chamber_5(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
     """Creates a YAP request with the chamber_id as payload.
     Sends the request to the target IP address and port.
@@ -396,8 +594,7 @@ def error_message_listener(
     Returns:
         None
     """
-    with socket.socket() as error_listener_client:
-        error_listener_client.connect((target_ip, target_port))
+    with chamber_connector.connect((target_ip, target_port)) as error_listener_client:
         error_listener_client.sendall(first_message)
 
         while received_data := error_listener_client.recv(1024):
@@ -405,80 +602,241 @@ def error_message_listener(
 
 
 def bucle_aceptar(
-    http_server_socket: socket.socket, http_provider_ip: str, http_provider_port: int
+    http_server_socket: socket.socket,
+    http_provider_ip: str,
+    http_provider_port: int,
+    workers: worker_pool.WorkerPool,
+    proxy: rfc_proxy.RfcProxy,
+    stop: Optional[multiprocessing.synchronize.Event] = None,
 ) -> bytes:
-    """Accepts incoming HTTP requests and proxies them to a provider.
-    Returns the next chamber prompt received as a POST request.
+    """Accepts incoming HTTP connections and hands them to the worker pool.
+    Each connection is classified by its request line once it is readable, without
+    waiting for it: the loop watches the server socket and the unclassified connections
+    together, so a slow client never delays the next accept. The connection that delivers
+    the prompt (any method but GET) goes to the priority lane of the pool, so it does not
+    wait behind the GETs; one that sends nothing within CLASSIFY_TIMEOUT goes to the normal
+    lane. While the pool queue is full, GET connections are held in arrival order and the
+    loop keeps accepting; it only blocks once too many are held.
+    Returns the next chamber prompt, received as the body of a POST request.
 
     Args:
         http_server_socket (socket.socket): The socket to accept incoming requests.
         http_provider_ip (str): The IP address of the provider.
         http_provider_port (int): The port of the provider.
+        workers (worker_pool.WorkerPool): The pool that serves the connections.
+        proxy (rfc_proxy.RfcProxy): Answers the GET requests.
+        stop (Optional[multiprocessing.synchronize.Event]): Set when another process got the
+            prompt.
 
     Returns:
-        bytes: The next chamber prompt.
+        bytes: The next chamber prompt, empty if stopped before it arrived.
     """
-    next_chamber_prompt: bytes = b""
-    while not next_chamber_prompt:
-        petition_socket, _ = http_server_socket.accept()
-
-        received_data: bytes = petition_socket.recv(1024)
-        logging.debug("incoming request %s", str(received_data))
-
-        if received_data.startswith(b"GET"):
-            uri: bytes = b"/rfc/" + received_data.split(b" ")[1]
-            try:
-                _thread.start_new_thread(
-                    proxy_request,
-                    (petition_socket, uri, http_provider_ip, http_provider_port),
-                )
-            except RuntimeError:
-                proxy_request(
-                    petition_socket, uri, http_provider_ip, http_provider_port
-                )
-        else:
-            next_chamber_prompt = petition_socket.recv(1024)
-            petition_socket.sendall(b"HTTP/1.1 200 OK\r\n\r\n")
+    prompts: "queue.Queue[bytes]" = queue.Queue()
+    # connections accepted while the pool queue was full, with the time they were accepted
+    held: collections.deque[tuple[socket.socket, float]] = collections.deque()
+    # connections whose request line has not arrived yet, with the time they were accepted
+    unclassified: dict[socket.socket, float] = {}
+    # until when a connection sent to the priority lane may deliver the prompt
+    candidate_until: float = 0.0
+    selector: selectors.BaseSelector = selectors.DefaultSelector()
+    http_server_socket.setblocking(False)
+    selector.register(http_server_socket, selectors.EVENT_READ)
+
+    def dispatch(petition_socket: socket.socket, accepted_at: float) -> None:
+        if held or not workers.submit(
+            serve_connection,
+            petition_socket,
+            proxy,
+            http_provider_ip,
+            http_provider_port,
+            prompts,
+            accepted_at,
+            on_cancel=petition_socket.close,
+            block=False,
+        ):
+            held.append((petition_socket, accepted_at))
 
-    return next_chamber_prompt
+    try:
+        while prompts.empty():
+            if stop is not None and stop.is_set():
+                break
+
+            # held connections go first, in arrival order
+            while held:
+                held_socket, held_at = held[0]
+                if not workers.submit(
+                    serve_connection,
+                    held_socket,
+                    proxy,
+                    http_provider_ip,
+                    http_provider_port,
+                    prompts,
+                    held_at,
+                    on_cancel=held_socket.close,
+                    # backpressure: with too many waiting, the loop waits for a worker
+                    block=len(held) >= MAX_HELD_CONNECTIONS,
+                ):
+                    break
+                held.popleft()
+
+            # the prompt may arrive on any connection, the loop wakes up to check it
+            busy: bool = bool(held or unclassified) or time.monotonic() < candidate_until
+            for key, _ in selector.select(HELD_POLL_INTERVAL if busy else ACCEPT_POLL_INTERVAL):
+                if key.fileobj is http_server_socket:
+                    try:
+                        petition_socket, _ = http_server_socket.accept()
+                    except BlockingIOError:
+                        continue
+                    petition_socket.setblocking(True)
+                    unclassified[petition_socket] = time.monotonic()
+                    selector.register(petition_socket, selectors.EVENT_READ)
+                    continue
+
+                petition_socket = key.fileobj  # type: ignore
+                selector.unregister(petition_socket)
+                accepted_at: float = unclassified.pop(petition_socket)
+                request_line: bytes = http_parser.peek_request_line(petition_socket, 0.0)
+                if request_line and not request_line.startswith(b"GET "):
+                    candidate_until = time.monotonic() + PROMPT_WAIT
+                    workers.submit(
+                        serve_connection,
+                        petition_socket,
+                        proxy,
+                        http_provider_ip,
+                        http_provider_port,
+                        prompts,
+                        accepted_at,
+                        on_cancel=petition_socket.close,
+                        priority=True,
+                    )
+                else:
+                    dispatch(petition_socket, accepted_at)
+
+            # connections still silent are served in order, as they are probably GETs
+            now: float = time.monotonic()
+            for petition_socket, accepted_at in list(unclassified.items()):
+                if now - accepted_at >= CLASSIFY_TIMEOUT:
+                    selector.unregister(petition_socket)
+                    del unclassified[petition_socket]
+                    dispatch(petition_socket, accepted_at)
+    finally:
+        selector.close()
+        http_server_socket.setblocking(True)
+        # the chamber is over, nobody will answer the held and unclassified connections
+        for petition_socket, _ in held:
+            petition_socket.close()
+        for petition_socket in unclassified:
+            petition_socket.close()
+    return b"" if prompts.empty() else prompts.get()
+
+
+def serve_connection(
+    incoming_socket: socket.socket,
+    proxy: rfc_proxy.RfcProxy,
+    http_provider_ip: str,
+    http_provider_port: int,
+    prompts: "queue.Queue[bytes]",
+    accepted_at: Optional[float] = None,
+) -> None:
+    """Answers the requests of a client connection in order, including pipelined ones.
+    GET requests are proxied to the provider, the connection is kept open while the client
+    uses HTTP/1.1 keep-alive. The body of any other request is the next chamber prompt; one
+    sent without Content-Length nor Transfer-Encoding is answered with 411 Length Required.
+
+    Args:
+        incoming_socket (socket.socket): The socket of the client, closed when done.
+        proxy (rfc_proxy.RfcProxy): Answers the GET requests.
+        http_provider_ip (str): The IP address of the provider.
+        http_provider_port (int): The port of the provider.
+        prompts (queue.Queue[bytes]): Where the prompt is put when it arrives.
+        accepted_at (Optional[float]): time.monotonic() when the connection was accepted,
+            to report how long the prompt took to be detected.
+
+    Returns:
+        None
+    """
+    with incoming_socket, proxy.metrics.active("connections"):
+        incoming_socket.settimeout(KEEP_ALIVE_TIMEOUT)
+        try:
+            for request in http_parser.iter_requests(incoming_socket):
+                logging.debug("incoming request %s %s", str(request.method), str(request.target))
+                keep_alive: bool = request.keep_alive
+
+                if request.method == b"GET":
+                    proxy_request(
+                        incoming_socket,
+                        proxy,
+                        b"/rfc/" + request.target,
+                        http_provider_ip,
+                        http_provider_port,
+                        keep_alive,
+                        http_cache.Preferences.from_headers(request.header),
+                    )
+                elif not request.header(b"content-length") and not request.header(
+                    b"transfer-encoding"
+                ):
+                    # without Content-Length nor Transfer-Encoding a request has no body
+                    # (RFC 9112, 6.3), the client is told instead of taking an empty prompt
+                    raise http_parser.RequestError(411, b"Length Required")
+                else:
+                    prompts.put(request.body)
+                    if accepted_at is not None:
+                        logging.info(
+                            "prompt detected %.1f ms after accepting its connection",
+                            (time.monotonic() - accepted_at) * 1000,
+                        )
+                    incoming_socket.sendall(rfc_proxy.error_response(200, b"OK"))
+                    # nothing else is needed from the chamber
+                    break
+
+                if not keep_alive:
+                    break
+        except http_parser.RequestError as ex:
+            logging.warning("bad request: %s", ex)
+            incoming_socket.sendall(rfc_proxy.error_response(ex.status, ex.reason))
+        except OSError as ex:
+            logging.debug("connection closed: %s", ex)
 
 
 def proxy_request(
     incoming_request_socket: socket.socket,
+    proxy: rfc_proxy.RfcProxy,
     uri: bytes,
     http_provider_ip: str,
     http_provider_port: int,
+    keep_alive: bool = False,
+    preferences: Optional[http_cache.Preferences] = None,
 ) -> None:
-    """Creates a HTTP request to a provider and sends the response to the incoming socket.
+    """Requests the URI to a provider and sends the response to the incoming socket.
+    Responses are cached, so repeated URIs are answered from memory while they are fresh,
+    compressed if the client accepts it and cut to the byte ranges it asks for.
+    If the provider is failing, the client gets a stale copy or an immediate error.
+    The connection to the provider is taken from the pool and kept alive for later requests.
 
     Args:
         incoming_request_socket (socket.socket): The socket that made the request.
+        proxy (rfc_proxy.RfcProxy): The proxy with the cache and the provider connections.
         uri (bytes): The URI to request.
         http_provider_ip (str): The IP address of the provider.
         http_provider_port (int): The port of the provider.
+        keep_alive (bool): Whether the client connection will be reused.
+        preferences (Optional[http_cache.Preferences]): Content coding and byte ranges
+            asked by the client.
 
     Returns:
         None
+
+    Raises:
+        OSError: If the response could not be sent, the connection must be closed.
     """
-    http_header: bytes = (
-        b"GET "
-        + uri
-        + b" HTTP/1.1\r\nHost: "
-        + http_provider_ip.encode()
-        + b":"
-        + str(http_provider_port).encode()
-        + b"\r\nConnection: close\r\n\r\n"
+    relayed: int = proxy.serve(
+        incoming_request_socket,
+        (http_provider_ip, http_provider_port),
+        uri,
+        keep_alive,
+        preferences,
     )
-    logging.debug("outgoing header: %s", str(http_header))
-
-    with socket.socket() as outgoing_client_socket:
-        outgoing_client_socket.connect((http_provider_ip, http_provider_port))
-        outgoing_client_socket.sendall(http_header)
-
-        while data := outgoing_client_socket.recv(1024):
-            incoming_request_socket.sendall(data)
-
-    incoming_request_socket.close()
+    logging.debug("relayed %d bytes of %s", relayed, str(uri))
 
 
 def chamber_6(
@@ -488,11 +846,19 @@ def chamber_6(
     http_provider_ip: str,
     http_provider_port: int,
     concurrent_connection_limit: int = 4,
+    worker_count: int = 16,
+    queue_size: int = 64,
+    processes: int = 1,
+    metrics_port: Optional[int] = METRICS_PORT,
 ) -> bytes:
     """Sends the chamber_id and listens for incoming HTTP requests.
-    Proxies the requests to a provider.
+    Proxies the requests to a provider using a fixed pool of worker threads.
     Returns the next chamber prompt received as a POST request.
     Starts a thread to listen for error messages from the target IP and port.
+    With several processes, each one listens on the same port with SO_REUSEPORT and has its
+    own pool, cache and interpreter; they share the disk cache.
+    With a metrics_port, the metrics of the proxy are served as plain text on that port;
+    with several processes, each one serves its own on a free port, written to the log.
 
     Args:
         target_ip (str): The target IP address to send the message to.
@@ -501,16 +867,50 @@ def chamber_6(
         http_provider_ip (str): The IP address of the provider.
         http_provider_port (int): The port of the provider.
         concurrent_connection_limit (int): The maximum number of concurrent connections.
+        worker_count (int): The number of threads that proxy requests, in each process.
+        queue_size (int): The number of accepted requests that can wait for a worker.
+        processes (int): The number of processes that serve the requests.
+        metrics_port (Optional[int]): The port of the metrics, 0 for a free one,
+            None to not serve them.
 
     Returns:
         bytes: The next chamber prompt.
     """
+    # pylint: disable=too-many-arguments
     next_chamber_prompt: bytes = b""
 
-    with socket.socket() as http_server_socket:
+    if processes > 1:
+        with reuseport.reserve_port() as reserved_socket, reuseport.ProcessGroup(
+            processes,
+            http_worker,
+            (
+                reserved_socket.getsockname()[1],
+                http_provider_ip,
+                http_provider_port,
+                max(concurrent_connection_limit, queue_size),
+                worker_count,
+                queue_size,
+                None if metrics_port is None else 0,
+            ),
+            "http",
+        ) as group:
+            _thread.start_new_thread(
+                error_message_listener,
+                (
+                    target_ip,
+                    target_port,
+                    chamber_id + b" " + str(reserved_socket.getsockname()[1]).encode(),
+                ),
+            )
+            return group.wait_prompt()
+
+    proxy: rfc_proxy.RfcProxy = provider_proxy()
+    with proxy, socket.socket() as http_server_socket, worker_pool.WorkerPool(
+        worker_count, queue_size, "proxy"
+    ) as workers, metrics_endpoint(proxy, metrics_port):
         http_server_socket.bind(("", 0))
         free_port: int = http_server_socket.getsockname()[1]
-        http_server_socket.listen(concurrent_connection_limit)
+        http_server_socket.listen(max(concurrent_connection_limit, queue_size))
 
         _thread.start_new_thread(
             error_message_listener,
@@ -522,12 +922,95 @@ def chamber_6(
         )
 
         next_chamber_prompt = bucle_aceptar(
-            http_server_socket, http_provider_ip, http_provider_port
+            http_server_socket, http_provider_ip, http_provider_port, workers, proxy
         )
 
+        # the prompt is all we wanted: requests still waiting are dropped, closing their
+        # sockets, and keep-alive connections in progress are not waited for
+        workers.shutdown(wait=False, cancel_pending=True)
+        logging.info("proxy workers: %s", workers.stats())
+        logging.info("proxy metrics: %s", proxy.metrics.snapshot())
+
     return next_chamber_prompt
 
 
+def http_worker(
+    port: int,
+    http_provider_ip: str,
+    http_provider_port: int,
+    backlog: int,
+    worker_count: int,
+    queue_size: int,
+    metrics_port: Optional[int],
+    ready: multiprocessing.synchronize.Semaphore,
+    prompts: "multiprocessing.Queue[bytes]",
+    stop: multiprocessing.synchronize.Event,
+) -> None:
+    """Serves the HTTP chamber in one of the processes of chamber_6.
+
+    Args:
+        port (int): The port shared by the processes.
+        http_provider_ip (str): The IP address of the provider.
+        http_provider_port (int): The port of the provider.
+        backlog (int): The listen backlog of this process.
+        worker_count (int): The number of threads that proxy requests.
+        queue_size (int): The number of accepted requests that can wait for a worker.
+        metrics_port (Optional[int]): The port of the metrics of this process, or None.
+        ready (multiprocessing.synchronize.Semaphore): Released once listening.
+        prompts (multiprocessing.Queue[bytes]): Where the prompt is put when it arrives.
+        stop (multiprocessing.synchronize.Event): Set when the chamber is over.
+
+    Returns:
+        None
+    """
+    # pylint: disable=too-many-arguments
+    proxy: rfc_proxy.RfcProxy = provider_proxy()
+    with proxy, reuseport.listen(port, backlog) as http_server_socket, worker_pool.WorkerPool(
+        worker_count, queue_size, "proxy"
+    ) as workers, metrics_endpoint(proxy, metrics_port):
+        ready.release()
+        prompt: bytes = bucle_aceptar(
+            http_server_socket, http_provider_ip, http_provider_port, workers, proxy, stop
+        )
+        if prompt:
+            prompts.put(prompt)
+
+        # this process or another one got the prompt: requests still waiting are dropped,
+        # closing their sockets, and keep-alive connections in progress are not waited for
+        workers.shutdown(wait=False, cancel_pending=True)
+        logging.info("proxy workers: %s", workers.stats())
+        logging.info("proxy metrics: %s", proxy.metrics.snapshot())
+
+
+def provider_proxy() -> rfc_proxy.RfcProxy:
+    """Builds the proxy of the HTTP chamber: keep-alive connections and cached responses of the
+    provider, shared by every proxy thread. The responses are also kept on disk
+    ($YINKANA_CACHE_DIR) for the next runs, and the RFCs referenced by the served ones are
+    prefetched.
+
+    Returns:
+        rfc_proxy.RfcProxy: The proxy, its background threads stop when it is closed.
+    """
+    return rfc_proxy.RfcProxy(disk=disk_cache.DiskCache(), prefetch_workers=2)
+
+
+def metrics_endpoint(
+    proxy: rfc_proxy.RfcProxy, port: Optional[int]
+) -> ContextManager[Optional[socket.socket]]:
+    """Serves the metrics of the proxy on a side port while in the block.
+
+    Args:
+        proxy (rfc_proxy.RfcProxy): The proxy whose metrics are served.
+        port (Optional[int]): The port, 0 for a free one, None to not serve them.
+
+    Returns:
+        ContextManager[Optional[socket.socket]]: The listening socket, closed on exit.
+    """
+    if port is None:
+        return contextlib.nullcontext()
+    return proxy.metrics.serve(port)
+
+
 def chamber_7(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
     """Sends chamber_id and obtains cake.
 
@@ -540,8 +1023,7 @@ def chamber_7(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
         bytes: The cake.
     """
     received_data: bytes
-    with socket.socket() as client_socket:
-        client_socket.connect((target_ip, target_port))
+    with chamber_connector.connect((target_ip, target_port)) as client_socket:
         client_socket.sendall(chamber_id)
         received_data = client_socket.recv(1024)
     return received_data
@@ -550,34 +1032,50 @@ def chamber_7(target_ip: str, target_port: int, chamber_id: bytes) -> bytes:
 def main() -> None:
     """Main function to solve the Yinkana challenge."""
     try:
-        received_data: bytes = chamber_0("rick", 2000, b"on_eagle")
-        logging.info(received_data.decode())
-
-        received_data = chamber_1("rick", 4000, get_message_identifier(received_data))
-        logging.info(received_data.decode())
-
-        received_data = chamber_2(
-            "rick", 3002, get_message_identifier(received_data), b"that's the end"
+        # only the first chamber is configured, every prompt describes the next one;
+        # each prompt is checkpointed, with --resume a failed run continues at the chamber
+        # that failed
+        pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+            "on_eagle", "--resume" in sys.argv[1:]
         )
-        logging.info(received_data.decode())
-
-        received_data = chamber_3("rick", 6510, get_message_identifier(received_data))
-        logging.info(received_data.decode())
-
-        received_data = chamber_4(
-            "rick", 3061, get_message_identifier(received_data), "on_eagle"
+        # only the handshake is retried, it starts from nothing; the other chambers spend
+        # the identifier of the previous one, so running them again would not help
+        pipeline.add(
+            "chamber_0",
+            lambda: chamber_0(
+                *chamber_connector.prepare(("rick", 2000), label="chamber_0"), b"on_eagle"
+            ),
+            retries=HANDSHAKE_RETRIES,
         )
-        logging.info(received_data.decode())
-
-        received_data = chamber_5("rick", 6001, get_message_identifier(received_data))
-        logging.info(received_data.decode())
-
-        received_data = chamber_6(
-            "rick", 8002, get_message_identifier(received_data), "web", 81
+        pipeline.add(
+            "chamber_1",
+            chamber_stage(chamber_1, ("rick", 4000), stream=False, following=("rick", 3002)),
         )
-        logging.info(received_data.decode())
+        pipeline.add(
+            "chamber_2",
+            chamber_stage(chamber_2, ("rick", 3002), b"that's the end", following=("rick", 6510)),
+        )
+        pipeline.add(
+            "chamber_3", chamber_stage(chamber_3, ("rick", 6510), following=("rick", 3061))
+        )
+        pipeline.add("chamber_4", chamber_stage(chamber_4, ("rick", 3061), "on_eagle"))
+        pipeline.add(
+            "chamber_5",
+            chamber_stage(chamber_5, ("rick", 6001), stream=False, following=("rick", 8002)),
+        )
+        pipeline.add(
+            "chamber_6",
+            chamber_stage(
+                chamber_6,
+                ("rick", 8002),
+                provider=("web", 81),
+                following=("rick", 33333),
+                processes=HTTP_PROCESSES,
+            ),
+        )
+        pipeline.add("chamber_7", chamber_stage(chamber_7, ("rick", 33333)))
 
-        received_data = chamber_7("rick", 33333, get_message_identifier(received_data))
+        received_data: bytes = pipeline.run()
         logging.info(received_data.decode())
 
         # This was a triumph.
@@ -650,6 +1148,9 @@ def main() -> None:
 
     except Exception as ex:  # pylint: disable=broad-exception-caught
         logging.error("Unexpected error: %s", ex)
+    finally:
+        chamber_connector.close()
+        logging.info("chamber connections:\n%s", chamber_connector.report())
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """Script para la resolución de la yinkana de la asignatura de Redes de Computadores."""
 
+import os
+import time
 import socket
 import logging
-import re
 import hashlib
 import base64
 import sys
@@ -11,6 +12,56 @@ import struct
 import array
 import _thread
 import urllib.parse
+import collections
+import contextlib
+import selectors
+import multiprocessing
+import multiprocessing.synchronize
+from typing import Any, Callable, ContextManager, Optional
+
+import rfc_proxy
+import http_cache
+import http_parser
+import reuseport
+import endpoints
+import prompt_parser
+import chamber_pipeline
+import disk_cache
+import worker_pool
+
+
+# el socket de cada hito, conectado en cuanto se analiza el enunciado que lo describe,
+# o mientras se resuelve el anterior con CONEXION_ESPECULATIVA; cada host se resuelve una vez
+conector_hitos: endpoints.EndpointManager = endpoints.EndpointManager()
+
+# segundos que una conexión keep-alive inactiva puede ocupar un hilo
+TIEMPO_KEEP_ALIVE: float = 5.0
+# segundos que tiene una conexión nueva para enviar la línea de petición y clasificarla,
+# el bucle de aceptar no la espera mientras tanto
+TIEMPO_CLASIFICAR: float = 0.01
+# segundos entre intentos de pasar al pool las conexiones retenidas mientras está lleno
+TIEMPO_RETENIDAS: float = 0.005
+# conexiones retenidas con el pool lleno antes de que el bucle de aceptar se bloquee
+MAX_RETENIDAS: int = 1024
+# segundos entre comprobaciones de si otro proceso ya tiene el enunciado
+TIEMPO_SONDEO: float = 0.1
+# segundos que el hito 6 espera al enunciado, las peticiones llegan de clientes de fuera
+TIEMPO_HITO_HTTP: float = 600.0
+# segundos que el hito 6 espera al enunciado después de que el servidor cierre la escucha de
+# errores: la petición que lo trae puede seguir en cola, detrás de las de archivos
+TIEMPO_ENUNCIADO: float = 10.0
+# procesos que atienden el hito 6, $YINKANA_HTTP_PROCESSES; con más de uno se lanzan
+# trabajadores que comparten el puerto con SO_REUSEPORT, cada uno con sus cachés y conexiones
+PROCESOS_HTTP: int = int(os.environ.get("YINKANA_HTTP_PROCESSES") or 1)
+# puerto de las métricas del proxy en texto plano, $YINKANA_METRICS_PORT; None las desactiva
+PUERTO_METRICAS: Optional[int] = (
+    int(os.environ["YINKANA_METRICS_PORT"]) if os.environ.get("YINKANA_METRICS_PORT") else None
+)
+# si conectarse a la dirección configurada del siguiente hito mientras se resuelve el actual,
+# $YINKANA_SPECULATE=1; la conexión se descarta si el enunciado da otra
+CONEXION_ESPECULATIVA: bool = os.environ.get("YINKANA_SPECULATE") == "1"
+# veces que se repite el hito0 si falla, el único que se puede repetir sin peligro
+REINTENTOS_HITO0: int = 2
 
 
 def cksum(pkt):
@@ -37,8 +88,88 @@ def obtener_identificador(msg: bytes) -> bytes:
     :return: El identificador del mensaje.
     :rtype: bytes
     """
-    # buscamos una línea que comience con "identifier:" y nos quedamos con el resto de la línea
-    return re.search(b"^identifier:(.+)$", msg, re.MULTILINE).group(1)
+    identificador: Optional[bytes] = prompt_parser.parse_prompt(msg).identifier
+    if identificador is None:
+        raise ValueError(f"no hay identificador en {msg!r}")
+    return identificador
+
+
+def preparar_siguiente_hito(
+    msg: bytes, defecto: tuple[str, int], tcp: bool = True, nombre: Optional[str] = None
+) -> tuple[prompt_parser.Prompt, tuple[str, int]]:
+    """Analiza el enunciado de un hito y empieza a conectarse al siguiente,
+    para que su socket esté listo cuando empiece.
+    Los hosts de los que el enunciado dice que vienen los documentos se resuelven en segundo
+    plano.
+
+    :param msg: El enunciado.
+    :type msg: bytes
+    :param defecto: Dirección y puerto del siguiente hito si el enunciado no los da.
+    :type defecto: tuple[str, int]
+    :param tcp: Si el siguiente hito usa TCP.
+    :type tcp: bool
+    :param nombre: Nombre del siguiente hito en el informe de conexiones.
+    :type nombre: Optional[str]
+
+    :return: El enunciado analizado y la dirección resuelta del siguiente hito.
+    :rtype: tuple[prompt_parser.Prompt, tuple[str, int]]
+
+    :raises ValueError: Si el enunciado no tiene identificador.
+    """
+    logging.info(msg.decode())
+    enunciado: prompt_parser.Prompt = prompt_parser.parse_prompt(msg)
+    if enunciado.identifier is None:
+        raise ValueError(f"no hay identificador en {msg!r}")
+    direccion: tuple[str, int] = conector_hitos.prepare(
+        enunciado.target(defecto), tcp, label=nombre
+    )
+    conector_hitos.warm(host for host, _ in enunciado.sources)
+    return enunciado, direccion
+
+
+def etapa_hito(
+    hito: Callable[..., bytes],
+    defecto: tuple[str, int],
+    *args: Any,
+    tcp: bool = True,
+    proveedor: Optional[tuple[str, int]] = None,
+    siguiente: Optional[tuple[str, int]] = None,
+    **kwargs: Any,
+) -> Callable[[bytes], bytes]:
+    """Devuelve una etapa del pipeline que resuelve un hito donde diga el enunciado anterior.
+    Con CONEXION_ESPECULATIVA, mientras tanto se abre la conexión del hito siguiente.
+
+    :param hito: Recibe la dirección, el puerto y el identificador del enunciado, el
+        proveedor si lo hay y el resto de argumentos.
+    :type hito: Callable[..., bytes]
+    :param defecto: Dirección y puerto del hito si el enunciado no los da.
+    :type defecto: tuple[str, int]
+    :param args: Argumentos del hito tras el identificador.
+    :type args: Any
+    :param tcp: Si el hito usa TCP.
+    :type tcp: bool
+    :param proveedor: Dirección por defecto de un proveedor, como el del hito 6; se usa la
+        segunda dirección del enunciado si la tiene.
+    :type proveedor: Optional[tuple[str, int]]
+    :param siguiente: Dirección configurada del hito siguiente, si usa TCP.
+    :type siguiente: Optional[tuple[str, int]]
+    :param kwargs: Argumentos con nombre del hito.
+    :type kwargs: Any
+
+    :return: Recibe el enunciado anterior y devuelve el siguiente.
+    :rtype: Callable[[bytes], bytes]
+    """
+
+    def etapa(msg: bytes) -> bytes:
+        enunciado, direccion = preparar_siguiente_hito(msg, defecto, tcp, hito.__name__)
+        if CONEXION_ESPECULATIVA and siguiente is not None:
+            conector_hitos.prepare(siguiente, speculative=True)
+        direccion_proveedor: tuple[Any, ...] = (
+            () if proveedor is None else enunciado.provider(proveedor)
+        )
+        return hito(*direccion, enunciado.identifier, *direccion_proveedor, *args, **kwargs)
+
+    return etapa
 
 
 def hito0(ip: str, puerto: int, username: bytes) -> bytes:
@@ -59,8 +190,7 @@ def hito0(ip: str, puerto: int, username: bytes) -> bytes:
     """
     recibido: bytes
 
-    with socket.socket() as cliente:
-        cliente.connect((ip, puerto))
+    with conector_hitos.connect((ip, puerto)) as cliente:
 
         recibido = cliente.recv(1024)
 
@@ -183,8 +313,7 @@ def hito2(ip: str, puerto: int, identificador: bytes, suma: int) -> bytes:
     recibido: bytes
     enunciado: bytes = None
 
-    with socket.socket() as cliente:
-        cliente.connect((ip, puerto))
+    with conector_hitos.connect((ip, puerto)) as cliente:
 
         cliente.sendall(identificador + b" " + longitudes(cliente, suma) + b"--")
 
@@ -315,8 +444,7 @@ def hito3(ip: str, puerto: int, identificador: bytes) -> bytes:
     enunciado: bytes = None
     palabras: bytes
 
-    with socket.socket() as cliente:
-        cliente.connect((ip, puerto))
+    with conector_hitos.connect((ip, puerto)) as cliente:
 
         cliente.sendall(identificador)
 
@@ -360,8 +488,7 @@ def hito4(ip: str, puerto: int, identificador: bytes) -> bytes:
     longitud_b: bytes
     longitud: int
 
-    with socket.socket() as cliente:
-        cliente.connect((ip, puerto))
+    with conector_hitos.connect((ip, puerto)) as cliente:
 
         cliente.sendall(identificador)
 
@@ -476,8 +603,7 @@ def escucha_errores(ip: str, puerto: int, mensaje: bytes) -> None:
     seguir_escuchando: bool = True
     recibido: bytes
 
-    with socket.socket() as cliente_errores:
-        cliente_errores.connect((ip, puerto))
+    with conector_hitos.connect((ip, puerto)) as cliente_errores:
         cliente_errores.sendall(mensaje)
 
         while seguir_escuchando:
@@ -488,88 +614,141 @@ def escucha_errores(ip: str, puerto: int, mensaje: bytes) -> None:
 
 
 def hacer_de_proxy(
-    peticion: socket.socket, nombre_archivo: bytes, ip: str, puerto: int
+    peticion: socket.socket,
+    proxy: rfc_proxy.RfcProxy,
+    nombre_archivo: bytes,
+    ip: str,
+    puerto: int,
+    mantener: bool = False,
+    preferencias: Optional[http_cache.Preferences] = None,
 ) -> None:
     """Dado un socket que pide un archivo, se pasa esta petición a la ip y puerto especificados.
     El resultado se envía al socket.
+    Si el archivo está en la caché y sigue fresco, se envía directamente desde memoria,
+    comprimido si el cliente lo acepta y recortado a los rangos de bytes que pida.
+    Si el proveedor está fallando, se envía la copia caducada o un error inmediato.
+    La conexión con el proveedor se obtiene del pool y se mantiene abierta para otras peticiones.
 
     :param peticion: Socket que realiza la petición.
     :type peticion: socket.socket
+    :param proxy: El proxy con la caché y las conexiones con el proveedor.
+    :type proxy: rfc_proxy.RfcProxy
     :param nombre_archivo: El nombre del archivo pedido por el socket.
     :type nombre_archivo: bytes
     :param ip: La dirección IP a la que enviaremos el mensaje.
     :type ip: str
     :param puerto: El puerto al que enviaremos el mensaje.
     :type puerto: int
+    :param mantener: Si la conexión con el cliente se reutiliza después de la respuesta.
+    :type mantener: bool
+    :param preferencias: Codificación y rangos de bytes que pide el cliente.
+    :type preferencias: Optional[http_cache.Preferences]
     """
-    queda_por_enviar: bool = True
-    recibido: bytes
-    cabecera: bytes
-
-    with socket.socket() as cliente:
-        cliente.connect((ip, puerto))
-        # Petición http debe especificar host: https://www.rfc-editor.org/rfc/rfc2616#section-14.23
-        # Opción de conexión no debe pasarse: https://www.rfc-editor.org/rfc/rfc2616#section-14.10
-        # Cambio todas las opciones ya que se deja libertad.
-        cabecera = (
-            b"GET /rfc"
-            + nombre_archivo
-            + b" HTTP/1.1\r\n"
-            + b"Host: "
-            + ip.encode()
-            + b":"
-            + bytes(str(puerto), encoding="utf-8")
-            + b"\r\n"
-            + b"Connection: close\r\n\r\n"
-        )
-
-        cliente.sendall(cabecera)
-
-        logging.debug(cabecera)
+    enviados: int
+
+    # Petición http debe especificar host: https://www.rfc-editor.org/rfc/rfc2616#section-14.23
+    # la conexión con el proveedor es persistente (HTTP/1.1), la respuesta se delimita
+    # por Content-Length o chunked y la conexión vuelve al pool
+    # las respuestas caducadas se revalidan con ETag / Last-Modified
+    # si el cliente mantiene la conexión, la respuesta debe ir delimitada
+    enviados = proxy.serve(
+        peticion, (ip, puerto), b"/rfc" + nombre_archivo, mantener, preferencias
+    )
 
-        while queda_por_enviar:
-            recibido = cliente.recv(1024)
-            peticion.sendall(recibido)
-            queda_por_enviar = bool(recibido)
+    logging.debug("enviados %d bytes de %s", enviados, nombre_archivo)
 
 
-def tratar_peticion(peticion: socket.socket, ip: str, puerto: int) -> None:
-    """Recibe una petición HTTP y decide si se trata de un archivo o del enunciado.
+def tratar_peticion(
+    peticion: socket.socket,
+    proxy: rfc_proxy.RfcProxy,
+    ip: str,
+    puerto: int,
+    aceptada: Optional[float] = None,
+) -> None:
+    """Recibe las peticiones HTTP de una conexión y decide si se trata de un archivo
+    o del enunciado.
     Si es un archivo, actuaremos de proxy.
     Si es el enunciado, lo guardaremos en una variable global.
+    Las peticiones se atienden en orden, aunque lleguen varias seguidas (pipelining),
+    y la conexión sigue abierta mientras el cliente use keep-alive de HTTP/1.1.
 
     :param peticion: Socket que realiza la petición.
     :type peticion: socket.socket
+    :param proxy: Atiende las peticiones de archivos.
+    :type proxy: rfc_proxy.RfcProxy
     :param ip: La dirección IP que nos provee de los archivos.
     :type ip: str
     :param puerto: El puerto que nos provee de los archivos.
     :type puerto: int
+    :param aceptada: time.monotonic() al aceptar la conexión, para medir cuánto se tarda
+        en detectar el enunciado.
+    :type aceptada: Optional[float]
     """
-    recibido: bytes
     uri: bytes
+    mantener: bool
 
     global enunciado
 
-    recibido = peticion.recv(1024)
-    logging.debug(recibido)
-
-    uri = recibido.split(b" ")[1]
-
-    # deberíamos preguntar por la `query`
-    pide_archivo = not uri.startswith(b"/submit")
-
-    if pide_archivo:
-        hacer_de_proxy(peticion, uri, ip, puerto)
-    else:
-        enunciado = urllib.parse.unquote(uri)[len(b"/submit?") :].encode()
-        #peticion.sendall(b"HTTP/1.1 200 OK\r\n\r\n" + obtener_identificador(enunciado))
-
-    peticion.close()
-
-
-def bucle_aceptar(servidor: socket.socket, ip: str, puerto: int) -> None:
+    # el socket se cierra aunque falle el proveedor o el cliente
+    with peticion, proxy.metrics.active("connections"):
+        # una conexión inactiva no puede ocupar un hilo para siempre
+        peticion.settimeout(TIEMPO_KEEP_ALIVE)
+        try:
+            for recibida in http_parser.iter_requests(peticion):
+                logging.debug("%s %s", recibida.method, recibida.target)
+
+                uri = recibida.target
+                mantener = recibida.keep_alive
+
+                # deberíamos preguntar por la `query`
+                pide_archivo = not uri.startswith(b"/submit")
+
+                if pide_archivo:
+                    hacer_de_proxy(
+                        peticion,
+                        proxy,
+                        uri,
+                        ip,
+                        puerto,
+                        mantener,
+                        http_cache.Preferences.from_headers(recibida.header),
+                    )
+                else:
+                    enunciado = urllib.parse.unquote(uri)[len(b"/submit?") :].encode()
+                    if aceptada is not None:
+                        logging.info(
+                            "enunciado detectado %.1f ms después de aceptar su conexión",
+                            (time.monotonic() - aceptada) * 1000,
+                        )
+                    #peticion.sendall(b"HTTP/1.1 200 OK\r\n\r\n" + obtener_identificador(enunciado))
+                    # como antes, la conexión se cierra sin responder
+                    break
+
+                if not mantener:
+                    break
+        except http_parser.RequestError as error:
+            logging.warning("petición incorrecta: %s", error)
+            peticion.sendall(rfc_proxy.error_response(error.status, error.reason))
+        except OSError as error:
+            logging.warning("no se pudo atender la conexión: %s", error)
+
+
+def bucle_aceptar(
+    servidor: socket.socket,
+    ip: str,
+    puerto: int,
+    trabajadores: worker_pool.WorkerPool,
+    proxy: rfc_proxy.RfcProxy,
+) -> None:
     """Bucle que acepta las peticiones de un servidor.
-    Crea un hilo para cada petición.
+    Cada conexión se clasifica por su línea de petición en cuanto se puede leer, sin
+    esperarla: el bucle vigila a la vez el servidor y las conexiones sin clasificar, así
+    un cliente lento no retrasa el siguiente accept. La que trae el enunciado (/submit) va
+    al carril prioritario del pool y no espera detrás de los GET; la que no envía nada en
+    TIEMPO_CLASIFICAR va al carril normal.
+    Si la cola del pool está llena, las demás se retienen en orden de llegada y se siguen
+    aceptando conexiones; solo se espera a que haya hueco si hay demasiadas retenidas.
+    Termina cuando se cierra el servidor.
 
     :param servidor: Socket servidor que acepta las peticiones.
     :type servidor: socket.socket
@@ -577,29 +756,120 @@ def bucle_aceptar(servidor: socket.socket, ip: str, puerto: int) -> None:
     :type ip: str
     :param puerto: El puerto que nos provee de los archivos.
     :type puerto: int
+    :param trabajadores: Pool de hilos que atiende las peticiones.
+    :type trabajadores: worker_pool.WorkerPool
+    :param proxy: Atiende las peticiones de archivos.
+    :type proxy: rfc_proxy.RfcProxy
     """
     peticion: socket.socket
+    aceptada: float
+    linea: bytes
+    # conexiones aceptadas con la cola del pool llena, con el momento en que se aceptaron
+    retenidas: collections.deque[tuple[socket.socket, float]] = collections.deque()
+    # conexiones cuya línea de petición aún no ha llegado, con el momento en que se aceptaron
+    sin_clasificar: dict[socket.socket, float] = {}
+    selector: selectors.BaseSelector = selectors.DefaultSelector()
     global enunciado
 
-    while enunciado is None:
-        peticion, _ = servidor.accept()
-
-        try:
-            _thread.start_new_thread(tratar_peticion, (peticion, ip, puerto))
-        except RuntimeError as re:
-            # la yinkana no tiene suficientes recursos :////
-            # no se puede hacer en un hilo a parte, toca hacerlo
-            # de forma secuencial...
-            tratar_peticion(peticion, ip, puerto)
+    def repartir(peticion: socket.socket, aceptada: float) -> None:
+        if retenidas or not trabajadores.submit(
+            tratar_peticion,
+            peticion,
+            proxy,
+            ip,
+            puerto,
+            aceptada,
+            on_cancel=peticion.close,
+            block=False,
+        ):
+            retenidas.append((peticion, aceptada))
+
+    servidor.setblocking(False)
+    selector.register(servidor, selectors.EVENT_READ)
+    try:
+        # el servidor se cierra desde otro hilo cuando llega el enunciado
+        while enunciado is None and servidor.fileno() != -1:
+            # las retenidas van primero, en orden de llegada
+            while retenidas:
+                peticion, aceptada = retenidas[0]
+                if not trabajadores.submit(
+                    tratar_peticion,
+                    peticion,
+                    proxy,
+                    ip,
+                    puerto,
+                    aceptada,
+                    on_cancel=peticion.close,
+                    block=len(retenidas) >= MAX_RETENIDAS,
+                ):
+                    break
+                retenidas.popleft()
+
+            # con conexiones retenidas o sin clasificar, el bucle se despierta antes
+            for clave, _ in selector.select(
+                TIEMPO_RETENIDAS if retenidas or sin_clasificar else TIEMPO_SONDEO
+            ):
+                if clave.fileobj is servidor:
+                    try:
+                        peticion, _ = servidor.accept()
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        # el servidor se ha cerrado, ya no hay más peticiones
+                        break
+                    peticion.setblocking(True)
+                    sin_clasificar[peticion] = time.monotonic()
+                    selector.register(peticion, selectors.EVENT_READ)
+                    continue
+
+                # antes se creaba un hilo por petición y, si no había recursos, se hacía de
+                # forma secuencial; ahora el pool tiene un número fijo de hilos y una cola
+                peticion = clave.fileobj  # type: ignore
+                selector.unregister(peticion)
+                aceptada = sin_clasificar.pop(peticion)
+                linea = http_parser.peek_request_line(peticion, 0.0)
+                if b" /submit" in linea:
+                    if not trabajadores.submit(
+                        tratar_peticion, peticion, proxy, ip, puerto, aceptada, priority=True
+                    ):
+                        peticion.close()
+                else:
+                    repartir(peticion, aceptada)
+
+            # las que siguen sin enviar nada se atienden en orden, seguramente son GET
+            ahora: float = time.monotonic()
+            for peticion, aceptada in list(sin_clasificar.items()):
+                if ahora - aceptada >= TIEMPO_CLASIFICAR:
+                    selector.unregister(peticion)
+                    del sin_clasificar[peticion]
+                    repartir(peticion, aceptada)
+    finally:
+        selector.close()
+        # el hito ha terminado, nadie va a atender las conexiones retenidas ni sin clasificar
+        for peticion, _ in retenidas:
+            peticion.close()
+        for peticion in sin_clasificar:
+            peticion.close()
 
 
 def hito6(
-    ip: str, puerto: int, identificador: bytes, ip_archivos: str, puerto_archivos: int
+    ip: str,
+    puerto: int,
+    identificador: bytes,
+    ip_archivos: str,
+    puerto_archivos: int,
+    hilos: int = 16,
+    tam_cola: int = 64,
+    procesos: int = 1,
+    puerto_metricas: Optional[int] = PUERTO_METRICAS,
 ) -> bytes:
     """Envía el identificador a la dirección IP y puerto especificados.
     Se queda a la escucha de peticiones HTTP y actúa de proxy,
     recibiendo el identificador de la última petición.
     Ejecuta un bucle para la escucha de errores.
+    Las peticiones se atienden con un número fijo de hilos.
+    Con varios procesos, todos escuchan en el mismo puerto (SO_REUSEPORT) y el núcleo
+    reparte las conexiones; cada uno tiene su intérprete, y comparten la caché en disco.
 
     :param ip: La dirección IP a la que enviaremos el mensaje.
     :type ip: str
@@ -611,32 +881,181 @@ def hito6(
     :type ip_archivos: str
     :param puerto_archivos: El puerto que nos provee de los archivos.
     :type puerto_archivos: int
+    :param hilos: Número de hilos que atienden las peticiones.
+    :type hilos: int
+    :param tam_cola: Número de peticiones aceptadas que pueden esperar a un hilo.
+    :type tam_cola: int
+    :param procesos: Número de procesos que atienden las peticiones.
+    :type procesos: int
+    :param puerto_metricas: Puerto en el que se sirven las métricas del proxy, 0 para uno
+        libre, None para no servirlas; con varios procesos cada uno usa uno libre.
+    :type puerto_metricas: Optional[int]
+    :return: El enunciado del siguiente hito.
+    :raises TimeoutError: Si el enunciado no llega a tiempo.
     """
-    conexiones_max: int = 4
+    conexiones_max: int = max(4, tam_cola)
     puerto_libre: int
     mensaje: bytes
 
     global enunciado
     enunciado = None
 
-    with socket.socket() as servidor:
-        servidor.bind(("", 0))
-        puerto_libre = servidor.getsockname()[1]
-        servidor.listen(conexiones_max)
+    if procesos > 1:
+        with reuseport.reserve_port() as reservado:
+            puerto_libre = reservado.getsockname()[1]
+
+            with reuseport.ProcessGroup(
+                procesos,
+                trabajador_hito6,
+                (
+                    puerto_libre,
+                    ip_archivos,
+                    puerto_archivos,
+                    conexiones_max,
+                    hilos,
+                    tam_cola,
+                    None if puerto_metricas is None else 0,
+                ),
+                "proxy",
+            ) as grupo:
+                mensaje = identificador + b" " + bytes(str(puerto_libre), encoding="utf-8")
+
+                escucha_errores(ip, puerto, mensaje)
+
+                # el servidor cierra la escucha de errores cuando ha enviado el enunciado
+                return grupo.wait_prompt(TIEMPO_HITO_HTTP)
+
+    proxy: rfc_proxy.RfcProxy = proxy_hito6()
+    with proxy, worker_pool.WorkerPool(
+        hilos, tam_cola, "proxy"
+    ) as trabajadores, servir_metricas(proxy, puerto_metricas):
+        with socket.socket() as servidor:
+            servidor.bind(("", 0))
+            puerto_libre = servidor.getsockname()[1]
+            servidor.listen(conexiones_max)
+
+            mensaje = identificador + b" " + bytes(str(puerto_libre), encoding="utf-8")
+
+            _thread.start_new_thread(
+                bucle_aceptar, (servidor, ip_archivos, puerto_archivos, trabajadores, proxy)
+            )
 
-        mensaje = identificador + b" " + bytes(str(puerto_libre), encoding="utf-8")
+            escucha_errores(ip, puerto, mensaje)
 
-        _thread.start_new_thread(bucle_aceptar, (servidor, ip_archivos, puerto_archivos))
+            # la petición del enunciado puede estar aún en cola, se sigue atendiendo
+            limite: float = time.monotonic() + TIEMPO_ENUNCIADO
+            while enunciado is None and time.monotonic() < limite:
+                time.sleep(TIEMPO_RETENIDAS)
 
-        escucha_errores(ip, puerto, mensaje)
+        # con el enunciado, las peticiones que quedan en cola se descartan (se cierran sus
+        # sockets); sin él no se descarta ninguna. No se espera a las conexiones keep-alive
+        trabajadores.shutdown(wait=False, cancel_pending=enunciado is not None)
+        logging.info("hilos del proxy: %s", trabajadores.stats())
+        logging.info("métricas del proxy: %s", proxy.metrics.snapshot())
 
+    if enunciado is None:
+        raise TimeoutError("no se ha recibido el enunciado")
     return enunciado
 
+
+def trabajador_hito6(
+    puerto_libre: int,
+    ip_archivos: str,
+    puerto_archivos: int,
+    conexiones_max: int,
+    hilos: int,
+    tam_cola: int,
+    puerto_metricas: Optional[int],
+    listo: multiprocessing.synchronize.Semaphore,
+    enunciados: "multiprocessing.Queue[bytes]",
+    parar: multiprocessing.synchronize.Event,
+) -> None:
+    """Atiende las peticiones HTTP del hito 6 en uno de sus procesos.
+
+    :param puerto_libre: El puerto que comparten los procesos.
+    :type puerto_libre: int
+    :param ip_archivos: La dirección IP que nos provee de los archivos.
+    :type ip_archivos: str
+    :param puerto_archivos: El puerto que nos provee de los archivos.
+    :type puerto_archivos: int
+    :param conexiones_max: Conexiones pendientes de aceptar en este proceso.
+    :type conexiones_max: int
+    :param hilos: Número de hilos que atienden las peticiones.
+    :type hilos: int
+    :param tam_cola: Número de peticiones aceptadas que pueden esperar a un hilo.
+    :type tam_cola: int
+    :param puerto_metricas: Puerto de las métricas de este proceso, o None.
+    :type puerto_metricas: Optional[int]
+    :param listo: Se libera cuando el proceso ya escucha.
+    :type listo: multiprocessing.synchronize.Semaphore
+    :param enunciados: Donde se deja el enunciado si llega a este proceso.
+    :type enunciados: multiprocessing.Queue[bytes]
+    :param parar: Se activa cuando el hito ha terminado.
+    :type parar: multiprocessing.synchronize.Event
+    """
+    # pylint: disable=too-many-arguments
+    global enunciado
+    enunciado = None
+
+    proxy: rfc_proxy.RfcProxy = proxy_hito6()
+    with proxy, worker_pool.WorkerPool(
+        hilos, tam_cola, "proxy"
+    ) as trabajadores, servir_metricas(proxy, puerto_metricas):
+        with reuseport.listen(puerto_libre, conexiones_max) as servidor:
+            _thread.start_new_thread(
+                bucle_aceptar, (servidor, ip_archivos, puerto_archivos, trabajadores, proxy)
+            )
+            listo.release()
+
+            while enunciado is None and not parar.wait(TIEMPO_SONDEO):
+                pass
+            if enunciado is not None:
+                enunciados.put(enunciado)
+
+            # despierta al accept del bucle, que termina al fallar
+            try:
+                servidor.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        # el enunciado ya lo tiene este proceso u otro: las peticiones en cola se descartan
+        # (se cierran sus sockets) y no se espera a las conexiones keep-alive
+        trabajadores.shutdown(wait=False, cancel_pending=True)
+        logging.info("hilos del proxy: %s", trabajadores.stats())
+
+
+def proxy_hito6() -> rfc_proxy.RfcProxy:
+    """Crea el proxy del hito 6: conexiones persistentes y respuestas cacheadas del
+    proveedor de archivos, compartidas por todos los hilos. Las respuestas se guardan
+    también en disco ($YINKANA_CACHE_DIR) para las siguientes ejecuciones, y los RFC
+    citados por los documentos servidos se piden por adelantado.
+
+    :return: El proxy, sus hilos de fondo terminan al cerrarlo.
+    :rtype: rfc_proxy.RfcProxy
+    """
+    return rfc_proxy.RfcProxy(disk=disk_cache.DiskCache(), prefetch_workers=2)
+
+
+def servir_metricas(
+    proxy: rfc_proxy.RfcProxy, puerto: Optional[int]
+) -> ContextManager[Optional[socket.socket]]:
+    """Sirve las métricas del proxy en un puerto aparte mientras dura el bloque.
+
+    :param proxy: El proxy cuyas métricas se sirven.
+    :type proxy: rfc_proxy.RfcProxy
+    :param puerto: El puerto, 0 para uno libre, None para no servirlas.
+    :type puerto: Optional[int]
+    :return: El socket que escucha, se cierra al salir.
+    """
+    if puerto is None:
+        return contextlib.nullcontext()
+    return proxy.metrics.serve(puerto)
+
+
 def hito7(ip: str, puerto: int, identificador: bytes) -> bytes:
     recibido: bytes
 
-    with socket.socket() as cliente:
-        cliente.connect((ip, puerto))
+    with conector_hitos.connect((ip, puerto)) as cliente:
 
         cliente.sendall(identificador)
 
@@ -657,33 +1076,38 @@ def main():
             format="%(levelname)s: %(funcName)s: %(message)s", level=logging.DEBUG
         )
 
-        recibido = hito0("rick", 2000, usuario)
-
-        logging.info(recibido.decode())
-
-        recibido = hito1("rick", 4000, obtener_identificador(recibido))
-
-        logging.info(recibido.decode())
-
-        recibido = hito2("rick", 3010, obtener_identificador(recibido), 1000)
-
-        logging.info(recibido.decode())
-
-        recibido = hito3("rick", 6501, obtener_identificador(recibido))
-
-        logging.info(recibido.decode())
-
-        recibido = hito4("rick", 9000, obtener_identificador(recibido))
-
-        logging.info(recibido.decode())
-
-        recibido = hito5("rick", 6001, obtener_identificador(recibido))
-
-        logging.info(recibido.decode())
-
-        recibido = hito6("rick", 8003, obtener_identificador(recibido), "web", 81)
-
-        logging.info(recibido.decode())
+        # solo se configura el primer hito, cada enunciado describe el siguiente;
+        # los enunciados se guardan y si algo falla, con --resume, se continúa desde el hito
+        # que falló
+        pipeline: chamber_pipeline.Pipeline = chamber_pipeline.Pipeline(
+            usuario.decode(), "--resume" in sys.argv[1:]
+        )
+        # solo el hito0 se repite si falla: no hay nada que perder, el resto no se puede
+        # repetir sin el identificador que el servidor ya ha gastado
+        pipeline.add(
+            "hito0",
+            lambda: hito0(*conector_hitos.prepare(("rick", 2000), label="hito0"), usuario),
+            retries=REINTENTOS_HITO0,
+        )
+        pipeline.add(
+            "hito1", etapa_hito(hito1, ("rick", 4000), tcp=False, siguiente=("rick", 3010))
+        )
+        pipeline.add("hito2", etapa_hito(hito2, ("rick", 3010), 1000, siguiente=("rick", 6501)))
+        pipeline.add("hito3", etapa_hito(hito3, ("rick", 6501), siguiente=("rick", 9000)))
+        pipeline.add("hito4", etapa_hito(hito4, ("rick", 9000)))
+        pipeline.add(
+            "hito5", etapa_hito(hito5, ("rick", 6001), tcp=False, siguiente=("rick", 8003))
+        )
+        pipeline.add(
+            "hito6",
+            etapa_hito(
+                hito6,
+                ("rick", 8003),
+                proveedor=("web", 81),
+                siguiente=("rick", 33333),
+                procesos=PROCESOS_HTTP,
+            ),
+        )
 
         # This was a triumph!
         # I'm making a note here:
@@ -691,7 +1115,9 @@ def main():
         # 
         # It's hard to overstate
         # My satisfaction.
-        recibido = hito7("rick", 33333, obtener_identificador(recibido))
+        pipeline.add("hito7", etapa_hito(hito7, ("rick", 33333)))
+
+        recibido = pipeline.run()
 
         logging.info(recibido.decode())
 
@@ -699,6 +1125,9 @@ def main():
 
     except Exception as ex:
         logging.error("Error inesperado: %s", ex)
+    finally:
+        conector_hitos.close()
+        logging.info("conexiones de los hitos:\n%s", conector_hitos.report())
 
 
 if __name__ == "__main__":